@@ -0,0 +1,91 @@
+"""
+Benchmark the processing of a query and its values by `Connection` before they
+are sent to the database.
+
+Compares the previous implementation, which compiled the html stripping regex
+and ran it over every string value on every call, with `rewrite_query` and
+`rewrite_values` of `lnbits.db`, on the values of a typical payment insert:
+
+    poetry run python benchmarks/db_values.py --calls 100000
+"""
+
+import argparse
+import datetime
+import re
+from time import perf_counter
+
+from lnbits.db import POSTGRES, Connection
+
+QUERY = """
+    INSERT INTO apipayments
+      (wallet, checking_id, bolt11, hash, preimage, amount, pending, memo, fee,
+       extra, webhook, expiry, funding_source)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+VALUES = (
+    "a" * 32,
+    "f" * 64,
+    "lnbc10u1pj" + "q" * 300,
+    "f" * 64,
+    None,
+    10_000,
+    True,
+    "coffee <b>& cake</b>",
+    0,
+    '{"tag": "lnurlp", "link": "abc", "comment": "thanks for the coffee"}',
+    None,
+    datetime.datetime.now(),
+    "FakeWallet",
+)
+
+
+def old_rewrite_query(conn: Connection, query: str) -> str:
+    if conn.type == POSTGRES:
+        query = query.replace("%", "%%")
+        query = query.replace("?", "%s")
+    return query
+
+
+def old_rewrite_values(conn: Connection, values: tuple) -> tuple:
+    clean_regex = re.compile("<.*?>|&([a-z0-9]+|#[0-9]{1,6}|#x[0-9a-f]{1,6});")
+    result = []
+    for value in values:
+        if isinstance(value, str):
+            result.append(re.sub(clean_regex, "", value))
+        elif isinstance(value, datetime.datetime):
+            result.append(value.timestamp())
+        else:
+            result.append(value)
+    return tuple(result)
+
+
+def run(label: str, process, calls: int):
+    start = perf_counter()
+    for _ in range(calls):
+        process()
+    duration = perf_counter() - start
+    print(f"  {label:<10} {duration / calls * 1e6:8.2f} µs/query")
+
+
+def main(calls: int):
+    conn = Connection(None, None, POSTGRES, "bench", "bench")
+    assert old_rewrite_values(conn, VALUES) == conn.rewrite_values(VALUES)
+    assert old_rewrite_query(conn, QUERY) == conn.rewrite_query(QUERY)
+    print(f"{calls} queries with {len(VALUES)} values")
+    run(
+        "old",
+        lambda: (old_rewrite_query(conn, QUERY), old_rewrite_values(conn, VALUES)),
+        calls,
+    )
+    run(
+        "lnbits.db",
+        lambda: (conn.rewrite_query(QUERY), conn.rewrite_values(VALUES)),
+        calls,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--calls", type=int, default=100_000)
+    args = parser.parse_args()
+    main(args.calls)
@@ -0,0 +1,99 @@
+"""
+Benchmark the http client of the funding sources against a local stub backend.
+
+Compares a new client for every request (like the LNbits funding source did on
+every reconnect of its stream), a client with the httpx default limits, as the
+funding sources used to create, and `create_http_client` with the pool settings.
+Also counts how many connections the backend had to accept:
+
+    poetry run python benchmarks/funding_source_http.py --requests 2000 \\
+        --concurrency 20 --latency 0.005
+"""
+
+import argparse
+import asyncio
+import os
+from time import perf_counter
+from typing import Optional
+
+import httpx
+
+os.environ.setdefault("FUNDING_SOURCE_MAX_KEEPALIVE_CONNECTIONS", "100")
+
+from lnbits.wallets.base import create_http_client, http_client_stats  # noqa: E402
+
+RESPONSE = (
+    b"HTTP/1.1 200 OK\r\n"
+    b"Content-Type: application/json\r\n"
+    b"Content-Length: 16\r\n\r\n"
+    b'{"balance": 100}'
+)
+
+
+class StubBackend:
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.connections = 0
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        try:
+            while await reader.readuntil(b"\r\n\r\n"):
+                await asyncio.sleep(self.latency)
+                writer.write(RESPONSE)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        writer.close()
+
+
+async def run(
+    client: Optional[httpx.AsyncClient], url: str, requests: int, concurrency: int
+) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def call():
+        async with semaphore:
+            if client:
+                r = await client.get("/v1/balance/channels")
+            else:
+                async with httpx.AsyncClient(base_url=url) as new_client:
+                    r = await new_client.get("/v1/balance/channels")
+            r.raise_for_status()
+
+    start = perf_counter()
+    await asyncio.gather(*[call() for _ in range(requests)])
+    return perf_counter() - start
+
+
+async def main(requests: int, concurrency: int, latency: float):
+    backend = StubBackend(latency)
+    server = await asyncio.start_server(backend.handle, "127.0.0.1", 0)
+    url = f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}"
+
+    clients = {
+        "client per request": None,
+        "httpx defaults": httpx.AsyncClient(base_url=url),
+        "create_http_client": create_http_client("Benchmark", base_url=url),
+    }
+    print(f"{requests} requests, {concurrency} concurrent, {latency * 1000} ms")
+    for label, client in clients.items():
+        backend.connections = 0
+        duration = await run(client, url, requests, concurrency)
+        if client:
+            await client.aclose()
+        print(
+            f"  {label:<20} {requests / duration:10.0f} req/s"
+            f"  {backend.connections:6d} connections"
+        )
+    print(f"  reuse stats: {http_client_stats['Benchmark'].dict()}")
+    server.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.005)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.concurrency, args.latency))
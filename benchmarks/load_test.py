@@ -0,0 +1,350 @@
+"""
+Load test a local LNbits instance that runs the FakeWallet.
+
+Start LNbits with the load test settings of the FakeWallet and a rate limit that
+does not get in the way, e.g.:
+
+    LNBITS_BACKEND_WALLET_CLASS=FakeWallet FAKE_WALLET_FAST_SIGNING=true \\
+        FAKE_WALLET_MAX_INVOICES=100000 FAKE_WALLET_PAY_EXTERNAL=true \\
+        LNBITS_RATE_LIMIT_NO=1000000 poetry run lnbits
+
+then run the scenarios against it, `--admin-user` is the super user (see
+`poetry run lnbits-cli superuser`) that funds the paying wallet. Throughput, errors
+and the p50/p99 latency are printed for every interval and can be written to a CSV
+file to compare runs:
+
+    poetry run python benchmarks/load_test.py --admin-user <super user id> \\
+        --scenarios create-invoice pay-internal pay-external sse webhook \\
+        --duration 30 --concurrency 20 --csv results.csv
+
+Scenarios:
+    create-invoice  create an invoice
+    pay-internal    pay an invoice of another wallet on the same instance
+    pay-external    pay an invoice of another node (FAKE_WALLET_PAY_EXTERNAL)
+    sse             internal payment until all --sse-clients received the event
+    webhook         internal payment until the invoice webhook arrived
+    longpoll        --longpoll-clients long-polls of /public/v1/payment/{hash} wait
+                    for an invoice, measured from its payment until all returned
+    poll            poll the wallet and its last payments like the wallet page,
+                    with the ETags of the last responses in If-None-Match
+    poll-full       the same polls without If-None-Match, run it against an
+                    instance with LNBITS_RESPONSE_CACHE_TTL=0 for the uncached reads
+
+For 10k concurrent long-polls on one invoice run `longpoll` with `--concurrency 1
+--longpoll-clients 10000`. The open file limit (`ulimit -n`) must allow it and
+LNBITS_LONGPOLL_TIMEOUT must be longer than it takes to open all of them.
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import os
+from hashlib import sha256
+from time import perf_counter, time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+from bolt11 import Bolt11, MilliSatoshi, TagChar, Tags
+
+from lnbits.wallets.fake import fast_encode
+
+
+class LoadTest:
+    def __init__(
+        self, url: str, admin_user: str, sse_clients: int, longpoll_clients: int
+    ):
+        self.url = url
+        self.admin_user = admin_user
+        self.sse_clients = sse_clients
+        self.longpoll_clients = longpoll_clients
+        self.client = httpx.AsyncClient(
+            base_url=url, timeout=30, limits=httpx.Limits(max_connections=None)
+        )
+        self.payer: dict = {}
+        self.payee: dict = {}
+        # payment hash -> number of deliveries and the event set by the last one
+        self.deliveries: Dict[str, Tuple[int, asyncio.Event]] = {}
+        self.webhook_url = ""
+        self.etags: Dict[str, str] = {}
+        self.tasks: List[asyncio.Task] = []
+
+    async def setup(self):
+        self.payer = await self._create_wallet("load test payer")
+        self.payee = await self._create_wallet("load test payee")
+        r = await self.client.put(
+            "/users/api/v1/topup",
+            params={"usr": self.admin_user},
+            json={"id": self.payer["id"], "amount": 1_000_000_000},
+        )
+        r.raise_for_status()
+
+    async def _create_wallet(self, name: str) -> dict:
+        r = await self.client.post("/api/v1/account", json={"name": name})
+        r.raise_for_status()
+        return r.json()
+
+    async def create_invoice(self, webhook: Optional[str] = None) -> dict:
+        r = await self.client.post(
+            "/api/v1/payments",
+            headers={"X-Api-Key": self.payee["inkey"]},
+            json={"out": False, "amount": 1, "memo": "load test", "webhook": webhook},
+        )
+        r.raise_for_status()
+        return r.json()
+
+    async def pay(self, bolt11: str):
+        r = await self.client.post(
+            "/api/v1/payments",
+            headers={"X-Api-Key": self.payer["adminkey"]},
+            json={"out": True, "bolt11": bolt11},
+        )
+        r.raise_for_status()
+
+    async def pay_internal(self):
+        invoice = await self.create_invoice()
+        start = perf_counter()
+        await self.pay(invoice["payment_request"])
+        return perf_counter() - start
+
+    async def pay_external(self):
+        secret = os.urandom(32)
+        tags = Tags()
+        tags.add(TagChar.description, "load test")
+        tags.add(TagChar.payment_secret, secret.hex())
+        tags.add(TagChar.payment_hash, sha256(secret).hexdigest())
+        invoice = Bolt11(
+            currency="bc", amount_msat=MilliSatoshi(1000), date=int(time()), tags=tags
+        )
+        bolt11 = fast_encode(invoice, os.urandom(32).hex())
+        start = perf_counter()
+        await self.pay(bolt11)
+        return perf_counter() - start
+
+    async def pay_until_delivered(self, deliveries: int, webhook: Optional[str]):
+        invoice = await self.create_invoice(webhook)
+        delivered = asyncio.Event()
+        self.deliveries[invoice["payment_hash"]] = (deliveries, delivered)
+        start = perf_counter()
+        try:
+            await self.pay(invoice["payment_request"])
+            await asyncio.wait_for(delivered.wait(), 30)
+        finally:
+            self.deliveries.pop(invoice["payment_hash"], None)
+        return perf_counter() - start
+
+    async def pay_until_polled(self, clients: int):
+        invoice = await self.create_invoice()
+        url = f"/public/v1/payment/{invoice['payment_hash']}"
+        polls: List[asyncio.Task] = []
+        # open the long-polls in steps, so the listen backlog of the server is not
+        # overrun, and pay once all of them wait on the server
+        for step in range(0, clients, 200):
+            polls += [
+                asyncio.create_task(self.client.get(url, timeout=None))
+                for _ in range(min(200, clients - step))
+            ]
+            while await self.payment_waiters() < len(polls):
+                await asyncio.sleep(0.2)
+        start = perf_counter()
+        await self.pay(invoice["payment_request"])
+        for r in await asyncio.gather(*polls, return_exceptions=True):
+            if isinstance(r, Exception):
+                raise r
+            r.raise_for_status()
+            if r.json()["status"] != "paid":
+                raise ValueError(r.text)
+        return perf_counter() - start
+
+    async def poll_wallet(self, conditional: bool):
+        for path in ["/api/v1/wallet", "/api/v1/payments?limit=10"]:
+            headers = {"X-Api-Key": self.payee["inkey"]}
+            if conditional and path in self.etags:
+                headers["If-None-Match"] = self.etags[path]
+            r = await self.client.get(path, headers=headers)
+            if r.status_code != 304:
+                r.raise_for_status()
+            if "etag" in r.headers:
+                self.etags[path] = r.headers["etag"]
+
+    async def payment_waiters(self) -> int:
+        r = await self.client.get(
+            "/admin/api/v1/monitor", params={"usr": self.admin_user}
+        )
+        r.raise_for_status()
+        return r.json()["payment_waiters"]["waiters"]
+
+    def delivered(self, payment_hash: str):
+        if payment_hash not in self.deliveries:
+            return
+        remaining, event = self.deliveries[payment_hash]
+        self.deliveries[payment_hash] = (remaining - 1, event)
+        if remaining <= 1:
+            event.set()
+
+    async def sse_client(self, connected: asyncio.Event):
+        async with self.client.stream(
+            "GET",
+            "/api/v1/payments/sse",
+            headers={"X-Api-Key": self.payee["inkey"]},
+            timeout=None,
+        ) as r:
+            connected.set()
+            async for line in r.aiter_lines():
+                if line.startswith("data:"):
+                    self.delivered(json.loads(line[5:])["payment_hash"])
+
+    async def webhook_server(self) -> asyncio.AbstractServer:
+        async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+            try:
+                while True:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                    length = 0
+                    for header in head.decode().split("\r\n"):
+                        if header.lower().startswith("content-length:"):
+                            length = int(header.split(":")[1])
+                    body = await reader.readexactly(length)
+                    self.delivered(json.loads(body)["payment_hash"])
+                    writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 0\r\n\r\n")
+                    await writer.drain()
+            except (asyncio.IncompleteReadError, ConnectionError):
+                pass
+            writer.close()
+
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        self.webhook_url = f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}/"
+        return server
+
+    async def scenario(self, name: str) -> Callable[[], Awaitable[Optional[float]]]:
+        """The operation of the scenario, it returns its own duration when only a
+        part of it should be measured."""
+        if name == "create-invoice":
+            return self.create_invoice
+        if name == "pay-internal":
+            return self.pay_internal
+        if name == "pay-external":
+            return self.pay_external
+        if name == "sse":
+            for _ in range(self.sse_clients):
+                connected = asyncio.Event()
+                self.tasks.append(asyncio.create_task(self.sse_client(connected)))
+                await connected.wait()
+            return lambda: self.pay_until_delivered(self.sse_clients, None)
+        if name == "webhook":
+            server = await self.webhook_server()
+            self.tasks.append(asyncio.create_task(server.serve_forever()))
+            return lambda: self.pay_until_delivered(1, self.webhook_url)
+        if name == "longpoll":
+            return lambda: self.pay_until_polled(self.longpoll_clients)
+        if name in ["poll", "poll-full"]:
+            for _ in range(20):
+                await self.create_invoice()
+            return lambda: self.poll_wallet(conditional=name == "poll")
+        raise ValueError(f"unknown scenario {name}")
+
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[int(p * (len(values) - 1))]
+
+
+async def run(
+    operation: Callable[[], Awaitable[Optional[float]]],
+    duration: float,
+    concurrency: int,
+    interval: float,
+) -> List[dict]:
+    latencies: List[float] = []
+    errors = 0
+    deadline = perf_counter() + duration
+
+    async def worker():
+        nonlocal errors
+        while perf_counter() < deadline:
+            start = perf_counter()
+            try:
+                measured = await operation()
+            except Exception:
+                errors += 1
+                continue
+            if not isinstance(measured, float):
+                measured = perf_counter() - start
+            latencies.append(measured)
+
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    rows, start = [], perf_counter()
+    while not all(w.done() for w in workers):
+        await asyncio.wait(workers, timeout=interval)
+        window, latencies[:] = latencies[:], []
+        elapsed = perf_counter() - start
+        rows.append(
+            {
+                "seconds": round(elapsed, 1),
+                "requests": len(window),
+                "errors": errors,
+                "throughput": round(len(window) / interval, 1),
+                "p50_ms": round(percentile(window, 0.5) * 1000, 2),
+                "p99_ms": round(percentile(window, 0.99) * 1000, 2),
+            }
+        )
+        errors = 0
+        row = rows[-1]
+        print(
+            f"  {row['seconds']:6.1f}s {row['throughput']:8.1f} req/s"
+            f"  p50 {row['p50_ms']:8.2f} ms  p99 {row['p99_ms']:8.2f} ms"
+            f"  {row['errors']} errors"
+        )
+    return rows
+
+
+async def main(args: argparse.Namespace):
+    test = LoadTest(args.url, args.admin_user, args.sse_clients, args.longpoll_clients)
+    await test.setup()
+    results = []
+    for name in args.scenarios:
+        print(f"{name}: {args.concurrency} concurrent for {args.duration}s")
+        operation = await test.scenario(name)
+        rows = await run(operation, args.duration, args.concurrency, args.interval)
+        requests = sum(row["requests"] for row in rows)
+        print(f"  total {requests} requests, {requests / args.duration:.1f} req/s")
+        results += [{"scenario": name, **row} for row in rows]
+
+    if args.csv:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(results[0].keys()))
+            writer.writeheader()
+            writer.writerows(results)
+    for task in test.tasks:
+        task.cancel()
+    await asyncio.gather(*test.tasks, return_exceptions=True)
+    await test.client.aclose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--admin-user", required=True, help="super user id")
+    parser.add_argument(
+        "--scenarios",
+        nargs="+",
+        default=["create-invoice", "pay-internal"],
+        choices=[
+            "create-invoice",
+            "pay-internal",
+            "pay-external",
+            "sse",
+            "webhook",
+            "longpoll",
+            "poll",
+            "poll-full",
+        ],
+    )
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--interval", type=float, default=5)
+    parser.add_argument("--sse-clients", type=int, default=10)
+    parser.add_argument("--longpoll-clients", type=int, default=1000)
+    parser.add_argument("--csv", help="write the results of every interval")
+    asyncio.run(main(parser.parse_args()))
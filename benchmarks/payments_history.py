@@ -0,0 +1,162 @@
+"""
+Benchmark `get_payments_history` on a synthetic wallet with lots of payments.
+
+Compares aggregating the history from `apipayments` on every call (the old way)
+with summing the hourly `payments_history` buckets, with and without the cache
+of closed periods.
+
+Runs on a throw away SQLite database:
+
+    poetry run python benchmarks/payments_history.py --rows 1000000
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import tempfile
+from time import perf_counter, time
+
+os.environ["LNBITS_DATA_FOLDER"] = tempfile.mkdtemp(prefix="lnbits-bench-")
+os.environ.pop("LNBITS_DATABASE_URL", None)
+
+from lnbits.commands import migrate_databases  # noqa: E402
+from lnbits.core import migrations as core_migrations  # noqa: E402
+from lnbits.core.crud import (  # noqa: E402
+    create_account,
+    create_wallet,
+    get_payments_history,
+    get_wallet,
+    refresh_wallet_stats,
+    sqlite_formats,
+)
+from lnbits.core.db import db  # noqa: E402
+from lnbits.core.models import PaymentHistoryPoint  # noqa: E402
+from lnbits.utils.cache import cache  # noqa: E402
+
+
+def insert_payments(wallet_id: str, rows: int, days: int):
+    start = int(time()) - days * 86400
+    conn = sqlite3.connect(db.path)
+    batch = []
+    for i in range(rows):
+        amount = random.randint(1, 100_000) * 1000
+        outgoing = random.random() < 0.4
+        batch.append(
+            (
+                wallet_id,
+                f"bench_{i}",
+                f"bench_{i}",
+                -amount if outgoing else amount,
+                random.random() < 0.05,
+                -random.randint(0, 1000) if outgoing else 0,
+                start + int(i * days * 86400 / rows),
+            )
+        )
+        if len(batch) == 50_000:
+            _flush(conn, batch)
+    _flush(conn, batch)
+    conn.close()
+
+
+def _flush(conn: sqlite3.Connection, batch: list):
+    conn.executemany(
+        """
+        INSERT INTO apipayments (wallet, checking_id, hash, amount, pending, fee, time)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """,
+        batch,
+    )
+    conn.commit()
+    batch.clear()
+
+
+async def old_payments_history(wallet_id: str, group: str):
+    """`get_payments_history` before the hourly buckets."""
+    date_trunc = f"strftime('{sqlite_formats[group]}', time, 'unixepoch')"
+    transactions = await db.fetchall(
+        f"""
+        SELECT {date_trunc} date,
+               SUM(CASE WHEN amount > 0 THEN amount ELSE 0 END) income,
+               SUM(CASE WHEN amount < 0 THEN abs(amount) + abs(fee) ELSE 0 END) spending
+        FROM apipayments
+        WHERE (pending = False OR amount < 0) AND wallet = ?
+        GROUP BY date
+        ORDER BY date DESC
+        """,
+        (wallet_id,),
+    )
+    wallet = await get_wallet(wallet_id)
+    assert wallet
+    balance = wallet.balance_msat
+    results: list[PaymentHistoryPoint] = []
+    for row in transactions:
+        results.insert(
+            0,
+            PaymentHistoryPoint(
+                balance=balance, date=row[0], income=row[1], spending=row[2]
+            ),
+        )
+        balance -= row.income - row.spending
+    return results
+
+
+async def timed(label: str, coro_fn, repeat: int):
+    durations = []
+    result = None
+    for _ in range(repeat):
+        start = perf_counter()
+        result = await coro_fn()
+        durations.append(perf_counter() - start)
+    best = min(durations) * 1000
+    print(f"  {label:<28} {best:10.1f} ms  ({len(result or [])} points)")
+    return result
+
+
+async def main(rows: int, days: int, repeat: int):
+    await migrate_databases()
+    user = await create_account()
+    wallet = await create_wallet(user_id=user.id)
+
+    print(f"inserting {rows} payments over {days} days...")
+    start = perf_counter()
+    insert_payments(wallet.id, rows, days)
+    print(f"  done in {perf_counter() - start:.1f}s")
+
+    print("building hourly buckets...")
+    start = perf_counter()
+    async with db.connect() as conn:
+        await conn.execute("DELETE FROM payments_history")
+        await core_migrations.m021_add_payments_history(conn)
+        await refresh_wallet_stats(wallet.id, conn=conn)
+    print(f"  done in {perf_counter() - start:.1f}s")
+
+    for group in ("hour", "day", "month"):
+        print(f"group by {group}:")
+        old = await timed(
+            "aggregate apipayments",
+            lambda group=group: old_payments_history(wallet.id, group),
+            1,
+        )
+
+        def cold(group=group):
+            cache.pop(f"payments_history:{wallet.id}:{group}")
+            return get_payments_history(wallet.id, group)
+
+        await timed("hourly buckets", cold, repeat)
+        new = await timed(
+            "hourly buckets, cached",
+            lambda group=group: get_payments_history(wallet.id, group),
+            repeat,
+        )
+        assert [p.balance for p in old] == [p.balance for p in new]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--days", type=int, default=730)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.days, args.repeat))
@@ -18,9 +18,12 @@ from starlette.middleware.sessions import SessionMiddleware
 
 from lnbits.core.crud import get_dbversions, get_installed_extensions
 from lnbits.core.helpers import migrate_extension_database
-from lnbits.core.tasks import (  # watchdog_task
+from lnbits.core.tasks import (
     killswitch_task,
+    node_sync_task,
+    settings_sync_task,
     wait_for_paid_invoices,
+    watchdog_task,
 )
 from lnbits.exceptions import register_exception_handlers
 from lnbits.settings import settings
@@ -35,6 +38,8 @@ from lnbits.utils.logger import (
     initialize_server_websocket_logger,
     log_server_info,
 )
+from lnbits.utils.loop_monitor import loop_monitor
+from lnbits.utils.outbound import outbound_client
 from lnbits.wallets import get_funding_source, set_funding_source
 
 from .commands import migrate_databases
@@ -53,6 +58,8 @@ from .middleware import (
     CustomGZipMiddleware,
     ExtensionsRedirectMiddleware,
     InstalledExtensionMiddleware,
+    MetricsMiddleware,
+    QueryTraceMiddleware,
     add_first_install_middleware,
     add_ip_block_middleware,
     add_ratelimit_middleware,
@@ -62,6 +69,7 @@ from .tasks import (
     check_pending_payments,
     internal_invoice_listener,
     invoice_listener,
+    push_notification_worker,
 )
 
 
@@ -110,6 +118,7 @@ async def shutdown():
     await asyncio.sleep(0.1)
     funding_source = get_funding_source()
     await funding_source.cleanup()
+    await outbound_client.close()
 
 
 @asynccontextmanager
@@ -169,6 +178,12 @@ def create_app() -> FastAPI:
     add_ip_block_middleware(app)
     add_ratelimit_middleware(app)
 
+    if settings.lnbits_query_trace:
+        app.add_middleware(QueryTraceMiddleware)
+
+    # outermost, to measure the whole request
+    app.add_middleware(MetricsMiddleware)
+
     register_exception_handlers(app)
 
     return app
@@ -301,7 +316,7 @@ async def check_installed_extension_files(ext: InstallableExtension) -> bool:
 
     if f"./{ext.zip_path!s}" not in zip_files:
         await ext.download_archive()
-    ext.extract_archive()
+    await ext.extract_archive()
 
     return False
 
@@ -410,17 +425,21 @@ def register_async_tasks():
     create_permanent_task(invoice_listener)
     create_permanent_task(internal_invoice_listener)
     create_permanent_task(cache.invalidate_forever)
+    create_permanent_task(push_notification_worker)
+    if settings.lnbits_loop_monitor:
+        create_permanent_task(loop_monitor.run_forever)
 
     # core invoice listener
     invoice_queue = asyncio.Queue(5)
     register_invoice_listener(invoice_queue, "core")
     create_permanent_task(lambda: wait_for_paid_invoices(invoice_queue))
 
-    # TODO: implement watchdog properly
-    # create_permanent_task(watchdog_task)
+    create_permanent_task(watchdog_task)
     create_permanent_task(killswitch_task)
+    create_permanent_task(node_sync_task)
 
     # server logs for websocket
     if settings.lnbits_admin_ui:
+        create_permanent_task(settings_sync_task)
         server_log_task = initialize_server_websocket_logger()
         create_permanent_task(server_log_task)
@@ -36,7 +36,7 @@ from .core.crud import (
     remove_deleted_wallets,
     update_payment_status,
 )
-from .core.helpers import migrate_extension_database, run_migration
+from .core.helpers import MigrationRun, migrate_extension_database, run_migration
 from .db import COCKROACH, POSTGRES, SQLITE
 from .extension_manager import (
     CreateExtension,
@@ -117,10 +117,37 @@ async def delete_settings():
 
 
 @db.command("migrate")
-def database_migrate():
+@click.option(
+    "--dry-run", is_flag=True, help="List the pending migrations, run nothing."
+)
+@click.option(
+    "--explain",
+    is_flag=True,
+    help="With --dry-run: the statements of each migration and the rows of the"
+    " tables they change.",
+)
+def database_migrate(dry_run: bool = False, explain: bool = False):
     """Migrate databases"""
     loop = asyncio.get_event_loop()
-    loop.run_until_complete(migrate_databases())
+    runs = loop.run_until_complete(migrate_databases(dry_run, explain))
+    if not runs:
+        click.echo("No pending migrations.")
+    for run in runs:
+        migration = run.migration
+        line = f"{run.db_name}.{migration.version:03d} {migration.name}"
+        if run.seconds is not None:
+            line += f" ({run.seconds:.3f}s)"
+        elif migration.description:
+            line += f": {migration.description}"
+        click.echo(line)
+        for statement in run.statements:
+            rows = "" if statement.rows is None else f"{statement.rows} rows: "
+            click.echo(f"    {rows}{statement.query[:160]}")
+        if run.error:
+            click.echo(f"    ({run.error})")
+    if runs and not dry_run:
+        total = sum(run.seconds or 0 for run in runs)
+        click.echo(f"{len(runs)} migrations done in {total:.3f}s")
 
 
 async def db_migrate():
@@ -128,7 +155,9 @@ async def db_migrate():
     await task
 
 
-async def migrate_databases():
+async def migrate_databases(
+    dry_run: bool = False, explain: bool = False
+) -> List[MigrationRun]:
     """Creates the necessary databases if they don't exist already; or migrates them."""
 
     async with core_db.connect() as conn:
@@ -143,12 +172,18 @@ async def migrate_databases():
                 " AND table_name = 'dbversions'"
             )
 
-        if not exists:
+        if not exists and not dry_run:
             await core_migrations.m000_create_migrations_table(conn)
 
-        current_versions = await get_dbversions(conn)
-        core_version = current_versions.get("core", 0)
-        await run_migration(conn, core_migrations, "core", core_version)
+        current_versions = await get_dbversions(conn) if exists or not dry_run else {}
+
+    core_version = current_versions.get("core", 0)
+    runs = await run_migration(
+        core_db, core_migrations, "core", core_version, dry_run, explain
+    )
+    if dry_run and core_version == 0:
+        # the tables of a new database are created first
+        return runs
 
     # here is the first place we can be sure that the
     # `installed_extensions` table has been created
@@ -157,11 +192,18 @@ async def migrate_databases():
     for ext in get_valid_extensions(False):
         current_version = current_versions.get(ext.code, 0)
         try:
-            await migrate_extension_database(ext, current_version)
+            runs += await migrate_extension_database(
+                ext, current_version, dry_run, explain
+            )
         except Exception as e:
             logger.exception(f"Error migrating extension {ext.code}: {e}")
 
-    logger.info("✔️ All migrations done.")
+    if not dry_run:
+        logger.info(
+            f"✔️ All migrations done, {len(runs)} in"
+            f" {sum(run.seconds or 0 for run in runs):.3f}s."
+        )
+    return runs
 
 
 @db.command("versions")
@@ -1,7 +1,7 @@
 import datetime
 import json
 from time import time
-from typing import Any, Dict, List, Literal, Optional
+from typing import Any, Dict, List, Literal, Optional, Tuple
 from uuid import UUID, uuid4
 
 import shortuuid
@@ -17,10 +17,12 @@ from lnbits.settings import (
     WebPushSettings,
     settings,
 )
+from lnbits.utils.cache import cache
 
 from .models import (
     Account,
     AccountFilters,
+    CreatePayment,
     CreateUser,
     Payment,
     PaymentFilters,
@@ -159,30 +161,29 @@ async def get_accounts(
 ) -> Page[Account]:
     return await (conn or db).fetch_page(
         """
-        SELECT
-            accounts.id,
-            accounts.username,
-            accounts.email,
-            SUM(COALESCE((
-                SELECT balance FROM balances WHERE wallet = wallets.id
-            ), 0)) as balance_msat,
-            SUM((
-                SELECT COUNT(*) FROM apipayments WHERE wallet = wallets.id
-            )) as transaction_count,
-            (
-                SELECT COUNT(*) FROM wallets WHERE wallets.user = accounts.id
-            ) as wallet_count,
-            MAX((
-                SELECT time FROM apipayments
-                WHERE wallet = wallets.id ORDER BY time DESC LIMIT 1
-            )) as last_payment
-            FROM accounts LEFT JOIN wallets ON accounts.id = wallets.user
+        SELECT * FROM (
+            SELECT
+                accounts.id,
+                accounts.username,
+                accounts.email,
+                COALESCE(SUM(
+                    CASE WHEN wallets.deleted = false
+                    THEN wallet_stats.balance_msat END
+                ), 0) as balance_msat,
+                COALESCE(SUM(wallet_stats.transaction_count), 0)
+                    as transaction_count,
+                COUNT(wallets.id) as wallet_count,
+                MAX(wallet_stats.last_payment) as last_payment
+            FROM accounts
+            LEFT JOIN wallets ON accounts.id = wallets.user
+            LEFT JOIN wallet_stats ON wallet_stats.wallet = wallets.id
+            GROUP BY accounts.id
+        ) as account_stats
         """,
         [],
         [],
         filters=filters,
         model=Account,
-        group_by=["accounts.id"],
     )
 
 
@@ -347,8 +348,7 @@ async def get_user(user_id: str, conn: Optional[Connection] = None) -> Optional[
             e[0] for e in extensions if User.is_extension_for_user(e[0], user["id"])
         ],
         wallets=[Wallet(**w) for w in wallets],
-        admin=user["id"] == settings.super_user
-        or user["id"] in settings.lnbits_admin_users,
+        admin=settings.is_admin_user(user["id"]),
         super_user=user["id"] == settings.super_user,
         has_password=True if user["pass"] else False,
         config=UserConfig(**json.loads(user["extra"])) if user["extra"] else None,
@@ -534,13 +534,15 @@ async def update_wallet(
         set_clause.append("currency = ?")
         values.append(currency)
     values.append(wallet_id)
-    await (conn or db).execute(
-        f"""
-        UPDATE wallets SET {', '.join(set_clause)} WHERE id = ?
-        """,
-        tuple(values),
-    )
-    wallet = await get_wallet(wallet_id=wallet_id, conn=conn)
+    async with db.reuse_conn(conn) if conn else db.connect() as new_conn:
+        await new_conn.execute(
+            f"""
+            UPDATE wallets SET {', '.join(set_clause)} WHERE id = ?
+            """,
+            tuple(values),
+        )
+        await _bump_wallet_versions(wallet_id, conn=new_conn)
+        wallet = await get_wallet(wallet_id=wallet_id, conn=new_conn)
     assert wallet, "updated created wallet couldn't be retrieved"
     return wallet
 
@@ -553,42 +555,49 @@ async def delete_wallet(
     conn: Optional[Connection] = None,
 ) -> None:
     now = int(time())
-    await (conn or db).execute(
-        f"""
-        UPDATE wallets
-        SET deleted = ?, updated_at = {db.timestamp_placeholder}
-        WHERE id = ? AND "user" = ?
-        """,
-        (deleted, now, wallet_id, user_id),
-    )
+    async with db.reuse_conn(conn) if conn else db.connect() as new_conn:
+        await new_conn.execute(
+            f"""
+            UPDATE wallets
+            SET deleted = ?, updated_at = {db.timestamp_placeholder}
+            WHERE id = ? AND "user" = ?
+            """,
+            (deleted, now, wallet_id, user_id),
+        )
+        await _bump_wallet_versions(wallet_id, conn=new_conn)
 
 
 async def force_delete_wallet(
     wallet_id: str, conn: Optional[Connection] = None
 ) -> None:
-    await (conn or db).execute(
-        "DELETE FROM wallets WHERE id = ?",
-        (wallet_id,),
-    )
+    async with db.reuse_conn(conn) if conn else db.connect() as new_conn:
+        await new_conn.execute("DELETE FROM wallets WHERE id = ?", (wallet_id,))
+        await new_conn.execute(
+            "DELETE FROM wallet_stats WHERE wallet = ?", (wallet_id,)
+        )
 
 
 async def delete_wallet_by_id(
     *, wallet_id: str, conn: Optional[Connection] = None
 ) -> Optional[int]:
     now = int(time())
-    result = await (conn or db).execute(
-        f"""
-        UPDATE wallets
-        SET deleted = true, updated_at = {db.timestamp_placeholder}
-        WHERE id = ?
-        """,
-        (now, wallet_id),
-    )
+    async with db.reuse_conn(conn) if conn else db.connect() as new_conn:
+        result = await new_conn.execute(
+            f"""
+            UPDATE wallets
+            SET deleted = true, updated_at = {db.timestamp_placeholder}
+            WHERE id = ?
+            """,
+            (now, wallet_id),
+        )
+        await _bump_wallet_versions(wallet_id, conn=new_conn)
     return result.rowcount
 
 
 async def remove_deleted_wallets(conn: Optional[Connection] = None) -> None:
-    await (conn or db).execute("DELETE FROM wallets WHERE deleted = true")
+    async with db.reuse_conn(conn) if conn else db.connect() as new_conn:
+        await new_conn.execute("DELETE FROM wallets WHERE deleted = true")
+        await _delete_orphaned_wallet_stats(new_conn)
 
 
 async def delete_unused_wallets(
@@ -596,20 +605,31 @@ async def delete_unused_wallets(
     conn: Optional[Connection] = None,
 ) -> None:
     delta = int(time()) - time_delta
-    await (conn or db).execute(
-        f"""
-        DELETE FROM wallets
-        WHERE (
-            SELECT COUNT(*) FROM apipayments WHERE wallet = wallets.id
-        ) = 0 AND (
-            (updated_at is null AND created_at < {db.timestamp_placeholder})
-            OR updated_at < {db.timestamp_placeholder}
+    async with db.reuse_conn(conn) if conn else db.connect() as new_conn:
+        await new_conn.execute(
+            f"""
+            DELETE FROM wallets
+            WHERE (
+                SELECT COUNT(*) FROM apipayments WHERE wallet = wallets.id
+            ) = 0 AND (
+                (updated_at is null AND created_at < {db.timestamp_placeholder})
+                OR updated_at < {db.timestamp_placeholder}
+            )
+            """,
+            (
+                delta,
+                delta,
+            ),
         )
-        """,
-        (
-            delta,
-            delta,
-        ),
+        await _delete_orphaned_wallet_stats(new_conn)
+
+
+async def _delete_orphaned_wallet_stats(conn: Connection) -> None:
+    await conn.execute(
+        """
+        DELETE FROM wallet_stats
+        WHERE NOT EXISTS (SELECT 1 FROM wallets WHERE wallets.id = wallet_stats.wallet)
+        """
     )
 
 
@@ -659,7 +679,14 @@ async def get_wallet_for_key(
 
 
 async def get_total_balance(conn: Optional[Connection] = None):
-    row = await (conn or db).fetchone("SELECT SUM(balance) FROM balances")
+    # the maintained wallet balances, the `balances` view sums over all payments
+    row = await (conn or db).fetchone(
+        """
+        SELECT SUM(wallet_stats.balance_msat) FROM wallet_stats
+        JOIN wallets ON wallets.id = wallet_stats.wallet
+        WHERE wallets.deleted = false OR wallets.deleted is NULL
+        """
+    )
     return 0 if row[0] is None else row[0]
 
 
@@ -830,22 +857,21 @@ async def get_payments(
 async def delete_expired_invoices(
     conn: Optional[Connection] = None,
 ) -> None:
-    # first we delete all invoices older than one month
-    await (conn or db).execute(
-        f"""
-        DELETE FROM apipayments
-        WHERE pending = true AND amount > 0
-          AND time < {db.timestamp_now} - {db.interval_seconds(2592000)}
-        """
-    )
-    # then we delete all invoices whose expiry date is in the past
-    await (conn or db).execute(
-        f"""
-        DELETE FROM apipayments
-        WHERE pending = true AND amount > 0
-          AND expiry < {db.timestamp_now}
-        """
-    )
+    async with db.reuse_conn(conn) if conn else db.connect() as new_conn:
+        # first we delete all invoices older than one month
+        # then we delete all invoices whose expiry date is in the past
+        expired_clauses = [
+            f"time < {db.timestamp_now} - {db.interval_seconds(2592000)}",
+            f"expiry < {db.timestamp_now}",
+        ]
+        for expired_clause in expired_clauses:
+            where = f"WHERE pending = true AND amount > 0 AND {expired_clause}"
+            rows = await new_conn.fetchall(
+                f"SELECT DISTINCT wallet FROM apipayments {where}"
+            )
+            await new_conn.execute(f"DELETE FROM apipayments {where}")
+            for row in rows:
+                await refresh_wallet_stats(row["wallet"], conn=new_conn)
 
 
 # payments
@@ -866,6 +892,7 @@ async def create_payment(
     pending: bool = True,
     extra: Optional[Dict] = None,
     webhook: Optional[str] = None,
+    funding_source: Optional[str] = None,
     conn: Optional[Connection] = None,
 ) -> Payment:
     # we don't allow the creation of the same invoice twice
@@ -873,46 +900,136 @@ async def create_payment(
     previous_payment = await get_standalone_payment(checking_id, conn=conn)
     assert previous_payment is None, "Payment already exists"
 
-    await (conn or db).execute(
-        """
-        INSERT INTO apipayments
-          (wallet, checking_id, bolt11, hash, preimage,
-           amount, pending, memo, fee, extra, webhook, expiry)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """,
-        (
-            wallet_id,
-            checking_id,
-            payment_request,
-            payment_hash,
-            preimage,
-            amount,
-            pending,
-            memo,
-            fee,
+    async with db.reuse_conn(conn) if conn else db.connect() as new_conn:
+        await new_conn.execute(
+            """
+            INSERT INTO apipayments
+              (wallet, checking_id, bolt11, hash, preimage,
+               amount, pending, memo, fee, extra, webhook, expiry, funding_source)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
             (
-                json.dumps(extra)
-                if extra and extra != {} and isinstance(extra, dict)
-                else None
+                wallet_id,
+                checking_id,
+                payment_request,
+                payment_hash,
+                preimage,
+                amount,
+                pending,
+                memo,
+                fee,
+                (
+                    json.dumps(extra)
+                    if extra and extra != {} and isinstance(extra, dict)
+                    else None
+                ),
+                webhook,
+                db.datetime_to_timestamp(expiry) if expiry else None,
+                funding_source,
             ),
-            webhook,
-            db.datetime_to_timestamp(expiry) if expiry else None,
-        ),
-    )
+        )
+        await _add_to_wallet_stats(
+            wallet_id,
+            balance_msat=_balance_contribution(amount, fee, pending),
+            transaction_count=1,
+            new_payment=True,
+            conn=new_conn,
+        )
 
-    new_payment = await get_wallet_payment(wallet_id, payment_hash, conn=conn)
-    assert new_payment, "Newly created payment couldn't be retrieved"
+        new_payment = await get_wallet_payment(wallet_id, payment_hash, conn=new_conn)
+        assert new_payment, "Newly created payment couldn't be retrieved"
+
+        income, spending = _payment_totals(amount, fee, pending)
+        if income or spending:
+            row = await new_conn.fetchone(
+                f"""
+                SELECT {db.timestamp_to_epoch("time")} AS epoch FROM apipayments
+                WHERE wallet = ? AND checking_id = ?
+                """,
+                (wallet_id, checking_id),
+            )
+            await _add_to_payments_history(
+                wallet_id, row["epoch"], income, spending, conn=new_conn
+            )
 
     return new_payment
 
 
+async def create_payments(
+    data: List[CreatePayment], conn: Optional[Connection] = None
+) -> None:
+    """
+    Insert many payments with a single statement.
+    Unlike `create_payment` the payments are not checked for duplicates
+    and are not fetched again after the insert.
+    """
+    if not data:
+        return
+    now = int(time())
+    placeholders = (
+        f"(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, {db.timestamp_placeholder})"
+    )
+    values: List[Any] = []
+    for payment in data:
+        values.extend(
+            [
+                payment.wallet_id,
+                payment.checking_id,
+                payment.payment_request,
+                payment.payment_hash,
+                payment.preimage,
+                payment.amount,
+                payment.pending,
+                payment.memo,
+                payment.fee,
+                json.dumps(payment.extra) if payment.extra else None,
+                payment.webhook,
+                db.datetime_to_timestamp(payment.expiry) if payment.expiry else None,
+                payment.funding_source,
+                now,
+            ]
+        )
+
+    columns = len(values) // len(data)
+    # keep below the max number of parameters per statement of older sqlite versions
+    chunk_size = 999 // columns
+    async with db.reuse_conn(conn) if conn else db.connect() as new_conn:
+        for start in range(0, len(data), chunk_size):
+            rows = len(data[start : start + chunk_size])
+            await new_conn.execute(
+                f"""
+                INSERT INTO apipayments
+                  (wallet, checking_id, bolt11, hash, preimage,
+                   amount, pending, memo, fee, extra, webhook, expiry,
+                   funding_source, time)
+                VALUES {", ".join([placeholders] * rows)}
+                """,
+                tuple(values[start * columns : (start + rows) * columns]),
+            )
+
+        wallet_ids = {payment.wallet_id for payment in data}
+        for wallet_id in wallet_ids:
+            payments = [payment for payment in data if payment.wallet_id == wallet_id]
+            totals = [
+                _payment_totals(payment.amount, payment.fee, payment.pending)
+                for payment in payments
+            ]
+            income = sum(income for income, _ in totals)
+            spending = sum(spending for _, spending in totals)
+            await _add_to_wallet_stats(
+                wallet_id,
+                balance_msat=income - spending,
+                transaction_count=len(payments),
+                new_payment=True,
+                conn=new_conn,
+            )
+            await _add_to_payments_history(wallet_id, now, income, spending, new_conn)
+
+
 async def update_payment_status(
     checking_id: str, pending: bool, conn: Optional[Connection] = None
 ) -> None:
-    await (conn or db).execute(
-        "UPDATE apipayments SET pending = ? WHERE checking_id = ?",
-        (pending, checking_id),
-    )
+    await update_payment_details(checking_id, pending=pending, conn=conn)
 
 
 async def update_payment_details(
@@ -921,6 +1038,7 @@ async def update_payment_details(
     fee: Optional[int] = None,
     preimage: Optional[str] = None,
     new_checking_id: Optional[str] = None,
+    funding_source: Optional[str] = None,
     conn: Optional[Connection] = None,
 ) -> None:
     set_clause: List[str] = []
@@ -938,14 +1056,66 @@ async def update_payment_details(
     if preimage is not None:
         set_clause.append("preimage = ?")
         set_variables.append(preimage)
-
-    set_variables.append(checking_id)
-
-    await (conn or db).execute(
-        f"UPDATE apipayments SET {', '.join(set_clause)} WHERE checking_id = ?",
-        tuple(set_variables),
-    )
-    return
+    if funding_source is not None:
+        set_clause.append("funding_source = ?")
+        set_variables.append(funding_source)
+
+    epoch = db.timestamp_to_epoch("time")
+    async with db.reuse_conn(conn) if conn else db.connect() as new_conn:
+        rows = await new_conn.fetchall(
+            f"SELECT wallet, amount, fee, pending, {epoch} AS epoch FROM apipayments "
+            "WHERE checking_id = ?",
+            (checking_id,),
+        )
+        for row in rows:
+            # only updated if `pending` and `fee` are still what was read, so a
+            # concurrent update (of another worker) is not counted twice
+            while True:
+                result = await new_conn.execute(
+                    f"""
+                    UPDATE apipayments SET {', '.join(set_clause)}
+                    WHERE checking_id = ? AND wallet = ? AND pending = ?
+                    AND COALESCE(fee, 0) = ?
+                    """,
+                    (
+                        *set_variables,
+                        checking_id,
+                        row["wallet"],
+                        row["pending"],
+                        row["fee"] or 0,
+                    ),
+                )
+                if result.rowcount:
+                    break
+                row = await new_conn.fetchone(
+                    f"SELECT wallet, amount, fee, pending, {epoch} AS epoch "
+                    "FROM apipayments WHERE checking_id = ? AND wallet = ?",
+                    (checking_id, row["wallet"]),
+                )
+                if not row:
+                    break
+            if not row:
+                continue
+            old_income, old_spending = _payment_totals(
+                row["amount"], row["fee"], row["pending"]
+            )
+            income, spending = _payment_totals(
+                row["amount"],
+                row["fee"] if fee is None else fee,
+                row["pending"] if pending is None else pending,
+            )
+            income_delta = income - old_income
+            spending_delta = spending - old_spending
+            # also bumps the wallet version when the balance did not change
+            await _add_to_wallet_stats(
+                row["wallet"],
+                balance_msat=income_delta - spending_delta,
+                conn=new_conn,
+            )
+            if income_delta or spending_delta:
+                await _add_to_payments_history(
+                    row["wallet"], row["epoch"], income_delta, spending_delta, new_conn
+                )
 
 
 async def update_payment_extra(
@@ -963,7 +1133,7 @@ async def update_payment_extra(
     amount_clause = "AND amount < 0" if outgoing else "AND amount > 0"
 
     row = await (conn or db).fetchone(
-        f"SELECT hash, extra from apipayments WHERE hash = ? {amount_clause}",
+        f"SELECT wallet, extra from apipayments WHERE hash = ? {amount_clause}",
         (payment_hash,),
     )
     if not row:
@@ -971,10 +1141,12 @@ async def update_payment_extra(
     db_extra = json.loads(row["extra"] if row["extra"] else "{}")
     db_extra.update(extra)
 
-    await (conn or db).execute(
-        f"UPDATE apipayments SET extra = ? WHERE hash = ? {amount_clause} ",
-        (json.dumps(db_extra), payment_hash),
-    )
+    async with db.reuse_conn(conn) if conn else db.connect() as new_conn:
+        await new_conn.execute(
+            f"UPDATE apipayments SET extra = ? WHERE hash = ? {amount_clause} ",
+            (json.dumps(db_extra), payment_hash),
+        )
+        await _bump_wallet_versions(row["wallet"], conn=new_conn)
 
 
 async def update_pending_payments(wallet_id: str):
@@ -1000,22 +1172,66 @@ async def get_payments_history(
     group: DateTrunc = "day",
     filters: Optional[Filters] = None,
 ) -> List[PaymentHistoryPoint]:
-    if not filters:
-        filters = Filters()
+    if group not in sqlite_formats:
+        raise ValueError(f"Invalid group value: {group}")
+
+    if filters and (filters.filters or filters.search):
+        transactions = await _get_filtered_payments_history(wallet_id, group, filters)
+    else:
+        closed = await _get_closed_payments_history(wallet_id, group)
+        transactions = await _get_payments_history_buckets(
+            wallet_id, group, since=_truncate_timestamp(int(time()), group)
+        )
+        transactions += closed
+
+    if wallet_id:
+        row = await db.fetchone(
+            """
+            SELECT wallets.deleted, wallet_stats.balance_msat FROM wallets
+            LEFT JOIN wallet_stats ON wallet_stats.wallet = wallets.id
+            WHERE wallets.id = ?
+            """,
+            (wallet_id,),
+        )
+        if not row:
+            raise ValueError("Unknown wallet")
+        balance = 0 if row["deleted"] else row["balance_msat"] or 0
+    else:
+        balance = await get_total_balance()
+
+    # since we dont know the balance at the starting point,
+    # we take the current balance and walk backwards
+    results: list[PaymentHistoryPoint] = []
+    for date, income, spending in transactions:
+        results.append(
+            PaymentHistoryPoint(
+                balance=balance, date=date, income=income, spending=spending
+            )
+        )
+        balance -= income - spending
+    results.reverse()
+    return results
+
+
+async def _get_filtered_payments_history(
+    wallet_id: Optional[str], group: DateTrunc, filters: Filters
+) -> List[Tuple[datetime.datetime, int, int]]:
+    """
+    Aggregate the history from the payments themselves,
+    the hourly buckets only work without filters.
+    """
     where = ["(pending = False OR amount < 0)"]
     values = []
     if wallet_id:
         where.append("wallet = ?")
         values.append(wallet_id)
 
-    if DB_TYPE == SQLITE and group in sqlite_formats:
+    if DB_TYPE == SQLITE:
         date_trunc = f"strftime('{sqlite_formats[group]}', time, 'unixepoch')"
-    elif group in ("day", "hour", "month"):
-        date_trunc = f"date_trunc('{group}', time)"
     else:
-        raise ValueError(f"Invalid group value: {group}")
+        date_trunc = f"date_trunc('{group}', time)"
 
-    transactions = await db.fetchall(
+    rows = await db.fetchall(
         f"""
         SELECT {date_trunc} date,
                SUM(CASE WHEN amount > 0 THEN amount ELSE 0 END) income,
@@ -1027,36 +1243,275 @@ async def get_payments_history(
         """,
         filters.values(values),
     )
+    return [(row[0], row[1], row[2]) for row in rows]
+
+
+async def _get_closed_payments_history(
+    wallet_id: Optional[str], group: DateTrunc
+) -> List[Tuple[datetime.datetime, int, int]]:
+    """
+    History of the periods before the current one. Those only change when an old
+    payment is updated, which increments the version in the database (see
+    `_add_to_payments_history`), so the cache of every worker notices it.
+    """
+    key = f"payments_history:{wallet_id or '*'}:{group}"
+    current_period = _truncate_timestamp(int(time()), group)
+    # read before the history, a concurrent change then invalidates the cache
+    version = await _get_payments_history_version(wallet_id)
+    cached = cache.get(key)
+    if cached and cached[:2] == (current_period, version):
+        return cached[2]
+    history = await _get_payments_history_buckets(
+        wallet_id, group, until=current_period
+    )
+    cache.set(key, (current_period, version, history), expiry=3600)
+    return history
+
+
+async def _get_payments_history_version(wallet_id: Optional[str]) -> int:
     if wallet_id:
-        wallet = await get_wallet(wallet_id)
-        if wallet:
-            balance = wallet.balance_msat
-        else:
-            raise ValueError("Unknown wallet")
+        row = await db.fetchone(
+            "SELECT version FROM payments_history_versions WHERE wallet = ?",
+            (wallet_id,),
+        )
     else:
-        balance = await get_total_balance()
+        # versions only grow and are not deleted, so neither does the sum
+        row = await db.fetchone("SELECT SUM(version) FROM payments_history_versions")
+    return row[0] if row and row[0] else 0
 
-    # since we dont know the balance at the starting point,
-    # we take the current balance and walk backwards
-    results: list[PaymentHistoryPoint] = []
-    for row in transactions:
-        results.insert(
-            0,
-            PaymentHistoryPoint(
-                balance=balance, date=row[0], income=row[1], spending=row[2]
-            ),
+
+async def _get_payments_history_buckets(
+    wallet_id: Optional[str],
+    group: DateTrunc,
+    since: Optional[int] = None,
+    until: Optional[int] = None,
+) -> List[Tuple[datetime.datetime, int, int]]:
+    """
+    Sum the hourly buckets into `group` sized periods, latest first.
+    """
+    where = []
+    values: List[Any] = []
+    if wallet_id:
+        where.append("wallet = ?")
+        values.append(wallet_id)
+    if since is not None:
+        where.append("hour >= ?")
+        values.append(since)
+    if until is not None:
+        where.append("hour < ?")
+        values.append(until)
+    clause = f"WHERE {' AND '.join(where)}" if where else ""
+
+    rows = await db.fetchall(
+        f"""
+        SELECT hour, SUM(income) AS income, SUM(spending) AS spending
+        FROM payments_history
+        {clause}
+        GROUP BY hour
+        ORDER BY hour DESC
+        """,
+        tuple(values),
+    )
+
+    periods: List[Tuple[datetime.datetime, int, int]] = []
+    last_period = None
+    for row in rows:
+        period = _truncate_timestamp(row["hour"], group)
+        if period == last_period:
+            date, income, spending = periods[-1]
+            periods[-1] = (date, income + row["income"], spending + row["spending"])
+        else:
+            date = datetime.datetime.fromtimestamp(period, datetime.timezone.utc)
+            if DB_TYPE == SQLITE:
+                # like the naive dates of `strftime` in the filtered history
+                date = date.replace(tzinfo=None)
+            periods.append((date, row["income"], row["spending"]))
+            last_period = period
+    return [period for period in periods if period[1] or period[2]]
+
+
+def _truncate_timestamp(timestamp: int, group: DateTrunc) -> int:
+    if group == "hour":
+        return timestamp - timestamp % 3600
+    if group == "day":
+        return timestamp - timestamp % 86400
+    date = datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc)
+    return int(date.replace(day=1, hour=0, minute=0, second=0).timestamp())
+
+
+async def _add_to_payments_history(
+    wallet_id: str,
+    epoch: int,
+    income: int,
+    spending: int,
+    conn: Optional[Connection] = None,
+) -> None:
+    """
+    `epoch` of the payment time, from `db.timestamp_to_epoch` like in the
+    migration that filled the buckets.
+    """
+    if not income and not spending:
+        return
+    hour = _truncate_timestamp(int(epoch), "hour")
+    await (conn or db).execute(
+        """
+        INSERT INTO payments_history (wallet, hour, income, spending)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT (wallet, hour) DO UPDATE SET
+            income = payments_history.income + ?,
+            spending = payments_history.spending + ?
+        """,
+        (wallet_id, hour, income, spending, income, spending),
+    )
+    if hour < _truncate_timestamp(int(time()), "hour"):
+        # an already closed period changed
+        await (conn or db).execute(
+            """
+            INSERT INTO payments_history_versions (wallet, version) VALUES (?, 1)
+            ON CONFLICT (wallet) DO UPDATE
+            SET version = payments_history_versions.version + 1
+            """,
+            (wallet_id,),
         )
-        balance -= row.income - row.spending
-    return results
 
 
 async def delete_wallet_payment(
     checking_id: str, wallet_id: str, conn: Optional[Connection] = None
 ) -> None:
+    async with db.reuse_conn(conn) if conn else db.connect() as new_conn:
+        rows = await new_conn.fetchall(
+            f"""
+            SELECT amount, fee, pending, {db.timestamp_to_epoch("time")} AS epoch
+            FROM apipayments WHERE checking_id = ? AND wallet = ?
+            """,
+            (checking_id, wallet_id),
+        )
+        await new_conn.execute(
+            "DELETE FROM apipayments WHERE checking_id = ? AND wallet = ?",
+            (checking_id, wallet_id),
+        )
+        await refresh_wallet_stats(wallet_id, conn=new_conn)
+        for row in rows:
+            income, spending = _payment_totals(
+                row["amount"], row["fee"], row["pending"]
+            )
+            await _add_to_payments_history(
+                wallet_id, row["epoch"], -income, -spending, new_conn
+            )
+
+
+# wallet stats
+# ------------
+
+
+def _payment_totals(amount: int, fee: int, pending: bool) -> Tuple[int, int]:
+    """
+    Income and spending a payment accounts for, same rules as the `balances` view:
+    incoming payments count once settled, outgoing ones (with fees) right away.
+    """
+    if amount > 0 and not pending:
+        return amount, 0
+    if amount < 0:
+        return 0, abs(amount) + abs(fee)
+    return 0, 0
+
+
+def _balance_contribution(amount: int, fee: int, pending: bool) -> int:
+    income, spending = _payment_totals(amount, fee, pending)
+    return income - spending
+
+
+async def _add_to_wallet_stats(
+    wallet_id: str,
+    balance_msat: int = 0,
+    transaction_count: int = 0,
+    new_payment: bool = False,
+    conn: Optional[Connection] = None,
+) -> None:
+    last_payment = db.timestamp_now if new_payment else "NULL"
+    # every write to the wallet or its payments bumps its version
     await (conn or db).execute(
-        "DELETE FROM apipayments WHERE checking_id = ? AND wallet = ?",
-        (checking_id, wallet_id),
+        f"""
+        INSERT INTO wallet_stats
+            (wallet, balance_msat, transaction_count, last_payment, version)
+        VALUES (?, ?, ?, {last_payment}, 1)
+        ON CONFLICT (wallet) DO UPDATE SET
+            balance_msat = wallet_stats.balance_msat + ?,
+            transaction_count = wallet_stats.transaction_count + ?,
+            last_payment = COALESCE({last_payment}, wallet_stats.last_payment),
+            version = wallet_stats.version + 1
+        """,
+        (
+            wallet_id,
+            balance_msat,
+            transaction_count,
+            balance_msat,
+            transaction_count,
+        ),
+    )
+
+
+async def _bump_wallet_versions(
+    *wallet_ids: str, conn: Optional[Connection] = None
+) -> None:
+    # in the transaction of the write, in a fixed order to not deadlock
+    for wallet_id in sorted(set(wallet_ids)):
+        await _add_to_wallet_stats(wallet_id, conn=conn)
+
+
+async def get_wallet_version_for_key(key: str) -> Optional[Tuple[str, int]]:
+    """
+    The id and the version of the wallet of an api key. The version is bumped by
+    every write to the wallet or its payments, by any worker.
+    """
+    row = await db.fetchone(
+        """
+        SELECT wallets.id, COALESCE(wallet_stats.version, 0) AS version
+        FROM wallets
+        LEFT JOIN wallet_stats ON wallet_stats.wallet = wallets.id
+        WHERE (adminkey = ? OR inkey = ?) AND deleted = false
+        """,
+        (key, key),
     )
+    return (row["id"], row["version"]) if row else None
+
+
+async def refresh_wallet_stats(
+    wallet_id: str, conn: Optional[Connection] = None
+) -> None:
+    """
+    Recalculate the stats of a wallet from its payments, its version is kept.
+    """
+    async with db.reuse_conn(conn) if conn else db.connect() as new_conn:
+        await new_conn.execute(
+            """
+            UPDATE wallet_stats
+            SET balance_msat = 0, transaction_count = 0, last_payment = NULL,
+                version = version + 1
+            WHERE wallet = ?
+            """,
+            (wallet_id,),
+        )
+        await new_conn.execute(
+            """
+            INSERT INTO wallet_stats
+                (wallet, balance_msat, transaction_count, last_payment, version)
+            SELECT wallet,
+                   SUM(CASE WHEN (pending = false AND amount > 0) OR amount < 0
+                       THEN amount - ABS(fee) ELSE 0 END),
+                   COUNT(*),
+                   MAX(time),
+                   1
+            FROM apipayments
+            WHERE wallet = ?
+            GROUP BY wallet
+            ON CONFLICT (wallet) DO UPDATE SET
+                balance_msat = excluded.balance_msat,
+                transaction_count = excluded.transaction_count,
+                last_payment = excluded.last_payment
+            """,
+            (wallet_id,),
+        )
 
 
 async def check_internal(
@@ -1100,12 +1555,38 @@ async def check_internal_pending(
 
 
 async def mark_webhook_sent(payment_hash: str, status: int) -> None:
+    async with db.connect() as conn:
+        rows = await conn.fetchall(
+            "SELECT wallet FROM apipayments WHERE hash = ?", (payment_hash,)
+        )
+        await conn.execute(
+            """
+            UPDATE apipayments SET webhook_status = ?
+            WHERE hash = ?
+            """,
+            (status, payment_hash),
+        )
+        await _bump_wallet_versions(*[row["wallet"] for row in rows], conn=conn)
+
+
+async def get_invoice_stream_cursor(funding_source: str) -> Optional[int]:
+    row = await db.fetchone(
+        "SELECT last_index FROM invoice_stream_cursors WHERE funding_source = ?",
+        (funding_source,),
+    )
+    return row["last_index"] if row else None
+
+
+async def update_invoice_stream_cursor(funding_source: str, last_index: int) -> None:
+    now = int(time())
     await db.execute(
-        """
-        UPDATE apipayments SET webhook_status = ?
-        WHERE hash = ?
+        f"""
+        INSERT INTO invoice_stream_cursors (funding_source, last_index, updated_at)
+        VALUES (?, ?, {db.timestamp_placeholder})
+        ON CONFLICT (funding_source) DO UPDATE SET
+            last_index = ?, updated_at = {db.timestamp_placeholder}
         """,
-        (status, payment_hash),
+        (funding_source, last_index, now, last_index, now),
     )
 
 
@@ -1141,17 +1622,41 @@ async def delete_admin_settings() -> None:
     await db.execute("DELETE FROM settings")
 
 
-async def update_admin_settings(data: EditableSettings) -> None:
-    row = await db.fetchone("SELECT editable_settings FROM settings")
-    editable_settings = json.loads(row["editable_settings"]) if row else {}
-    editable_settings.update(data.dict(exclude_unset=True))
-    await db.execute(
-        "UPDATE settings SET editable_settings = ?", (json.dumps(editable_settings),)
-    )
+async def update_admin_settings(
+    data: EditableSettings, conn: Optional[Connection] = None
+) -> Optional[int]:
+    """Returns the new version of the settings."""
+    async with db.reuse_conn(conn) if conn else db.connect() as new_conn:
+        while True:
+            row = await new_conn.fetchone(
+                "SELECT editable_settings, version FROM settings"
+            )
+            if not row:
+                return None
+            editable_settings = json.loads(row["editable_settings"])
+            editable_settings.update(data.dict(exclude_unset=True))
+            # only written if the settings were not changed (by another worker)
+            # since they were read, otherwise merged into the changed ones again
+            result = await new_conn.execute(
+                """
+                UPDATE settings SET editable_settings = ?, version = version + 1
+                WHERE version = ?
+                """,
+                (json.dumps(editable_settings), row["version"]),
+            )
+            if result.rowcount:
+                return row["version"] + 1
+
+
+async def get_settings_version() -> Optional[int]:
+    row = await db.fetchone("SELECT version FROM settings")
+    return row["version"] if row else None
 
 
 async def update_super_user(super_user: str) -> SuperSettings:
-    await db.execute("UPDATE settings SET super_user = ?", (super_user,))
+    await db.execute(
+        "UPDATE settings SET super_user = ?, version = version + 1", (super_user,)
+    )
     settings = await get_super_settings()
     assert settings, "updated super_user settings could not be retrieved"
     return settings
@@ -1309,3 +1814,13 @@ async def delete_webpush_subscriptions(endpoint: str) -> None:
     await db.execute(
         "DELETE FROM webpush_subscriptions WHERE endpoint = ?", (endpoint,)
     )
+
+
+async def delete_webpush_subscriptions_for_endpoints(endpoints: List[str]) -> None:
+    if not endpoints:
+        return
+    placeholders = ", ".join(["?"] * len(endpoints))
+    await db.execute(
+        f"DELETE FROM webpush_subscriptions WHERE endpoint IN ({placeholders})",
+        tuple(endpoints),
+    )
@@ -1,20 +1,140 @@
 import importlib
+import inspect
 import re
-from typing import Any, Optional
+import time
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional
 from uuid import UUID
 
 import httpx
 from loguru import logger
 
 from lnbits.core.db import db as core_db
-from lnbits.db import Connection
+from lnbits.db import SQLITE, Connection, Database
 from lnbits.extension_manager import Extension
 from lnbits.settings import settings
 
 from .crud import update_migration_version
 
+migration_matcher = re.compile(r"^m(\d\d\d)_(\w+)$")
+statement_table_matcher = re.compile(
+    r"^\s*(?:UPDATE|INSERT\s+INTO|DELETE\s+FROM|ALTER\s+TABLE|DROP\s+TABLE"
+    r"(?:\s+IF\s+EXISTS)?|CREATE\s+(?:UNIQUE\s+)?INDEX\s+(?:IF\s+NOT\s+EXISTS\s+)?"
+    r"\S+\s+ON)\s+([\w.\"]+)",
+    re.IGNORECASE,
+)
 
-async def migrate_extension_database(ext: Extension, current_version):
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    migrate: Callable[[Connection], Awaitable[Any]]
+
+    @property
+    def description(self) -> str:
+        return (inspect.getdoc(self.migrate) or "").split("\n")[0]
+
+
+class ExplainedStatement(NamedTuple):
+    query: str
+    table: Optional[str]
+    rows: Optional[int] = None
+
+
+class MigrationRun(NamedTuple):
+    db_name: str
+    migration: Migration
+    seconds: Optional[float] = None
+    statements: List[ExplainedStatement] = []
+    error: Optional[str] = None
+
+
+class _NoResult:
+    rowcount = 0
+
+    async def fetchall(self) -> list:
+        return []
+
+    async def fetchone(self) -> None:
+        return None
+
+    async def close(self):
+        pass
+
+
+class ExplainConnection(Connection):
+    """
+    Runs the reads of a migration and records its writes instead of executing
+    them, for a dry-run of the migration.
+    """
+
+    def __init__(self, conn: Connection):
+        super().__init__(
+            conn.conn, conn.txn, conn.type, conn.name, conn.schema, conn.driver
+        )
+        self.statements: List[ExplainedStatement] = []
+
+    async def execute(self, query: str, values: tuple = ()):
+        if query.lstrip().upper().startswith(("SELECT", "PRAGMA")):
+            return await super().execute(query, values)
+        match = statement_table_matcher.match(query)
+        self.statements.append(
+            ExplainedStatement(" ".join(query.split()), match[1] if match else None)
+        )
+        return _NoResult()
+
+
+def get_migrations(migrations_module: Any, current_version: int = 0) -> List[Migration]:
+    """The migrations of the module after `current_version`, sorted by version."""
+    migrations: Dict[int, Migration] = {}
+    for key, migrate in vars(migrations_module).items():
+        match = migration_matcher.match(key)
+        if not match or not callable(migrate):
+            continue
+        version = int(match[1])
+        if version in migrations:
+            raise ValueError(
+                f"Migrations `{migrations[version].migrate.__name__}` and `{key}`"
+                f" of {migrations_module.__name__} have the same version."
+            )
+        migrations[version] = Migration(version, match[2], migrate)
+    return [migrations[v] for v in sorted(migrations) if v > current_version]
+
+
+async def explain_migration(
+    db: Database, db_name: str, migration: Migration
+) -> MigrationRun:
+    """
+    The statements the migration would execute and the number of rows of the
+    tables they change, without changing anything. A migration that reads what
+    an earlier statement of it would change is explained up to that read.
+    """
+    error = None
+    async with db.connect() as conn:
+        explain_conn = ExplainConnection(conn)
+        try:
+            await migration.migrate(explain_conn)
+        except Exception as exc:
+            error = f"explained up to a read of a change: {exc!s}".split("\n")[0]
+
+    rows: Dict[str, Optional[int]] = {}
+    for table in {s.table for s in explain_conn.statements if s.table}:
+        try:
+            # one transaction each, a failed query aborts it on postgres
+            async with db.connect() as conn:
+                row = await conn.fetchone(f"SELECT COUNT(*) FROM {table}")
+                rows[table] = row[0]
+        except Exception:
+            rows[table] = None  # created by the migration
+    statements = [
+        s._replace(rows=rows.get(s.table)) if s.table else s
+        for s in explain_conn.statements
+    ]
+    return MigrationRun(db_name, migration, statements=statements, error=error)
+
+
+async def migrate_extension_database(
+    ext: Extension, current_version, dry_run: bool = False, explain: bool = False
+) -> List[MigrationRun]:
     try:
         ext_migrations = importlib.import_module(f"{ext.module_name}.migrations")
         ext_db = importlib.import_module(ext.module_name).db
@@ -24,28 +144,52 @@ async def migrate_extension_database(ext: Extension, current_version):
             f"Please make sure that the extension `{ext.code}` has a migrations file."
         ) from exc
 
-    async with ext_db.connect() as ext_conn:
-        await run_migration(ext_conn, ext_migrations, ext.code, current_version)
+    return await run_migration(
+        ext_db, ext_migrations, ext.code, current_version, dry_run, explain
+    )
 
 
 async def run_migration(
-    db: Connection, migrations_module: Any, db_name: str, current_version: int
-):
-    matcher = re.compile(r"^m(\d\d\d)_")
-    for key, migrate in migrations_module.__dict__.items():
-        match = matcher.match(key)
-        if match:
-            version = int(match.group(1))
-            if version > current_version:
-                logger.debug(f"running migration {db_name}.{version}")
-                print(f"running migration {db_name}.{version}")
-                await migrate(db)
-
-                if db.schema is None:
-                    await update_migration_version(db, db_name, version)
-                else:
-                    async with core_db.connect() as conn:
-                        await update_migration_version(conn, db_name, version)
+    db: Database,
+    migrations_module: Any,
+    db_name: str,
+    current_version: int,
+    dry_run: bool = False,
+    explain: bool = False,
+) -> List[MigrationRun]:
+    """
+    Runs the migrations after `current_version` in the order of their versions,
+    each in its own transaction together with the update of the version, and
+    records how long each took. A dry-run only lists them, or explains them.
+    """
+    runs = []
+    for migration in get_migrations(migrations_module, current_version):
+        if dry_run:
+            runs.append(
+                await explain_migration(db, db_name, migration)
+                if explain
+                else MigrationRun(db_name, migration)
+            )
+            continue
+
+        logger.info(f"running migration {db_name}.{migration.version}")
+        start = time.monotonic()
+        async with db.connect() as conn:
+            await migration.migrate(conn)
+            # the versions are in the core database, the extension schemas are
+            # separate sqlite files
+            if db.type != SQLITE or db.schema is None:
+                await update_migration_version(conn, db_name, migration.version)
+        if db.type == SQLITE and db.schema is not None:
+            async with core_db.connect() as conn:
+                await update_migration_version(conn, db_name, migration.version)
+        seconds = time.monotonic() - start
+        logger.info(
+            f"migration {db_name}.{migration.version} {migration.name}"
+            f" done in {seconds:.3f}s"
+        )
+        runs.append(MigrationRun(db_name, migration, seconds))
+    return runs
 
 
 async def stop_extension_background_work(
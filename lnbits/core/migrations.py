@@ -1,4 +1,3 @@
-import datetime
 from time import time
 
 from loguru import logger
@@ -102,28 +101,16 @@ async def m002_add_fields_to_apipayments(db):
 
         import json
 
-        rows = await (await db.execute("SELECT * FROM apipayments")).fetchall()
-        for row in rows:
-            if not row["memo"] or not row["memo"].startswith("#"):
-                continue
-
-            for ext in ["withdraw", "events", "lnticket", "paywall", "tpos"]:
-                prefix = f"#{ext} "
-                if row["memo"].startswith(prefix):
-                    new = row["memo"][len(prefix) :]
-                    await db.execute(
-                        """
-                        UPDATE apipayments SET extra = ?, memo = ?
-                        WHERE checking_id = ? AND memo = ?
-                        """,
-                        (
-                            json.dumps({"tag": ext}),
-                            new,
-                            row["checking_id"],
-                            row["memo"],
-                        ),
-                    )
-                    break
+        # one statement per extension instead of one per payment
+        for ext in ["withdraw", "events", "lnticket", "paywall", "tpos"]:
+            prefix = f"#{ext} "
+            await db.execute(
+                """
+                UPDATE apipayments SET extra = ?, memo = SUBSTR(memo, ?)
+                WHERE SUBSTR(memo, 1, ?) = ?
+                """,
+                (json.dumps({"tag": ext}), len(prefix) + 1, len(prefix), prefix),
+            )
     except OperationalError:
         # this is necessary now because it may be the case that this migration will
         # run twice in some environments.
@@ -212,49 +199,38 @@ async def m007_set_invoice_expiries(db):
     Precomputes invoice expiry for existing pending incoming payments.
     """
     try:
-        rows = await (
-            await db.execute(
-                f"""
-                SELECT bolt11, checking_id
-                FROM apipayments
-                WHERE pending = true
-                AND amount > 0
-                AND bolt11 IS NOT NULL
-                AND expiry IS NULL
-                AND time < {db.timestamp_now}
-                """
-            )
-        ).fetchall()
-        if len(rows):
-            logger.info(f"Migration: Checking expiry of {len(rows)} invoices")
-        for i, (
-            payment_request,
-            checking_id,
-        ) in enumerate(rows):
-            try:
-                invoice = bolt11.decode(payment_request)
-                if invoice.expiry is None:
+        checked = 0
+        # in batches, so that the invoices are not all loaded at once
+        async for rows in db.fetch_batches(
+            f"""
+            SELECT bolt11, checking_id
+            FROM apipayments
+            WHERE pending = true
+            AND amount > 0
+            AND bolt11 IS NOT NULL
+            AND expiry IS NULL
+            AND time < {db.timestamp_now}
+            """,
+            key="checking_id",
+        ):
+            expiries = []
+            for payment_request, checking_id in rows:
+                try:
+                    invoice = bolt11.decode(payment_request)
+                except Exception:
                     continue
-
-                expiration_date = datetime.datetime.fromtimestamp(
-                    invoice.date + invoice.expiry
-                )
-                logger.info(
-                    f"Migration: {i+1}/{len(rows)} setting expiry of invoice"
-                    f" {invoice.payment_hash} to {expiration_date}"
-                )
-                await db.execute(
-                    """
-                    UPDATE apipayments SET expiry = ?
-                    WHERE checking_id = ? AND amount > 0
-                    """,
-                    (
-                        db.datetime_to_timestamp(expiration_date),
-                        checking_id,
-                    ),
-                )
-            except Exception:
-                continue
+                if invoice.expiry is not None:
+                    expiries.append((checking_id, invoice.date + invoice.expiry))
+            await db.update_many(
+                "apipayments",
+                "checking_id",
+                ["expiry"],
+                expiries,
+                where="AND amount > 0",
+                placeholders=[db.timestamp_placeholder],
+            )
+            checked += len(rows)
+            logger.info(f"Migration: checked the expiry of {checked} invoices")
     except OperationalError:
         # this is necessary now because it may be the case that this migration will
         # run twice in some environments.
@@ -347,32 +323,17 @@ async def m014_set_deleted_wallets(db):
     Sets deleted column to wallets.
     """
     try:
-        rows = await (
-            await db.execute(
-                """
-                SELECT *
-                FROM wallets
-                WHERE user LIKE 'del:%'
-                AND adminkey LIKE 'del:%'
-                AND inkey LIKE 'del:%'
-                """
-            )
-        ).fetchall()
-
-        for row in rows:
-            try:
-                user = row[2].split(":")[1]
-                adminkey = row[3].split(":")[1]
-                inkey = row[4].split(":")[1]
-                await db.execute(
-                    """
-                    UPDATE wallets SET user = ?, adminkey = ?, inkey = ?, deleted = true
-                    WHERE id = ?
-                    """,
-                    (user, adminkey, inkey, row[0]),
-                )
-            except Exception:
-                continue
+        # one statement instead of one per wallet, strips the `del:` prefixes
+        await db.execute(
+            """
+            UPDATE wallets SET "user" = SUBSTR("user", 5),
+                adminkey = SUBSTR(adminkey, 5), inkey = SUBSTR(inkey, 5),
+                deleted = true
+            WHERE "user" LIKE 'del:%'
+            AND adminkey LIKE 'del:%'
+            AND inkey LIKE 'del:%'
+            """
+        )
     except OperationalError:
         # this is necessary now because it may be the case that this migration will
         # run twice in some environments.
@@ -512,3 +473,122 @@ async def m019_balances_view_based_on_wallets(db):
         GROUP BY apipayments.wallet
     """
     )
+
+
+async def m020_add_wallet_stats(db):
+    """
+    Per wallet statistics (balance, number of payments and time of the last
+    payment), kept up to date by the payment crud functions so that listing
+    accounts does not have to aggregate over all payments.
+    """
+    await db.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS wallet_stats (
+            wallet TEXT PRIMARY KEY,
+            balance_msat {db.big_int} NOT NULL DEFAULT 0,
+            transaction_count INT NOT NULL DEFAULT 0,
+            last_payment TIMESTAMP
+        );
+    """
+    )
+    await db.execute(
+        """
+        INSERT INTO wallet_stats
+            (wallet, balance_msat, transaction_count, last_payment)
+        SELECT wallet,
+               SUM(CASE WHEN (pending = false AND amount > 0) OR amount < 0
+                   THEN amount - ABS(fee) ELSE 0 END),
+               COUNT(*),
+               MAX(time)
+        FROM apipayments
+        GROUP BY wallet
+    """
+    )
+
+
+async def m021_add_payments_history(db):
+    """
+    Hourly income and spending per wallet, kept up to date by the payment crud
+    functions, so the payments history does not aggregate over all payments.
+    """
+    await db.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS payments_history (
+            wallet TEXT NOT NULL,
+            hour {db.big_int} NOT NULL,
+            income {db.big_int} NOT NULL DEFAULT 0,
+            spending {db.big_int} NOT NULL DEFAULT 0,
+            PRIMARY KEY (wallet, hour)
+        );
+    """
+    )
+    await db.execute(
+        f"""
+        INSERT INTO payments_history (wallet, hour, income, spending)
+        SELECT wallet, ({db.timestamp_to_epoch("time")} / 3600) * 3600 AS hour,
+               SUM(CASE WHEN amount > 0 THEN amount ELSE 0 END),
+               SUM(CASE WHEN amount < 0 THEN ABS(amount) + ABS(fee) ELSE 0 END)
+        FROM apipayments
+        WHERE pending = false OR amount < 0
+        GROUP BY wallet, hour
+    """
+    )
+
+
+async def m022_add_invoice_stream_cursors(db):
+    """
+    Last seen settle/pay index of the funding source's paid invoices stream, so
+    it can resume without gaps after a reconnect or a restart.
+    """
+    await db.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS invoice_stream_cursors (
+            funding_source TEXT PRIMARY KEY,
+            last_index {db.big_int} NOT NULL,
+            updated_at TIMESTAMP
+        );
+    """
+    )
+
+
+async def m023_add_payment_funding_source(db):
+    """
+    Backend of a routing funding source (`RouterWallet`) that holds the payment,
+    the status checks are sent to it.
+    """
+    await db.execute("ALTER TABLE apipayments ADD COLUMN funding_source TEXT")
+
+
+async def m024_add_settings_version(db):
+    """
+    Incremented with every change of the admin settings, so other workers and
+    instances on the same database notice the change and apply it.
+    """
+    await db.execute(
+        "ALTER TABLE settings ADD COLUMN version INTEGER NOT NULL DEFAULT 0"
+    )
+
+
+async def m025_add_payments_history_versions(db):
+    """
+    Incremented when the payments history of a wallet changes in an already
+    closed hour, so every worker knows when its cached history is outdated.
+    """
+    await db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS payments_history_versions (
+            wallet TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        );
+    """
+    )
+
+
+async def m026_add_wallet_version(db):
+    """
+    Incremented with every write to a wallet or its payments, the ETags of the
+    polled wallet endpoints are made from it, so they hold for every worker.
+    """
+    await db.execute(
+        "ALTER TABLE wallet_stats ADD COLUMN version INTEGER NOT NULL DEFAULT 0"
+    )
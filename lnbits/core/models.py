@@ -151,13 +151,9 @@ class User(BaseModel):
 
     @classmethod
     def is_extension_for_user(cls, ext: str, user: str) -> bool:
-        if ext not in settings.lnbits_admin_extensions:
+        if ext not in settings.snapshot.admin_extensions:
             return True
-        if user == settings.super_user:
-            return True
-        if user in settings.lnbits_admin_users:
-            return True
-        return False
+        return settings.is_admin_user(user)
 
 
 class CreateUser(BaseModel):
@@ -212,6 +208,8 @@ class Payment(FromRowModel):
     wallet_id: str
     webhook: Optional[str]
     webhook_status: Optional[int]
+    # backend of a routing funding source that holds the payment
+    funding_source: Optional[str] = None
 
     @classmethod
     def from_row(cls, row: Row):
@@ -230,6 +228,7 @@ class Payment(FromRowModel):
             wallet_id=row["wallet"],
             webhook=row["webhook"],
             webhook_status=row["webhook_status"],
+            funding_source=row["funding_source"],
         )
 
     @property
@@ -296,7 +295,7 @@ class Payment(FromRowModel):
             f"pending payment {self.checking_id}"
         )
 
-        funding_source = get_funding_source()
+        funding_source = get_funding_source().get_backend(self.funding_source)
         if self.is_out:
             status = await funding_source.get_payment_status(self.checking_id)
         else:
@@ -421,6 +420,42 @@ class CreateInvoice(BaseModel):
     lnurl_callback: Optional[str] = None
 
 
+class CreateInvoiceResult(BaseModel):
+    payment_hash: Optional[str] = None
+    payment_request: Optional[str] = None
+    checking_id: Optional[str] = None
+    error: Optional[str] = None
+
+
+class PayInvoices(BaseModel):
+    bolt11: List[str]
+    extra: Optional[dict] = None
+
+
+class PayInvoiceResult(BaseModel):
+    index: int
+    payment_hash: Optional[str] = None
+    checking_id: Optional[str] = None
+    status: str = "pending"  # success | pending | failed
+    error: Optional[str] = None
+
+
+class CreatePayment(BaseModel):
+    wallet_id: str
+    checking_id: str
+    payment_request: str
+    payment_hash: str
+    amount: int
+    memo: str
+    fee: int = 0
+    preimage: Optional[str] = None
+    expiry: Optional[datetime.datetime] = None
+    pending: bool = True
+    extra: Optional[Dict] = None
+    webhook: Optional[str] = None
+    funding_source: Optional[str] = None
+
+
 class CreateTopup(BaseModel):
     id: str
     amount: int
@@ -449,6 +484,7 @@ class WebPushSubscription(BaseModel):
 class BalanceDelta(BaseModel):
     lnbits_balance_msats: int
     node_balance_msats: int
+    error_message: Optional[str] = None
 
     @property
     def delta_msats(self):
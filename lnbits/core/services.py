@@ -4,10 +4,19 @@ import json
 import time
 from io import BytesIO
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple, TypedDict
+from typing import (
+    AsyncGenerator,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+    TypedDict,
+)
 from urllib.parse import parse_qs, urlparse
 
-import httpx
+from bolt11 import Bolt11
 from bolt11 import decode as bolt11_decode
 from cryptography.hazmat.primitives import serialization
 from fastapi import Depends, WebSocket
@@ -15,22 +24,30 @@ from loguru import logger
 from py_vapid import Vapid
 from py_vapid.utils import b64urlencode
 
-from lnbits.core.db import db
-from lnbits.db import Connection
+from lnbits.core.db import core_app_extra, db
+from lnbits.db import Connection, is_integrity_error
 from lnbits.decorators import WalletTypeInfo, require_admin_key
 from lnbits.helpers import url_for
 from lnbits.lnurl import LnurlErrorResponse
 from lnbits.lnurl import decode as decode_lnurl
 from lnbits.settings import (
     EditableSettings,
+    Settings,
     SuperSettings,
     readonly_variables,
     send_admin_user_to_saas,
     settings,
 )
-from lnbits.utils.exchange_rates import fiat_amount_as_satoshis, satoshis_amount_as_fiat
+from lnbits.utils.exchange_rates import (
+    fiat_amount_as_satoshis,
+    get_fiat_rate_satoshis,
+    satoshis_amount_as_fiat,
+)
+from lnbits.utils.metrics import open_connections
+from lnbits.utils.outbound import outbound_client
 from lnbits.wallets import fake_wallet, get_funding_source, set_funding_source
 from lnbits.wallets.base import (
+    InvoiceResponse,
     PaymentPendingStatus,
     PaymentResponse,
     PaymentStatus,
@@ -43,10 +60,12 @@ from .crud import (
     create_account,
     create_admin_settings,
     create_payment,
+    create_payments,
     create_wallet,
     delete_wallet_payment,
     get_account,
     get_payments,
+    get_settings_version,
     get_standalone_payment,
     get_super_settings,
     get_total_balance,
@@ -58,7 +77,16 @@ from .crud import (
     update_super_user,
 )
 from .helpers import to_valid_user_id
-from .models import BalanceDelta, Payment, UserConfig, Wallet
+from .models import (
+    BalanceDelta,
+    CreateInvoice,
+    CreateInvoiceResult,
+    CreatePayment,
+    PayInvoiceResult,
+    Payment,
+    UserConfig,
+    Wallet,
+)
 
 
 class PaymentError(Exception):
@@ -79,8 +107,9 @@ async def calculate_fiat_amounts(
     currency: Optional[str] = None,
     extra: Optional[Dict] = None,
     conn: Optional[Connection] = None,
+    wallet: Optional[Wallet] = None,
 ) -> Tuple[int, Optional[Dict]]:
-    wallet = await get_wallet(wallet_id, conn=conn)
+    wallet = wallet or await get_wallet(wallet_id, conn=conn)
     assert wallet, "invalid wallet_id"
     wallet_currency = wallet.currency or settings.lnbits_default_accounting_currency
 
@@ -180,12 +209,148 @@ async def create_invoice(
         memo=memo,
         extra=extra,
         webhook=webhook,
+        funding_source=funding_source.backend_of(checking_id),
         conn=conn,
     )
 
     return invoice.payment_hash, payment_request
 
 
+async def create_invoices(
+    *,
+    wallet_id: str,
+    invoices: List[CreateInvoice],
+    conn: Optional[Connection] = None,
+) -> List[CreateInvoiceResult]:
+    """
+    Create many invoices for one wallet at once.
+    The fiat rates are fetched once for the whole batch, the funding source is
+    called concurrently (up to `lightning_batch_concurrency` calls at a time) and
+    all payments are inserted together. Every invoice gets a result in the same
+    order as requested, failed ones only have an `error`.
+    """
+    wallet = await get_wallet(wallet_id, conn=conn)
+    if not wallet:
+        raise InvoiceError(f"Could not fetch wallet '{wallet_id}'.", status="failed")
+
+    await _fetch_fiat_rates(wallet, {data.unit for data in invoices})
+
+    results: List[CreateInvoiceResult] = [CreateInvoiceResult()] * len(invoices)
+    pending: List[Tuple[int, CreateInvoice, int, Optional[Dict], bytes, bytes]] = []
+    balance_sat = wallet.balance_msat / 1000
+    for index, data in enumerate(invoices):
+        try:
+            if data.out or data.bolt11:
+                raise InvoiceError("Only invoices can be created in a batch.")
+            if data.lnurl_callback:
+                raise InvoiceError("'lnurl_callback' is not supported in a batch.")
+            if not data.amount or not data.amount > 0:
+                raise InvoiceError("Amountless invoices not supported.")
+            try:
+                description_hash = bytes.fromhex(data.description_hash or "")
+                unhashed_description = bytes.fromhex(data.unhashed_description or "")
+            except ValueError as exc:
+                raise InvoiceError("Descriptions must be valid hex strings.") from exc
+
+            amount_sat, extra = await calculate_fiat_amounts(
+                data.amount, wallet_id, data.unit, data.extra, conn=conn, wallet=wallet
+            )
+            balance_sat += amount_sat
+            if settings.is_wallet_max_balance_exceeded(balance_sat):
+                raise InvoiceError(
+                    f"Wallet balance cannot exceed "
+                    f"{settings.lnbits_wallet_limit_max_balance} sats."
+                )
+        except InvoiceError as exc:
+            results[index] = CreateInvoiceResult(error=exc.message)
+            continue
+        pending.append(
+            (index, data, amount_sat, extra, description_hash, unhashed_description)
+        )
+
+    semaphore = asyncio.Semaphore(settings.lightning_batch_concurrency)
+
+    async def _create_invoice(
+        data: CreateInvoice,
+        amount_sat: int,
+        description_hash: bytes,
+        unhashed_description: bytes,
+    ) -> InvoiceResponse:
+        funding_source = fake_wallet if data.internal else get_funding_source()
+        has_description = description_hash or unhashed_description
+        async with semaphore:
+            return await funding_source.create_invoice(
+                amount=amount_sat,
+                memo=None if has_description else _invoice_memo(data),
+                description_hash=description_hash,
+                unhashed_description=unhashed_description,
+                expiry=data.expiry or settings.lightning_invoice_expiry,
+            )
+
+    responses = await asyncio.gather(
+        *[_create_invoice(item[1], item[2], item[4], item[5]) for item in pending],
+        return_exceptions=True,
+    )
+
+    payments: List[CreatePayment] = []
+    for item, response in zip(pending, responses):
+        index, data, amount_sat, extra, description_hash, unhashed_description = item
+        if isinstance(response, BaseException):
+            logger.warning(f"Batch invoice creation failed: {response}")
+            results[index] = CreateInvoiceResult(error="unexpected backend error.")
+            continue
+        ok, checking_id, payment_request, error_message = response
+        if not ok or not payment_request or not checking_id:
+            results[index] = CreateInvoiceResult(
+                error=error_message or "unexpected backend error."
+            )
+            continue
+
+        invoice = bolt11_decode(payment_request)
+        has_description = description_hash or unhashed_description
+        funding_source = fake_wallet if data.internal else get_funding_source()
+        payments.append(
+            CreatePayment(
+                wallet_id=wallet_id,
+                checking_id=checking_id,
+                payment_request=payment_request,
+                payment_hash=invoice.payment_hash,
+                amount=amount_sat * 1000,
+                expiry=invoice.expiry_date,
+                # do not save memo if description_hash or unhashed_description is set
+                memo="" if has_description else _invoice_memo(data),
+                extra=extra,
+                webhook=data.webhook,
+                funding_source=funding_source.backend_of(checking_id),
+            )
+        )
+        results[index] = CreateInvoiceResult(
+            payment_hash=invoice.payment_hash,
+            payment_request=payment_request,
+            checking_id=checking_id,
+        )
+
+    await create_payments(payments, conn=conn)
+
+    return results
+
+
+def _invoice_memo(data: CreateInvoice) -> str:
+    return data.memo or settings.lnbits_site_title
+
+
+async def _fetch_fiat_rates(wallet: Wallet, currencies: Set[str]):
+    """
+    Fetch the fiat rates needed for a batch once, they are cached so
+    `calculate_fiat_amounts` won't fetch them again for every item.
+    """
+    wallet_currency = wallet.currency or settings.lnbits_default_accounting_currency
+    if wallet_currency:
+        currencies = currencies | {wallet_currency}
+    for currency in currencies - {"sat"}:
+        await get_fiat_rate_satoshis(currency)
+
+
 async def pay_invoice(
     *,
     wallet_id: str,
@@ -361,6 +526,7 @@ async def pay_invoice(
                     ),
                     preimage=payment.preimage,
                     new_checking_id=payment.checking_id,
+                    funding_source=funding_source.backend_of(payment.checking_id),
                     conn=conn,
                 )
                 wallet = await get_wallet(wallet_id, conn=conn)
@@ -402,6 +568,304 @@ async def pay_invoice(
     return invoice.payment_hash
 
 
+# keep references to running batch payments, see `pay_invoices`
+_batch_payment_tasks: Set[asyncio.Task] = set()
+
+
+class _BatchPayment(NamedTuple):
+    position: int
+    payment_request: str
+    invoice: Bolt11
+    internal_checking_id: Optional[str]
+
+
+async def pay_invoices(
+    *,
+    wallet_id: str,
+    payment_requests: List[str],
+    extra: Optional[Dict] = None,
+) -> AsyncGenerator[PayInvoiceResult, None]:
+    """
+    Pay many Lightning invoices from one wallet.
+    Like `pay_invoice`, every payment is first created as a temporary payment with
+    the fee reserve, but all of them together in one transaction, followed by a
+    single balance check. If the balance is too low none of the invoices is paid.
+    Internal invoices are settled right away, external ones are sent to the funding
+    source concurrently (`lightning_batch_concurrency` at a time). A failed payment
+    releases its reserved funds by deleting its temporary payment.
+
+    The payments are started before this returns, the results are returned as they
+    come in, invoices that could not be paid at all come first.
+    """
+    wallet = await get_wallet(wallet_id)
+    if not wallet:
+        raise PaymentError(f"Could not fetch wallet '{wallet_id}'.", status="failed")
+
+    rejected: List[PayInvoiceResult] = []
+    batch: List[_BatchPayment] = []
+    payment_hashes: Set[str] = set()
+    for index, payment_request in enumerate(payment_requests):
+        try:
+            try:
+                invoice = bolt11_decode(payment_request)
+            except Exception as exc:
+                raise PaymentError("Bolt11 decoding failed.") from exc
+            if not invoice.amount_msat or not invoice.amount_msat > 0:
+                raise PaymentError("Amountless invoices not supported.")
+            if invoice.payment_hash in payment_hashes:
+                raise PaymentError("Invoice is more than once in the batch.")
+        except PaymentError as exc:
+            rejected.append(
+                PayInvoiceResult(index=index, status="failed", error=exc.message)
+            )
+            continue
+        payment_hashes.add(invoice.payment_hash)
+        batch.append(_BatchPayment(index, payment_request, invoice, None))
+
+    if batch:
+        batch = await _reserve_batch_payments(wallet, batch, rejected, extra)
+
+    # the payments run as tasks so they are completed and recorded
+    # even if the client stops reading the results
+    results: asyncio.Queue[PayInvoiceResult] = asyncio.Queue()
+    semaphore = asyncio.Semaphore(settings.lightning_batch_concurrency)
+    for payment in batch:
+        task = asyncio.create_task(
+            _pay_batch_payment(wallet, payment, semaphore, results)
+        )
+        _batch_payment_tasks.add(task)
+        task.add_done_callback(_batch_payment_tasks.discard)
+
+    return _batch_payment_results(rejected, results, len(batch))
+
+
+async def _reserve_batch_payments(
+    wallet: Wallet,
+    batch: List[_BatchPayment],
+    rejected: List[PayInvoiceResult],
+    extra: Optional[Dict],
+) -> List[_BatchPayment]:
+    """
+    Create the temporary payments of the invoices that can be paid, the others are
+    added to `rejected`. The checks run in the same transaction as the inserts.
+    """
+    await _fetch_fiat_rates(wallet, set())
+    payment_extras: Dict[int, Optional[Dict]] = {}
+    for payment in batch:
+        _, payment_extras[payment.position] = await calculate_fiat_amounts(
+            (payment.invoice.amount_msat or 0) / 1000,
+            wallet.id,
+            extra=dict(extra or {}),
+            wallet=wallet,
+        )
+
+    async with db.connect() as conn:
+        reserved: List[_BatchPayment] = []
+        for payment in batch:
+            try:
+                reserved.append(await _check_batch_payment(payment, conn))
+            except PaymentError as exc:
+                rejected.append(
+                    PayInvoiceResult(
+                        index=payment.position, status="failed", error=exc.message
+                    )
+                )
+        if not reserved:
+            return []
+
+        total_msat = sum(payment.invoice.amount_msat or 0 for payment in reserved)
+        await check_wallet_limits(wallet.id, conn, total_msat)
+
+        temporary_payments = []
+        for payment in reserved:
+            amount_msat = payment.invoice.amount_msat or 0
+            internal = payment.internal_checking_id is not None
+            fee_reserve_total_msat = fee_reserve_total(amount_msat, internal=internal)
+            temporary_payments.append(
+                CreatePayment(
+                    wallet_id=wallet.id,
+                    checking_id=(
+                        f"internal_{payment.invoice.payment_hash}"
+                        if internal
+                        else payment.invoice.payment_hash
+                    ),
+                    payment_request=payment.payment_request,
+                    payment_hash=payment.invoice.payment_hash,
+                    amount=-amount_msat,
+                    expiry=payment.invoice.expiry_date,
+                    memo=payment.invoice.description or "",
+                    extra=payment_extras[payment.position],
+                    fee=-abs(fee_reserve_total_msat),
+                    pending=not internal,
+                )
+            )
+
+        try:
+            await create_payments(temporary_payments, conn=conn)
+        except Exception as exc:
+            # a concurrent request created one of the payments in the meantime
+            if not is_integrity_error(exc):
+                raise
+            raise PaymentError("Payment already exists.", status="failed") from exc
+        # one balance check for the whole batch,
+        # raising here rolls back all the temporary payments
+        updated_wallet = await get_wallet(wallet.id, conn=conn)
+        assert updated_wallet, "Wallet for balancecheck could not be fetched"
+        if updated_wallet.balance_msat < 0:
+            logger.debug("balance is too low, deleting temporary payments")
+            raise PaymentError("Insufficient balance.", status="failed")
+    return reserved
+
+
+async def _check_batch_payment(
+    payment: _BatchPayment, conn: Connection
+) -> _BatchPayment:
+    payment_hash = payment.invoice.payment_hash
+    if not await check_internal_pending(payment_hash, conn=conn):
+        raise PaymentError("Internal invoice already paid.")
+
+    internal_checking_id = await check_internal(payment_hash, conn=conn)
+    if internal_checking_id:
+        internal_invoice = await get_standalone_payment(
+            internal_checking_id, incoming=True, conn=conn
+        )
+        assert internal_invoice is not None
+        if (
+            internal_invoice.amount != payment.invoice.amount_msat
+            or internal_invoice.bolt11 != payment.payment_request.lower()
+        ):
+            raise PaymentError("Invalid invoice.")
+    checking_id = f"internal_{payment_hash}" if internal_checking_id else payment_hash
+    if await get_standalone_payment(checking_id, conn=conn):
+        raise PaymentError("Payment already exists.")
+    return payment._replace(internal_checking_id=internal_checking_id)
+
+
+async def _pay_batch_payment(
+    wallet: Wallet,
+    payment: _BatchPayment,
+    semaphore: asyncio.Semaphore,
+    results: asyncio.Queue[PayInvoiceResult],
+):
+    try:
+        if payment.internal_checking_id:
+            result = await _settle_batch_internal_payment(wallet, payment)
+        else:
+            async with semaphore:
+                result = await _send_batch_payment(wallet, payment)
+    except Exception as exc:
+        logger.warning(f"batch payment {payment.invoice.payment_hash}: {exc}")
+        result = PayInvoiceResult(
+            index=payment.position,
+            payment_hash=payment.invoice.payment_hash,
+            status="pending",
+            error="Unexpected error, payment may be stuck.",
+        )
+    await results.put(result)
+
+
+async def _batch_payment_results(
+    rejected: List[PayInvoiceResult],
+    results: asyncio.Queue[PayInvoiceResult],
+    count: int,
+) -> AsyncGenerator[PayInvoiceResult, None]:
+    for result in rejected:
+        yield result
+    for _ in range(count):
+        yield await results.get()
+
+
+async def _settle_batch_internal_payment(
+    wallet: Wallet, payment: _BatchPayment
+) -> PayInvoiceResult:
+    assert payment.internal_checking_id
+    payment_hash = payment.invoice.payment_hash
+    logger.debug(f"marking temporary payment as not pending {payment_hash}")
+    await update_payment_status(checking_id=payment.internal_checking_id, pending=False)
+    new_payment = await get_wallet_payment(wallet.id, payment_hash)
+    if new_payment:
+        await send_payment_notification(wallet, new_payment)
+
+    from lnbits.tasks import internal_invoice_queue
+
+    await internal_invoice_queue.put(payment.internal_checking_id)
+
+    await _credit_service_fee(
+        payment,
+        service_fee(payment.invoice.amount_msat or 0, internal=True),
+        f"internal_{payment_hash}",
+    )
+    return PayInvoiceResult(
+        index=payment.position,
+        payment_hash=payment_hash,
+        checking_id=f"internal_{payment_hash}",
+        status="success",
+    )
+
+
+async def _send_batch_payment(
+    wallet: Wallet, payment: _BatchPayment
+) -> PayInvoiceResult:
+    temp_id = payment.invoice.payment_hash
+    amount_msat = payment.invoice.amount_msat or 0
+    service_fee_msat = service_fee(amount_msat, internal=False)
+    funding_source = get_funding_source()
+    response: PaymentResponse = await funding_source.pay_invoice(
+        payment.payment_request, fee_reserve(amount_msat, internal=False)
+    )
+    result = PayInvoiceResult(
+        index=payment.position, payment_hash=temp_id, checking_id=response.checking_id
+    )
+
+    if response.checking_id and response.ok is not False:
+        async with db.connect() as conn:
+            await update_payment_details(
+                checking_id=temp_id,
+                pending=response.ok is not True,
+                fee=-(abs(response.fee_msat or 0) + abs(service_fee_msat)),
+                preimage=response.preimage,
+                new_checking_id=response.checking_id,
+                funding_source=funding_source.backend_of(response.checking_id),
+                conn=conn,
+            )
+            updated_wallet = await get_wallet(wallet.id, conn=conn)
+            updated = await get_wallet_payment(wallet.id, temp_id, conn=conn)
+        if updated_wallet and updated:
+            await send_payment_notification(updated_wallet, updated)
+        result.status = "success" if response.ok else "pending"
+    elif response.checking_id is None and response.ok is False:
+        logger.debug(f"deleting temporary payment {temp_id}")
+        await delete_wallet_payment(temp_id, wallet.id)
+        result.status = "failed"
+        result.error = f"Payment failed: {response.error_message}"
+        return result
+    else:
+        logger.warning(
+            "didn't receive checking_id from backend, payment may be stuck in"
+            f" database: {temp_id}"
+        )
+        result.status = "pending"
+
+    await _credit_service_fee(payment, service_fee_msat, temp_id)
+    return result
+
+
+async def _credit_service_fee(
+    payment: _BatchPayment, service_fee_msat: int, checking_id: str
+):
+    if settings.lnbits_service_fee_wallet and service_fee_msat:
+        await create_payment(
+            wallet_id=settings.lnbits_service_fee_wallet,
+            fee=0,
+            amount=abs(service_fee_msat),
+            memo="Service fee",
+            checking_id="service_fee" + checking_id,
+            payment_request=payment.payment_request,
+            payment_hash=payment.invoice.payment_hash,
+            pending=False,
+        )
+
+
 async def check_wallet_limits(wallet_id, conn, amount_msat):
     await check_time_limit_between_transactions(conn, wallet_id)
     await check_wallet_daily_withdraw_limit(conn, wallet_id, amount_msat)
@@ -468,11 +932,9 @@ async def redeem_lnurl_withdraw(
 
     res = {}
 
-    headers = {"User-Agent": settings.user_agent}
-    async with httpx.AsyncClient(headers=headers) as client:
-        lnurl = decode_lnurl(lnurl_request)
-        r = await client.get(str(lnurl))
-        res = r.json()
+    lnurl = decode_lnurl(lnurl_request)
+    r = await outbound_client.get(str(lnurl), cache=True)
+    res = r.json()
 
     try:
         _, payment_request = await create_invoice(
@@ -503,12 +965,10 @@ async def redeem_lnurl_withdraw(
     except Exception:
         pass
 
-    headers = {"User-Agent": settings.user_agent}
-    async with httpx.AsyncClient(headers=headers) as client:
-        try:
-            await client.get(res["callback"], params=params)
-        except Exception:
-            pass
+    try:
+        await outbound_client.get(res["callback"], params=params)
+    except Exception:
+        pass
 
 
 async def perform_lnurlauth(
@@ -566,27 +1026,25 @@ async def perform_lnurlauth(
 
     sig = key.sign_digest_deterministic(k1, sigencode=encode_strict_der)
 
-    headers = {"User-Agent": settings.user_agent}
-    async with httpx.AsyncClient(headers=headers) as client:
-        assert key.verifying_key, "LNURLauth verifying_key does not exist"
-        r = await client.get(
-            callback,
-            params={
-                "k1": k1.hex(),
-                "key": key.verifying_key.to_string("compressed").hex(),
-                "sig": sig.hex(),
-            },
+    assert key.verifying_key, "LNURLauth verifying_key does not exist"
+    r = await outbound_client.get(
+        callback,
+        params={
+            "k1": k1.hex(),
+            "key": key.verifying_key.to_string("compressed").hex(),
+            "sig": sig.hex(),
+        },
+    )
+    try:
+        resp = json.loads(r.text)
+        if resp["status"] == "OK":
+            return None
+
+        return LnurlErrorResponse(reason=resp["reason"])
+    except (KeyError, json.decoder.JSONDecodeError):
+        return LnurlErrorResponse(
+            reason=r.text[:200] + "..." if len(r.text) > 200 else r.text
         )
-        try:
-            resp = json.loads(r.text)
-            if resp["status"] == "OK":
-                return None
-
-            return LnurlErrorResponse(reason=resp["reason"])
-        except (KeyError, json.decoder.JSONDecodeError):
-            return LnurlErrorResponse(
-                reason=r.text[:200] + "..." if len(r.text) > 200 else r.text
-            )
 
 
 async def check_transaction_status(
@@ -680,6 +1138,7 @@ async def check_admin_settings():
             settings_db = await update_super_user(settings.super_user)
 
         update_cached_settings(settings_db.dict())
+        settings_sync.version = await get_settings_version()
 
         # saving superuser to {data_dir}/.super_user file
         with open(Path(settings.lnbits_data_folder) / ".super_user", "w") as file:
@@ -720,24 +1179,72 @@ async def check_webpush_settings():
             "lnbits_webpush_pubkey": pubkey,
         }
         update_cached_settings(push_settings)
-        await update_admin_settings(EditableSettings(**push_settings))
+        version = await update_admin_settings(EditableSettings(**push_settings))
+        settings_sync.applied(version)
 
     logger.info("Initialized webpush settings with generated VAPID key pair.")
     logger.info(f"Pubkey: {settings.lnbits_webpush_pubkey}")
 
 
-def update_cached_settings(sets_dict: dict):
+def update_cached_settings(sets_dict: dict) -> List[str]:
+    """Applies the settings to the running instance, returns the changed keys."""
+    changed = []
     for key, value in sets_dict.items():
         if key in readonly_variables:
             continue
-        if key not in settings.dict().keys():
+        if key not in Settings.__fields__:
+            continue
+        if getattr(settings, key) == value:
             continue
         try:
             setattr(settings, key, value)
+            changed.append(key)
         except Exception:
             logger.warning(f"Failed overriding setting: {key}, value: {value}")
-    if "super_user" in sets_dict:
+    if "super_user" in sets_dict and settings.super_user != sets_dict["super_user"]:
         settings.super_user = sets_dict["super_user"]
+        changed.append("super_user")
+    return changed
+
+
+class SettingsSync:
+    """
+    Applies the admin settings that other workers or instances on the same database
+    changed. Every change increments the version of the `settings` row, `check`
+    compares it to the version that was applied last and only then loads and
+    applies the settings. Changes made by this worker are recorded with `applied`.
+    """
+
+    def __init__(self):
+        self.version: Optional[int] = None
+        self.reloads = 0
+
+    def applied(self, version: Optional[int]):
+        # a change of another worker in between must still be loaded
+        if version is not None and self.version == version - 1:
+            self.version = version
+
+    async def check(self) -> List[str]:
+        version = await get_settings_version()
+        if version is None or version == self.version:
+            return []
+        settings_db = await get_super_settings()
+        if not settings_db:
+            return []
+        changed = update_cached_settings(settings_db.dict())
+        self.version = version
+        self.reloads += 1
+        if changed:
+            logger.info(f"Applied changed settings: {', '.join(changed)}")
+        if "lnbits_rate_limit_no" in changed or "lnbits_rate_limit_unit" in changed:
+            core_app_extra.register_new_ratelimiter()
+        return changed
+
+    def dict(self) -> dict:
+        return {"version": self.version, "reloads": self.reloads}
+
+
+settings_sync = SettingsSync()
 
 
 async def init_admin_settings(super_user: Optional[str] = None) -> SuperSettings:
@@ -777,6 +1284,11 @@ class WebsocketConnectionManager:
 websocket_manager = WebsocketConnectionManager()
 
 
+@open_connections
+def collect_websocket_connections():
+    yield ("websocket",), len(websocket_manager.active_connections)
+
+
 async def websocket_updater(item_id, data):
     return await websocket_manager.send_data(f"{data}", item_id)
 
@@ -796,4 +1308,5 @@ async def get_balance_delta() -> BalanceDelta:
     return BalanceDelta(
         lnbits_balance_msats=lnbits_balance,
         node_balance_msats=status.balance_msat,
+        error_message=status.error_message,
     )
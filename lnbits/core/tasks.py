@@ -1,5 +1,9 @@
 import asyncio
-from typing import Dict
+import random
+import time
+from contextlib import contextmanager
+from http import HTTPStatus
+from typing import Dict, Iterator, Optional
 
 import httpx
 from loguru import logger
@@ -13,48 +17,173 @@ from lnbits.core.models import Payment
 from lnbits.core.services import (
     get_balance_delta,
     send_payment_notification,
+    settings_sync,
     switch_to_voidwallet,
 )
+from lnbits.nodes import get_node_class
 from lnbits.settings import get_funding_source, settings
-from lnbits.tasks import send_push_notification
+from lnbits.tasks import enqueue_push_notification
+from lnbits.utils.metrics import open_connections, queue_size, task_duration
 
 api_invoice_listeners: Dict[str, asyncio.Queue] = {}
 
 
+class PaymentWaiters:
+    """
+    Long-poll waiters by payment hash. All requests that wait for the same payment
+    share one future, it is resolved when the payment is paid and removed when
+    the last of its waiters leaves.
+    """
+
+    def __init__(self):
+        self._futures: Dict[str, asyncio.Future] = {}
+        self._waiters: Dict[str, int] = {}
+
+    @contextmanager
+    def waiting(self, payment_hash: str) -> Iterator[asyncio.Future]:
+        future = self._futures.get(payment_hash)
+        if not future:
+            future = asyncio.get_running_loop().create_future()
+            self._futures[payment_hash] = future
+        self._waiters[payment_hash] = self._waiters.get(payment_hash, 0) + 1
+        try:
+            yield future
+        finally:
+            self._waiters[payment_hash] -= 1
+            if not self._waiters[payment_hash]:
+                del self._waiters[payment_hash]
+                del self._futures[payment_hash]
+
+    def paid(self, payment_hash: str):
+        future = self._futures.get(payment_hash)
+        if future and not future.done():
+            future.set_result(None)
+
+    def dict(self) -> dict:
+        return {
+            "payment_hashes": len(self._futures),
+            "waiters": sum(self._waiters.values()),
+        }
+
+
+payment_waiters = PaymentWaiters()
+
+
+@open_connections
+def collect_listener_connections():
+    yield ("sse",), len(api_invoice_listeners)
+    yield ("longpoll",), payment_waiters.dict()["waiters"]
+
+
+@queue_size
+def collect_sse_queue_sizes():
+    yield ("sse",), sum(queue.qsize() for queue in api_invoice_listeners.values())
+
+
+def jittered(seconds: float, jitter: float = 0.1) -> float:
+    """Spread periodic checks, so that instances do not fetch in lockstep."""
+    return seconds * random.uniform(1 - jitter, 1 + jitter)
+
+
+class StatusManifestChecker:
+    """
+    Fetches the lnbits status manifest with a shared client and a conditional GET,
+    an unchanged manifest is answered with `304 Not Modified` and not downloaded
+    again. The last result is kept for the monitor API.
+    """
+
+    def __init__(self):
+        self.manifest: Optional[dict] = None
+        self.etag: Optional[str] = None
+        self.url: Optional[str] = None
+        self.checked_at: Optional[float] = None
+        self.not_modified = False
+        self.error: Optional[str] = None
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if not self._client or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                headers={"User-Agent": settings.user_agent}, timeout=4
+            )
+        return self._client
+
+    async def check(self) -> dict:
+        url = settings.lnbits_status_manifest
+        if url != self.url:
+            self.url, self.etag, self.manifest = url, None, None
+        headers = {"If-None-Match": self.etag} if self.etag and self.manifest else {}
+        self.checked_at = time.time()
+        try:
+            r = await self.client.get(url, headers=headers)
+            self.not_modified = r.status_code == HTTPStatus.NOT_MODIFIED
+            if not self.not_modified:
+                r.raise_for_status()
+                self.manifest = r.json()
+                self.etag = r.headers.get("etag")
+        except (httpx.RequestError, httpx.HTTPStatusError, ValueError) as exc:
+            self.error = str(exc) or exc.__class__.__name__
+            raise
+        self.error = None
+        assert self.manifest is not None
+        return self.manifest
+
+    @property
+    def killswitch(self) -> bool:
+        return bool(self.manifest and self.manifest.get("killswitch") == 1)
+
+    def dict(self) -> dict:
+        return {
+            "url": self.url,
+            "checked_at": self.checked_at,
+            "not_modified": self.not_modified,
+            "killswitch": self.killswitch,
+            "error": self.error,
+        }
+
+    async def close(self):
+        if self._client:
+            await self._client.aclose()
+
+
+status_manifest_checker = StatusManifestChecker()
+
+
 async def killswitch_task():
     """
     killswitch will check lnbits-status repository for a signal from
     LNbits and will switch to VoidWallet if the killswitch is triggered.
     """
-    while settings.lnbits_running:
-        funding_source = get_funding_source()
-        if (
-            settings.lnbits_killswitch
-            and funding_source.__class__.__name__ != "VoidWallet"
-        ):
-            with httpx.Client() as client:
+    try:
+        while settings.lnbits_running:
+            funding_source = get_funding_source()
+            if (
+                settings.lnbits_killswitch
+                and funding_source.__class__.__name__ != "VoidWallet"
+            ):
                 try:
-                    r = client.get(settings.lnbits_status_manifest, timeout=4)
-                    r.raise_for_status()
-                    if r.status_code == 200:
-                        ks = r.json().get("killswitch")
-                        if ks and ks == 1:
-                            logger.error(
-                                "Switching to VoidWallet. Killswitch triggered."
-                            )
-                            await switch_to_voidwallet()
-                except (httpx.RequestError, httpx.HTTPStatusError):
+                    with task_duration.time("killswitch"):
+                        await status_manifest_checker.check()
+                    if status_manifest_checker.killswitch:
+                        logger.error("Switching to VoidWallet. Killswitch triggered.")
+                        await switch_to_voidwallet()
+                except (httpx.RequestError, httpx.HTTPStatusError, ValueError):
                     logger.error(
                         "Cannot fetch lnbits status manifest."
                         f" {settings.lnbits_status_manifest}"
                     )
-        await asyncio.sleep(settings.lnbits_killswitch_interval * 60)
+            await asyncio.sleep(jittered(settings.lnbits_killswitch_interval * 60))
+    finally:
+        await status_manifest_checker.close()
 
 
 async def watchdog_task():
     """
     Registers a watchdog which will check lnbits balance and nodebalance
     and will switch to VoidWallet if the watchdog delta is reached.
+    The lnbits balance is the sum of the maintained wallet balances, so a check
+    costs a status call to the funding source and one cheap query.
     """
     while settings.lnbits_running:
         funding_source = get_funding_source()
@@ -63,15 +192,56 @@ async def watchdog_task():
             and funding_source.__class__.__name__ != "VoidWallet"
         ):
             try:
-                balance = await get_balance_delta()
+                with task_duration.time("watchdog"):
+                    balance = await get_balance_delta()
                 delta = balance.delta_msats
-                logger.debug(f"Running watchdog task. current delta: {delta}")
-                if delta + settings.lnbits_watchdog_delta <= 0:
+                if balance.error_message:
+                    # a failed status reports a zero node balance, not a real delta
+                    logger.warning(
+                        "Skipping watchdog check, funding source status failed: "
+                        f"{balance.error_message}"
+                    )
+                elif delta + settings.lnbits_watchdog_delta <= 0:
                     logger.error(f"Switching to VoidWallet. current delta: {delta}")
                     await switch_to_voidwallet()
+                else:
+                    logger.debug(f"Running watchdog task. current delta: {delta}")
             except Exception as e:
-                logger.error("Error in watchdog task", e)
-        await asyncio.sleep(settings.lnbits_watchdog_interval * 60)
+                logger.error(f"Error in watchdog task: {e!s}")
+        await asyncio.sleep(jittered(settings.lnbits_watchdog_interval * 60))
+
+
+async def settings_sync_task():
+    """
+    Applies the admin settings changed by other workers or instances, a check is
+    one query of the settings version.
+    """
+    while settings.lnbits_running and settings.lnbits_settings_sync_interval:
+        await asyncio.sleep(jittered(settings.lnbits_settings_sync_interval))
+        try:
+            with task_duration.time("settings_sync"):
+                await settings_sync.check()
+        except Exception as e:
+            logger.error(f"Error in settings sync task: {e!s}")
+
+
+async def node_sync_task():
+    """
+    Keeps the payments and invoices of the node ui up to date in the background,
+    so a page of the node ui rarely has to wait for a sync.
+    """
+    while settings.lnbits_running and settings.lnbits_node_ui_sync_interval:
+        await asyncio.sleep(jittered(settings.lnbits_node_ui_sync_interval))
+        node = get_node_class()
+        if not node or not settings.lnbits_node_ui:
+            continue
+        if not settings.lnbits_node_ui_transactions:
+            continue
+        try:
+            with task_duration.time("node_sync"):
+                await node.sync()
+        except Exception as e:
+            logger.warning(f"Error in node sync task: {e!s}")
 
 
 async def wait_for_paid_invoices(invoice_paid_queue: asyncio.Queue):
@@ -98,6 +268,7 @@ async def dispatch_api_invoice_listeners(payment: Payment):
     """
     Emits events to invoice listener subscribed from the API.
     """
+    payment_waiters.paid(payment.payment_hash)
     for chan_name, send_channel in api_invoice_listeners.items():
         try:
             logger.debug(f"api invoice listener: sending paid event to {chan_name}")
@@ -156,4 +327,4 @@ async def send_payment_push_notification(payment: Payment):
             url = (
                 f"https://{subscription.host}/wallet?usr={wallet.user}&wal={wallet.id}"
             )
-            await send_push_notification(subscription, title, body, url)
+            enqueue_push_notification(subscription, title, body, url)
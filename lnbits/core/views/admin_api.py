@@ -7,18 +7,31 @@ from typing import Optional
 from urllib.parse import urlparse
 
 from fastapi import APIRouter, Depends
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, PlainTextResponse
 
 from lnbits.core.models import User
 from lnbits.core.services import (
     get_balance_delta,
+    settings_sync,
     update_cached_settings,
 )
-from lnbits.core.tasks import api_invoice_listeners
+from lnbits.core.tasks import (
+    api_invoice_listeners,
+    payment_waiters,
+    status_manifest_checker,
+)
+from lnbits.db import POSTGRES, database_type
 from lnbits.decorators import check_admin, check_super_user
+from lnbits.nodes import get_node_class
 from lnbits.server import server_restart
 from lnbits.settings import AdminSettings, UpdateSettings, settings
 from lnbits.tasks import invoice_listeners
+from lnbits.utils.etag import wallet_responses
+from lnbits.utils.loop_monitor import loop_monitor
+from lnbits.utils.metrics import metrics
+from lnbits.utils.outbound import outbound_client
+from lnbits.wallets import get_funding_source_monitor
+from lnbits.wallets.base import http_client_stats
 
 from .. import core_app_extra
 from ..crud import delete_admin_settings, get_admin_settings, update_admin_settings
@@ -43,12 +56,45 @@ async def api_auditor():
     dependencies=[Depends(check_admin)],
 )
 async def api_monitor():
+    node = get_node_class()
     return {
         "invoice_listeners": list(invoice_listeners.keys()),
         "api_invoice_listeners": list(api_invoice_listeners.keys()),
+        "payment_waiters": payment_waiters.dict(),
+        "wallet_response_cache": wallet_responses.dict(),
+        "settings": {"snapshot": settings.snapshot.version, **settings_sync.dict()},
+        "funding_source_http_clients": {
+            name: stats.dict() for name, stats in http_client_stats.items()
+        },
+        "funding_source_health": get_funding_source_monitor().dict(),
+        "event_loop": loop_monitor.dict(),
+        "status_manifest": status_manifest_checker.dict(),
+        "outbound_http": outbound_client.dict(),
+        "node": (
+            {"payments": node.payments.dict(), "invoices": node.invoices.dict()}
+            if node
+            else None
+        ),
     }
 
 
+@admin_router.get(
+    "/api/v1/monitor/metrics",
+    name="Monitor metrics",
+    description=(
+        "latencies, queues, connections, caches and funding source health"
+        " in the prometheus text format"
+    ),
+    dependencies=[Depends(check_admin)],
+    response_class=PlainTextResponse,
+)
+async def api_monitor_metrics():
+    return PlainTextResponse(
+        metrics.render() + get_funding_source_monitor().prometheus(),
+        media_type="text/plain; version=0.0.4",
+    )
+
+
 @admin_router.get("/api/v1/settings", response_model=Optional[AdminSettings])
 async def api_get_settings(
     user: User = Depends(check_admin),
@@ -62,11 +108,13 @@ async def api_get_settings(
     status_code=HTTPStatus.OK,
 )
 async def api_update_settings(data: UpdateSettings, user: User = Depends(check_admin)):
-    await update_admin_settings(data)
-    admin_settings = await get_admin_settings(user.super_user)
-    assert admin_settings, "Updated admin settings not found."
-    update_cached_settings(admin_settings.dict())
-    core_app_extra.register_new_ratelimiter()
+    version = await update_admin_settings(data)
+    assert version is not None, "Updated admin settings not found."
+    settings_sync.applied(version)
+    # the update is what changed, the stored settings need not be read again
+    changed = update_cached_settings(data.dict(exclude_unset=True))
+    if "lnbits_rate_limit_no" in changed or "lnbits_rate_limit_unit" in changed:
+        core_app_extra.register_new_ratelimiter()
     return {"status": "Success"}
 
 
@@ -101,7 +149,7 @@ async def api_download_backup() -> FileResponse:
     filename = f"lnbits-backup-{int(time.time())}.zip"
     db_url = settings.lnbits_database_url
     pg_backup_filename = f"{settings.lnbits_data_folder}/lnbits-database.dmp"
-    is_pg = db_url and db_url.startswith("postgres://")
+    is_pg = database_type(db_url) == POSTGRES
 
     if is_pg:
         p = urlparse(db_url)
@@ -10,6 +10,8 @@ import pyqrcode
 from fastapi import (
     APIRouter,
     Depends,
+    Request,
+    Response,
 )
 from fastapi.exceptions import HTTPException
 from starlette.responses import StreamingResponse
@@ -30,11 +32,13 @@ from lnbits.decorators import (
 )
 from lnbits.lnurl import decode as lnurl_decode
 from lnbits.settings import settings
+from lnbits.utils.etag import conditional_response, render_json
 from lnbits.utils.exchange_rates import (
     allowed_currencies,
     fiat_amount_as_satoshis,
     satoshis_amount_as_fiat,
 )
+from lnbits.utils.outbound import outbound_client
 
 from ..crud import (
     create_account,
@@ -109,15 +113,16 @@ async def api_lnurlscan(
         assert lnurlauth_key.verifying_key
         params.update(pubkey=lnurlauth_key.verifying_key.to_string("compressed").hex())
     else:
-        headers = {"User-Agent": settings.user_agent}
-        async with httpx.AsyncClient(headers=headers, follow_redirects=True) as client:
-            r = await client.get(url, timeout=5)
+        try:
+            r = await outbound_client.get(
+                url, timeout=5, follow_redirects=True, cache=True
+            )
             r.raise_for_status()
-            if r.is_error:
-                raise HTTPException(
-                    status_code=HTTPStatus.SERVICE_UNAVAILABLE,
-                    detail={"domain": domain, "message": "failed to get parameters"},
-                )
+        except (httpx.RequestError, httpx.HTTPStatusError) as exc:
+            raise HTTPException(
+                status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+                detail={"domain": domain, "message": "failed to get parameters"},
+            ) from exc
 
         try:
             data = json.loads(r.text)
@@ -204,9 +209,11 @@ async def api_perform_lnurlauth(
     return ""
 
 
-@api_router.get("/api/v1/currencies")
-async def api_list_currencies_available() -> List[str]:
-    return allowed_currencies()
+@api_router.get("/api/v1/currencies", response_model=List[str])
+async def api_list_currencies_available(request: Request) -> Response:
+    body = render_json(allowed_currencies())
+    etag = f'W/"{hashlib.sha256(body).hexdigest()[:16]}"'
+    return conditional_response(request, body, etag)
 
 
 @api_router.post("/api/v1/conversion")
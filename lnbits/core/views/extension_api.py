@@ -29,9 +29,11 @@ from lnbits.extension_manager import (
     Extension,
     ExtensionRelease,
     InstallableExtension,
+    InstallProgress,
     fetch_github_release_config,
     fetch_release_payment_info,
     get_valid_extensions,
+    install_progress,
 )
 from lnbits.settings import settings
 
@@ -81,7 +83,7 @@ async def api_install_extension(
 
         await ext_info.download_archive()
 
-        ext_info.extract_archive()
+        await ext_info.extract_archive()
 
         extension = Extension.from_installable_ext(ext_info)
 
@@ -189,6 +191,16 @@ async def get_extension_releases(ext_id: str):
         ) from exc
 
 
+@extension_router.get("/{ext_id}/progress", dependencies=[Depends(check_admin)])
+async def get_extension_install_progress(ext_id: str) -> InstallProgress:
+    progress = install_progress.get(ext_id)
+    if not progress:
+        raise HTTPException(
+            status_code=HTTPStatus.NOT_FOUND, detail="No install in progress."
+        )
+    return progress
+
+
 @extension_router.put("/invoice", dependencies=[Depends(check_admin)])
 async def get_extension_invoice(data: CreateExtension):
     try:
@@ -15,8 +15,9 @@ from fastapi import (
     HTTPException,
     Query,
     Request,
+    Response,
 )
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from loguru import logger
 from sse_starlette.sse import EventSourceResponse
 
@@ -24,9 +25,11 @@ from lnbits import bolt11
 from lnbits.core.db import db
 from lnbits.core.models import (
     CreateInvoice,
+    CreateInvoiceResult,
     CreateLnurl,
     DecodePayment,
     KeyType,
+    PayInvoices,
     Payment,
     PaymentFilters,
     PaymentHistoryPoint,
@@ -34,7 +37,9 @@ from lnbits.core.models import (
 )
 from lnbits.db import Filters, Page
 from lnbits.decorators import (
+    KeyChecker,
     WalletTypeInfo,
+    get_api_key,
     get_key_type,
     parse_filters,
     require_admin_key,
@@ -43,7 +48,9 @@ from lnbits.decorators import (
 from lnbits.helpers import generate_filter_params_openapi
 from lnbits.lnurl import decode as lnurl_decode
 from lnbits.settings import settings
+from lnbits.utils.etag import wallet_responses
 from lnbits.utils.exchange_rates import fiat_amount_as_satoshis
+from lnbits.utils.outbound import outbound_client
 
 from ..crud import (
     DateTrunc,
@@ -57,8 +64,10 @@ from ..crud import (
 from ..services import (
     check_transaction_status,
     create_invoice,
+    create_invoices,
     fee_reserve_total,
     pay_invoice,
+    pay_invoices,
 )
 from ..tasks import api_invoice_listeners
 
@@ -74,16 +83,21 @@ payment_router = APIRouter(prefix="/api/v1/payments", tags=["Payments"])
     openapi_extra=generate_filter_params_openapi(PaymentFilters),
 )
 async def api_payments(
-    wallet: WalletTypeInfo = Depends(get_key_type),
+    request: Request,
+    api_key: Optional[str] = Depends(get_api_key),
     filters: Filters = Depends(parse_filters(PaymentFilters)),
-):
-    await update_pending_payments(wallet.wallet.id)
-    return await get_payments(
-        wallet_id=wallet.wallet.id,
-        pending=True,
-        complete=True,
-        filters=filters,
-    )
+) -> Response:
+    async def payments():
+        wallet = await KeyChecker(api_key=api_key)(request)
+        await update_pending_payments(wallet.wallet.id)
+        return wallet.wallet.id, await get_payments(
+            wallet_id=wallet.wallet.id,
+            pending=True,
+            complete=True,
+            filters=filters,
+        )
+
+    return await wallet_responses.respond(request, api_key, payments)
 
 
 @payment_router.get(
@@ -172,27 +186,25 @@ async def api_payments_create_invoice(data: CreateInvoice, wallet: Wallet):
 
     lnurl_response: Union[None, bool, str] = None
     if data.lnurl_callback:
-        headers = {"User-Agent": settings.user_agent}
-        async with httpx.AsyncClient(headers=headers) as client:
-            try:
-                r = await client.get(
-                    data.lnurl_callback,
-                    params={
-                        "pr": payment_request,
-                    },
-                    timeout=10,
-                )
-                if r.is_error:
-                    lnurl_response = r.text
+        try:
+            r = await outbound_client.get(
+                data.lnurl_callback,
+                params={
+                    "pr": payment_request,
+                },
+                timeout=10,
+            )
+            if r.is_error:
+                lnurl_response = r.text
+            else:
+                resp = json.loads(r.text)
+                if resp["status"] != "OK":
+                    lnurl_response = resp["reason"]
                 else:
-                    resp = json.loads(r.text)
-                    if resp["status"] != "OK":
-                        lnurl_response = resp["reason"]
-                    else:
-                        lnurl_response = True
-            except (httpx.ConnectError, httpx.RequestError) as ex:
-                logger.error(ex)
-                lnurl_response = False
+                    lnurl_response = True
+        except (httpx.ConnectError, httpx.RequestError) as ex:
+            logger.error(ex)
+            lnurl_response = False
 
     return {
         "payment_hash": invoice.payment_hash,
@@ -253,6 +265,65 @@ async def api_payments_create(
         )
 
 
+@payment_router.post(
+    "/batch",
+    summary="Create many invoices at once",
+    description="""
+        Create up to `lightning_batch_max_size` invoices for the authorized wallet
+        in one request. The results are returned in the same order as requested,
+        invoices that could not be created only contain an `error`.
+    """,
+    status_code=HTTPStatus.CREATED,
+    response_model=List[CreateInvoiceResult],
+)
+async def api_payments_create_batch(
+    wallet: WalletTypeInfo = Depends(require_invoice_key),
+    invoices: List[CreateInvoice] = Body(...),
+):
+    if len(invoices) > settings.lightning_batch_max_size:
+        raise HTTPException(
+            status_code=HTTPStatus.BAD_REQUEST,
+            detail=f"Too many invoices, max is {settings.lightning_batch_max_size}.",
+        )
+    return await create_invoices(wallet_id=wallet.wallet.id, invoices=invoices)
+
+
+@payment_router.post(
+    "/batch/pay",
+    summary="Pay many invoices at once",
+    description="""
+        Pay up to `lightning_batch_max_size` invoices from the authorized wallet.
+        The funds for all invoices (plus fee reserve) are reserved at once, if the
+        balance is not enough none of them is paid. The results are streamed back
+        as newline delimited JSON, one line per invoice as soon as it completes,
+        `index` refers to the position of the invoice in the request.
+    """,
+    responses={
+        200: {"content": {"application/x-ndjson": {}}},
+        400: {"description": "Too many invoices."},
+        520: {"description": "Payment error, e.g. insufficient balance."},
+    },
+)
+async def api_payments_pay_batch(
+    data: PayInvoices,
+    wallet: WalletTypeInfo = Depends(require_admin_key),
+):
+    if len(data.bolt11) > settings.lightning_batch_max_size:
+        raise HTTPException(
+            status_code=HTTPStatus.BAD_REQUEST,
+            detail=f"Too many invoices, max is {settings.lightning_batch_max_size}.",
+        )
+    results = await pay_invoices(
+        wallet_id=wallet.wallet.id, payment_requests=data.bolt11, extra=data.extra
+    )
+
+    async def stream_results():
+        async for result in results:
+            yield result.json() + "\n"
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+
 @payment_router.get("/fee-reserve")
 async def api_payments_fee_reserve(invoice: str = Query("invoice")) -> JSONResponse:
     invoice_obj = bolt11.decode(invoice)
@@ -274,28 +345,27 @@ async def api_payments_pay_lnurl(
 ):
     domain = urlparse(data.callback).netloc
 
-    headers = {"User-Agent": settings.user_agent}
-    async with httpx.AsyncClient(headers=headers, follow_redirects=True) as client:
-        try:
-            if data.unit and data.unit != "sat":
-                amount_msat = await fiat_amount_as_satoshis(data.amount, data.unit)
-                # no msat precision
-                amount_msat = ceil(amount_msat // 1000) * 1000
-            else:
-                amount_msat = data.amount
-            r = await client.get(
-                data.callback,
-                params={"amount": amount_msat, "comment": data.comment},
-                timeout=40,
-            )
-            if r.is_error:
-                raise httpx.ConnectError("LNURL callback connection error")
-            r.raise_for_status()
-        except (httpx.ConnectError, httpx.RequestError) as exc:
-            raise HTTPException(
-                status_code=HTTPStatus.BAD_REQUEST,
-                detail=f"Failed to connect to {domain}.",
-            ) from exc
+    try:
+        if data.unit and data.unit != "sat":
+            amount_msat = await fiat_amount_as_satoshis(data.amount, data.unit)
+            # no msat precision
+            amount_msat = ceil(amount_msat // 1000) * 1000
+        else:
+            amount_msat = data.amount
+        r = await outbound_client.get(
+            data.callback,
+            params={"amount": amount_msat, "comment": data.comment},
+            timeout=40,
+            follow_redirects=True,
+        )
+        if r.is_error:
+            raise httpx.ConnectError("LNURL callback connection error")
+        r.raise_for_status()
+    except (httpx.ConnectError, httpx.RequestError) as exc:
+        raise HTTPException(
+            status_code=HTTPStatus.BAD_REQUEST,
+            detail=f"Failed to connect to {domain}.",
+        ) from exc
 
     params = json.loads(r.text)
     if params.get("status") == "ERROR":
@@ -390,7 +460,23 @@ async def api_payments_sse(
 
 # TODO: refactor this route into a public and admin one
 @payment_router.get("/{payment_hash}")
-async def api_payment(payment_hash, x_api_key: Optional[str] = Header(None)):
+async def api_payment_status(
+    request: Request, payment_hash: str, x_api_key: Optional[str] = Header(None)
+) -> Response:
+    async def payment_status():
+        payment, status = await _payment_status(payment_hash, x_api_key)
+        # only the final status of a payment is cached
+        return (None if payment.pending else payment.wallet_id), status
+
+    return await wallet_responses.respond(request, x_api_key, payment_status)
+
+
+async def api_payment(payment_hash, x_api_key: Optional[str] = None):
+    _, status = await _payment_status(payment_hash, x_api_key)
+    return status
+
+
+async def _payment_status(payment_hash, x_api_key: Optional[str]):
     # We use X_Api_Key here because we want this call to work with and without keys
     # If a valid key is given, we also return the field "details", otherwise not
     wallet = await get_wallet_for_key(x_api_key) if isinstance(x_api_key, str) else None
@@ -412,24 +498,28 @@ async def api_payment(payment_hash, x_api_key: Optional[str] = Header(None)):
         )
     elif not payment.pending:
         if wallet and wallet.id == payment.wallet_id:
-            return {"paid": True, "preimage": payment.preimage, "details": payment}
-        return {"paid": True, "preimage": payment.preimage}
+            return payment, {
+                "paid": True,
+                "preimage": payment.preimage,
+                "details": payment,
+            }
+        return payment, {"paid": True, "preimage": payment.preimage}
 
     try:
         status = await payment.check_status()
     except Exception:
         if wallet and wallet.id == payment.wallet_id:
-            return {"paid": False, "details": payment}
-        return {"paid": False}
+            return payment, {"paid": False, "details": payment}
+        return payment, {"paid": False}
 
     if wallet and wallet.id == payment.wallet_id:
-        return {
+        return payment, {
             "paid": not payment.pending,
             "status": f"{status!s}",
             "preimage": payment.preimage,
             "details": payment,
         }
-    return {"paid": not payment.pending, "preimage": payment.preimage}
+    return payment, {"paid": not payment.pending, "preimage": payment.preimage}
 
 
 @payment_router.post("/decode", status_code=HTTPStatus.OK)
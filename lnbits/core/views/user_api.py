@@ -20,7 +20,7 @@ from lnbits.core.models import (
     User,
     Wallet,
 )
-from lnbits.core.services import update_wallet_balance
+from lnbits.core.services import settings_sync, update_wallet_balance
 from lnbits.db import Filters, Page
 from lnbits.decorators import check_admin, check_super_user, parse_filters
 from lnbits.helpers import generate_filter_params_openapi
@@ -42,7 +42,7 @@ async def api_get_users(
         filtered = await get_accounts(filters=filters)
         for user in filtered.data:
             user.is_super_user = user.id == settings.super_user
-            user.is_admin = user.id in settings.lnbits_admin_users or user.is_super_user
+            user.is_admin = settings.is_admin_user(user.id)
         return filtered
     except Exception as exc:
         raise HTTPException(
@@ -81,13 +81,15 @@ async def api_users_toggle_admin(user_id: str) -> None:
         if user_id == settings.super_user:
             raise Exception("Cannot change super user.")
         if user_id in settings.lnbits_admin_users:
-            settings.lnbits_admin_users.remove(user_id)
+            admin_users = [u for u in settings.lnbits_admin_users if u != user_id]
         else:
-            settings.lnbits_admin_users.append(user_id)
-            update_settings = EditableSettings(
-                lnbits_admin_users=settings.lnbits_admin_users
-            )
-            await update_admin_settings(update_settings)
+            admin_users = [*settings.lnbits_admin_users, user_id]
+        # assigned, not changed in place, so the settings snapshot is updated
+        settings.lnbits_admin_users = admin_users
+        version = await update_admin_settings(
+            EditableSettings(lnbits_admin_users=admin_users)
+        )
+        settings_sync.applied(version)
     except Exception as exc:
         raise HTTPException(
             status_code=HTTPStatus.INTERNAL_SERVER_ERROR,
@@ -4,6 +4,8 @@ from fastapi import (
     APIRouter,
     Body,
     Depends,
+    Request,
+    Response,
 )
 
 from lnbits.core.models import (
@@ -12,10 +14,12 @@ from lnbits.core.models import (
     Wallet,
 )
 from lnbits.decorators import (
+    KeyChecker,
     WalletTypeInfo,
-    get_key_type,
+    get_api_key,
     require_admin_key,
 )
+from lnbits.utils.etag import wallet_responses
 
 from ..crud import (
     create_wallet,
@@ -27,15 +31,24 @@ wallet_router = APIRouter(prefix="/api/v1/wallet", tags=["Wallet"])
 
 
 @wallet_router.get("")
-async def api_wallet(wallet: WalletTypeInfo = Depends(get_key_type)):
-    if wallet.key_type == KeyType.admin:
-        return {
-            "id": wallet.wallet.id,
-            "name": wallet.wallet.name,
-            "balance": wallet.wallet.balance_msat,
-        }
-    else:
-        return {"name": wallet.wallet.name, "balance": wallet.wallet.balance_msat}
+async def api_wallet(
+    request: Request, api_key: Optional[str] = Depends(get_api_key)
+) -> Response:
+    async def wallet_info():
+        wallet = await KeyChecker(api_key=api_key)(request)
+        if wallet.key_type == KeyType.admin:
+            return wallet.wallet.id, {
+                "id": wallet.wallet.id,
+                "name": wallet.wallet.name,
+                "balance": wallet.wallet.balance_msat,
+            }
+        else:
+            return wallet.wallet.id, {
+                "name": wallet.wallet.name,
+                "balance": wallet.wallet.balance_msat,
+            }
+
+    return await wallet_responses.respond(request, api_key, wallet_info)
 
 
 @wallet_router.put("/{new_name}")
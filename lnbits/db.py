@@ -2,33 +2,70 @@ from __future__ import annotations
 
 import asyncio
 import datetime
+import json
 import os
 import re
+import sys
 import time
 from contextlib import asynccontextmanager
 from enum import Enum
+from functools import lru_cache
 from sqlite3 import Row
-from typing import Any, Generic, Literal, Optional, TypeVar
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Generic,
+    Literal,
+    Optional,
+    Sequence,
+    TypeVar,
+)
 
 from loguru import logger
 from pydantic import BaseModel, ValidationError, root_validator
 from sqlalchemy import create_engine
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy_aio.base import AsyncConnection
 from sqlalchemy_aio.strategy import ASYNCIO_STRATEGY
 
 from lnbits.settings import settings
+from lnbits.utils.metrics import db_lock_wait, db_query_duration
+from lnbits.utils.query_trace import current_trace
 
 POSTGRES = "POSTGRES"
 COCKROACH = "COCKROACH"
 SQLITE = "SQLITE"
 
+# drivers, asyncpg is used for `postgres+asyncpg://` urls
+SQLALCHEMY = "SQLALCHEMY"
+ASYNCPG = "ASYNCPG"
+
+
+def database_type(database_url: Optional[str]) -> str:
+    if not database_url:
+        return SQLITE
+    if database_url.startswith("cockroachdb://"):
+        return COCKROACH
+    return POSTGRES
+
+
+def database_driver(database_url: Optional[str]) -> str:
+    if database_url and database_url.startswith(
+        ("postgres+asyncpg://", "postgresql+asyncpg://")
+    ):
+        return ASYNCPG
+    return SQLALCHEMY
+
+
+DB_TYPE = database_type(settings.lnbits_database_url)
+DB_DRIVER = database_driver(settings.lnbits_database_url)
+
 if settings.lnbits_database_url:
     database_uri = settings.lnbits_database_url
 
-    if database_uri.startswith("cockroachdb://"):
-        DB_TYPE = COCKROACH
-    else:
-        DB_TYPE = POSTGRES
+    if DB_DRIVER == ASYNCPG:
+        import asyncpg
 
     from psycopg2.extensions import DECIMAL, new_type, register_type
 
@@ -53,7 +90,18 @@ else:
     if not os.path.isdir(settings.lnbits_data_folder):
         os.mkdir(settings.lnbits_data_folder)
         logger.info(f"Created {settings.lnbits_data_folder}")
-    DB_TYPE = SQLITE
+
+
+def is_integrity_error(exc: Exception) -> bool:
+    """
+    Whether `exc` is a violated constraint (e.g. a duplicate unique key),
+    for the exceptions of both database drivers.
+    """
+    if DB_DRIVER == ASYNCPG and isinstance(
+        exc, asyncpg.IntegrityConstraintViolationError
+    ):
+        return True
+    return isinstance(exc, IntegrityError)
 
 
 def compat_timestamp_placeholder():
@@ -83,6 +131,17 @@ class Compat:
             return time.mktime(date.timetuple())
         return "<nothing>"
 
+    def timestamp_to_epoch(self, column: str) -> str:
+        if self.type in {POSTGRES, COCKROACH}:
+            # timestamps are stored in the time zone of the database session
+            return (
+                f"CAST(FLOOR(EXTRACT(EPOCH FROM CAST({column} AS TIMESTAMPTZ)))"
+                " AS BIGINT)"
+            )
+        elif self.type == SQLITE:
+            return f"CAST({column} AS INT)"
+        return "<nothing>"
+
     @property
     def timestamp_now(self) -> str:
         if self.type in {POSTGRES, COCKROACH}:
@@ -124,30 +183,74 @@ class Compat:
         return compat_timestamp_placeholder()
 
 
+# html tags and entities, stripped from the string values of all queries
+_html = re.compile("<.*?>|&([a-z0-9]+|#[0-9]{1,6}|#x[0-9a-f]{1,6});")
+_column_name = re.compile(r"[a-zA-Z_][a-zA-Z0-9_]*(\.[a-zA-Z_][a-zA-Z0-9_]*)?")
+
+
+@lru_cache(maxsize=2048)
+def _rewrite_query(query: str, db_type: str, driver: str) -> str:
+    if driver == ASYNCPG:
+        parts = query.split("?")
+        return parts[0] + "".join(
+            f"${i}{part}" for i, part in enumerate(parts[1:], start=1)
+        )
+    if db_type in {POSTGRES, COCKROACH}:
+        query = query.replace("%", "%%")
+        query = query.replace("?", "%s")
+    return query
+
+
+def _strip_html(value: str) -> str:
+    # most values (hashes, bolt11s, json) have nothing to strip
+    if "<" not in value and "&" not in value:
+        return value
+    return _html.sub("", value)
+
+
+# code object -> name of the function, the label of its queries in the metrics
+_call_sites: dict[Any, str] = {}
+
+
+def _call_site() -> str:
+    """The function outside of this module that made the current query."""
+    frame = sys._getframe(1)
+    while frame.f_back and frame.f_code.co_filename == __file__:
+        frame = frame.f_back
+    site = _call_sites.get(frame.f_code)
+    if not site:
+        site = f"{frame.f_globals.get('__name__')}.{frame.f_code.co_name}"
+        _call_sites[frame.f_code] = site
+    return site
+
+
 class Connection(Compat):
-    def __init__(self, conn: AsyncConnection, txn, typ, name, schema):
+    def __init__(
+        self,
+        conn: AsyncConnection | AsyncpgConnection,
+        txn,
+        typ,
+        name,
+        schema,
+        driver: str = SQLALCHEMY,
+    ):
         self.conn = conn
         self.txn = txn
         self.type = typ
         self.name = name
         self.schema = schema
+        self.driver = driver
 
     def rewrite_query(self, query) -> str:
-        if self.type in {POSTGRES, COCKROACH}:
-            query = query.replace("%", "%%")
-            query = query.replace("?", "%s")
-        return query
+        return _rewrite_query(query, self.type, self.driver)
 
     def rewrite_values(self, values):
-        # strip html
-        clean_regex = re.compile("<.*?>|&([a-z0-9]+|#[0-9]{1,6}|#x[0-9a-f]{1,6});")
-
         # tuple to list and back to tuple
         raw_values = [values] if isinstance(values, str) else list(values)
         values = []
         for raw_value in raw_values:
             if isinstance(raw_value, str):
-                values.append(re.sub(clean_regex, "", raw_value))
+                values.append(_strip_html(raw_value))
             elif isinstance(raw_value, datetime.datetime):
                 ts = raw_value.timestamp()
                 if self.type == SQLITE:
@@ -159,19 +262,78 @@ class Connection(Compat):
         return tuple(values)
 
     async def fetchall(self, query: str, values: tuple = ()) -> list:
-        result = await self.conn.execute(
-            self.rewrite_query(query), self.rewrite_values(values)
-        )
+        result = await self.execute(query, values)
         return await result.fetchall()
 
     async def fetchone(self, query: str, values: tuple = ()):
-        result = await self.conn.execute(
-            self.rewrite_query(query), self.rewrite_values(values)
-        )
+        result = await self.execute(query, values)
         row = await result.fetchone()
         await result.close()
         return row
 
+    async def fetch_batches(
+        self, query: str, key: str, values: tuple = (), batch_size: int = 1000
+    ) -> AsyncIterator[list]:
+        """
+        Rows of `query` in batches, ordered by the unique column `key`, which must be
+        selected. Each batch is a query that continues after the last key of the
+        previous one, so a large table is never loaded at once. `query` must end
+        with a WHERE clause.
+        """
+        order = f"ORDER BY {key} LIMIT {int(batch_size)}"
+        last_key = None
+        while True:
+            if last_key is None:
+                rows = await self.fetchall(f"{query} {order}", values)
+            else:
+                rows = await self.fetchall(
+                    f"{query} AND {key} > ? {order}", (*values, last_key)
+                )
+            if not rows:
+                return
+            yield rows
+            if len(rows) < batch_size:
+                return
+            last_key = rows[-1][key]
+
+    async def update_many(
+        self,
+        table: str,
+        key: str,
+        columns: Sequence[str],
+        rows: Sequence[tuple],
+        where: str = "",
+        placeholders: Optional[Sequence[str]] = None,
+        batch_size: int = 200,
+    ) -> None:
+        """
+        Sets `columns` of many rows with one statement per batch instead of one per
+        row. A row is the value of the `key` column followed by the new values,
+        `placeholders` of the values (e.g. `timestamp_placeholder`) default to `?`.
+        """
+        placeholders = placeholders or ["?"] * len(columns)
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start : start + batch_size]
+            # the ELSE (never used) types the values like the column for postgres
+            cases = ", ".join(
+                f"{column} = CASE {key} "
+                + " ".join([f"WHEN ? THEN {placeholder}"] * len(batch))
+                + f" ELSE {column} END"
+                for column, placeholder in zip(columns, placeholders)
+            )
+            values: list = []
+            for i in range(len(columns)):
+                for row in batch:
+                    values += [row[0], row[i + 1]]
+            values += [row[0] for row in batch]
+            await self.execute(
+                f"""
+                UPDATE {table} SET {cases}
+                WHERE {key} IN ({", ".join(["?"] * len(batch))}) {where}
+                """,
+                tuple(values),
+            )
+
     async def fetch_page(
         self,
         query: str,
@@ -189,9 +351,7 @@ class Connection(Compat):
         group_by_string = ""
         if group_by:
             for field in group_by:
-                if not re.fullmatch(
-                    r"[a-zA-Z_][a-zA-Z0-9_]*(\.[a-zA-Z_][a-zA-Z0-9_]*)?", field
-                ):
+                if not _column_name.fullmatch(field):
                     raise ValueError("Value for GROUP BY is invalid")
             group_by_string = f"GROUP BY {', '.join(group_by)}"
 
@@ -230,9 +390,139 @@ class Connection(Compat):
         )
 
     async def execute(self, query: str, values: tuple = ()):
-        return await self.conn.execute(
-            self.rewrite_query(query), self.rewrite_values(values)
+        start = time.perf_counter()
+        try:
+            return await self.conn.execute(
+                self.rewrite_query(query), self.rewrite_values(values)
+            )
+        finally:
+            seconds = time.perf_counter() - start
+            site = _call_site()
+            db_query_duration.observe(seconds, self.name, site)
+            trace = current_trace.get()
+            if trace:
+                trace.record(query, seconds, site)
+
+
+_asyncpg_returns_rows = re.compile(
+    r"^\s*(SELECT|WITH|VALUES|SHOW|EXPLAIN)\b|\bRETURNING\b", re.IGNORECASE
+)
+
+# postgres type -> conversion of values of another type, which psycopg2 sends as
+# literals and postgres casts, but asyncpg refuses
+_asyncpg_conversions: dict[str, Callable[[Any], Any]] = {
+    "text": str,
+    "varchar": str,
+    "bpchar": str,
+    "int2": int,
+    "int4": int,
+    "int8": int,
+    "float4": float,
+    "float8": float,
+}
+
+
+@lru_cache(maxsize=2048)
+def _asyncpg_statement_returns_rows(query: str) -> bool:
+    return bool(_asyncpg_returns_rows.search(query))
+
+
+def _encode_json(value: Any) -> str:
+    return value if isinstance(value, str) else json.dumps(value)
+
+
+async def _init_asyncpg_connection(conn) -> None:
+    # the same python values as the types registered for psycopg2 above
+    await conn.set_type_codec(
+        "numeric", schema="pg_catalog", encoder=str, decoder=float, format="text"
+    )
+    for name in ("timestamp", "timestamptz"):
+        await conn.set_type_codec(
+            name,
+            schema="pg_catalog",
+            encoder=str,
+            decoder=lambda value: _parse_timestamp(value, None),
+            format="text",
         )
+    for name in ("json", "jsonb"):
+        await conn.set_type_codec(
+            name,
+            schema="pg_catalog",
+            encoder=_encode_json,
+            decoder=json.loads,
+            format="text",
+        )
+
+
+class AsyncpgResult:
+    """Rows of an asyncpg statement, like the results of sqlalchemy."""
+
+    def __init__(self, rows: list, rowcount: int):
+        self.rows = rows
+        self.rowcount = rowcount
+
+    async def fetchall(self) -> list:
+        rows, self.rows = self.rows, []
+        return rows
+
+    async def fetchone(self):
+        return self.rows.pop(0) if self.rows else None
+
+    async def close(self):
+        self.rows = []
+
+
+class AsyncpgConnection:
+    """
+    asyncpg connection with the `execute` of the sqlalchemy connections.
+
+    asyncpg prepares every statement once per connection and keeps it in its
+    statement cache, so a repeated query is only bound and executed. Values of a
+    type that asyncpg refuses for a parameter are converted to the parameter type,
+    the conversions of a query are kept after its first failure.
+    """
+
+    conversions: dict[str, Callable[[tuple], tuple]] = {}
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    async def execute(self, query: str, values: tuple = ()) -> AsyncpgResult:
+        convert = self.conversions.get(query)
+        if convert:
+            return await self._execute(query, convert(values))
+        try:
+            return await self._execute(query, values)
+        except asyncpg.DataError as exc:
+            # raised before the statement is sent, the transaction is still fine
+            if not str(exc).startswith("invalid input for query argument"):
+                raise
+        statement = await self.conn.prepare(query)
+        convert = self._conversion(statement.get_parameters())
+        if len(self.conversions) >= 1000:
+            self.conversions.clear()
+        self.conversions[query] = convert
+        return await self._execute(query, convert(values))
+
+    async def _execute(self, query: str, values: tuple) -> AsyncpgResult:
+        if _asyncpg_statement_returns_rows(query):
+            rows = await self.conn.fetch(query, *values)
+            return AsyncpgResult(rows, len(rows))
+        status = await self.conn.execute(query, *values)
+        count = status.rsplit(" ", 1)[-1]
+        return AsyncpgResult([], int(count) if count.isdigit() else -1)
+
+    @staticmethod
+    def _conversion(parameters) -> Callable[[tuple], tuple]:
+        conversions = [_asyncpg_conversions.get(p.name) for p in parameters]
+
+        def convert(values: tuple) -> tuple:
+            return tuple(
+                conversion(value) if conversion and value is not None else value
+                for conversion, value in zip(conversions, values)
+            )
+
+        return convert
 
 
 class Database(Compat):
@@ -254,35 +544,74 @@ class Database(Compat):
         else:
             self.schema = None
 
-        self.engine = create_engine(
-            database_uri, strategy=ASYNCIO_STRATEGY, echo=settings.debug_database
-        )
+        self.driver = DB_DRIVER if self.type == POSTGRES else SQLALCHEMY
+        if self.driver == ASYNCPG:
+            self.dsn = database_uri.replace("+asyncpg", "", 1)
+            # a pool per event loop, asyncpg connections belong to their loop
+            self.pools: dict[asyncio.AbstractEventLoop, Any] = {}
+        else:
+            self.engine = create_engine(
+                database_uri, strategy=ASYNCIO_STRATEGY, echo=settings.debug_database
+            )
         self.lock = asyncio.Lock()
 
         logger.trace(f"database {self.type} added for {self.name}")
 
     @asynccontextmanager
     async def connect(self):
+        start = time.perf_counter()
         await self.lock.acquire()
+        db_lock_wait.observe(time.perf_counter() - start, self.name)
         try:
-            async with self.engine.connect() as conn:  # type: ignore
-                async with conn.begin() as txn:
-                    wconn = Connection(conn, txn, self.type, self.name, self.schema)
-
-                    if self.schema:
-                        if self.type in {POSTGRES, COCKROACH}:
-                            await wconn.execute(
-                                f"CREATE SCHEMA IF NOT EXISTS {self.schema}"
-                            )
-                        elif self.type == SQLITE:
-                            await wconn.execute(
-                                f"ATTACH '{self.path}' AS {self.schema}"
-                            )
-
-                    yield wconn
+            async with self._begin() as (conn, txn):
+                wconn = Connection(
+                    conn, txn, self.type, self.name, self.schema, self.driver
+                )
+
+                if self.schema:
+                    if self.type in {POSTGRES, COCKROACH}:
+                        await wconn.execute(
+                            f"CREATE SCHEMA IF NOT EXISTS {self.schema}"
+                        )
+                    elif self.type == SQLITE:
+                        await wconn.execute(f"ATTACH '{self.path}' AS {self.schema}")
+
+                yield wconn
         finally:
             self.lock.release()
 
+    @asynccontextmanager
+    async def _begin(self) -> AsyncIterator[tuple[Any, Any]]:
+        if self.driver == ASYNCPG:
+            pool = await self._asyncpg_pool()
+            async with pool.acquire() as conn:
+                txn = conn.transaction()
+                async with txn:
+                    yield AsyncpgConnection(conn), txn
+        else:
+            async with self.engine.connect() as conn:  # type: ignore
+                async with conn.begin() as txn:
+                    yield conn, txn
+
+    async def _asyncpg_pool(self):
+        loop = asyncio.get_running_loop()
+        pool = self.pools.get(loop)
+        if not pool:
+            for closed in [loop for loop in self.pools if loop.is_closed()]:
+                del self.pools[closed]
+            # one connection, `connect` holds `self.lock` for the whole transaction
+            # anyway. The balance checks of the payments rely on that lock, two
+            # concurrent transactions would not see each other's payments.
+            pool = await asyncpg.create_pool(
+                self.dsn,
+                min_size=1,
+                max_size=1,
+                init=_init_asyncpg_connection,
+                statement_cache_size=1000,
+            )
+            self.pools[loop] = pool
+        return pool
+
     async def fetchall(self, query: str, values: tuple = ()) -> list:
         async with self.connect() as conn:
             result = await conn.execute(query, values)
@@ -88,11 +88,8 @@ class KeyChecker(SecurityBase):
                 detail="Invalid adminkey.",
             )
 
-        if (
-            wallet.user != settings.super_user
-            and wallet.user not in settings.lnbits_admin_users
-            and settings.lnbits_admin_extensions
-            and request["path"].split("/")[1] in settings.lnbits_admin_extensions
+        if not settings.is_admin_user(wallet.user) and settings.is_admin_extension(
+            request["path"]
         ):
             raise HTTPException(
                 status_code=HTTPStatus.FORBIDDEN,
@@ -103,6 +100,14 @@ class KeyChecker(SecurityBase):
         return WalletTypeInfo(key_type, wallet)
 
 
+async def get_api_key(
+    api_key_header: str = Security(api_key_header),
+    api_key_query: str = Security(api_key_query),
+) -> Optional[str]:
+    """The api key of the request, without looking it up."""
+    return api_key_header or api_key_query
+
+
 async def get_key_type(
     request: Request,
     api_key_header: str = Security(api_key_header),
@@ -161,12 +166,7 @@ async def check_user_exists(
     user = await get_user(account.id)
     assert user, "User not found for account."
 
-    if (
-        user.id != settings.super_user
-        and user.id not in settings.lnbits_admin_users
-        and settings.lnbits_admin_extensions
-        and r["path"].split("/")[1] in settings.lnbits_admin_extensions
-    ):
+    if not settings.is_admin_user(user.id) and settings.is_admin_extension(r["path"]):
         raise HTTPException(
             HTTPStatus.UNAUTHORIZED, "User not authorized for extension."
         )
@@ -175,7 +175,7 @@ async def check_user_exists(
 
 
 async def check_admin(user: Annotated[User, Depends(check_user_exists)]) -> User:
-    if user.id != settings.super_user and user.id not in settings.lnbits_admin_users:
+    if not settings.is_admin_user(user.id):
         raise HTTPException(
             HTTPStatus.UNAUTHORIZED, "User not authorized. No admin privileges."
         )
@@ -6,8 +6,7 @@ import shutil
 import sys
 import zipfile
 from pathlib import Path
-from typing import Any, List, NamedTuple, Optional, Tuple
-from urllib import request
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
 
 import httpx
 from loguru import logger
@@ -85,19 +84,58 @@ class ReleasePaymentInfo(BaseModel):
     payment_request: Optional[str] = None
 
 
-def download_url(url, save_path):
-    with request.urlopen(url, timeout=60) as dl_file:
-        with open(save_path, "wb") as out_file:
-            out_file.write(dl_file.read())
+class InstallProgress(BaseModel):
+    """
+    Progress of an ongoing extension install, polled by the admin UI.
+    """
+
+    stage: str = "pending"  # pending | downloading | extracting | installed | failed
+    downloaded_bytes: int = 0
+    total_bytes: Optional[int] = None
+
+
+# extension id -> progress of the last install of that extension
+install_progress: Dict[str, InstallProgress] = {}
 
 
-def file_hash(filename):
+def _forget_install_progress(ext_id: str, progress: InstallProgress):
+    # unless another install of the extension started in the meantime
+    if install_progress.get(ext_id) is progress:
+        del install_progress[ext_id]
+
+
+async def download_url(
+    url: str,
+    save_path: Path,
+    on_progress: Optional[Callable[[int, Optional[int]], None]] = None,
+) -> str:
+    """
+    Stream the file at `url` into `save_path` and return its sha256 hash.
+    The content is hashed chunk by chunk while it is written, it is never held in
+    memory as a whole and the file does not have to be read again for the hash.
+    The file only appears at `save_path` once the download is complete.
+    """
     h = hashlib.sha256()
-    b = bytearray(128 * 1024)
-    mv = memoryview(b)
-    with open(filename, "rb", buffering=0) as f:
-        while n := f.readinto(mv):
-            h.update(mv[:n])
+    part_path = Path(f"{save_path}.part")
+    headers = {"User-Agent": settings.user_agent}
+    try:
+        async with httpx.AsyncClient(headers=headers, follow_redirects=True) as client:
+            async with client.stream("GET", url, timeout=60) as resp:
+                resp.raise_for_status()
+                content_length = resp.headers.get("Content-Length")
+                total = int(content_length) if content_length else None
+                downloaded = 0
+                with open(part_path, "wb") as out_file:
+                    async for chunk in resp.aiter_bytes(128 * 1024):
+                        out_file.write(chunk)
+                        h.update(chunk)
+                        downloaded += len(chunk)
+                        if on_progress:
+                            on_progress(downloaded, total)
+        os.replace(part_path, save_path)
+    finally:
+        # left behind by a download that failed midway
+        part_path.unlink(missing_ok=True)
     return h.hexdigest()
 
 
@@ -177,6 +215,28 @@ async def fetch_release_payment_info(
         return None
 
 
+def _extract_into(zip_ref: zipfile.ZipFile, target: Path):
+    """
+    Extract the single top level folder of the archive as `target`.
+    The files are unpacked into a staging folder next to `target` (same filesystem)
+    which then replaces `target` by renaming, so `target` is never half written.
+    """
+    staging = Path(target.parent, f".{target.name}.staging")
+    replaced = Path(target.parent, f".{target.name}.old")
+    shutil.rmtree(staging, True)
+    shutil.rmtree(replaced, True)
+
+    zip_ref.extractall(staging)
+    generated_dir_name = os.listdir(staging)[0]
+
+    if target.exists():
+        os.rename(target, replaced)
+    os.rename(Path(staging, generated_dir_name), target)
+
+    shutil.rmtree(replaced, True)
+    shutil.rmtree(staging, True)
+
+
 def icon_to_github_url(source_repo: str, path: Optional[str]) -> str:
     if not path:
         return ""
@@ -412,72 +472,98 @@ class InstallableExtension(BaseModel):
             return self.installed_release.version
         return ""
 
+    @property
+    def install_progress(self) -> InstallProgress:
+        progress = install_progress.get(self.id)
+        if not progress:
+            progress = InstallProgress()
+            install_progress[self.id] = progress
+        return progress
+
     async def download_archive(self):
         logger.info(f"Downloading extension {self.name} ({self.installed_version}).")
         ext_zip_file = self.zip_path
         if ext_zip_file.is_file():
             os.remove(ext_zip_file)
+
+        progress = self.install_progress
+        progress.stage = "downloading"
+
+        def _on_progress(downloaded: int, total: Optional[int]):
+            progress.downloaded_bytes = downloaded
+            progress.total_bytes = total
+
         try:
             assert self.installed_release, "installed_release is none."
 
             self._restore_payment_info()
 
-            await asyncio.to_thread(
-                download_url, self.installed_release.archive_url, ext_zip_file
+            archive_hash = await download_url(
+                self.installed_release.archive_url, ext_zip_file, _on_progress
             )
 
             self._remember_payment_info()
 
         except Exception as exc:
             logger.warning(exc)
+            self._finish_install("failed")
             raise AssertionError("Cannot fetch extension archive file") from exc
 
-        archive_hash = file_hash(ext_zip_file)
         if self.installed_release.hash and self.installed_release.hash != archive_hash:
             # remove downloaded archive
             if ext_zip_file.is_file():
                 os.remove(ext_zip_file)
+            self._finish_install("failed")
             raise AssertionError("File hash missmatch. Will not install.")
 
-    def extract_archive(self):
+    async def extract_archive(self):
         logger.info(f"Extracting extension {self.name} ({self.installed_version}).")
+        self.install_progress.stage = "extracting"
+        try:
+            await asyncio.to_thread(self._extract_archive)
+        except Exception:
+            self._finish_install("failed")
+            raise
+        self._finish_install("installed")
+        logger.success(f"Extension {self.name} ({self.installed_version}) installed.")
+
+    def _finish_install(self, stage: str):
+        progress = self.install_progress
+        progress.stage = stage
+        # the admin ui polls until it sees the final stage, then it is not needed
+        asyncio.get_running_loop().call_later(
+            60, _forget_install_progress, self.id, progress
+        )
+
+    def _extract_archive(self):
         Path(settings.lnbits_extensions_path, "upgrades").mkdir(
             parents=True, exist_ok=True
         )
-
-        tmp_dir = Path(settings.lnbits_data_folder, "unzip-temp", self.hash)
-        shutil.rmtree(tmp_dir, True)
+        Path(settings.lnbits_extensions_path, "extensions").mkdir(
+            parents=True, exist_ok=True
+        )
 
         with zipfile.ZipFile(self.zip_path, "r") as zip_ref:
-            zip_ref.extractall(tmp_dir)
-        generated_dir_name = os.listdir(tmp_dir)[0]
-        shutil.rmtree(self.ext_upgrade_dir, True)
-        shutil.copytree(
-            Path(tmp_dir, generated_dir_name),
-            Path(self.ext_upgrade_dir),
-        )
-        shutil.rmtree(tmp_dir, True)
-
-        # Pre-packed extensions can be upgraded
-        # Mark the extension as installed so we know it is not the pre-packed version
-        with open(Path(self.ext_upgrade_dir, "config.json"), "r+") as json_file:
-            config_json = json.load(json_file)
-
-            self.name = config_json.get("name")
-            self.short_description = config_json.get("short_description")
-
-            if (
-                self.installed_release
-                and self.installed_release.is_github_release
-                and config_json.get("tile")
-            ):
-                self.icon = icon_to_github_url(
-                    self.installed_release.source_repo, config_json.get("tile")
-                )
+            _extract_into(zip_ref, self.ext_upgrade_dir)
+
+            # Pre-packed extensions can be upgraded
+            # Mark the extension as installed so we know it is not the pre-packed
+            with open(Path(self.ext_upgrade_dir, "config.json")) as json_file:
+                config_json = json.load(json_file)
+
+                self.name = config_json.get("name")
+                self.short_description = config_json.get("short_description")
+
+                if (
+                    self.installed_release
+                    and self.installed_release.is_github_release
+                    and config_json.get("tile")
+                ):
+                    self.icon = icon_to_github_url(
+                        self.installed_release.source_repo, config_json.get("tile")
+                    )
 
-        shutil.rmtree(self.ext_dir, True)
-        shutil.copytree(Path(self.ext_upgrade_dir), Path(self.ext_dir))
-        logger.success(f"Extension {self.name} ({self.installed_version}) installed.")
+            _extract_into(zip_ref, self.ext_dir)
 
     def notify_upgrade(self) -> None:
         """
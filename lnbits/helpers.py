@@ -16,20 +16,16 @@ from lnbits.requestvars import g
 from lnbits.settings import settings
 from lnbits.utils.crypto import AESCipher
 
-from .db import FilterModel
+from .db import COCKROACH, POSTGRES, FilterModel, database_type
 from .extension_manager import get_valid_extensions
 
 
 def get_db_vendor_name():
-    db_url = settings.lnbits_database_url
+    db_type = database_type(settings.lnbits_database_url)
     return (
         "PostgreSQL"
-        if db_url and db_url.startswith("postgres://")
-        else (
-            "CockroachDB"
-            if db_url and db_url.startswith("cockroachdb://")
-            else "SQLite"
-        )
+        if db_type == POSTGRES
+        else "CockroachDB" if db_type == COCKROACH else "SQLite"
     )
 
 
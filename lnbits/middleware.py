@@ -1,17 +1,22 @@
+import time
 from http import HTTPStatus
 from typing import Any, List, Tuple, Union
 
 from fastapi import FastAPI, Request
 from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
+from loguru import logger
 from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 from slowapi.middleware import SlowAPIMiddleware
+from starlette.datastructures import MutableHeaders
 from starlette.middleware.gzip import GZipMiddleware
-from starlette.types import ASGIApp, Receive, Scope, Send
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
 from lnbits.core.db import core_app_extra
 from lnbits.helpers import template_renderer
 from lnbits.settings import settings
+from lnbits.utils.metrics import http_request_duration
+from lnbits.utils.query_trace import trace_queries
 
 
 class InstalledExtensionMiddleware:
@@ -33,7 +38,7 @@ class InstalledExtensionMiddleware:
         headers = scope.get("headers", [])
 
         # block path for all users if the extension is disabled
-        if top_path in settings.lnbits_deactivated_extensions:
+        if top_path in settings.snapshot.deactivated_extensions:
             response = self._response_by_accepted_type(
                 scope, headers, f"Extension '{top_path}' disabled", HTTPStatus.NOT_FOUND
             )
@@ -104,6 +109,74 @@ class CustomGZipMiddleware(GZipMiddleware):
         await super().__call__(scope, receive, send)
 
 
+class MetricsMiddleware:
+    # Observes the latency of every http request, labeled with the path template
+    # of its route (e.g. `/api/v1/payments/{payment_hash}`) to keep the number of
+    # labels bounded. Requests that match no route are labeled `other`.
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            http_request_duration.observe(
+                time.perf_counter() - start,
+                scope["method"],
+                getattr(route, "path", "other"),
+                str(status),
+            )
+
+
+class QueryTraceMiddleware:
+    # Traces the database queries of every http request (`lnbits_query_trace`).
+    # Their count and duration (so far) are added to the response headers and a
+    # summary is logged when the request is done, as a warning if the same
+    # statement ran more than once (a likely N+1 query).
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with trace_queries() as trace:
+
+            async def send_with_headers(message: Message) -> None:
+                if message["type"] == "http.response.start":
+                    headers = MutableHeaders(scope=message)
+                    ms = trace.seconds * 1000
+                    timing = f'db;dur={ms:.1f};desc="{trace.count} queries"'
+                    headers.append("X-Query-Count", str(trace.count))
+                    headers.append("Server-Timing", timing)
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_headers)
+            finally:
+                route = getattr(scope.get("route"), "path", scope["path"])
+                summary = f"{scope['method']} {route}: {trace.summary()}"
+                if trace.repeated():
+                    logger.warning(summary)
+                else:
+                    logger.debug(summary)
+
+
 class ExtensionsRedirectMiddleware:
     # Extensions are allowed to specify redirect paths. A call to a path outside the
     # scope of the extension can be redirected to one of the extension's endpoints.
@@ -204,9 +277,10 @@ def add_ip_block_middleware(app: FastAPI):
                 status_code=403,  # Forbidden
                 content={"detail": "No request client"},
             )
+        snapshot = settings.snapshot
         if (
-            request.client.host in settings.lnbits_blocked_ips
-            and request.client.host not in settings.lnbits_allowed_ips
+            request.client.host in snapshot.blocked_ips
+            and request.client.host not in snapshot.allowed_ips
         ):
             return JSONResponse(
                 status_code=403,  # Forbidden
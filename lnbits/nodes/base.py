@@ -1,12 +1,15 @@
 from __future__ import annotations
 
+import asyncio
 from abc import ABC, abstractmethod
 from enum import Enum
+from time import time
 from typing import TYPE_CHECKING, Optional
 
 from pydantic import BaseModel
 
 from lnbits.db import FilterModel, Filters, Page
+from lnbits.nodes.store import NodeBatch, NodeRecords
 from lnbits.utils.cache import cache
 
 if TYPE_CHECKING:
@@ -149,6 +152,14 @@ class Node(ABC):
     def __init__(self, wallet: Wallet):
         self.wallet = wallet
         self.id: Optional[str] = None
+        self.payments: NodeRecords[NodePayment] = NodeRecords(
+            self._fetch_payments, lambda payment: payment.pending
+        )
+        self.invoices: NodeRecords[NodeInvoice] = NodeRecords(
+            self._fetch_invoices,
+            # an expired invoice can not be paid anymore
+            lambda invoice: invoice.pending and (invoice.expiry or 0) > time(),
+        )
 
     @property
     def name(self):
@@ -165,7 +176,8 @@ class Node(ABC):
 
     async def get_peers(self) -> list[NodePeerInfo]:
         peer_ids = await self.get_peer_ids()
-        return [await self.get_peer_info(peer_id) for peer_id in peer_ids]
+        peers = await self.get_peer_infos(peer_ids)
+        return list(peers.values())
 
     @abstractmethod
     async def get_peer_ids(self) -> list[str]:
@@ -192,6 +204,19 @@ class Node(ABC):
                 cache.set(key, info)
         return info
 
+    async def get_peer_infos(
+        self, peer_ids: list[str], concurrency: int = 10
+    ) -> dict[str, NodePeerInfo]:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def get_peer_info(peer_id: str) -> NodePeerInfo:
+            async with semaphore:
+                return await self.get_peer_info(peer_id)
+
+        unique_ids = list(dict.fromkeys(peer_ids))
+        infos = await asyncio.gather(*[get_peer_info(i) for i in unique_ids])
+        return dict(zip(unique_ids, infos))
+
     @abstractmethod
     async def open_channel(
         self,
@@ -223,14 +248,24 @@ class Node(ABC):
         info = await self.get_info()
         return PublicNodeInfo(**info.__dict__)
 
-    @abstractmethod
     async def get_payments(
         self, filters: Filters[NodePaymentsFilters]
     ) -> Page[NodePayment]:
-        pass
+        return await self.payments.page(filters)
 
-    @abstractmethod
     async def get_invoices(
         self, filters: Filters[NodeInvoiceFilters]
     ) -> Page[NodeInvoice]:
-        pass
+        return await self.invoices.page(filters)
+
+    async def sync(self):
+        await self.payments.sync()
+        await self.invoices.sync()
+
+    @abstractmethod
+    async def _fetch_payments(self, after: int, limit: int) -> NodeBatch:
+        """Up to `limit` payments with an index after `after`, oldest first."""
+
+    @abstractmethod
+    async def _fetch_invoices(self, after: int, limit: int) -> NodeBatch:
+        """Up to `limit` invoices with an index after `after`, oldest first."""
@@ -1,15 +1,10 @@
 from __future__ import annotations
 
-import asyncio
 from http import HTTPStatus
 from typing import TYPE_CHECKING, Optional
 
 from fastapi import HTTPException
 
-from lnbits.db import Filters, Page
-
-from ..utils.cache import cache
-
 try:
     from pyln.client import RpcError  # type: ignore
 
@@ -29,10 +24,9 @@ from lnbits.nodes.base import (
     Node,
     NodeFees,
     NodeInvoice,
-    NodeInvoiceFilters,
-    NodePaymentsFilters,
     NodePeerInfo,
 )
+from lnbits.nodes.store import NodeBatch
 
 from .base import NodeChannel, NodeInfoResponse, NodePayment
 
@@ -57,16 +51,20 @@ def catch_rpc_errors(f):
 class CoreLightningNode(Node):
     wallet: CoreLightningWallet
 
-    async def ln_rpc(self, method, *args, **kwargs) -> dict:
-        loop = asyncio.get_event_loop()
-        fn = getattr(self.wallet.ln, method)
-        return await loop.run_in_executor(None, lambda: fn(*args, **kwargs))
+    def __init__(self, wallet: CoreLightningWallet):
+        super().__init__(wallet)
+        # parts of the payments that can still change, by payment hash and group
+        self._open_parts: dict[tuple[str, int], dict[int, dict]] = {}
+        self.payments.fetch_open = self._fetch_open_payment
+
+    async def ln_rpc(self, method, **kwargs) -> dict:
+        return await self.wallet.ln.call(method, kwargs)
 
     @catch_rpc_errors
     async def connect_peer(self, uri: str):
         # https://docs.corelightning.org/reference/lightning-connect
         try:
-            await self.ln_rpc("connect", uri)
+            await self.ln_rpc("connect", id=uri)
         except RpcError as exc:
             if exc.error["code"] == 400:
                 raise HTTPException(
@@ -78,7 +76,7 @@ class CoreLightningNode(Node):
     @catch_rpc_errors
     async def disconnect_peer(self, peer_id: str):
         try:
-            await self.ln_rpc("disconnect", peer_id)
+            await self.ln_rpc("disconnect", id=peer_id)
         except RpcError as exc:
             if exc.error["code"] == -1:
                 raise HTTPException(
@@ -99,7 +97,7 @@ class CoreLightningNode(Node):
         try:
             result = await self.ln_rpc(
                 "fundchannel",
-                peer_id,
+                id=peer_id,
                 amount=local_amount,
                 push_msat=int(push_amount * 1000) if push_amount else None,
                 feerate=fee_rate,
@@ -154,7 +152,7 @@ class CoreLightningNode(Node):
         if not short_id:
             raise HTTPException(status_code=400, detail="Short id required")
         try:
-            await self.ln_rpc("close", short_id)
+            await self.ln_rpc("close", id=short_id)
         except RpcError as exc:
             message = exc.error["message"]
             if (
@@ -177,7 +175,7 @@ class CoreLightningNode(Node):
 
     @catch_rpc_errors
     async def _get_peer_info(self, peer_id: str) -> NodePeerInfo:
-        result = await self.ln_rpc("listnodes", peer_id)
+        result = await self.ln_rpc("listnodes", id=peer_id)
         nodes = result["nodes"]
         if len(nodes) == 0:
             return NodePeerInfo(id=peer_id)
@@ -271,69 +269,128 @@ class CoreLightningNode(Node):
         )
 
     @catch_rpc_errors
-    async def get_payments(
-        self, filters: Filters[NodePaymentsFilters]
-    ) -> Page[NodePayment]:
-        async def get_payments():
-            result = await self.ln_rpc("listpays")
-            return [
-                NodePayment(
-                    bolt11=pay.get("bolt11"),
-                    amount=pay["amount_msat"],
-                    fee=int(pay["amount_msat"]) - int(pay["amount_sent_msat"]),
-                    memo=pay.get("description"),
-                    time=pay["created_at"],
-                    preimage=pay.get("preimage"),
-                    payment_hash=pay["payment_hash"],
-                    pending=pay["status"] != "complete",
-                    destination=await self.get_peer_info(pay["destination"]),
-                )
-                for pay in reversed(result["pays"])
-                if pay["status"] != "failed"
+    async def _fetch_payments(self, after: int, limit: int) -> NodeBatch:
+        # https://docs.corelightning.org/reference/lightning-listsendpays
+        result = await self.ln_rpc(
+            "listsendpays", index="created", start=after + 1, limit=limit
+        )
+        parts = result["payments"]
+        changed: set[tuple[str, int]] = set()
+        for part in parts:
+            group = (part["payment_hash"], part.get("groupid", 0))
+            index = part["created_index"]
+            if group not in self._open_parts and index <= self.payments.last_index:
+                # a part of a payment that was final when it was synced
+                continue
+            self._open_parts.setdefault(group, {})[index] = part
+            changed.add(group)
+
+        peers = await self.get_peer_infos(
+            [
+                part["destination"]
+                for group in changed
+                for part in self._open_parts[group].values()
+                if part.get("destination")
             ]
+        )
+        records = []
+        for group in changed:
+            group_parts = self._open_parts[group]
+            payment = _payment_from_parts(list(group_parts.values()), peers)
+            records.append((min(group_parts), payment))
+        more = len(parts) == limit
+        if not more:
+            # the parts of a payment can be split over batches, so the parts of
+            # final payments are only dropped after the last one
+            for group, group_parts in list(self._open_parts.items()):
+                if all(part["status"] != "pending" for part in group_parts.values()):
+                    self._open_parts.pop(group)
+        return NodeBatch(
+            records,
+            last_index=parts[-1]["created_index"] if parts else after,
+            more=more,
+        )
 
-        results = await cache.save_result(get_payments, key="node:payments")
-        count = len(results)
-        if filters.offset:
-            results = results[filters.offset :]
-        if filters.limit:
-            results = results[: filters.limit]
-        return Page(data=results, total=count)
+    @catch_rpc_errors
+    async def _fetch_open_payment(self, index: int) -> Optional[NodePayment]:
+        # a payment is stored at the index of its first part
+        group = next(
+            (group for group, parts in self._open_parts.items() if min(parts) == index),
+            None,
+        )
+        if not group:
+            return None
+        result = await self.ln_rpc("listsendpays", payment_hash=group[0])
+        parts = {
+            part["created_index"]: part
+            for part in result["payments"]
+            if part.get("groupid", 0) == group[1]
+        }
+        if not parts or all(part["status"] != "pending" for part in parts.values()):
+            self._open_parts.pop(group)
+        else:
+            self._open_parts[group] = parts
+        peers = await self.get_peer_infos(
+            [part["destination"] for part in parts.values() if part.get("destination")]
+        )
+        return _payment_from_parts(list(parts.values()), peers) if parts else None
 
     @catch_rpc_errors
-    async def get_invoices(
-        self, filters: Filters[NodeInvoiceFilters]
-    ) -> Page[NodeInvoice]:
-        result = await cache.save_result(
-            lambda: self.ln_rpc("listinvoices"), key="node:invoices"
+    async def _fetch_invoices(self, after: int, limit: int) -> NodeBatch:
+        # https://docs.corelightning.org/reference/lightning-listinvoices
+        result = await self.ln_rpc(
+            "listinvoices", index="created", start=after + 1, limit=limit
         )
         invoices = result["invoices"]
-        invoices.reverse()
-        count = len(invoices)
-        if filters.offset:
-            invoices = invoices[filters.offset :]
-        if filters.limit:
-            invoices = invoices[: filters.limit]
-        return Page(
-            data=[
-                NodeInvoice(
-                    bolt11=invoice.get("bolt11") or invoice.get("bolt12"),
-                    amount=(
-                        # normal invoice
-                        invoice.get("amount_msat")
-                        # keysend or paid amountless invoice
-                        or invoice.get("amount_received_msat")
-                        # unpaid amountless invoice
-                        or 0
+        return NodeBatch(
+            [
+                (
+                    invoice["created_index"],
+                    NodeInvoice(
+                        bolt11=invoice.get("bolt11") or invoice.get("bolt12"),
+                        amount=(
+                            # normal invoice
+                            invoice.get("amount_msat")
+                            # keysend or paid amountless invoice
+                            or invoice.get("amount_received_msat")
+                            # unpaid amountless invoice
+                            or 0
+                        ),
+                        preimage=invoice.get("payment_preimage"),
+                        memo=invoice.get("description"),
+                        paid_at=invoice.get("paid_at"),
+                        expiry=invoice["expires_at"],
+                        payment_hash=invoice["payment_hash"],
+                        pending=invoice["status"] != "paid",
                     ),
-                    preimage=invoice.get("payment_preimage"),
-                    memo=invoice.get("description"),
-                    paid_at=invoice.get("paid_at"),
-                    expiry=invoice["expires_at"],
-                    payment_hash=invoice["payment_hash"],
-                    pending=invoice["status"] != "paid",
                 )
                 for invoice in invoices
             ],
-            total=count,
+            last_index=invoices[-1]["created_index"] if invoices else after,
+            more=len(invoices) == limit,
         )
+
+
+def _payment_from_parts(
+    parts: list[dict], peers: dict[str, NodePeerInfo]
+) -> Optional[NodePayment]:
+    """Combines the parts of a payment like `listpays`, `None` if it failed."""
+    complete = [part for part in parts if part["status"] == "complete"]
+    pending = [part for part in parts if part["status"] == "pending"]
+    if not complete and not pending:
+        return None
+    first = parts[0]
+    sent = complete or pending
+    amount = sum(int(part.get("amount_msat") or 0) for part in sent)
+    destination = first.get("destination")
+    return NodePayment(
+        bolt11=first.get("bolt11"),
+        amount=amount,
+        fee=sum(int(part["amount_sent_msat"]) for part in sent) - amount,
+        memo=first.get("description"),
+        time=first["created_at"],
+        preimage=next((p.get("payment_preimage") for p in complete), None),
+        payment_hash=first["payment_hash"],
+        pending=not complete,
+        destination=peers.get(destination) if destination else None,
+    )
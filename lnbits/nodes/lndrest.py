@@ -10,7 +10,6 @@ from fastapi import HTTPException
 from httpx import HTTPStatusError
 from loguru import logger
 
-from lnbits.db import Filters, Page
 from lnbits.nodes import Node
 from lnbits.nodes.base import (
     ChannelBalance,
@@ -21,13 +20,11 @@ from lnbits.nodes.base import (
     NodeFees,
     NodeInfoResponse,
     NodeInvoice,
-    NodeInvoiceFilters,
     NodePayment,
-    NodePaymentsFilters,
     NodePeerInfo,
     PublicNodeInfo,
 )
-from lnbits.utils.cache import cache
+from lnbits.nodes.store import NodeBatch
 
 if TYPE_CHECKING:
     from lnbits.wallets import LndRestWallet
@@ -37,6 +34,10 @@ def msat(raw: str) -> int:
     return int(raw) * 1000
 
 
+def _payment_destination(payment: dict) -> str:
+    return payment["htlcs"][0]["route"]["hops"][-1]["pub_key"]
+
+
 def _decode_bytes(data: str) -> str:
     return base64.b64decode(data).hex()
 
@@ -286,105 +287,67 @@ class LndRestNode(Node):
             ),
         )
 
-    async def get_payments(
-        self, filters: Filters[NodePaymentsFilters]
-    ) -> Page[NodePayment]:
-        count_key = "node:payments_count"
-        payments_count = cache.get(count_key)
-        if not payments_count and filters.offset:
-            # this forces fetching the payments count
-            await self.get_payments(Filters(limit=1))
-            payments_count = cache.get(count_key)
-
-        if filters.offset and payments_count:
-            index_offset = max(payments_count + 1 - filters.offset, 0)
-        else:
-            index_offset = 0
-
+    async def _fetch_payments(self, after: int, limit: int) -> NodeBatch:
         response = await self.get(
             "/v1/payments",
             params={
-                "index_offset": index_offset,
-                "max_payments": filters.limit,
+                "index_offset": after,
+                "max_payments": limit,
                 "include_incomplete": True,
-                "reversed": True,
-                "count_total_payments": not index_offset,
             },
         )
+        payments = response["payments"]
+        peers = await self.get_peer_infos(
+            [_payment_destination(payment) for payment in payments if payment["htlcs"]]
+        )
+        return NodeBatch(
+            [
+                (
+                    int(payment["payment_index"]),
+                    NodePayment(
+                        payment_hash=payment["payment_hash"],
+                        pending=payment["status"] == "IN_FLIGHT",
+                        amount=payment["value_msat"],
+                        fee=payment["fee_msat"],
+                        time=payment["creation_date"],
+                        destination=(
+                            peers[_payment_destination(payment)]
+                            if payment["htlcs"]
+                            else None
+                        ),
+                        bolt11=payment["payment_request"],
+                        preimage=payment["payment_preimage"],
+                    ),
+                )
+                for payment in payments
+            ],
+            last_index=int(response["last_index_offset"] or after),
+            more=len(payments) == limit,
+        )
 
-        if not filters.offset:
-            payments_count = int(response["total_num_payments"])
-
-        cache.set(count_key, payments_count)
-
-        payments = [
-            NodePayment(
-                payment_hash=payment["payment_hash"],
-                pending=payment["status"] == "IN_FLIGHT",
-                amount=payment["value_msat"],
-                fee=payment["fee_msat"],
-                time=payment["creation_date"],
-                destination=(
-                    await self.get_peer_info(
-                        payment["htlcs"][0]["route"]["hops"][-1]["pub_key"]
-                    )
-                    if payment["htlcs"]
-                    else None
-                ),
-                bolt11=payment["payment_request"],
-                preimage=payment["payment_preimage"],
-            )
-            for payment in response["payments"]
-        ]
-
-        payments.sort(key=lambda p: p.time, reverse=True)
-
-        return Page(data=payments, total=payments_count or 0)
-
-    async def get_invoices(
-        self, filters: Filters[NodeInvoiceFilters]
-    ) -> Page[NodeInvoice]:
-        last_invoice_key = "node:last_invoice_index"
-        last_invoice_index = cache.get(last_invoice_key)
-        if not last_invoice_index and filters.offset:
-            # this forces fetching the last invoice index so
-            await self.get_invoices(Filters(limit=1))
-            last_invoice_index = cache.get(last_invoice_key)
-
-        if filters.offset and last_invoice_index:
-            index_offset = max(last_invoice_index + 1 - filters.offset, 0)
-        else:
-            index_offset = 0
-
+    async def _fetch_invoices(self, after: int, limit: int) -> NodeBatch:
         response = await self.get(
             "/v1/invoices",
-            params={
-                "index_offset": index_offset,
-                "num_max_invoices": filters.limit,
-                "reversed": True,
-            },
+            params={"index_offset": after, "num_max_invoices": limit},
         )
-
-        if not filters.offset:
-            last_invoice_index = int(response["last_index_offset"])
-
-        cache.set(last_invoice_key, last_invoice_index)
-
-        invoices = [
-            NodeInvoice(
-                payment_hash=_decode_bytes(invoice["r_hash"]),
-                amount=invoice["value_msat"],
-                memo=invoice["memo"],
-                pending=invoice["state"] == "OPEN",
-                paid_at=invoice["settle_date"],
-                expiry=int(invoice["creation_date"]) + int(invoice["expiry"]),
-                preimage=_decode_bytes(invoice["r_preimage"]),
-                bolt11=invoice["payment_request"],
-            )
-            for invoice in reversed(response["invoices"])
-        ]
-
-        return Page(
-            data=invoices,
-            total=last_invoice_index or 0,
+        invoices = response["invoices"]
+        return NodeBatch(
+            [
+                (
+                    int(invoice["add_index"]),
+                    NodeInvoice(
+                        payment_hash=_decode_bytes(invoice["r_hash"]),
+                        amount=invoice["value_msat"],
+                        memo=invoice["memo"],
+                        pending=invoice["state"] == "OPEN",
+                        paid_at=invoice["settle_date"],
+                        expiry=int(invoice["creation_date"]) + int(invoice["expiry"]),
+                        preimage=_decode_bytes(invoice["r_preimage"]),
+                        bolt11=invoice["payment_request"],
+                    ),
+                )
+                for invoice in invoices
+            ],
+            last_index=int(response["last_index_offset"] or after),
+            more=len(invoices) == limit,
         )
@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import asyncio
+from bisect import bisect_left, insort
+from time import time
+from typing import Any, Awaitable, Callable, Generic, NamedTuple, Optional, TypeVar
+
+from lnbits.db import Filters, Page
+from lnbits.settings import settings
+
+T = TypeVar("T")
+
+
+class NodeBatch(NamedTuple):
+    # (index, record) pairs, a `None` record is removed from the store
+    records: list[tuple[int, Any]]
+    # highest index the node returned, where the next batch starts after
+    last_index: int
+    # whether the node may have records after `last_index`
+    more: bool
+
+
+class NodeRecords(Generic[T]):
+    """
+    Local copy of the payments or invoices of the node, ordered by their index on
+    the node (creation order) and served by offset, newest first.
+
+    `fetch(after, limit)` returns the next batch of records with an index higher
+    than `after`. A sync only fetches what was created since the last one, and
+    checks the records that can still change (`is_open`), so a pending payment
+    or an unpaid invoice is updated until it settles. Up to `max_open_checks` of
+    them are checked on their own with `fetch_open(index)`, by default a batch of
+    one. With more of them everything from the oldest one on is fetched again in
+    batches instead.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[int, int], Awaitable[NodeBatch]],
+        is_open: Callable[[T], bool],
+        fetch_open: Optional[Callable[[int], Awaitable[Optional[T]]]] = None,
+        batch_size: int = 1000,
+        concurrency: int = 10,
+        max_open_checks: int = 10,
+    ):
+        self.fetch = fetch
+        self.is_open = is_open
+        self.fetch_open = fetch_open or self._fetch_one
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.max_open_checks = max_open_checks
+        self.last_index = 0
+        self.synced_at: Optional[float] = None
+        self._records: dict[int, T] = {}
+        self._indexes: list[int] = []
+        self._open: set[int] = set()
+        self._lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        return len(self._indexes)
+
+    def put(self, index: int, record: Optional[T]):
+        if record is None:
+            self.discard(index)
+            return
+        if index not in self._records:
+            if not self._indexes or index > self._indexes[-1]:
+                self._indexes.append(index)
+            else:
+                insort(self._indexes, index)
+        self._records[index] = record
+        if self.is_open(record):
+            self._open.add(index)
+        else:
+            self._open.discard(index)
+
+    def discard(self, index: int):
+        if self._records.pop(index, None) is None:
+            return
+        del self._indexes[bisect_left(self._indexes, index)]
+        self._open.discard(index)
+
+    async def sync(self, max_age: float = 0):
+        """Fetches new and changed records, unless synced in the last `max_age`."""
+        async with self._lock:
+            if self.synced_at and time() - self.synced_at < max_age:
+                return
+            self._open = {i for i in self._open if self.is_open(self._records[i])}
+            if len(self._open) > self.max_open_checks:
+                after = min(self._open) - 1
+            else:
+                await self._sync_open()
+                after = self.last_index
+            while True:
+                batch = await self.fetch(after, self.batch_size)
+                for index, record in batch.records:
+                    self.put(index, record)
+                self.last_index = max(self.last_index, batch.last_index)
+                if not batch.more or batch.last_index <= after:
+                    break
+                after = batch.last_index
+            self.synced_at = time()
+
+    async def _sync_open(self):
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def fetch_open(index: int) -> tuple[int, Optional[T]]:
+            async with semaphore:
+                return index, await self.fetch_open(index)
+
+        opened = await asyncio.gather(*[fetch_open(i) for i in sorted(self._open)])
+        for index, record in opened:
+            self.put(index, record)
+
+    async def _fetch_one(self, index: int) -> Optional[T]:
+        batch = await self.fetch(index - 1, 1)
+        # not returned if it is gone from the node
+        return dict(batch.records).get(index)
+
+    async def page(self, filters: Filters) -> Page[T]:
+        # the first page shows the latest records, the next ones can lag behind
+        if filters.offset:
+            await self.sync(max_age=settings.lnbits_node_ui_sync_interval)
+        else:
+            await self.sync()
+        count = len(self._indexes)
+        end = max(count - (filters.offset or 0), 0)
+        start = max(end - filters.limit, 0) if filters.limit else 0
+        indexes = self._indexes[start:end]
+        return Page(
+            data=[self._records[index] for index in reversed(indexes)], total=count
+        )
+
+    def dict(self) -> dict:
+        return {
+            "records": len(self._indexes),
+            "open": len(self._open),
+            "last_index": self.last_index,
+            "synced_at": self.synced_at,
+        }
@@ -9,11 +9,11 @@ from hashlib import sha256
 from os import path
 from sqlite3 import Row
 from time import time
-from typing import Any, Optional
+from typing import Any, NamedTuple, Optional
 
 import httpx
 from loguru import logger
-from pydantic import BaseModel, BaseSettings, Extra, Field, validator
+from pydantic import BaseModel, BaseSettings, Extra, Field, PrivateAttr, validator
 
 
 def list_parse_fallback(v: str):
@@ -154,6 +154,13 @@ class SecuritySettings(LNbitsSettings):
 
 class FakeWalletFundingSource(LNbitsSettings):
     fake_wallet_secret: str = Field(default="ToTheMoon1")
+    # load testing: invoices kept in memory (0 keeps all), fast invoice encoding,
+    # seconds of latency and share of failed calls, pretend to pay any invoice
+    fake_wallet_max_invoices: int = Field(default=0, ge=0)
+    fake_wallet_fast_signing: bool = Field(default=False)
+    fake_wallet_latency: float = Field(default=0, ge=0)
+    fake_wallet_failure_rate: float = Field(default=0, ge=0, le=1)
+    fake_wallet_pay_external: bool = Field(default=False)
 
 
 class LNbitsFundingSource(LNbitsSettings):
@@ -171,6 +178,7 @@ class CoreLightningFundingSource(LNbitsSettings):
     corelightning_rpc: Optional[str] = Field(default=None)
     corelightning_pay_command: str = Field(default="pay")
     clightning_rpc: Optional[str] = Field(default=None)
+    corelightning_rpc_pool_size: int = Field(default=4, ge=1)
 
 
 class CoreLightningRestFundingSource(LNbitsSettings):
@@ -250,9 +258,50 @@ class LnTipsFundingSource(LNbitsSettings):
 
 class LightningSettings(LNbitsSettings):
     lightning_invoice_expiry: int = Field(default=3600)
+    # max number of invoices in one batch request
+    lightning_batch_max_size: int = Field(default=500)
+    # max number of concurrent funding source calls for a batch request
+    lightning_batch_concurrency: int = Field(default=10)
+
+
+class RouterWalletBackend(BaseModel):
+    name: str
+    wallet_class: str
+    weight: float = Field(default=1, ge=0)
+    # funding source settings of this backend, e.g. {"lnd_rest_endpoint": "..."}
+    settings: dict[str, Any] = Field(default={})
+
+
+class RouterFundingSource(LNbitsSettings):
+    router_wallet_backends: list[RouterWalletBackend] = Field(default=[])
+    # `weight` or `liquidity` (the backend with the least outbound balance)
+    router_wallet_strategy: str = Field(default="weight")
+
+
+class FundingSourceHttpSettings(LNbitsSettings):
+    # connection pool of the http based funding sources, the invoice streams
+    # have their own pool
+    funding_source_max_connections: int = Field(default=100, ge=1)
+    funding_source_max_keepalive_connections: int = Field(default=20, ge=0)
+    funding_source_keepalive_expiry: float = Field(default=30, ge=0)
+    # needs the `h2` package, backends that do not support it fall back to http/1.1
+    funding_source_http2: bool = Field(default=False)
+    # timeouts in seconds, `None` waits as long as the backend takes
+    funding_source_timeout: float = Field(default=10)
+    funding_source_invoice_timeout: float = Field(default=40)
+    funding_source_pay_timeout: Optional[float] = Field(default=None)
+
+
+class FundingSourceHealthSettings(LNbitsSettings):
+    # consecutive failures that open the circuit breaker of the funding source,
+    # and seconds until a probe call is let through again
+    funding_source_failure_threshold: int = Field(default=5, ge=1)
+    funding_source_reset_timeout: float = Field(default=30, ge=0)
 
 
 class FundingSourcesSettings(
+    FundingSourceHttpSettings,
+    FundingSourceHealthSettings,
     FakeWalletFundingSource,
     LNbitsFundingSource,
     ClicheFundingSource,
@@ -268,6 +317,7 @@ class FundingSourcesSettings(
     OpenNodeFundingSource,
     SparkFundingSource,
     LnTipsFundingSource,
+    RouterFundingSource,
 ):
     lnbits_backend_wallet_class: str = Field(default="VoidWallet")
 
@@ -390,6 +440,26 @@ class EnvSettings(LNbitsSettings):
     server_startup_time: int = Field(default=time())
     cleanup_wallets_days: int = Field(default=90)
     funding_source_max_retries: int = Field(default=4)
+    # samples the event loop lag and the call sites that block it for longer
+    # than the threshold (seconds), see /admin/api/v1/monitor
+    lnbits_loop_monitor: bool = Field(default=True)
+    lnbits_slow_callback_threshold: float = Field(default=0.1, gt=0)
+    lnbits_loop_monitor_log_interval: int = Field(default=300, ge=0)
+    # seconds a request to /public/v1/payment/{payment_hash} waits for the payment
+    lnbits_longpoll_timeout: int = Field(default=45, gt=0)
+    # seconds the responses of polled wallet endpoints are cached, 0 disables it
+    lnbits_response_cache_ttl: float = Field(default=5, ge=0)
+    # seconds between checks for admin settings changed by other workers
+    lnbits_settings_sync_interval: float = Field(default=10, ge=0)
+    # seconds between syncs of the node ui payments and invoices with the node
+    lnbits_node_ui_sync_interval: float = Field(default=10, ge=0)
+    # requests to lnurl services: whether hosts on private networks are allowed,
+    # the maximum response size in bytes and seconds lnurl metadata is cached
+    lnbits_outbound_allow_private_hosts: bool = Field(default=False)
+    lnbits_outbound_max_response_size: int = Field(default=2_000_000, ge=0)
+    lnbits_outbound_cache_ttl: float = Field(default=60, ge=0)
+    # trace the database queries of every request, for finding N+1 queries
+    lnbits_query_trace: bool = Field(default=False)
 
     @property
     def has_default_extension_path(self) -> bool:
@@ -469,7 +539,53 @@ class ReadOnlySettings(
         return [f for f in inspect.signature(cls).parameters if not f.startswith("_")]
 
 
+class SettingsSnapshot(NamedTuple):
+    """
+    Immutable sets derived from the settings that are checked on every request.
+    It is computed once after the settings it is made of changed.
+    """
+
+    version: int
+    super_user: str
+    admin_users: frozenset[str]
+    allowed_users: frozenset[str]
+    admin_extensions: frozenset[str]
+    deactivated_extensions: frozenset[str]
+    allowed_ips: frozenset[str]
+    blocked_ips: frozenset[str]
+
+    @classmethod
+    def from_settings(cls, s: Settings, version: int) -> SettingsSnapshot:
+        return cls(
+            version=version,
+            super_user=s.super_user,
+            admin_users=frozenset(s.lnbits_admin_users),
+            allowed_users=frozenset(s.lnbits_allowed_users),
+            admin_extensions=frozenset(s.lnbits_admin_extensions),
+            deactivated_extensions=frozenset(s.lnbits_deactivated_extensions),
+            allowed_ips=frozenset(s.lnbits_allowed_ips),
+            blocked_ips=frozenset(s.lnbits_blocked_ips),
+        )
+
+
+# settings that a `SettingsSnapshot` is derived from
+snapshot_fields = frozenset(
+    [
+        "super_user",
+        "lnbits_admin_users",
+        "lnbits_allowed_users",
+        "lnbits_admin_extensions",
+        "lnbits_deactivated_extensions",
+        "lnbits_allowed_ips",
+        "lnbits_blocked_ips",
+    ]
+)
+
+
 class Settings(EditableSettings, ReadOnlySettings, TransientSettings, BaseSettings):
+    _snapshot: Optional[SettingsSnapshot] = PrivateAttr(default=None)
+    _snapshot_version: int = PrivateAttr(default=0)
+
     @classmethod
     def from_row(cls, row: Row) -> Settings:
         data = dict(row)
@@ -481,14 +597,39 @@ class Settings(EditableSettings, ReadOnlySettings, TransientSettings, BaseSettin
         case_sensitive = False
         json_loads = list_parse_fallback
 
+    def __setattr__(self, name: str, value: Any):
+        super().__setattr__(name, value)
+        # lists must be assigned, not changed in place, to update the snapshot
+        if name in snapshot_fields:
+            self._snapshot = None
+
+    @property
+    def snapshot(self) -> SettingsSnapshot:
+        if self._snapshot is None:
+            self._snapshot_version += 1
+            self._snapshot = SettingsSnapshot.from_settings(
+                self, self._snapshot_version
+            )
+        return self._snapshot
+
     def is_user_allowed(self, user_id: str):
+        snapshot = self.snapshot
         return (
-            len(self.lnbits_allowed_users) == 0
-            or user_id in self.lnbits_allowed_users
-            or user_id in self.lnbits_admin_users
-            or user_id == self.super_user
+            len(snapshot.allowed_users) == 0
+            or user_id in snapshot.allowed_users
+            or user_id in snapshot.admin_users
+            or user_id == snapshot.super_user
         )
 
+    def is_admin_user(self, user_id: str) -> bool:
+        snapshot = self.snapshot
+        return user_id == snapshot.super_user or user_id in snapshot.admin_users
+
+    def is_admin_extension(self, path: str) -> bool:
+        """The path belongs to an extension that only admin users can use."""
+        admin_extensions = self.snapshot.admin_extensions
+        return bool(admin_extensions) and path.split("/")[1] in admin_extensions
+
 
 class SuperSettings(EditableSettings):
     super_user: str
@@ -3,25 +3,32 @@ import json
 import time
 import traceback
 import uuid
+from collections import deque
 from http import HTTPStatus
-from typing import Dict, List, Optional
+from typing import Deque, Dict, List, Optional, Tuple
 
 from loguru import logger
-from py_vapid import Vapid
-from pywebpush import WebPushException, webpush
 
 from lnbits.core.crud import (
     delete_expired_invoices,
-    delete_webpush_subscriptions,
+    delete_webpush_subscriptions_for_endpoints,
+    get_invoice_stream_cursor,
     get_payments,
     get_standalone_payment,
+    update_invoice_stream_cursor,
 )
+from lnbits.core.models import WebPushSubscription
 from lnbits.settings import settings
+from lnbits.utils.metrics import queue_size, task_duration
+from lnbits.utils.webpush import webpush_sender
 from lnbits.wallets import get_funding_source
 
 tasks: List[asyncio.Task] = []
 unique_tasks: Dict[str, asyncio.Task] = {}
 
+PushNotification = Tuple[WebPushSubscription, str, str, str]
+push_notification_queue: asyncio.Queue = asyncio.Queue(10000)
+
 
 def create_task(coro):
     task = asyncio.create_task(coro)
@@ -99,6 +106,14 @@ def register_invoice_listener(send_chan: asyncio.Queue, name: Optional[str] = No
 internal_invoice_queue: asyncio.Queue = asyncio.Queue(0)
 
 
+@queue_size
+def collect_queue_sizes():
+    yield ("internal_invoices",), internal_invoice_queue.qsize()
+    yield ("push_notifications",), push_notification_queue.qsize()
+    for name, queue in invoice_listeners.items():
+        yield (f"invoice_listener:{name}",), queue.qsize()
+
+
 async def internal_invoice_listener():
     """
     internal_invoice_queue will be filled directly in core/services.py
@@ -117,12 +132,77 @@ async def invoice_listener():
     invoice_listener will collect all invoices that come directly
     from the backend wallet.
 
+    If the backend can replay its stream, it resumes from the cursor saved by the
+    previous run, so invoices settled while LNbits was down are not missed.
+
     Called by the app startup sequence.
     """
     funding_source = get_funding_source()
+    if not funding_source.resumable_invoice_stream:
+        async for checking_id in funding_source.paid_invoices_stream():
+            logger.info("> got a payment notification", checking_id)
+            create_task(invoice_callback_dispatcher(checking_id))
+        return
+
+    cursor_key = funding_source.invoice_stream_cursor_key
+    funding_source.invoice_stream_cursor = await get_invoice_stream_cursor(cursor_key)
+    cursor = InvoiceStreamCursor(cursor_key)
     async for checking_id in funding_source.paid_invoices_stream():
         logger.info("> got a payment notification", checking_id)
-        create_task(invoice_callback_dispatcher(checking_id))
+        cursor.dispatch(checking_id, funding_source.invoice_stream_cursor)
+    await cursor.drain()
+
+
+class InvoiceStreamCursor:
+    """
+    Saves the cursor of a resumable invoice stream while its payments are
+    dispatched concurrently. The saved cursor is the highest one below which every
+    dispatch has finished, so a crash replays the payments still being dispatched.
+    A failed dispatch is retried, it holds the cursor back only until it succeeds.
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        # cursor after each payment that is dispatched, in stream order
+        self.dispatches: Deque[Tuple[Optional[int], asyncio.Task]] = deque()
+        self._lock = asyncio.Lock()
+
+    def dispatch(self, checking_id: str, cursor: Optional[int]):
+        task = create_task(dispatch_with_retries(checking_id))
+        self.dispatches.append((cursor, task))
+        task.add_done_callback(lambda _: create_task(self.save()))
+
+    async def save(self):
+        # under the lock, so the saved cursor only moves forward
+        async with self._lock:
+            cursor = None
+            while self.dispatches and self.dispatches[0][1].done():
+                popped = self.dispatches.popleft()[0]
+                cursor = cursor if popped is None else popped
+            if cursor is not None:
+                await update_invoice_stream_cursor(self.key, cursor)
+
+    async def drain(self):
+        await asyncio.gather(*[task for _, task in self.dispatches])
+        await self.save()
+
+
+async def dispatch_with_retries(
+    checking_id: str, delay: float = 0.1, max_delay: float = 60
+):
+    while True:
+        try:
+            await invoice_callback_dispatcher(checking_id)
+            return
+        except Exception as exc:
+            if not settings.lnbits_running:
+                raise
+            logger.error(
+                f"could not dispatch payment {checking_id}: {exc!s},"
+                f" retrying in {delay:.1f} s"
+            )
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, max_delay)
 
 
 async def check_pending_payments():
@@ -130,9 +210,18 @@ async def check_pending_payments():
     check_pending_payments is called during startup to check for pending payments with
     the backend and also to delete expired invoices. Incoming payments will be
     checked only once, outgoing pending payments will be checked regularly.
+
+    Incoming payments are not checked at all if the invoice stream resumes from a
+    saved cursor, it replays everything that was settled in the meantime.
     """
+    funding_source = get_funding_source()
     outgoing = True
-    incoming = True
+    incoming = not (
+        funding_source.resumable_invoice_stream
+        and await get_invoice_stream_cursor(funding_source.invoice_stream_cursor_key)
+        is not None
+    )
+    first_check = True
 
     while settings.lnbits_running:
         logger.info(
@@ -152,12 +241,13 @@ async def check_pending_payments():
             await payment.check_status()
             await asyncio.sleep(0.01)  # to avoid complete blocking
 
+        task_duration.observe(time.time() - start_time, "check_pending_payments")
         logger.info(
             f"Task: pending check finished for {len(pending_payments)} payments"
             f" (took {time.time() - start_time:0.3f} s)"
         )
         # we delete expired invoices once upon the first pending check
-        if incoming:
+        if first_check:
             logger.debug("Task: deleting all expired invoices")
             start_time = time.time()
             await delete_expired_invoices()
@@ -169,6 +259,7 @@ async def check_pending_payments():
         # after the first check we will only check outgoing, not incoming
         # that will be handled by the global invoice listeners, hopefully
         incoming = False
+        first_check = False
 
         await asyncio.sleep(60 * 30)  # every 30 minutes
 
@@ -190,18 +281,55 @@ async def invoice_callback_dispatcher(checking_id: str):
 
 
 async def send_push_notification(subscription, title, body, url=""):
-    vapid = Vapid()
+    await send_push_notifications([(subscription, title, body, url)])
+
+
+async def send_push_notifications(notifications: List[PushNotification]):
+    """
+    Sends the push notifications concurrently and deletes the subscriptions that
+    are gone (unsubscribed or expired) afterwards with a single query.
+    """
+
+    async def send(subscription, title, body, url) -> Optional[str]:
+        try:
+            logger.debug("sending push notification")
+            r = await webpush_sender.send(
+                json.loads(subscription.data),
+                json.dumps({"title": title, "body": body, "url": url}),
+            )
+        except Exception as exc:
+            logger.error(f"failed sending push notification: {exc!s}")
+            return None
+        if r.status_code == HTTPStatus.GONE:
+            return subscription.endpoint
+        if r.status_code > 202:
+            logger.error(f"failed sending push notification: {r.text}")
+        return None
+
+    results = await asyncio.gather(*[send(*n) for n in notifications])
+    gone = list({endpoint for endpoint in results if endpoint})
+    if gone:
+        logger.debug(f"deleting {len(gone)} gone push subscriptions")
+        await delete_webpush_subscriptions_for_endpoints(gone)
+
+
+def enqueue_push_notification(subscription, title, body, url=""):
     try:
-        logger.debug("sending push notification")
-        webpush(
-            json.loads(subscription.data),
-            json.dumps({"title": title, "body": body, "url": url}),
-            vapid.from_pem(bytes(settings.lnbits_webpush_privkey, "utf-8")),
-            {"aud": "", "sub": "mailto:alan@lnbits.com"},
-        )
-    except WebPushException as e:
-        if e.response.status_code == HTTPStatus.GONE:
-            # cleanup unsubscribed or expired push subscriptions
-            await delete_webpush_subscriptions(subscription.endpoint)
-        else:
-            logger.error(f"failed sending push notification: {e.response.text}")
+        push_notification_queue.put_nowait((subscription, title, body, url))
+    except asyncio.QueueFull:
+        logger.warning("push notification queue is full, dropping notification")
+
+
+async def push_notification_worker(batch_size: int = 100):
+    """
+    Delivers the queued push notifications, everything that queued up while the
+    previous batch was sent goes out together in the next one.
+    """
+    try:
+        while settings.lnbits_running:
+            batch = [await push_notification_queue.get()]
+            while not push_notification_queue.empty() and len(batch) < batch_size:
+                batch.append(push_notification_queue.get_nowait())
+            await send_push_notifications(batch)
+    finally:
+        await webpush_sender.close()
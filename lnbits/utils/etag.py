@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+from collections import OrderedDict
+from time import time
+from typing import Any, Awaitable, Callable, NamedTuple, Optional
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+from lnbits.core.crud import get_wallet_version_for_key
+from lnbits.settings import settings
+from lnbits.utils.metrics import cache_requests
+
+
+class CachedResponse(NamedTuple):
+    wallet_id: str
+    version: int
+    etag: str
+    body: bytes
+    expiry: float
+
+
+def render_json(content: Any) -> bytes:
+    # the same rendering as `JSONResponse`
+    return json.dumps(
+        jsonable_encoder(content),
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    return etag in [tag.strip() for tag in if_none_match.split(",")]
+
+
+def conditional_response(request: Request, body: bytes, etag: str) -> Response:
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(body, media_type="application/json", headers={"ETag": etag})
+
+
+class WalletResponseCache:
+    """
+    Conditional and short-lived cached responses of the wallet endpoints that are
+    polled. The ETag is made from the version of the wallet, which is persisted
+    and bumped by every write to the wallet or its payments, so as long as nothing
+    of the wallet was written by any worker, `If-None-Match` is answered with
+    `304 Not Modified` and a repeated request with the cached body, both after a
+    single query of the version. Responses are cached per api key and url for
+    `lnbits_response_cache_ttl` seconds, then they are computed again (with their
+    side effects, like checking pending payments). Concurrent requests that miss
+    the cache at the same version share one computation.
+    """
+
+    def __init__(
+        self,
+        get_version: Callable[[str], Awaitable[Optional[tuple[str, int]]]],
+        max_size: int = 10_000,
+    ):
+        self.get_version = get_version
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+        self._responses: OrderedDict[tuple[str, str], CachedResponse] = OrderedDict()
+        # key and version -> running computation of the body and its ETag
+        self._computing: dict[
+            tuple[str, str, Optional[tuple[str, int]]],
+            asyncio.Task[tuple[bytes, Optional[str]]],
+        ] = {}
+
+    async def respond(
+        self,
+        request: Request,
+        api_key: Optional[str],
+        compute: Callable[[], Awaitable[tuple[Optional[str], Any]]],
+    ) -> Response:
+        """
+        `compute` returns the content and the id of the wallet it belongs to, or
+        `None` instead of the id when the content must not be cached.
+        """
+        key = (api_key or "", str(request.url))
+        # read before the content, a write in between is a newer version next time
+        version = await self.get_version(api_key) if api_key else None
+        cached = self._responses.get(key)
+        if (
+            cached
+            and version
+            and cached.expiry > time()
+            and (cached.wallet_id, cached.version) == version
+        ):
+            self.hits += 1
+            self._responses.move_to_end(key)
+            return conditional_response(request, cached.body, cached.etag)
+
+        computing_key = (*key, version)
+        computing = self._computing.get(computing_key)
+        if computing:
+            self.shared += 1
+        else:
+            self.misses += 1
+            computing = asyncio.create_task(self._compute(key, compute, version))
+            self._computing[computing_key] = computing
+            computing.add_done_callback(
+                lambda _: self._computing.pop(computing_key, None)
+            )
+        body, etag = await asyncio.shield(computing)
+        if not etag:
+            return Response(body, media_type="application/json")
+        return conditional_response(request, body, etag)
+
+    async def _compute(
+        self,
+        key: tuple[str, str],
+        compute: Callable[[], Awaitable[tuple[Optional[str], Any]]],
+        version: Optional[tuple[str, int]],
+    ) -> tuple[bytes, Optional[str]]:
+        wallet_id, content = await compute()
+        body = render_json(content)
+        if not wallet_id or not version or version[0] != wallet_id:
+            # not cacheable, or not the wallet whose version was read
+            self._responses.pop(key, None)
+            return body, None
+
+        variant = hashlib.sha256(repr(key).encode()).hexdigest()[:16]
+        etag = f'W/"{version[1]}-{variant}"'
+        ttl = settings.lnbits_response_cache_ttl
+        if ttl:
+            self._responses[key] = CachedResponse(
+                wallet_id, version[1], etag, body, time() + ttl
+            )
+            self._responses.move_to_end(key)
+            if len(self._responses) > self.max_size:
+                self._responses.popitem(last=False)
+        return body, etag
+
+    def dict(self) -> dict:
+        return {
+            "responses": len(self._responses),
+            "hits": self.hits,
+            "misses": self.misses,
+            "shared": self.shared,
+        }
+
+
+wallet_responses = WalletResponseCache(get_wallet_version_for_key)
+
+
+@cache_requests
+def collect_cache_requests():
+    yield ("wallet_responses", "hit"), wallet_responses.hits
+    yield ("wallet_responses", "miss"), wallet_responses.misses
+    yield ("wallet_responses", "shared"), wallet_responses.shared
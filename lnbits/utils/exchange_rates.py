@@ -1,5 +1,6 @@
 import asyncio
-from typing import Callable, NamedTuple
+from functools import lru_cache
+from typing import Callable, List, NamedTuple, Tuple
 
 import httpx
 from loguru import logger
@@ -176,14 +177,17 @@ currencies = {
 }
 
 
-def allowed_currencies():
-    if len(settings.lnbits_allowed_currencies) > 0:
-        return [
-            item
-            for item in currencies.keys()
-            if item.upper() in settings.lnbits_allowed_currencies
-        ]
-    return list(currencies.keys())
+def allowed_currencies() -> List[str]:
+    return list(_allowed_currencies(tuple(settings.lnbits_allowed_currencies)))
+
+
+@lru_cache(maxsize=8)
+def _allowed_currencies(allowed: Tuple[str, ...]) -> Tuple[str, ...]:
+    # memoized until the setting changes
+    if len(allowed) > 0:
+        allowed_set = set(allowed)
+        return tuple(item for item in currencies.keys() if item.upper() in allowed_set)
+    return tuple(currencies.keys())
 
 
 class Provider(NamedTuple):
@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Optional
+
+from loguru import logger
+
+from lnbits.settings import settings
+
+
+@dataclass
+class SlowCallSite:
+    site: str
+    stalls: int = 0
+    samples: int = 0
+    stack: list[str] = field(default_factory=list)
+
+
+class LoopMonitor:
+    """
+    Measures the lag of the event loop and finds the code that blocks it.
+
+    A thread pings the loop every `threshold / 2` seconds with a callback. The
+    time until the callback runs is the lag. While a ping is overdue by more than
+    `threshold` the thread samples the stack of the loop thread, so the blocking
+    call site is recorded while it blocks. When idle this costs one callback per
+    ping.
+    """
+
+    def __init__(self, threshold: Optional[float] = None, max_lags: int = 1000):
+        self.threshold = threshold or settings.lnbits_slow_callback_threshold
+        self.lags: deque[float] = deque(maxlen=max_lags)
+        self.max_lag = 0.0
+        self.stalls = 0
+        self._logged_stalls = 0
+        self.sites: dict[str, SlowCallSite] = {}
+        self._ping_sent: Optional[float] = None
+        self._stalled_site: Optional[str] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._stop = threading.Event()
+
+    async def run_forever(self):
+        self.start()
+        try:
+            while settings.lnbits_running:
+                interval = settings.lnbits_loop_monitor_log_interval
+                await asyncio.sleep(interval or 60)
+                if interval:
+                    self.log_summary()
+        finally:
+            self.stop()
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        # used by asyncio when the loop runs in debug mode (PYTHONASYNCIODEBUG)
+        self._loop.slow_callback_duration = self.threshold
+        self._loop_thread = threading.get_ident()
+        self._stop.clear()
+        threading.Thread(target=self._watch, name="loop-monitor", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _watch(self):
+        while not self._stop.wait(self.threshold / 2):
+            if self._ping_sent is None:
+                self._ping_sent = time.monotonic()
+                assert self._loop
+                try:
+                    self._loop.call_soon_threadsafe(self._pong, self._ping_sent)
+                except RuntimeError:  # the loop is closed
+                    return
+            elif time.monotonic() - self._ping_sent > self.threshold:
+                self._sample()
+
+    def _pong(self, sent: float):
+        lag = time.monotonic() - sent
+        self.lags.append(lag)
+        self.max_lag = max(self.max_lag, lag)
+        self._stalled_site = None
+        self._ping_sent = None
+
+    def _sample(self):
+        assert self._loop_thread
+        frame = sys._current_frames().get(self._loop_thread)
+        if not frame:
+            return
+        stack = traceback.extract_stack(frame)
+        site = _call_site(stack)
+        if site not in self.sites:
+            self.sites[site] = SlowCallSite(site)
+        call_site = self.sites[site]
+        call_site.samples += 1
+        call_site.stack = [f"{f.filename}:{f.lineno} in {f.name}" for f in stack[-15:]]
+        if self._stalled_site != site:
+            self._stalled_site = site
+            call_site.stalls += 1
+            self.stalls += 1
+
+    def top_sites(self, count: int = 10) -> list[SlowCallSite]:
+        return sorted(self.sites.values(), key=lambda s: -s.samples)[:count]
+
+    def dict(self) -> dict:
+        lags = sorted(self.lags)
+        return {
+            "threshold": self.threshold,
+            "lag": {
+                "last": round(self.lags[-1], 6) if lags else None,
+                "p99": round(lags[int(0.99 * (len(lags) - 1))], 6) if lags else None,
+                "max": round(self.max_lag, 6),
+            },
+            "stalls": self.stalls,
+            "slow_call_sites": [
+                {
+                    "site": site.site,
+                    "stalls": site.stalls,
+                    "blocked_seconds": round(site.samples * self.threshold / 2, 3),
+                    "stack": site.stack,
+                }
+                for site in self.top_sites()
+            ],
+        }
+
+    def log_summary(self):
+        if self.stalls == self._logged_stalls:
+            return
+        self._logged_stalls = self.stalls
+        sites = ", ".join(
+            f"{site.site} ({site.stalls}x, ~{site.samples * self.threshold / 2:.1f}s)"
+            for site in self.top_sites(5)
+        )
+        logger.warning(
+            f"event loop blocked {self.stalls} times for more than "
+            f"{self.threshold}s (max lag {self.max_lag:.3f}s): {sites}"
+        )
+
+
+def _call_site(stack: traceback.StackSummary) -> str:
+    """Innermost frame of LNbits or an extension, the code that made the call."""
+    paths = (
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        os.path.abspath(settings.lnbits_extensions_path),
+    )
+    for frame in reversed(stack):
+        if frame.filename.startswith(paths):
+            return f"{frame.filename}:{frame.lineno} in {frame.name}"
+    frame = stack[-1]
+    return f"{frame.filename}:{frame.lineno} in {frame.name}"
+
+
+loop_monitor = LoopMonitor()
@@ -0,0 +1,202 @@
+"""
+Metrics of the running instance in the prometheus text format, served by
+`/admin/api/v1/monitor/metrics`.
+
+Histograms are plain in-memory numbers that are updated inline. Gauges and
+counters that are kept anyway (queue depths, connections, cache hits) are read
+by callbacks of the modules that own them, only when the metrics are rendered.
+"""
+
+from __future__ import annotations
+
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterable, Iterator, Tuple
+
+# seconds, same as the default buckets of the prometheus client libraries
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+Labels = Tuple[str, ...]
+
+
+class LatencyHistogram:
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts: list[int] = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.sum += seconds
+        for i, bucket in enumerate(self.buckets):
+            if seconds <= bucket:
+                self.counts[i] += 1
+                break
+
+    def cumulative(self) -> list[int]:
+        cumulative, total = [], 0
+        for count in self.counts:
+            total += count
+            cumulative.append(total)
+        return cumulative
+
+    def dict(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "buckets": dict(zip(map(str, self.buckets), self.cumulative())),
+        }
+
+
+def format_labels(names: Labels, values: Labels, *extra: str) -> str:
+    labels = [
+        name + '="' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+        for name, value in zip(names, values)
+    ]
+    labels += extra
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, label_names: Labels):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.histograms: dict[Labels, LatencyHistogram] = {}
+
+    def observe(self, seconds: float, *labels: str):
+        histogram = self.histograms.get(labels)
+        if not histogram:
+            histogram = self.histograms[labels] = LatencyHistogram()
+        histogram.observe(seconds)
+
+    @contextmanager
+    def time(self, *labels: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def render(self) -> list[str]:
+        lines = [
+            f"# HELP {self.name} {self.help_text}",
+            f"# TYPE {self.name} histogram",
+        ]
+        for values, histogram in self.histograms.items():
+            buckets = zip(
+                [*histogram.buckets, "+Inf"], [*histogram.cumulative(), histogram.count]
+            )
+            for bucket, count in buckets:
+                labels = format_labels(self.label_names, values, f'le="{bucket}"')
+                lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = format_labels(self.label_names, values)
+            lines += [
+                f"{self.name}_sum{labels} {histogram.sum}",
+                f"{self.name}_count{labels} {histogram.count}",
+            ]
+        return lines
+
+
+Collector = Callable[[], Iterable[Tuple[Labels, float]]]
+
+
+class Collected:
+    """Gauge or counter whose values are read from their owners when rendered."""
+
+    def __init__(self, name: str, help_text: str, kind: str, label_names: Labels):
+        self.name = name
+        self.help_text = help_text
+        self.kind = kind
+        self.label_names = label_names
+        self.collectors: list[Collector] = []
+
+    def render(self) -> list[str]:
+        lines = [
+            f"# HELP {self.name} {self.help_text}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        for collect in self.collectors:
+            for values, value in collect():
+                labels = format_labels(self.label_names, values)
+                lines.append(f"{self.name}{labels} {value}")
+        return lines
+
+
+class Metrics:
+    def __init__(self):
+        self._metrics: dict[str, Histogram | Collected] = {}
+
+    def histogram(
+        self, name: str, help_text: str, label_names: Labels = ()
+    ) -> Histogram:
+        histogram = Histogram(name, help_text, label_names)
+        self._metrics[name] = histogram
+        return histogram
+
+    def gauge(
+        self,
+        name: str,
+        help_text: str,
+        label_names: Labels = (),
+        kind: str = "gauge",
+    ) -> Callable:
+        """
+        Registers the decorated function as a collector of the metric, it returns
+        the label values and the value of every series it owns.
+        """
+
+        def register(collect: Collector) -> Collector:
+            metric = self._metrics.get(name)
+            if not isinstance(metric, Collected):
+                metric = Collected(name, help_text, kind, label_names)
+                self._metrics[name] = metric
+            metric.collectors.append(collect)
+            return collect
+
+        return register
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for metric in self._metrics.values():
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+http_request_duration = metrics.histogram(
+    "lnbits_http_request_duration_seconds",
+    "Latency of the http requests by route.",
+    ("method", "route", "status"),
+)
+db_query_duration = metrics.histogram(
+    "lnbits_db_query_duration_seconds",
+    "Latency of the database queries by the function that made them.",
+    ("db", "site"),
+)
+db_lock_wait = metrics.histogram(
+    "lnbits_db_lock_wait_seconds",
+    "Time spent waiting for the connection lock of a database.",
+    ("db",),
+)
+task_duration = metrics.histogram(
+    "lnbits_task_iteration_duration_seconds",
+    "Duration of one iteration of a periodic background task.",
+    ("task",),
+)
+queue_size = metrics.gauge(
+    "lnbits_queue_size", "Items waiting in an internal queue.", ("queue",)
+)
+open_connections = metrics.gauge(
+    "lnbits_open_connections",
+    "Open websocket, server-sent events and long-poll connections.",
+    ("kind",),
+)
+cache_requests = metrics.gauge(
+    "lnbits_cache_requests_total",
+    "Requests to the caches by result (hit, miss or shared with a running miss).",
+    ("cache", "result"),
+    kind="counter",
+)
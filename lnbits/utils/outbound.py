@@ -0,0 +1,267 @@
+from __future__ import annotations
+
+import asyncio
+import ipaddress
+import socket
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from time import time
+from typing import AsyncIterator, NamedTuple, Optional
+
+import httpx
+
+from lnbits.settings import settings
+from lnbits.utils.metrics import cache_requests
+
+
+class OutboundRequestError(httpx.RequestError):
+    """A request that was refused, before or while it was made."""
+
+
+class OutboundResponse(NamedTuple):
+    url: str
+    status_code: int
+    headers: httpx.Headers
+    content: bytes
+
+    def response(self) -> httpx.Response:
+        return httpx.Response(
+            self.status_code,
+            headers=self.headers,
+            content=self.content,
+            request=httpx.Request("GET", self.url),
+        )
+
+
+def is_public_address(address: str) -> bool:
+    ip = ipaddress.ip_address(address.split("%")[0])
+    if isinstance(ip, ipaddress.IPv6Address) and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+def cache_ttl(headers: httpx.Headers, max_ttl: float) -> float:
+    """Seconds a response may be cached for its `Cache-Control`, up to `max_ttl`."""
+    directives = {}
+    for directive in headers.get("cache-control", "").lower().split(","):
+        name, _, value = directive.strip().partition("=")
+        directives[name] = value
+    if {"no-store", "no-cache", "private"} & directives.keys():
+        return 0
+    try:
+        return min(float(directives["max-age"]), max_ttl)
+    except (KeyError, ValueError):
+        return max_ttl
+
+
+class OutboundClient:
+    """
+    Shared client for the requests to lnurl services and other third party urls.
+
+    Connections are pooled (and limited) per host and reused across requests,
+    instead of a new client with a DNS lookup and TLS handshake for every request.
+    Unless `lnbits_outbound_allow_private_hosts` is set, hosts that resolve to a
+    private, loopback or otherwise non public address are refused, also when a
+    redirect leads there. Responses are limited to
+    `lnbits_outbound_max_response_size` bytes.
+
+    GET requests made with `cache=True` (lnurl metadata) are cached by url for up
+    to `lnbits_outbound_cache_ttl` seconds or what their `Cache-Control` allows,
+    and concurrent identical requests share one request.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 100,
+        max_connections_per_host: int = 10,
+        max_redirects: int = 5,
+        max_cached: int = 1000,
+    ):
+        self.max_connections = max_connections
+        self.max_connections_per_host = max_connections_per_host
+        self.max_redirects = max_redirects
+        self.max_cached = max_cached
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+        self.refused = 0
+        self._client: Optional[httpx.AsyncClient] = None
+        self._host_slots: dict[str, asyncio.Semaphore] = {}
+        self._host_users: dict[str, int] = {}
+        # host -> (expiry, whether it resolves to public addresses only)
+        self._checked_hosts: dict[str, tuple[float, bool]] = {}
+        self._cache: OrderedDict[str, tuple[float, OutboundResponse]] = OrderedDict()
+        self._fetching: dict[str, asyncio.Task[OutboundResponse]] = {}
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if not self._client or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                headers={"User-Agent": settings.user_agent},
+                limits=httpx.Limits(max_connections=self.max_connections),
+                timeout=5,
+            )
+        return self._client
+
+    async def get(
+        self,
+        url: str,
+        params: Optional[dict] = None,
+        timeout: float = 5,
+        follow_redirects: bool = False,
+        cache: bool = False,
+    ) -> httpx.Response:
+        request_url = httpx.URL(url)
+        if params:
+            request_url = request_url.copy_merge_params(params)
+        if not cache or not settings.lnbits_outbound_cache_ttl:
+            fetched = await self._fetch(request_url, timeout, follow_redirects)
+            return fetched.response()
+
+        key = str(request_url)
+        cached = self._cache.get(key)
+        if cached and cached[0] > time():
+            self.hits += 1
+            self._cache.move_to_end(key)
+            return cached[1].response()
+
+        fetching = self._fetching.get(key)
+        if fetching:
+            self.shared += 1
+        else:
+            self.misses += 1
+            fetching = asyncio.create_task(
+                self._fetch_and_cache(request_url, timeout, follow_redirects)
+            )
+            self._fetching[key] = fetching
+            fetching.add_done_callback(lambda _: self._fetching.pop(key, None))
+        fetched = await asyncio.shield(fetching)
+        return fetched.response()
+
+    async def _fetch_and_cache(
+        self, url: httpx.URL, timeout: float, follow_redirects: bool
+    ) -> OutboundResponse:
+        fetched = await self._fetch(url, timeout, follow_redirects)
+        if fetched.status_code == 200:
+            ttl = cache_ttl(fetched.headers, settings.lnbits_outbound_cache_ttl)
+            if ttl > 0:
+                self._cache[str(url)] = (time() + ttl, fetched)
+                self._cache.move_to_end(str(url))
+                if len(self._cache) > self.max_cached:
+                    self._cache.popitem(last=False)
+        return fetched
+
+    async def _fetch(
+        self, url: httpx.URL, timeout: float, follow_redirects: bool
+    ) -> OutboundResponse:
+        for _ in range(self.max_redirects + 1):
+            await self.check_url(url)
+            request = self.client.build_request("GET", url, timeout=timeout)
+            async with self._host_slot(url.host):
+                response = await self.client.send(request, stream=True)
+                try:
+                    self._check_peer(response)
+                    content = await self._read(response)
+                finally:
+                    await response.aclose()
+            if not follow_redirects or not response.next_request:
+                headers = response.headers.copy()
+                # the content is decoded already
+                headers.pop("content-encoding", None)
+                headers.pop("content-length", None)
+                return OutboundResponse(
+                    str(url), response.status_code, headers, content
+                )
+            url = response.next_request.url
+        raise httpx.TooManyRedirects("Exceeded maximum allowed redirects.")
+
+    async def check_url(self, url: httpx.URL):
+        if url.scheme not in ("http", "https"):
+            raise self._refuse(f"scheme '{url.scheme}' is not allowed")
+        if settings.lnbits_outbound_allow_private_hosts:
+            return
+        host = url.host
+        checked = self._checked_hosts.get(host)
+        if checked and checked[0] > time():
+            public = checked[1]
+        else:
+            port = url.port or (443 if url.scheme == "https" else 80)
+            try:
+                infos = await asyncio.get_running_loop().getaddrinfo(
+                    host, port, type=socket.SOCK_STREAM
+                )
+            except socket.gaierror:
+                # unknown hosts fail on connecting with the usual error
+                return
+            public = all(is_public_address(str(info[4][0])) for info in infos)
+            self._checked_hosts[host] = (time() + 60, public)
+            if len(self._checked_hosts) > self.max_cached:
+                self._checked_hosts.pop(next(iter(self._checked_hosts)))
+        if not public:
+            raise self._refuse(f"host '{host}' is not a public address")
+
+    def _check_peer(self, response: httpx.Response):
+        # the address that was connected to, in case the dns answer changed
+        if settings.lnbits_outbound_allow_private_hosts:
+            return
+        stream = response.extensions.get("network_stream")
+        address = stream.get_extra_info("server_addr") if stream else None
+        if address and not is_public_address(str(address[0])):
+            raise self._refuse(f"host '{response.url.host}' is not a public address")
+
+    def _refuse(self, message: str) -> OutboundRequestError:
+        self.refused += 1
+        return OutboundRequestError(message)
+
+    async def _read(self, response: httpx.Response) -> bytes:
+        limit = settings.lnbits_outbound_max_response_size
+        chunks = []
+        size = 0
+        async for chunk in response.aiter_bytes():
+            size += len(chunk)
+            if limit and size > limit:
+                raise self._refuse(
+                    f"response of '{response.url.host}' exceeds {limit} bytes"
+                )
+            chunks.append(chunk)
+        return b"".join(chunks)
+
+    @asynccontextmanager
+    async def _host_slot(self, host: str) -> AsyncIterator[None]:
+        slot = self._host_slots.get(host)
+        if not slot:
+            slot = asyncio.Semaphore(self.max_connections_per_host)
+            self._host_slots[host] = slot
+        self._host_users[host] = self._host_users.get(host, 0) + 1
+        try:
+            async with slot:
+                yield
+        finally:
+            self._host_users[host] -= 1
+            if not self._host_users[host]:
+                del self._host_users[host]
+                del self._host_slots[host]
+
+    def dict(self) -> dict:
+        return {
+            "cached": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "shared": self.shared,
+            "refused": self.refused,
+            "hosts": len(self._host_slots),
+        }
+
+    async def close(self):
+        if self._client:
+            await self._client.aclose()
+
+
+outbound_client = OutboundClient()
+
+
+@cache_requests
+def collect_cache_requests():
+    yield ("outbound", "hit"), outbound_client.hits
+    yield ("outbound", "miss"), outbound_client.misses
+    yield ("outbound", "shared"), outbound_client.shared
@@ -0,0 +1,81 @@
+"""
+Opt-in tracer of the database queries of a request (`LNBITS_QUERY_TRACE`).
+
+Every statement that goes through `Connection.execute` is recorded with its
+normalized SQL, duration and the function that made it. A statement that runs
+more than once in the same request is flagged as a likely N+1 query.
+"""
+
+from __future__ import annotations
+
+import re
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, NamedTuple, Optional
+
+_literals = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_lists = re.compile(r"\((?:\s*\?\s*,)+\s*\?\s*\)")
+_whitespace = re.compile(r"\s+")
+
+
+def normalize_sql(query: str) -> str:
+    """The statement without its values, `IN (?, ?, ?)` becomes `IN (...)`."""
+    query = _whitespace.sub(" ", query).strip()
+    query = _literals.sub("?", query)
+    return _lists.sub("(...)", query)
+
+
+class TracedQuery(NamedTuple):
+    sql: str
+    seconds: float
+    site: str
+
+
+class QueryTrace:
+    def __init__(self):
+        self.queries: list[TracedQuery] = []
+
+    def record(self, query: str, seconds: float, site: str):
+        self.queries.append(TracedQuery(normalize_sql(query), seconds, site))
+
+    @property
+    def count(self) -> int:
+        return len(self.queries)
+
+    @property
+    def seconds(self) -> float:
+        return sum(query.seconds for query in self.queries)
+
+    def repeated(self) -> dict[str, int]:
+        """Statements that ran more than once, the likely N+1 queries."""
+        counts = Counter(query.sql for query in self.queries)
+        return {sql: count for sql, count in counts.most_common() if count > 1}
+
+    def summary(self) -> str:
+        lines = [f"{self.count} queries in {self.seconds * 1000:.1f} ms"]
+        lines += [
+            f"  {query.seconds * 1000:7.2f} ms  {query.site}: {query.sql}"
+            for query in self.queries
+        ]
+        lines += [
+            f"  likely N+1, {count} times: {sql}"
+            for sql, count in self.repeated().items()
+        ]
+        return "\n".join(lines)
+
+
+current_trace: ContextVar[Optional[QueryTrace]] = ContextVar(
+    "current_trace", default=None
+)
+
+
+@contextmanager
+def trace_queries() -> Iterator[QueryTrace]:
+    """Records the queries made in this context (and the tasks it starts)."""
+    trace = QueryTrace()
+    token = current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        current_trace.reset(token)
@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import asyncio
+import base64
+import time
+from typing import Optional
+from urllib.parse import urlparse
+
+import http_ece
+import httpx
+from cryptography.hazmat.primitives.asymmetric import ec
+from py_vapid import Vapid
+
+from lnbits.settings import settings
+
+VAPID_SUBJECT = "mailto:alan@lnbits.com"
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def encrypt(subscription_info: dict, data: str) -> bytes:
+    """RFC 8291 aes128gcm payload for the keys of the subscription."""
+    keys = subscription_info["keys"]
+    receiver_key = ec.EllipticCurvePublicKey.from_encoded_point(
+        ec.SECP256R1(), _b64decode(keys["p256dh"])
+    )
+    return http_ece.encrypt(
+        data.encode(),
+        private_key=ec.generate_private_key(ec.SECP256R1()),
+        dh=receiver_key,
+        auth_secret=_b64decode(keys["auth"]),
+        version="aes128gcm",
+    )
+
+
+class WebPushSender:
+    """
+    Delivers web push notifications without blocking the event loop.
+
+    The VAPID key is loaded once and the signed claims are reused for a push
+    service (the audience) until shortly before they expire, instead of signing a
+    new token for every message. The payload encryption (ECDH with a fresh key for
+    every message) runs in a thread and the requests share a pooled http client.
+    """
+
+    def __init__(
+        self,
+        claims_ttl: int = 12 * 3600,
+        max_connections: int = 20,
+        timeout: float = 10,
+    ):
+        self.claims_ttl = claims_ttl
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.signed = 0
+        self._vapid: Optional[Vapid] = None
+        self._privkey: Optional[str] = None
+        # audience -> (expiry, authorization header)
+        self._authorizations: dict[str, tuple[float, str]] = {}
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def vapid(self) -> Vapid:
+        privkey = settings.lnbits_webpush_privkey
+        if not self._vapid or self._privkey != privkey:
+            self._vapid = Vapid.from_pem(bytes(privkey, "utf-8"))
+            self._privkey = privkey
+            self._authorizations.clear()
+        return self._vapid
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if not self._client or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                headers={"User-Agent": settings.user_agent},
+                limits=httpx.Limits(max_connections=self.max_connections),
+                timeout=self.timeout,
+            )
+        return self._client
+
+    def authorization(self, endpoint: str) -> str:
+        url = urlparse(endpoint)
+        audience = f"{url.scheme}://{url.netloc}"
+        vapid = self.vapid
+        now = time.time()
+        cached = self._authorizations.get(audience)
+        # renew with a margin, the push service must not see an expired token
+        if cached and cached[0] - now > self.claims_ttl / 10:
+            return cached[1]
+        expiry = int(now) + self.claims_ttl
+        headers = vapid.sign({"aud": audience, "exp": expiry, "sub": VAPID_SUBJECT})
+        self.signed += 1
+        self._authorizations[audience] = (expiry, headers["Authorization"])
+        return headers["Authorization"]
+
+    async def send(
+        self, subscription_info: dict, data: str, ttl: int = 0
+    ) -> httpx.Response:
+        body = await asyncio.to_thread(encrypt, subscription_info, data)
+        endpoint = subscription_info["endpoint"]
+        return await self.client.post(
+            endpoint,
+            content=body,
+            headers={
+                "Authorization": self.authorization(endpoint),
+                "Content-Encoding": "aes128gcm",
+                "TTL": str(ttl),
+            },
+        )
+
+    async def close(self):
+        if self._client:
+            await self._client.aclose()
+
+
+webpush_sender = WebPushSender()
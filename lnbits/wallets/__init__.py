@@ -22,8 +22,10 @@ from .lndgrpc import LndWallet
 from .lndrest import LndRestWallet
 from .lnpay import LNPayWallet
 from .lntips import LnTipsWallet
+from .monitor import FundingSourceMonitor
 from .opennode import OpenNodeWallet
 from .phoenixd import PhoenixdWallet
+from .router import RouterWallet
 from .spark import SparkWallet
 from .void import VoidWallet
 from .zbd import ZBDWallet
@@ -34,6 +36,9 @@ def set_funding_source(class_name: Optional[str] = None):
     funding_source_constructor = getattr(wallets_module, backend_wallet_class)
     global funding_source
     funding_source = funding_source_constructor()
+    global funding_source_monitor
+    funding_source_monitor = FundingSourceMonitor(backend_wallet_class)
+    funding_source_monitor.instrument(funding_source)
     if funding_source.__node_cls__:
         set_node_class(funding_source.__node_cls__(funding_source))
 
@@ -42,8 +47,14 @@ def get_funding_source() -> Wallet:
     return funding_source
 
 
+def get_funding_source_monitor() -> FundingSourceMonitor:
+    return funding_source_monitor
+
+
 wallets_module = importlib.import_module("lnbits.wallets")
 fake_wallet = FakeWallet()
 
 # initialize as fake wallet
 funding_source: Wallet = fake_wallet
+# the shared fake wallet also creates the internal invoices, it is not instrumented
+funding_source_monitor = FundingSourceMonitor("FakeWallet")
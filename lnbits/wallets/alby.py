@@ -3,10 +3,9 @@ import hashlib
 import json
 from typing import AsyncGenerator, Dict, Optional
 
-import httpx
 from loguru import logger
 
-from lnbits.settings import settings
+from lnbits.settings import Settings, settings
 
 from .base import (
     InvoiceResponse,
@@ -15,24 +14,28 @@ from .base import (
     PaymentStatus,
     StatusResponse,
     Wallet,
+    create_http_client,
 )
 
 
 class AlbyWallet(Wallet):
     """https://guides.getalby.com/alby-wallet-api/reference/api-reference"""
 
-    def __init__(self):
-        if not settings.alby_api_endpoint:
+    def __init__(self, config: Optional[Settings] = None):
+        super().__init__(config)
+        if not self.config.alby_api_endpoint:
             raise ValueError("cannot initialize AlbyWallet: missing alby_api_endpoint")
-        if not settings.alby_access_token:
+        if not self.config.alby_access_token:
             raise ValueError("cannot initialize AlbyWallet: missing alby_access_token")
 
-        self.endpoint = self.normalize_endpoint(settings.alby_api_endpoint)
+        self.endpoint = self.normalize_endpoint(self.config.alby_api_endpoint)
         self.auth = {
-            "Authorization": "Bearer " + settings.alby_access_token,
-            "User-Agent": settings.user_agent,
+            "Authorization": "Bearer " + self.config.alby_access_token,
+            "User-Agent": self.config.user_agent,
         }
-        self.client = httpx.AsyncClient(base_url=self.endpoint, headers=self.auth)
+        self.client = create_http_client(
+            "AlbyWallet", base_url=self.endpoint, headers=self.auth
+        )
 
     async def cleanup(self):
         try:
@@ -42,7 +45,7 @@ class AlbyWallet(Wallet):
 
     async def status(self) -> StatusResponse:
         try:
-            r = await self.client.get("/balance", timeout=10)
+            r = await self.client.get("/balance")
             r.raise_for_status()
 
             data = r.json()
@@ -87,7 +90,7 @@ class AlbyWallet(Wallet):
             r = await self.client.post(
                 "/invoices",
                 json=data,
-                timeout=40,
+                timeout=settings.funding_source_invoice_timeout,
             )
             r.raise_for_status()
 
@@ -122,7 +125,7 @@ class AlbyWallet(Wallet):
             r = await self.client.post(
                 "/payments/bolt11",
                 json={"invoice": bolt11},  # assume never need amount in body
-                timeout=None,
+                timeout=settings.funding_source_pay_timeout,
             )
             r.raise_for_status()
             data = r.json()
@@ -1,7 +1,26 @@
 from __future__ import annotations
 
+import asyncio
+import importlib.util
+import weakref
 from abc import ABC, abstractmethod
-from typing import TYPE_CHECKING, AsyncGenerator, Coroutine, NamedTuple, Optional
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import (
+    TYPE_CHECKING,
+    AsyncGenerator,
+    AsyncIterator,
+    Callable,
+    Coroutine,
+    NamedTuple,
+    Optional,
+    Union,
+)
+
+import httpx
+from loguru import logger
+
+from lnbits.settings import Settings, settings
 
 if TYPE_CHECKING:
     from lnbits.nodes.base import Node
@@ -89,10 +108,93 @@ class PaymentPendingStatus(PaymentStatus):
     paid = None
 
 
+class PaymentTracker:
+    """
+    Latest status of the outgoing payments, kept up to date by one long lived
+    subscription to all payments of the backend (e.g. LND `TrackPayments`), so a
+    status check does not have to open a stream for every payment.
+
+    `subscribe` yields `(checking_id, status)` for every payment update. Pending
+    statuses are only trusted while the subscription is connected, final ones are
+    kept until the oldest entries are dropped after `max_size` payments.
+    """
+
+    def __init__(
+        self,
+        subscribe: Callable[[], AsyncIterator[tuple[str, PaymentStatus]]],
+        max_size: int = 10_000,
+    ):
+        self.subscribe = subscribe
+        self.max_size = max_size
+        self.connected = False
+        self.statuses: OrderedDict[str, PaymentStatus] = OrderedDict()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if not self._task or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def get(self, checking_id: str) -> Optional[PaymentStatus]:
+        status = self.statuses.get(checking_id)
+        if status and status.pending and not self.connected:
+            return None
+        return status
+
+    def set(self, checking_id: str, status: PaymentStatus):
+        self.statuses[checking_id] = status
+        self.statuses.move_to_end(checking_id)
+        while len(self.statuses) > self.max_size:
+            self.statuses.popitem(last=False)
+
+    async def _run(self):
+        while settings.lnbits_running:
+            try:
+                async for checking_id, status in self.subscribe():
+                    self.connected = True
+                    self.set(checking_id, status)
+            except Exception as exc:
+                logger.warning(f"lost connection to payments subscription: {exc}")
+            finally:
+                self.connected = False
+            await asyncio.sleep(5)
+
+
 class Wallet(ABC):
 
     __node_cls__: Optional[type[Node]] = None
 
+    # backends whose paid invoices stream can be replayed from an index (LND
+    # `settle_index`, CLN `pay_index`) keep `invoice_stream_cursor` at the index
+    # of the last invoice they yielded. it is persisted by the invoice listener
+    # and restored before the stream starts, so settlements are not missed
+    # while reconnecting or while LNbits is down.
+    resumable_invoice_stream: bool = False
+    invoice_stream_cursor: Optional[int] = None
+
+    # funding source settings the wallet is created with, the backends of the
+    # `RouterWallet` each get their own
+    config: Settings = settings
+
+    def __init__(self, config: Optional[Settings] = None):
+        if config:
+            self.config = config
+
+    @property
+    def invoice_stream_cursor_key(self) -> str:
+        """
+        Key of the persisted cursor, the indices are only valid for the node they
+        were read from, so backends with a resumable stream include it.
+        """
+        return self.__class__.__name__
+
     @abstractmethod
     async def cleanup(self):
         pass
@@ -134,6 +236,17 @@ class Wallet(ABC):
     def paid_invoices_stream(self) -> AsyncGenerator[str, None]:
         pass
 
+    def backend_of(self, checking_id: str) -> Optional[str]:
+        """
+        Name of the backend that holds the payment, for funding sources that
+        route between several backends. It is stored with the payment and passed
+        to `get_backend` for the status checks.
+        """
+        return None
+
+    def get_backend(self, name: Optional[str]) -> Wallet:
+        return self
+
     def normalize_endpoint(self, endpoint: str, add_proto=True) -> str:
         endpoint = endpoint[:-1] if endpoint.endswith("/") else endpoint
         if add_proto:
@@ -143,5 +256,78 @@ class Wallet(ABC):
         return endpoint
 
 
+@dataclass
+class HttpClientStats:
+    requests: int = 0
+    connections: int = 0
+
+    @property
+    def reused(self) -> int:
+        return max(self.requests - self.connections, 0)
+
+    def dict(self) -> dict:
+        return {**asdict(self), "reused": self.reused}
+
+
+# connection reuse per funding source http client, see `create_http_client`
+http_client_stats: dict[str, HttpClientStats] = {}
+
+
+def create_http_client(
+    name: str,
+    base_url: str = "",
+    headers: Optional[dict] = None,
+    verify: Union[str, bool] = True,
+    stream: bool = False,
+) -> httpx.AsyncClient:
+    """
+    The `httpx.AsyncClient` used by http funding sources, with the pool limits,
+    keep-alive and timeouts from the settings.
+
+    Long lived streams (`paid_invoices_stream`) should use their own client, made
+    with `stream=True`, so they cannot take up connections of the regular calls.
+    It has no read timeout. The number of requests and of newly opened
+    connections of every client is counted in `http_client_stats`.
+    """
+    if stream:
+        name = f"{name}:stream"
+    stats = http_client_stats.setdefault(name, HttpClientStats())
+    seen_streams: weakref.WeakSet = weakref.WeakSet()
+
+    async def on_response(response: httpx.Response):
+        stats.requests += 1
+        # every connection has its own network stream
+        network_stream = response.extensions.get("network_stream")
+        if network_stream is not None and network_stream not in seen_streams:
+            seen_streams.add(network_stream)
+            stats.connections += 1
+
+    if stream:
+        limits = httpx.Limits(max_connections=2, max_keepalive_connections=1)
+        timeout = httpx.Timeout(settings.funding_source_timeout, read=None)
+    else:
+        limits = httpx.Limits(
+            max_connections=settings.funding_source_max_connections,
+            max_keepalive_connections=settings.funding_source_max_keepalive_connections,
+            keepalive_expiry=settings.funding_source_keepalive_expiry,
+        )
+        timeout = httpx.Timeout(settings.funding_source_timeout)
+
+    http2 = settings.funding_source_http2
+    if http2 and not importlib.util.find_spec("h2"):
+        logger.warning("funding_source_http2 is set but `h2` is not installed.")
+        http2 = False
+
+    return httpx.AsyncClient(
+        base_url=base_url,
+        headers=headers,
+        verify=verify,
+        http2=http2,
+        limits=limits,
+        timeout=timeout,
+        event_hooks={"response": [on_response]},
+    )
+
+
 class UnsupportedError(Exception):
     pass
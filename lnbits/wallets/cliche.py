@@ -6,7 +6,7 @@ from typing import AsyncGenerator, Optional
 from loguru import logger
 from websocket import create_connection
 
-from lnbits.settings import settings
+from lnbits.settings import Settings, settings
 
 from .base import (
     InvoiceResponse,
@@ -21,11 +21,12 @@ from .base import (
 class ClicheWallet(Wallet):
     """https://github.com/fiatjaf/cliche"""
 
-    def __init__(self):
-        if not settings.cliche_endpoint:
+    def __init__(self, config: Optional[Settings] = None):
+        super().__init__(config)
+        if not self.config.cliche_endpoint:
             raise ValueError("cannot initialize ClicheWallet: missing cliche_endpoint")
 
-        self.endpoint = self.normalize_endpoint(settings.cliche_endpoint)
+        self.endpoint = self.normalize_endpoint(self.config.cliche_endpoint)
 
     async def cleanup(self):
         pass
@@ -1,14 +1,14 @@
 import asyncio
 import random
-from typing import Any, AsyncGenerator, Optional
+from typing import AsyncGenerator, Optional
 
 from bolt11.decode import decode as bolt11_decode
 from bolt11.exceptions import Bolt11Exception
 from loguru import logger
-from pyln.client import LightningRpc, RpcError
+from pyln.client import RpcError
 
 from lnbits.nodes.cln import CoreLightningNode
-from lnbits.settings import settings
+from lnbits.settings import Settings, settings
 
 from .base import (
     InvoiceResponse,
@@ -21,30 +21,33 @@ from .base import (
     UnsupportedError,
     Wallet,
 )
-
-
-async def run_sync(func) -> Any:
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, func)
+from .corelightning_rpc import AsyncLightningRpc
 
 
 class CoreLightningWallet(Wallet):
     __node_cls__ = CoreLightningNode
+    resumable_invoice_stream = True
 
     async def cleanup(self):
-        pass
+        try:
+            await self.ln.close()
+        except RuntimeError as exc:
+            logger.warning(f"Error closing wallet connection: {exc}")
 
-    def __init__(self):
-        rpc = settings.corelightning_rpc or settings.clightning_rpc
+    def __init__(self, config: Optional[Settings] = None):
+        super().__init__(config)
+        rpc = self.config.corelightning_rpc or self.config.clightning_rpc
         if not rpc:
             raise ValueError(
                 "cannot initialize CoreLightningWallet: missing corelightning_rpc"
             )
-        self.pay = settings.corelightning_pay_command
-        self.ln = LightningRpc(rpc)
-        # check if description_hash is supported (from corelightning>=v0.11.0)
-        command = self.ln.help("invoice")["help"][0]["command"]  # type: ignore
-        self.supports_description_hash = "deschashonly" in command
+        self.rpc = rpc
+        self.pay = self.config.corelightning_pay_command
+        self.ln = AsyncLightningRpc(
+            rpc, pool_size=self.config.corelightning_rpc_pool_size
+        )
+        # checked on first use, `deschashonly` needs corelightning>=v0.11.0
+        self.supports_description_hash: Optional[bool] = None
 
         # https://docs.corelightning.org/reference/lightning-pay
         # -32602: Invalid bolt11: Prefix bc is not for regtest
@@ -57,17 +60,38 @@ class CoreLightningWallet(Wallet):
         # 210: Payment timed out without a payment in progress.
         self.pay_failure_error_codes = [-32602, 201, 203, 205, 206, 207, 210]
 
-        # check last payindex so we can listen from that point on
-        self.last_pay_index = 0
-        invoices: dict = self.ln.listinvoices()  # type: ignore
-        for inv in invoices["invoices"][::-1]:
-            if "pay_index" in inv:
-                self.last_pay_index = inv["pay_index"]
-                break
+    @property
+    def invoice_stream_cursor_key(self) -> str:
+        return f"{self.__class__.__name__}:{self.rpc}"
+
+    async def _supports_description_hash(self) -> bool:
+        if self.supports_description_hash is None:
+            r: dict = await self.ln.help(command="invoice")
+            self.supports_description_hash = "deschashonly" in r["help"][0]["command"]
+        return self.supports_description_hash
+
+    async def _get_last_pay_index(self, page_size: int = 100) -> int:
+        # the paid invoice updated last has the highest `pay_index`, page back
+        # through the most recently updated invoices instead of listing them all
+        # https://docs.corelightning.org/reference/lightning-wait
+        r: dict = await self.ln.wait(
+            subsystem="invoices", indexname="updated", nextvalue=0
+        )
+        end: int = r.get("updated", 0)
+        while end > 0:
+            start = max(end - page_size + 1, 1)
+            invoices: dict = await self.ln.listinvoices(
+                index="updated", start=start, limit=end - start + 1
+            )
+            for inv in invoices["invoices"][::-1]:
+                if "pay_index" in inv:
+                    return inv["pay_index"]
+            end = start - 1
+        return 0
 
     async def status(self) -> StatusResponse:
         try:
-            funds: dict = self.ln.listfunds()  # type: ignore
+            funds: dict = await self.ln.listfunds()
             if len(funds) == 0:
                 return StatusResponse("no data", 0)
 
@@ -98,10 +122,10 @@ class CoreLightningWallet(Wallet):
                     "'description_hash' unsupported by CoreLightning, provide"
                     " 'unhashed_description'"
                 )
-            if unhashed_description and not self.supports_description_hash:
+            if unhashed_description and not await self._supports_description_hash():
                 raise UnsupportedError("unhashed_description")
-            r: dict = self.ln.invoice(  # type: ignore
-                msatoshi=msat,
+            r: dict = await self.ln.invoice(
+                amount_msat=msat,
                 label=label,
                 description=(
                     unhashed_description.decode() if unhashed_description else memo
@@ -157,7 +181,7 @@ class CoreLightningWallet(Wallet):
                 "description": invoice.description,
             }
 
-            r = await run_sync(lambda: self.ln.call(self.pay, payload))
+            r = await self.ln.call(self.pay, payload)
 
             fee_msat = -int(r["amount_sent_msat"] - r["amount_msat"])
             return PaymentResponse(
@@ -190,7 +214,7 @@ class CoreLightningWallet(Wallet):
 
     async def get_invoice_status(self, checking_id: str) -> PaymentStatus:
         try:
-            r: dict = self.ln.listinvoices(payment_hash=checking_id)  # type: ignore
+            r: dict = await self.ln.listinvoices(payment_hash=checking_id)
 
             if not r["invoices"]:
                 return PaymentPendingStatus()
@@ -216,7 +240,7 @@ class CoreLightningWallet(Wallet):
 
     async def get_payment_status(self, checking_id: str) -> PaymentStatus:
         try:
-            r: dict = self.ln.listpays(payment_hash=checking_id)  # type: ignore
+            r: dict = await self.ln.listpays(payment_hash=checking_id)
 
             if "pays" not in r:
                 return PaymentPendingStatus()
@@ -251,10 +275,13 @@ class CoreLightningWallet(Wallet):
     async def paid_invoices_stream(self) -> AsyncGenerator[str, None]:
         while settings.lnbits_running:
             try:
-                paid = await run_sync(
-                    lambda: self.ln.waitanyinvoice(self.last_pay_index, timeout=2)
+                if self.invoice_stream_cursor is None:
+                    # nothing to resume from, listen from the last paid invoice on
+                    self.invoice_stream_cursor = await self._get_last_pay_index()
+                paid = await self.ln.waitanyinvoice(
+                    lastpay_index=self.invoice_stream_cursor, timeout=2
                 )
-                self.last_pay_index = paid["pay_index"]
+                self.invoice_stream_cursor = paid["pay_index"]
                 yield paid["payment_hash"]
             except RpcError as exc:
                 # only raise if not a timeout
@@ -0,0 +1,152 @@
+import asyncio
+import json
+from typing import Any, Dict, List, Optional
+
+from loguru import logger
+from pyln.client import RpcError
+
+
+class _RpcConnection:
+    """
+    One long lived unix socket connection to lightningd.
+
+    Requests are written as soon as they are made and the responses, which
+    lightningd terminates with an empty line, are matched back to the waiting
+    callers by their JSON-RPC id. Responses may arrive in any order.
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.pending: Dict[int, asyncio.Future] = {}
+        self._read_task = asyncio.create_task(self._read_responses())
+
+    @property
+    def closed(self) -> bool:
+        return self._read_task.done()
+
+    async def request(self, request: dict) -> dict:
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request["id"]] = future
+        try:
+            self.writer.write(json.dumps(request).encode())
+            await self.writer.drain()
+            return await future
+        finally:
+            self.pending.pop(request["id"], None)
+
+    async def close(self):
+        self._read_task.cancel()
+        try:
+            await self._read_task
+        except asyncio.CancelledError:
+            pass
+
+    async def _read_responses(self):
+        buffer = bytearray()
+        searched = 0
+        try:
+            while True:
+                data = await self.reader.read(2**16)
+                if not data:
+                    raise ConnectionError("lightningd closed the connection")
+                buffer += data
+                while True:
+                    end = buffer.find(b"\n\n", searched)
+                    if end == -1:
+                        # the separator can be split across two reads
+                        searched = max(len(buffer) - 1, 0)
+                        break
+                    message = bytes(buffer[:end])
+                    del buffer[: end + 2]
+                    searched = 0
+                    if message.strip():
+                        self._resolve(json.loads(message))
+        except Exception as exc:
+            logger.debug(f"lightningd rpc connection lost: {exc}")
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(
+                        ConnectionError(f"lightningd rpc connection lost: {exc}")
+                    )
+        finally:
+            self.writer.close()
+
+    def _resolve(self, response: Any):
+        if not isinstance(response, dict):
+            logger.warning(f"Malformed lightningd rpc response: {response}")
+            return
+        # notifications carry no id and are not requested by us
+        future = self.pending.get(response.get("id"))  # type: ignore
+        if future and not future.done():
+            future.set_result(response)
+
+
+class AsyncLightningRpc:
+    """
+    asyncio JSON-RPC client for the lightningd unix socket.
+
+    `pyln.client.LightningRpc` opens a new socket and blocks on it for every
+    call. This client keeps a small pool of connections instead and pipelines
+    concurrent calls over them, so nothing blocks the event loop and slow calls
+    (`pay`, `waitanyinvoice`) do not hold up the others.
+
+    Methods are called by their lightningd name with lightningd's own parameter
+    names, e.g. `await rpc.listinvoices(payment_hash=...)`. `None` parameters are
+    left out and errors are raised as `pyln.client.RpcError`, like `pyln` does.
+    """
+
+    def __init__(self, socket_path: str, pool_size: int = 4):
+        self.socket_path = socket_path
+        self.pool_size = max(pool_size, 1)
+        self._connections: List[_RpcConnection] = []
+        self._connect_lock: Optional[asyncio.Lock] = None
+        self._next_id = 0
+
+    async def call(self, method: str, payload: Optional[dict] = None) -> Any:
+        payload = {k: v for k, v in (payload or {}).items() if v is not None}
+        self._next_id += 1
+        request = {
+            "jsonrpc": "2.0",
+            "id": self._next_id,
+            "method": method,
+            "params": payload,
+        }
+        connection = await self._get_connection()
+        response = await connection.request(request)
+        if "error" in response:
+            raise RpcError(method, payload, response["error"])
+        if "result" not in response:
+            raise ValueError(f"Malformed response, 'result' missing: {response}")
+        return response["result"]
+
+    def __getattr__(self, method: str):
+        if method.startswith("_"):
+            raise AttributeError(method)
+
+        async def _call(**kwargs) -> Any:
+            return await self.call(method, kwargs)
+
+        return _call
+
+    async def close(self):
+        connections, self._connections = self._connections, []
+        for connection in connections:
+            await connection.close()
+
+    async def _get_connection(self) -> _RpcConnection:
+        self._connections = [c for c in self._connections if not c.closed]
+        idle = [c for c in self._connections if not c.pending]
+        if idle:
+            return idle[0]
+        if len(self._connections) >= self.pool_size:
+            return min(self._connections, key=lambda c: len(c.pending))
+
+        if not self._connect_lock:
+            self._connect_lock = asyncio.Lock()
+        async with self._connect_lock:
+            if len(self._connections) < self.pool_size:
+                reader, writer = await asyncio.open_unix_connection(self.socket_path)
+                self._connections.append(_RpcConnection(reader, writer))
+                return self._connections[-1]
+        return min(self._connections, key=lambda c: len(c.pending))
@@ -8,7 +8,7 @@ from bolt11 import Bolt11Exception
 from bolt11.decode import decode
 from loguru import logger
 
-from lnbits.settings import settings
+from lnbits.settings import Settings, settings
 
 from .base import (
     InvoiceResponse,
@@ -18,35 +18,39 @@ from .base import (
     StatusResponse,
     UnsupportedError,
     Wallet,
+    create_http_client,
 )
 from .macaroon import load_macaroon
 
 
 class CoreLightningRestWallet(Wallet):
-    def __init__(self):
-        if not settings.corelightning_rest_url:
+    resumable_invoice_stream = True
+
+    def __init__(self, config: Optional[Settings] = None):
+        super().__init__(config)
+        if not self.config.corelightning_rest_url:
             raise ValueError(
                 "cannot initialize CoreLightningRestWallet: "
                 "missing corelightning_rest_url"
             )
-        if not settings.corelightning_rest_macaroon:
+        if not self.config.corelightning_rest_macaroon:
             raise ValueError(
                 "cannot initialize CoreLightningRestWallet: "
                 "missing corelightning_rest_macaroon"
             )
-        macaroon = load_macaroon(settings.corelightning_rest_macaroon)
+        macaroon = load_macaroon(self.config.corelightning_rest_macaroon)
         if not macaroon:
             raise ValueError(
                 "cannot initialize CoreLightningRestWallet: "
                 "invalid corelightning_rest_macaroon provided"
             )
 
-        self.url = self.normalize_endpoint(settings.corelightning_rest_url)
+        self.url = self.normalize_endpoint(self.config.corelightning_rest_url)
         headers = {
             "macaroon": macaroon,
             "encodingtype": "hex",
             "accept": "application/json",
-            "User-Agent": settings.user_agent,
+            "User-Agent": self.config.user_agent,
         }
 
         # https://docs.corelightning.org/reference/lightning-pay
@@ -60,9 +64,13 @@ class CoreLightningRestWallet(Wallet):
         # 210: Payment timed out without a payment in progress.
         self.pay_failure_error_codes = [-32602, 201, 203, 205, 206, 207, 210]
 
-        self.cert = settings.corelightning_rest_cert or False
-        self.client = httpx.AsyncClient(verify=self.cert, headers=headers)
-        self.last_pay_index = 0
+        self.cert = self.config.corelightning_rest_cert or False
+        self.client = create_http_client(
+            "CoreLightningRestWallet", headers=headers, verify=self.cert
+        )
+        self.stream_client = create_http_client(
+            "CoreLightningRestWallet", headers=headers, verify=self.cert, stream=True
+        )
         self.statuses = {
             "paid": True,
             "complete": True,
@@ -70,17 +78,20 @@ class CoreLightningRestWallet(Wallet):
             "pending": None,
         }
 
+    @property
+    def invoice_stream_cursor_key(self) -> str:
+        return f"{self.__class__.__name__}:{self.url}"
+
     async def cleanup(self):
         try:
             await self.client.aclose()
+            await self.stream_client.aclose()
         except RuntimeError as e:
             logger.warning(f"Error closing wallet connection: {e}")
 
     async def status(self) -> StatusResponse:
         try:
-            r = await self.client.get(
-                f"{self.url}/v1/channel/localremotebal", timeout=5
-            )
+            r = await self.client.get(f"{self.url}/v1/channel/localremotebal")
             r.raise_for_status()
             data = r.json()
 
@@ -133,6 +144,7 @@ class CoreLightningRestWallet(Wallet):
             r = await self.client.post(
                 f"{self.url}/v1/invoice/genInvoice",
                 data=data,
+                timeout=settings.funding_source_invoice_timeout,
             )
             r.raise_for_status()
 
@@ -181,7 +193,7 @@ class CoreLightningRestWallet(Wallet):
                     "invoice": bolt11,
                     "maxfee": fee_limit_msat,
                 },
-                timeout=None,
+                timeout=settings.funding_source_pay_timeout,
             )
 
             r.raise_for_status()
@@ -278,8 +290,9 @@ class CoreLightningRestWallet(Wallet):
     async def paid_invoices_stream(self) -> AsyncGenerator[str, None]:
         while settings.lnbits_running:
             try:
-                url = f"{self.url}/v1/invoice/waitAnyInvoice/{self.last_pay_index}"
-                async with self.client.stream("GET", url, timeout=None) as r:
+                last_pay_index = self.invoice_stream_cursor or 0
+                url = f"{self.url}/v1/invoice/waitAnyInvoice/{last_pay_index}"
+                async with self.stream_client.stream("GET", url) as r:
                     async for line in r.aiter_lines():
                         inv = json.loads(line)
                         if "error" in inv and "message" in inv["error"]:
@@ -287,7 +300,7 @@ class CoreLightningRestWallet(Wallet):
                             raise Exception(inv["error"]["message"])
                         try:
                             paid = inv["status"] == "paid"
-                            self.last_pay_index = inv["pay_index"]
+                            self.invoice_stream_cursor = inv["pay_index"]
                             if not paid:
                                 continue
                         except Exception:
@@ -5,11 +5,10 @@ import json
 import urllib.parse
 from typing import Any, AsyncGenerator, Dict, Optional
 
-import httpx
 from loguru import logger
 from websockets.client import connect
 
-from lnbits.settings import settings
+from lnbits.settings import Settings, settings
 
 from .base import (
     InvoiceResponse,
@@ -18,6 +17,7 @@ from .base import (
     PaymentStatus,
     StatusResponse,
     Wallet,
+    create_http_client,
 )
 
 
@@ -30,23 +30,26 @@ class UnknownError(Exception):
 
 
 class EclairWallet(Wallet):
-    def __init__(self):
-        if not settings.eclair_url:
+    def __init__(self, config: Optional[Settings] = None):
+        super().__init__(config)
+        if not self.config.eclair_url:
             raise ValueError("cannot initialize EclairWallet: missing eclair_url")
-        if not settings.eclair_pass:
+        if not self.config.eclair_pass:
             raise ValueError("cannot initialize EclairWallet: missing eclair_pass")
 
-        self.url = self.normalize_endpoint(settings.eclair_url)
+        self.url = self.normalize_endpoint(self.config.eclair_url)
         self.ws_url = f"ws://{urllib.parse.urlsplit(self.url).netloc}/ws"
 
-        password = settings.eclair_pass
+        password = self.config.eclair_pass
         encoded_auth = base64.b64encode(f":{password}".encode())
         auth = str(encoded_auth, "utf-8")
         self.headers = {
             "Authorization": f"Basic {auth}",
-            "User-Agent": settings.user_agent,
+            "User-Agent": self.config.user_agent,
         }
-        self.client = httpx.AsyncClient(base_url=self.url, headers=self.headers)
+        self.client = create_http_client(
+            "EclairWallet", base_url=self.url, headers=self.headers
+        )
 
     async def cleanup(self):
         try:
@@ -56,7 +59,7 @@ class EclairWallet(Wallet):
 
     async def status(self) -> StatusResponse:
         try:
-            r = await self.client.post("/globalbalance", timeout=5)
+            r = await self.client.post("/globalbalance")
             r.raise_for_status()
 
             data = r.json()
@@ -100,7 +103,11 @@ class EclairWallet(Wallet):
             data["description"] = memo
 
         try:
-            r = await self.client.post("/createinvoice", data=data, timeout=40)
+            r = await self.client.post(
+                "/createinvoice",
+                data=data,
+                timeout=settings.funding_source_invoice_timeout,
+            )
             r.raise_for_status()
             data = r.json()
 
@@ -136,7 +143,7 @@ class EclairWallet(Wallet):
             r = await self.client.post(
                 "/payinvoice",
                 data={"invoice": bolt11, "blocking": True},
-                timeout=None,
+                timeout=settings.funding_source_pay_timeout,
             )
             r.raise_for_status()
             data = r.json()
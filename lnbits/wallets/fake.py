@@ -1,9 +1,13 @@
 import asyncio
 import hashlib
+import random
+from collections import OrderedDict
 from datetime import datetime
+from functools import lru_cache
 from os import urandom
-from typing import AsyncGenerator, Dict, Optional, Set
+from typing import AsyncGenerator, List, Optional
 
+from bech32 import bech32_encode
 from bolt11 import (
     Bolt11,
     Bolt11Exception,
@@ -13,7 +17,9 @@ from bolt11 import (
     decode,
     encode,
 )
+from bolt11.utils import msat_to_amount
 from loguru import logger
+from secp256k1 import PrivateKey
 
 from lnbits.settings import settings
 
@@ -30,9 +36,15 @@ from .base import (
 
 
 class FakeWallet(Wallet):
+    """
+    Settles the invoices it created itself. For load tests it can keep a bounded
+    number of invoices, encode them without `bitstring` (`fake_wallet_fast_signing`),
+    add latency and failures and pretend to pay external invoices.
+    """
+
     queue: asyncio.Queue = asyncio.Queue(0)
-    payment_secrets: Dict[str, str] = {}
-    paid_invoices: Set[str] = set()
+    payment_secrets: OrderedDict[str, str] = OrderedDict()
+    paid_invoices: OrderedDict[str, None] = OrderedDict()
     secret: str = settings.fake_wallet_secret
     privkey: str = hashlib.pbkdf2_hmac(
         "sha256",
@@ -87,7 +99,10 @@ class FakeWallet(Wallet):
 
         tags.add(TagChar.payment_hash, payment_hash)
 
-        self.payment_secrets[payment_hash] = secret
+        if await self._simulate_failure():
+            return InvoiceResponse(ok=False, error_message="Simulated failure.")
+
+        _remember(self.payment_secrets, payment_hash, secret)
 
         bolt11 = Bolt11(
             currency="bc",
@@ -96,7 +111,10 @@ class FakeWallet(Wallet):
             tags=tags,
         )
 
-        payment_request = encode(bolt11, self.privkey)
+        if settings.fake_wallet_fast_signing:
+            payment_request = fast_encode(bolt11, self.privkey)
+        else:
+            payment_request = encode(bolt11, self.privkey)
 
         return InvoiceResponse(
             ok=True, checking_id=payment_hash, payment_request=payment_request
@@ -108,15 +126,23 @@ class FakeWallet(Wallet):
         except Bolt11Exception as exc:
             return PaymentResponse(ok=False, error_message=str(exc))
 
+        if await self._simulate_failure():
+            return PaymentResponse(ok=False, error_message="Simulated failure.")
+
         if invoice.payment_hash in self.payment_secrets:
             await self.queue.put(invoice)
-            self.paid_invoices.add(invoice.payment_hash)
+            _remember(self.paid_invoices, invoice.payment_hash, None)
             return PaymentResponse(
                 ok=True,
                 checking_id=invoice.payment_hash,
                 fee_msat=0,
                 preimage=self.payment_secrets.get(invoice.payment_hash) or "0" * 64,
             )
+        elif settings.fake_wallet_pay_external:
+            _remember(self.paid_invoices, invoice.payment_hash, None)
+            return PaymentResponse(
+                ok=True, checking_id=invoice.payment_hash, fee_msat=0, preimage="0" * 64
+            )
         else:
             return PaymentResponse(
                 ok=False, error_message="Only internal invoices can be used!"
@@ -125,7 +151,7 @@ class FakeWallet(Wallet):
     async def get_invoice_status(self, checking_id: str) -> PaymentStatus:
         if checking_id in self.paid_invoices:
             return PaymentSuccessStatus()
-        if checking_id in list(self.payment_secrets.keys()):
+        if checking_id in self.payment_secrets:
             return PaymentPendingStatus()
         return PaymentFailedStatus()
 
@@ -136,3 +162,70 @@ class FakeWallet(Wallet):
         while settings.lnbits_running:
             value: Bolt11 = await self.queue.get()
             yield value.payment_hash
+
+    async def _simulate_failure(self) -> bool:
+        if settings.fake_wallet_latency:
+            await asyncio.sleep(settings.fake_wallet_latency)
+        return random.random() < settings.fake_wallet_failure_rate
+
+
+def _remember(items: OrderedDict, key: str, value):
+    items[key] = value
+    if settings.fake_wallet_max_invoices:
+        while len(items) > settings.fake_wallet_max_invoices:
+            items.popitem(last=False)
+
+
+@lru_cache(maxsize=4)
+def _private_key(privkey: str) -> PrivateKey:
+    return PrivateKey(bytes.fromhex(privkey))
+
+
+def _to_words(data: bytes) -> List[int]:
+    """Bytes to zero padded 5 bit words."""
+    bits = len(data) * 8
+    padding = -bits % 5
+    value = int.from_bytes(data, "big") << padding
+    count = (bits + padding) // 5
+    return [(value >> 5 * (count - 1 - i)) & 31 for i in range(count)]
+
+
+def _int_to_words(value: int, length: int = 0) -> List[int]:
+    words: List[int] = []
+    while value or len(words) < length:
+        words.insert(0, value & 31)
+        value >>= 5
+    return words
+
+
+def fast_encode(invoice: Bolt11, privkey: str) -> str:
+    """
+    Same result as `bolt11.encode` for the tags of the FakeWallet, but computed with
+    plain integers and a cached signing key, `bitstring` is most of the cost of
+    creating an invoice.
+    """
+    data = _int_to_words(invoice.date, 7)
+    for tag in invoice.tags:
+        if tag.char == TagChar.description:
+            words = _to_words(tag.data.encode())
+        elif tag.char == TagChar.expire_time:
+            words = _int_to_words(tag.data)
+        else:  # payment_hash, payment_secret, description_hash
+            words = _to_words(bytes.fromhex(tag.data))
+        data += [tag.bech32, len(words) // 32, len(words) % 32, *words]
+
+    hrp = f"ln{invoice.currency}"
+    if invoice.amount_msat:
+        hrp += msat_to_amount(invoice.amount_msat)
+    # the signed data is the 5 bit words zero padded to full bytes
+    bits = len(data) * 5
+    padding = -bits % 8
+    value = 0
+    for word in data:
+        value = value << 5 | word
+    signing_data = (value << padding).to_bytes((bits + padding) // 8, "big")
+
+    key = _private_key(privkey)
+    signature = key.ecdsa_sign_recoverable(hrp.encode() + signing_data)
+    signature_data, recid = key.ecdsa_recoverable_serialize(signature)
+    return bech32_encode(hrp, data + _to_words(bytes(signature_data) + bytes([recid])))
@@ -5,7 +5,7 @@ from typing import AsyncGenerator, Dict, Optional
 import httpx
 from loguru import logger
 
-from lnbits.settings import settings
+from lnbits.settings import Settings, settings
 
 from .base import (
     InvoiceResponse,
@@ -16,38 +16,48 @@ from .base import (
     PaymentSuccessStatus,
     StatusResponse,
     Wallet,
+    create_http_client,
 )
 
 
 class LNbitsWallet(Wallet):
     """https://github.com/lnbits/lnbits"""
 
-    def __init__(self):
-        if not settings.lnbits_endpoint:
+    def __init__(self, config: Optional[Settings] = None):
+        super().__init__(config)
+        if not self.config.lnbits_endpoint:
             raise ValueError("cannot initialize LNbitsWallet: missing lnbits_endpoint")
         key = (
-            settings.lnbits_key
-            or settings.lnbits_admin_key
-            or settings.lnbits_invoice_key
+            self.config.lnbits_key
+            or self.config.lnbits_admin_key
+            or self.config.lnbits_invoice_key
         )
         if not key:
             raise ValueError(
                 "cannot initialize LNbitsWallet: "
                 "missing lnbits_key or lnbits_admin_key or lnbits_invoice_key"
             )
-        self.endpoint = self.normalize_endpoint(settings.lnbits_endpoint)
-        self.headers = {"X-Api-Key": key, "User-Agent": settings.user_agent}
-        self.client = httpx.AsyncClient(base_url=self.endpoint, headers=self.headers)
+        self.endpoint = self.normalize_endpoint(self.config.lnbits_endpoint)
+        self.headers = {"X-Api-Key": key, "User-Agent": self.config.user_agent}
+        self.client = create_http_client(
+            "LNbitsWallet", base_url=self.endpoint, headers=self.headers
+        )
+        self.stream_client = create_http_client(
+            "LNbitsWallet", base_url=self.endpoint, headers=self.headers, stream=True
+        )
+        # we have to disable compression for SSEs
+        del self.stream_client.headers["accept-encoding"]
 
     async def cleanup(self):
         try:
             await self.client.aclose()
+            await self.stream_client.aclose()
         except RuntimeError as e:
             logger.warning(f"Error closing wallet connection: {e}")
 
     async def status(self) -> StatusResponse:
         try:
-            r = await self.client.get(url="/api/v1/wallet", timeout=15)
+            r = await self.client.get(url="/api/v1/wallet")
             r.raise_for_status()
             data = r.json()
 
@@ -114,7 +124,7 @@ class LNbitsWallet(Wallet):
             r = await self.client.post(
                 url="/api/v1/payments",
                 json={"out": True, "bolt11": bolt11},
-                timeout=None,
+                timeout=settings.funding_source_pay_timeout,
             )
 
             r.raise_for_status()
@@ -200,29 +210,23 @@ class LNbitsWallet(Wallet):
 
         while settings.lnbits_running:
             try:
-                async with httpx.AsyncClient(
-                    timeout=None, headers=self.headers
-                ) as client:
-                    del client.headers[
-                        "accept-encoding"
-                    ]  # we have to disable compression for SSEs
-                    async with client.stream(
-                        "GET", url, content="text/event-stream"
-                    ) as r:
-                        sse_trigger = False
-                        async for line in r.aiter_lines():
-                            # The data we want to listen to is of this shape:
-                            # event: payment-received
-                            # data: {.., "payment_hash" : "asd"}
-                            if line.startswith("event: payment-received"):
-                                sse_trigger = True
-                                continue
-                            elif sse_trigger and line.startswith("data:"):
-                                data = json.loads(line[len("data:") :])
-                                sse_trigger = False
-                                yield data["payment_hash"]
-                            else:
-                                sse_trigger = False
+                async with self.stream_client.stream(
+                    "GET", url, content="text/event-stream"
+                ) as r:
+                    sse_trigger = False
+                    async for line in r.aiter_lines():
+                        # The data we want to listen to is of this shape:
+                        # event: payment-received
+                        # data: {.., "payment_hash" : "asd"}
+                        if line.startswith("event: payment-received"):
+                            sse_trigger = True
+                            continue
+                        elif sse_trigger and line.startswith("data:"):
+                            data = json.loads(line[len("data:") :])
+                            sse_trigger = False
+                            yield data["payment_hash"]
+                        else:
+                            sse_trigger = False
 
             except (OSError, httpx.ReadError, httpx.ConnectError, httpx.ReadTimeout):
                 pass
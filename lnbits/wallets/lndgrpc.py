@@ -2,7 +2,7 @@ import asyncio
 import base64
 import hashlib
 from os import environ
-from typing import AsyncGenerator, Dict, Optional
+from typing import Any, AsyncGenerator, AsyncIterator, Dict, Optional, Tuple
 
 import grpc
 from loguru import logger
@@ -11,7 +11,7 @@ import lnbits.wallets.lnd_grpc_files.lightning_pb2 as ln
 import lnbits.wallets.lnd_grpc_files.lightning_pb2_grpc as lnrpc
 import lnbits.wallets.lnd_grpc_files.router_pb2 as router
 import lnbits.wallets.lnd_grpc_files.router_pb2_grpc as routerrpc
-from lnbits.settings import settings
+from lnbits.settings import Settings, settings
 from lnbits.utils.crypto import AESCipher
 
 from .base import (
@@ -20,6 +20,7 @@ from .base import (
     PaymentResponse,
     PaymentStatus,
     PaymentSuccessStatus,
+    PaymentTracker,
     StatusResponse,
     Wallet,
 )
@@ -59,26 +60,29 @@ environ["GRPC_SSL_CIPHER_SUITES"] = "HIGH+ECDSA"
 
 
 class LndWallet(Wallet):
-    def __init__(self):
-        if not settings.lnd_grpc_endpoint:
+    resumable_invoice_stream = True
+
+    def __init__(self, config: Optional[Settings] = None):
+        super().__init__(config)
+        if not self.config.lnd_grpc_endpoint:
             raise ValueError("cannot initialize LndWallet: missing lnd_grpc_endpoint")
-        if not settings.lnd_grpc_port:
+        if not self.config.lnd_grpc_port:
             raise ValueError("cannot initialize LndWallet: missing lnd_grpc_port")
 
-        cert_path = settings.lnd_grpc_cert or settings.lnd_cert
+        cert_path = self.config.lnd_grpc_cert or self.config.lnd_cert
         if not cert_path:
             raise ValueError(
                 "cannot initialize LndWallet: missing lnd_grpc_cert or lnd_cert"
             )
 
         macaroon = (
-            settings.lnd_grpc_macaroon
-            or settings.lnd_grpc_admin_macaroon
-            or settings.lnd_admin_macaroon
-            or settings.lnd_grpc_invoice_macaroon
-            or settings.lnd_invoice_macaroon
+            self.config.lnd_grpc_macaroon
+            or self.config.lnd_grpc_admin_macaroon
+            or self.config.lnd_admin_macaroon
+            or self.config.lnd_grpc_invoice_macaroon
+            or self.config.lnd_invoice_macaroon
         )
-        encrypted_macaroon = settings.lnd_grpc_macaroon_encrypted
+        encrypted_macaroon = self.config.lnd_grpc_macaroon_encrypted
         if encrypted_macaroon:
             macaroon = AESCipher(description="macaroon decryption").decrypt(
                 encrypted_macaroon
@@ -92,9 +96,9 @@ class LndWallet(Wallet):
             )
 
         self.endpoint = self.normalize_endpoint(
-            settings.lnd_grpc_endpoint, add_proto=False
+            self.config.lnd_grpc_endpoint, add_proto=False
         )
-        self.port = int(settings.lnd_grpc_port)
+        self.port = int(self.config.lnd_grpc_port)
         self.macaroon = load_macaroon(macaroon)
         cert = open(cert_path, "rb").read()
         creds = grpc.ssl_channel_credentials(cert)
@@ -105,12 +109,23 @@ class LndWallet(Wallet):
         )
         self.rpc = lnrpc.LightningStub(channel)
         self.routerpc = routerrpc.RouterStub(channel)
+        # routerrpc.TrackPayments is missing in the generated router stubs, it takes
+        # a TrackPaymentsRequest, sent empty (`no_inflight_updates=false`)
+        self.track_payments = channel.unary_stream(
+            "/routerrpc.Router/TrackPayments",
+            response_deserializer=ln.Payment.FromString,  # type: ignore[attr-defined]
+        )
+        self.payment_tracker = PaymentTracker(self._subscribe_payments)
 
     def metadata_callback(self, _, callback):
         callback([("macaroon", self.macaroon)], None)
 
+    @property
+    def invoice_stream_cursor_key(self) -> str:
+        return f"{self.__class__.__name__}:{self.endpoint}:{self.port}"
+
     async def cleanup(self):
-        pass
+        await self.payment_tracker.stop()
 
     async def status(self) -> StatusResponse:
         try:
@@ -226,17 +241,23 @@ class LndWallet(Wallet):
 
     async def get_payment_status(self, checking_id: str) -> PaymentStatus:
         """
-        This routine checks the payment status using routerpc.TrackPaymentV2.
+        Answered by the payment tracker, only payments it has not seen are
+        checked with routerpc.TrackPaymentV2.
         """
-        try:
-            r_hash = hex_to_bytes(checking_id)
-            if len(r_hash) != 32:
-                raise ValueError
-        except ValueError:
-            # this may happen if we switch between backend wallets
-            # that use different checking_id formats
-            return PaymentPendingStatus()
-
+        status = self.payment_tracker.get(checking_id)
+        if status is None:
+            status = await self._track_payment(checking_id)
+            if not status.pending:
+                self.payment_tracker.set(checking_id, status)
+        return status
+
+    async def _subscribe_payments(self) -> AsyncIterator[Tuple[str, PaymentStatus]]:
+        """Updates of all payments, using routerpc.TrackPayments."""
+        async for payment in self.track_payments(b""):
+            yield payment.payment_hash, self._payment_status(payment)
+
+    def _payment_status(self, payment: Any) -> PaymentStatus:
+        # an `ln.Payment`, the generated messages have no stubs
         # # HTLCAttempt.HTLCStatus:
         # # https://github.com/lightningnetwork/lnd/blob/master/lnrpc/lightning.proto#L3641
         # htlc_statuses = {
@@ -250,32 +271,52 @@ class LndWallet(Wallet):
             2: True,  # SUCCEEDED
             3: False,  # FAILED
         }
+        if len(payment.htlcs) and statuses[payment.status]:
+            return PaymentSuccessStatus(
+                fee_msat=-payment.htlcs[-1].route.total_fees_msat,
+                preimage=bytes_to_hex(payment.htlcs[-1].preimage),
+            )
+        return PaymentStatus(statuses[payment.status])
+
+    async def _track_payment(self, checking_id: str) -> PaymentStatus:
+        """
+        This routine checks the payment status using routerpc.TrackPaymentV2.
+        """
+        try:
+            r_hash = hex_to_bytes(checking_id)
+            if len(r_hash) != 32:
+                raise ValueError
+        except ValueError:
+            # this may happen if we switch between backend wallets
+            # that use different checking_id formats
+            return PaymentPendingStatus()
 
         try:
             resp = self.routerpc.TrackPaymentV2(
                 router.TrackPaymentRequest(payment_hash=r_hash)
             )
             async for payment in resp:
-                if len(payment.htlcs) and statuses[payment.status]:
-                    return PaymentSuccessStatus(
-                        fee_msat=-payment.htlcs[-1].route.total_fees_msat,
-                        preimage=bytes_to_hex(payment.htlcs[-1].preimage),
-                    )
-                return PaymentStatus(statuses[payment.status])
+                return self._payment_status(payment)
         except Exception:  # most likely the payment wasn't found
             return PaymentPendingStatus()
 
         return PaymentPendingStatus()
 
     async def paid_invoices_stream(self) -> AsyncGenerator[str, None]:
+        # the invoices stream runs as long as LNbits does, so does the tracker
+        self.payment_tracker.start()
         while settings.lnbits_running:
             try:
-                request = ln.InvoiceSubscription()
+                # replays the invoices settled after the cursor first
+                request = ln.InvoiceSubscription(
+                    settle_index=self.invoice_stream_cursor or 0
+                )
                 async for i in self.rpc.SubscribeInvoices(request):
                     if not i.settled:
                         continue
 
                     checking_id = bytes_to_hex(i.r_hash)
+                    self.invoice_stream_cursor = i.settle_index
                     yield checking_id
             except Exception as exc:
                 logger.error(
@@ -2,13 +2,12 @@ import asyncio
 import base64
 import hashlib
 import json
-from typing import AsyncGenerator, Dict, Optional
+from typing import AsyncGenerator, AsyncIterator, Dict, Optional, Tuple
 
-import httpx
 from loguru import logger
 
 from lnbits.nodes.lndrest import LndRestNode
-from lnbits.settings import settings
+from lnbits.settings import Settings, settings
 from lnbits.utils.crypto import AESCipher
 
 from .base import (
@@ -18,8 +17,10 @@ from .base import (
     PaymentResponse,
     PaymentStatus,
     PaymentSuccessStatus,
+    PaymentTracker,
     StatusResponse,
     Wallet,
+    create_http_client,
 )
 from .macaroon import load_macaroon
 
@@ -28,21 +29,23 @@ class LndRestWallet(Wallet):
     """https://api.lightning.community/rest/index.html#lnd-rest-api-reference"""
 
     __node_cls__ = LndRestNode
+    resumable_invoice_stream = True
 
-    def __init__(self):
-        if not settings.lnd_rest_endpoint:
+    def __init__(self, config: Optional[Settings] = None):
+        super().__init__(config)
+        if not self.config.lnd_rest_endpoint:
             raise ValueError(
                 "cannot initialize LndRestWallet: missing lnd_rest_endpoint"
             )
 
         macaroon = (
-            settings.lnd_rest_macaroon
-            or settings.lnd_admin_macaroon
-            or settings.lnd_rest_admin_macaroon
-            or settings.lnd_invoice_macaroon
-            or settings.lnd_rest_invoice_macaroon
+            self.config.lnd_rest_macaroon
+            or self.config.lnd_admin_macaroon
+            or self.config.lnd_rest_admin_macaroon
+            or self.config.lnd_invoice_macaroon
+            or self.config.lnd_rest_invoice_macaroon
         )
-        encrypted_macaroon = settings.lnd_rest_macaroon_encrypted
+        encrypted_macaroon = self.config.lnd_rest_macaroon_encrypted
         if encrypted_macaroon:
             macaroon = AESCipher(description="macaroon decryption").decrypt(
                 encrypted_macaroon
@@ -55,31 +58,45 @@ class LndRestWallet(Wallet):
                 "lnd_rest_invoice_macaroon or lnd_rest_macaroon_encrypted"
             )
 
-        if not settings.lnd_rest_cert:
+        if not self.config.lnd_rest_cert:
             logger.warning(
                 "No certificate for LndRestWallet provided! "
                 "This only works if you have a publicly issued certificate."
             )
 
-        self.endpoint = self.normalize_endpoint(settings.lnd_rest_endpoint)
+        self.endpoint = self.normalize_endpoint(self.config.lnd_rest_endpoint)
 
         # if no cert provided it should be public so we set verify to True
         # and it will still check for validity of certificate and fail if its not valid
         # even on startup
-        cert = settings.lnd_rest_cert or True
+        cert = self.config.lnd_rest_cert or True
 
         macaroon = load_macaroon(macaroon)
         headers = {
             "Grpc-Metadata-macaroon": macaroon,
-            "User-Agent": settings.user_agent,
+            "User-Agent": self.config.user_agent,
         }
-        self.client = httpx.AsyncClient(
-            base_url=self.endpoint, headers=headers, verify=cert
+        self.client = create_http_client(
+            "LndRestWallet", base_url=self.endpoint, headers=headers, verify=cert
         )
+        self.stream_client = create_http_client(
+            "LndRestWallet",
+            base_url=self.endpoint,
+            headers=headers,
+            verify=cert,
+            stream=True,
+        )
+        self.payment_tracker = PaymentTracker(self._subscribe_payments)
+
+    @property
+    def invoice_stream_cursor_key(self) -> str:
+        return f"{self.__class__.__name__}:{self.endpoint}"
 
     async def cleanup(self):
         try:
+            await self.payment_tracker.stop()
             await self.client.aclose()
+            await self.stream_client.aclose()
         except RuntimeError as e:
             logger.warning(f"Error closing wallet connection: {e}")
 
@@ -112,7 +129,7 @@ class LndRestWallet(Wallet):
     ) -> InvoiceResponse:
         data: Dict = {
             "value": amount,
-            "private": settings.lnd_rest_route_hints,
+            "private": self.config.lnd_rest_route_hints,
             "memo": memo or "",
         }
         if kwargs.get("expiry"):
@@ -127,7 +144,11 @@ class LndRestWallet(Wallet):
             ).decode("ascii")
 
         try:
-            r = await self.client.post(url="/v1/invoices", json=data)
+            r = await self.client.post(
+                url="/v1/invoices",
+                json=data,
+                timeout=settings.funding_source_invoice_timeout,
+            )
             r.raise_for_status()
             data = r.json()
 
@@ -171,7 +192,7 @@ class LndRestWallet(Wallet):
             r = await self.client.post(
                 url="/v1/channels/transactions",
                 json={"payment_request": bolt11, "fee_limit": lnrpc_fee_limit},
-                timeout=None,
+                timeout=settings.funding_source_pay_timeout,
             )
             r.raise_for_status()
             data = r.json()
@@ -217,6 +238,42 @@ class LndRestWallet(Wallet):
         return PaymentSuccessStatus()
 
     async def get_payment_status(self, checking_id: str) -> PaymentStatus:
+        """
+        Answered by the payment tracker, only payments it has not seen are
+        checked with routerpc.TrackPaymentV2.
+        """
+        status = self.payment_tracker.get(checking_id)
+        if status is None:
+            status = await self._track_payment(checking_id)
+            if not status.pending:
+                self.payment_tracker.set(checking_id, status)
+        return status
+
+    async def _subscribe_payments(self) -> AsyncIterator[Tuple[str, PaymentStatus]]:
+        """Updates of all payments, using routerpc.TrackPayments."""
+        async with self.stream_client.stream("GET", "/v2/router/payments") as r:
+            r.raise_for_status()
+            async for line in r.aiter_lines():
+                payment = json.loads(line).get("result")
+                if payment and payment.get("status"):
+                    yield payment["payment_hash"], self._payment_status(payment)
+
+    def _payment_status(self, payment: dict) -> PaymentStatus:
+        # check payment.status:
+        # https://api.lightning.community/?python=#paymentpaymentstatus
+        statuses = {
+            "UNKNOWN": None,
+            "IN_FLIGHT": None,
+            "SUCCEEDED": True,
+            "FAILED": False,
+        }
+        return PaymentStatus(
+            paid=statuses[payment["status"]],
+            fee_msat=payment.get("fee_msat"),
+            preimage=payment.get("payment_preimage"),
+        )
+
+    async def _track_payment(self, checking_id: str) -> PaymentStatus:
         """
         This routine checks the payment status using routerpc.TrackPaymentV2.
         """
@@ -230,15 +287,6 @@ class LndRestWallet(Wallet):
 
         url = f"/v2/router/track/{checking_id}"
 
-        # check payment.status:
-        # https://api.lightning.community/?python=#paymentpaymentstatus
-        statuses = {
-            "UNKNOWN": None,
-            "IN_FLIGHT": None,
-            "SUCCEEDED": True,
-            "FAILED": False,
-        }
-
         async with self.client.stream("GET", url, timeout=None) as r:
             async for json_line in r.aiter_lines():
                 try:
@@ -258,11 +306,7 @@ class LndRestWallet(Wallet):
                         return PaymentPendingStatus()
                     payment = line.get("result")
                     if payment is not None and payment.get("status"):
-                        return PaymentStatus(
-                            paid=statuses[payment["status"]],
-                            fee_msat=payment.get("fee_msat"),
-                            preimage=payment.get("payment_preimage"),
-                        )
+                        return self._payment_status(payment)
                     else:
                         return PaymentPendingStatus()
                 except Exception:
@@ -271,10 +315,14 @@ class LndRestWallet(Wallet):
         return PaymentPendingStatus()
 
     async def paid_invoices_stream(self) -> AsyncGenerator[str, None]:
+        # the invoices stream runs as long as LNbits does, so does the tracker
+        self.payment_tracker.start()
         while settings.lnbits_running:
             try:
                 url = "/v1/invoices/subscribe"
-                async with self.client.stream("GET", url, timeout=None) as r:
+                # replays the invoices settled after the cursor first
+                params = {"settle_index": self.invoice_stream_cursor or 0}
+                async with self.stream_client.stream("GET", url, params=params) as r:
                     async for line in r.aiter_lines():
                         try:
                             inv = json.loads(line)["result"]
@@ -284,6 +332,7 @@ class LndRestWallet(Wallet):
                             continue
 
                         payment_hash = base64.b64decode(inv["r_hash"]).hex()
+                        self.invoice_stream_cursor = int(inv.get("settle_index", 0))
                         yield payment_hash
             except Exception as exc:
                 logger.error(
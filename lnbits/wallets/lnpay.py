@@ -5,7 +5,7 @@ from typing import AsyncGenerator, Dict, Optional
 import httpx
 from loguru import logger
 
-from lnbits.settings import settings
+from lnbits.settings import Settings, settings
 
 from .base import (
     InvoiceResponse,
@@ -14,21 +14,23 @@ from .base import (
     PaymentStatus,
     StatusResponse,
     Wallet,
+    create_http_client,
 )
 
 
 class LNPayWallet(Wallet):
     """https://docs.lnpay.co/"""
 
-    def __init__(self):
-        if not settings.lnpay_api_endpoint:
+    def __init__(self, config: Optional[Settings] = None):
+        super().__init__(config)
+        if not self.config.lnpay_api_endpoint:
             raise ValueError(
                 "cannot initialize LNPayWallet: missing lnpay_api_endpoint"
             )
-        if not settings.lnpay_api_key:
+        if not self.config.lnpay_api_key:
             raise ValueError("cannot initialize LNPayWallet: missing lnpay_api_key")
 
-        wallet_key = settings.lnpay_wallet_key or settings.lnpay_admin_key
+        wallet_key = self.config.lnpay_wallet_key or self.config.lnpay_admin_key
         if not wallet_key:
             raise ValueError(
                 "cannot initialize LNPayWallet: "
@@ -36,13 +38,15 @@ class LNPayWallet(Wallet):
             )
         self.wallet_key = wallet_key
 
-        self.endpoint = self.normalize_endpoint(settings.lnpay_api_endpoint)
+        self.endpoint = self.normalize_endpoint(self.config.lnpay_api_endpoint)
 
         headers = {
-            "X-Api-Key": settings.lnpay_api_key,
-            "User-Agent": settings.user_agent,
+            "X-Api-Key": self.config.lnpay_api_key,
+            "User-Agent": self.config.user_agent,
         }
-        self.client = httpx.AsyncClient(base_url=self.endpoint, headers=headers)
+        self.client = create_http_client(
+            "LNPayWallet", base_url=self.endpoint, headers=headers
+        )
 
     async def cleanup(self):
         try:
@@ -53,7 +57,7 @@ class LNPayWallet(Wallet):
     async def status(self) -> StatusResponse:
         url = f"/wallet/{self.wallet_key}"
         try:
-            r = await self.client.get(url, timeout=60)
+            r = await self.client.get(url)
         except (httpx.ConnectError, httpx.RequestError):
             return StatusResponse(f"Unable to connect to '{url}'", 0)
 
@@ -89,7 +93,7 @@ class LNPayWallet(Wallet):
         r = await self.client.post(
             f"/wallet/{self.wallet_key}/invoice",
             json=data,
-            timeout=60,
+            timeout=settings.funding_source_invoice_timeout,
         )
         ok, checking_id, payment_request, error_message = (
             r.status_code == 201,
@@ -108,7 +112,7 @@ class LNPayWallet(Wallet):
         r = await self.client.post(
             f"/wallet/{self.wallet_key}/withdraw",
             json={"payment_request": bolt11},
-            timeout=None,
+            timeout=settings.funding_source_pay_timeout,
         )
 
         try:
@@ -4,10 +4,9 @@ import json
 import time
 from typing import AsyncGenerator, Dict, Optional
 
-import httpx
 from loguru import logger
 
-from lnbits.settings import settings
+from lnbits.settings import Settings, settings
 
 from .base import (
     InvoiceResponse,
@@ -16,19 +15,21 @@ from .base import (
     PaymentStatus,
     StatusResponse,
     Wallet,
+    create_http_client,
 )
 
 
 class LnTipsWallet(Wallet):
-    def __init__(self):
-        if not settings.lntips_api_endpoint:
+    def __init__(self, config: Optional[Settings] = None):
+        super().__init__(config)
+        if not self.config.lntips_api_endpoint:
             raise ValueError(
                 "cannot initialize LnTipsWallet: missing lntips_api_endpoint"
             )
         key = (
-            settings.lntips_api_key
-            or settings.lntips_admin_key
-            or settings.lntips_invoice_key
+            self.config.lntips_api_key
+            or self.config.lntips_admin_key
+            or self.config.lntips_invoice_key
         )
         if not key:
             raise ValueError(
@@ -36,22 +37,28 @@ class LnTipsWallet(Wallet):
                 "missing lntips_api_key or lntips_admin_key or lntips_invoice_key"
             )
 
-        self.endpoint = self.normalize_endpoint(settings.lntips_api_endpoint)
+        self.endpoint = self.normalize_endpoint(self.config.lntips_api_endpoint)
 
         headers = {
             "Authorization": f"Basic {key}",
-            "User-Agent": settings.user_agent,
+            "User-Agent": self.config.user_agent,
         }
-        self.client = httpx.AsyncClient(base_url=self.endpoint, headers=headers)
+        self.client = create_http_client(
+            "LnTipsWallet", base_url=self.endpoint, headers=headers
+        )
+        self.stream_client = create_http_client(
+            "LnTipsWallet", base_url=self.endpoint, headers=headers, stream=True
+        )
 
     async def cleanup(self):
         try:
             await self.client.aclose()
+            await self.stream_client.aclose()
         except RuntimeError as e:
             logger.warning(f"Error closing wallet connection: {e}")
 
     async def status(self) -> StatusResponse:
-        r = await self.client.get("/api/v1/balance", timeout=40)
+        r = await self.client.get("/api/v1/balance")
         try:
             data = r.json()
         except Exception:
@@ -81,7 +88,7 @@ class LnTipsWallet(Wallet):
         r = await self.client.post(
             "/api/v1/createinvoice",
             json=data,
-            timeout=40,
+            timeout=settings.funding_source_invoice_timeout,
         )
 
         if r.is_error:
@@ -102,7 +109,7 @@ class LnTipsWallet(Wallet):
         r = await self.client.post(
             "/api/v1/payinvoice",
             json={"pay_req": bolt11},
-            timeout=None,
+            timeout=settings.funding_source_pay_timeout,
         )
         if r.is_error:
             return PaymentResponse(False, None, 0, None, r.text)
@@ -156,7 +163,7 @@ class LnTipsWallet(Wallet):
             url = "/api/v1/invoicestream"
             try:
                 last_connected = time.time()
-                async with self.client.stream("GET", url, timeout=None) as r:
+                async with self.stream_client.stream("GET", url) as r:
                     async for line in r.aiter_lines():
                         try:
                             prefix = "data: "
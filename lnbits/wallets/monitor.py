@@ -0,0 +1,295 @@
+"""
+Health of the funding source: latency histograms and error counts of every
+method, and a circuit breaker that stops calling a backend that keeps failing.
+The backends of a routing funding source have their own stats and circuit.
+
+After `failure_threshold` consecutive failures the circuit opens and the calls
+fail fast without reaching the backend. After `reset_timeout` seconds one call
+is let through as a probe (half open), it closes the circuit again if it
+succeeds.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from functools import wraps
+from typing import Any, Callable, Optional, cast
+
+from loguru import logger
+
+from lnbits.settings import settings
+from lnbits.utils.metrics import LatencyHistogram
+
+from .base import (
+    InvoiceResponse,
+    PaymentPendingStatus,
+    PaymentResponse,
+    StatusResponse,
+    Wallet,
+)
+
+
+class MethodStats:
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.errors = 0
+        self.rejected = 0
+
+    def dict(self) -> dict:
+        return {
+            "calls": self.latency.count,
+            "errors": self.errors,
+            "rejected": self.rejected,
+            "latency": self.latency.dict(),
+        }
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+
+    def allow(self) -> bool:
+        """Whether a call may go to the backend, the first call after the
+        timeout of an open circuit is the probe."""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            assert self.opened_at is not None
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return True
+        return False
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            logger.info("funding source recovered, closing the circuit")
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning(
+                    f"funding source failed {self.failures} times in a row, "
+                    f"opening the circuit for {self.reset_timeout} seconds"
+                )
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def release(self):
+        """The probe ended without a result (cancelled), let the next call probe."""
+        if self.state == self.HALF_OPEN:
+            self.state = self.OPEN
+
+    def dict(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "failure_threshold": self.failure_threshold,
+            "reset_timeout": self.reset_timeout,
+        }
+
+
+def _answered(method: str, result: Any) -> Optional[bool]:
+    """
+    Whether the response means the backend answered (True) or could not be reached
+    or did not answer (False). None if the response does not tell.
+    """
+    if method == "status":
+        return result.error_message is None
+    if method == "create_invoice":
+        # also returned for rejected requests (e.g. a bad amount), see `_wrap`
+        return None if result.ok is False else True
+    if method == "pay_invoice":
+        # unknown outcome with an error, a failed payment is not a backend failure
+        return not (result.ok is None and result.error_message is not None)
+    # the status checks return errors as pending
+    return None if result.paid is None else True
+
+
+class FundingSourceMonitor:
+    methods = (
+        "status",
+        "create_invoice",
+        "pay_invoice",
+        "get_invoice_status",
+        "get_payment_status",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: Optional[int] = None,
+        reset_timeout: Optional[float] = None,
+    ):
+        self.name = name
+        self.stats: dict[str, MethodStats] = {m: MethodStats() for m in self.methods}
+        self.circuit = CircuitBreaker(
+            failure_threshold or settings.funding_source_failure_threshold,
+            reset_timeout or settings.funding_source_reset_timeout,
+        )
+        # monitors of the backends of a routing funding source, by backend name
+        self.backends: dict[str, FundingSourceMonitor] = {}
+
+    def instrument(self, wallet: Wallet) -> Wallet:
+        """Wrap the methods of the funding source instance in place, so the class,
+        attributes and node of the wallet stay the same."""
+        self._status = wallet.status
+        for method in self.methods:
+            setattr(wallet, method, self._wrap(method, getattr(wallet, method)))
+
+        # the status checks of a routing funding source go to one of its backends
+        get_backend = wallet.get_backend
+        backends: dict[str, _MonitoredBackend] = {}
+
+        def monitored_backend(name: Optional[str]) -> Wallet:
+            backend = get_backend(name)
+            if backend is wallet or not name:
+                return backend
+            if name not in backends:
+                monitor = FundingSourceMonitor(
+                    name, self.circuit.failure_threshold, self.circuit.reset_timeout
+                )
+                self.backends[name] = monitor
+                backends[name] = _MonitoredBackend(monitor, backend)
+            return cast(Wallet, backends[name])
+
+        wallet.get_backend = monitored_backend  # type: ignore
+        return wallet
+
+    async def _status_answered(self) -> bool:
+        """Ask the backend for its status, bypassing the circuit and the stats."""
+        try:
+            status = await self._status()
+        except Exception:
+            return False
+        return status.error_message is None
+
+    def _wrap(self, method: str, func: Callable) -> Callable:
+        stats = self.stats[method]
+
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            if not self.circuit.allow():
+                stats.rejected += 1
+                return self._unavailable(method)
+            start = time.perf_counter()
+            try:
+                result = await func(*args, **kwargs)
+            except Exception:
+                stats.errors += 1
+                self.circuit.record_failure()
+                raise
+            except asyncio.CancelledError:
+                self.circuit.release()
+                raise
+            finally:
+                stats.latency.observe(time.perf_counter() - start)
+            answered = _answered(method, result)
+            if answered is None and method == "create_invoice":
+                # the invoice was rejected, by a backend that is down or because of
+                # the request itself, only the former is a failure of the backend
+                answered = await self._status_answered()
+            if answered is None:
+                # e.g. a pending status, which is also returned for errors
+                self.circuit.release()
+            elif answered:
+                self.circuit.record_success()
+            else:
+                stats.errors += 1
+                self.circuit.record_failure()
+            return result
+
+        return wrapper
+
+    def _unavailable(self, method: str) -> Any:
+        message = f"Funding source {self.name} is unavailable, try again later."
+        if method == "status":
+            return StatusResponse(message, 0)
+        if method == "create_invoice":
+            return InvoiceResponse(False, None, None, message)
+        if method == "pay_invoice":
+            # nothing was sent, so the payment can be failed right away
+            return PaymentResponse(False, None, None, None, message)
+        return PaymentPendingStatus()
+
+    def dict(self) -> dict:
+        return {
+            "funding_source": self.name,
+            "circuit": self.circuit.dict(),
+            "methods": {name: stats.dict() for name, stats in self.stats.items()},
+            "backends": {
+                name: monitor.dict() for name, monitor in self.backends.items()
+            },
+        }
+
+    def prometheus(self) -> str:
+        """Prometheus text exposition format."""
+        source = f'funding_source="{self.name}"'
+        prefix = "lnbits_funding_source"
+        lines = [
+            f"# HELP {prefix}_call_duration_seconds Latency of the funding source.",
+            f"# TYPE {prefix}_call_duration_seconds histogram",
+        ]
+        for method, stats in self.stats.items():
+            labels = f'{source},method="{method}"'
+            latency = stats.latency
+            for bucket, count in zip(latency.buckets, latency.cumulative()):
+                lines.append(
+                    f'{prefix}_call_duration_seconds_bucket{{{labels},le="{bucket}"}}'
+                    f" {count}"
+                )
+            lines += [
+                f'{prefix}_call_duration_seconds_bucket{{{labels},le="+Inf"}}'
+                f" {latency.count}",
+                f"{prefix}_call_duration_seconds_sum{{{labels}}} {latency.sum}",
+                f"{prefix}_call_duration_seconds_count{{{labels}}} {latency.count}",
+            ]
+        for name, help_text, attr in (
+            ("errors", "Failed calls to the funding source.", "errors"),
+            ("rejected", "Calls rejected by the open circuit.", "rejected"),
+        ):
+            lines += [
+                f"# HELP {prefix}_{name}_total {help_text}",
+                f"# TYPE {prefix}_{name}_total counter",
+            ]
+            for method, stats in self.stats.items():
+                lines.append(
+                    f'{prefix}_{name}_total{{{source},method="{method}"}}'
+                    f" {getattr(stats, attr)}"
+                )
+        lines += [
+            f"# HELP {prefix}_circuit_open Whether the circuit breaker is open.",
+            f"# TYPE {prefix}_circuit_open gauge",
+            f"{prefix}_circuit_open{{{source}}}"
+            f" {int(self.circuit.state != CircuitBreaker.CLOSED)}",
+        ]
+        return "\n".join(lines) + "\n"
+
+
+class _MonitoredBackend:
+    """
+    Backend of a routing funding source (`get_backend`) whose calls go through its
+    own monitor. Unlike `instrument` the backend itself stays unchanged, the router
+    calls it as well.
+    """
+
+    def __init__(self, monitor: FundingSourceMonitor, wallet: Wallet):
+        self.wallet = wallet
+        monitor._status = wallet.status
+        for method in monitor.methods:
+            setattr(self, method, monitor._wrap(method, getattr(wallet, method)))
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.wallet, name)
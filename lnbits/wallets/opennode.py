@@ -4,7 +4,7 @@ from typing import AsyncGenerator, Optional
 import httpx
 from loguru import logger
 
-from lnbits.settings import settings
+from lnbits.settings import Settings, settings
 
 from .base import (
     InvoiceResponse,
@@ -14,21 +14,23 @@ from .base import (
     StatusResponse,
     UnsupportedError,
     Wallet,
+    create_http_client,
 )
 
 
 class OpenNodeWallet(Wallet):
     """https://developers.opennode.com/"""
 
-    def __init__(self):
-        if not settings.opennode_api_endpoint:
+    def __init__(self, config: Optional[Settings] = None):
+        super().__init__(config)
+        if not self.config.opennode_api_endpoint:
             raise ValueError(
                 "cannot initialize OpenNodeWallet: missing opennode_api_endpoint"
             )
         key = (
-            settings.opennode_key
-            or settings.opennode_admin_key
-            or settings.opennode_invoice_key
+            self.config.opennode_key
+            or self.config.opennode_admin_key
+            or self.config.opennode_invoice_key
         )
         if not key:
             raise ValueError(
@@ -37,13 +39,15 @@ class OpenNodeWallet(Wallet):
             )
         self.key = key
 
-        self.endpoint = self.normalize_endpoint(settings.opennode_api_endpoint)
+        self.endpoint = self.normalize_endpoint(self.config.opennode_api_endpoint)
 
         headers = {
             "Authorization": self.key,
-            "User-Agent": settings.user_agent,
+            "User-Agent": self.config.user_agent,
         }
-        self.client = httpx.AsyncClient(base_url=self.endpoint, headers=headers)
+        self.client = create_http_client(
+            "OpenNodeWallet", base_url=self.endpoint, headers=headers
+        )
 
     async def cleanup(self):
         try:
@@ -53,7 +57,7 @@ class OpenNodeWallet(Wallet):
 
     async def status(self) -> StatusResponse:
         try:
-            r = await self.client.get("/v1/account/balance", timeout=40)
+            r = await self.client.get("/v1/account/balance")
         except (httpx.ConnectError, httpx.RequestError):
             return StatusResponse(f"Unable to connect to '{self.endpoint}'", 0)
 
@@ -82,7 +86,7 @@ class OpenNodeWallet(Wallet):
                 "amount": amount,
                 "description": memo or "",
             },
-            timeout=40,
+            timeout=settings.funding_source_invoice_timeout,
         )
 
         if r.is_error:
@@ -98,7 +102,7 @@ class OpenNodeWallet(Wallet):
         r = await self.client.post(
             "/v2/withdrawals",
             json={"type": "ln", "address": bolt11},
-            timeout=None,
+            timeout=settings.funding_source_pay_timeout,
         )
 
         if r.is_error:
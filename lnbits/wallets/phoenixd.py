@@ -4,11 +4,10 @@ import json
 import urllib.parse
 from typing import AsyncGenerator, Dict, Optional
 
-import httpx
 from loguru import logger
 from websockets.client import connect
 
-from lnbits.settings import settings
+from lnbits.settings import Settings, settings
 
 from .base import (
     InvoiceResponse,
@@ -19,34 +18,38 @@ from .base import (
     StatusResponse,
     UnsupportedError,
     Wallet,
+    create_http_client,
 )
 
 
 class PhoenixdWallet(Wallet):
     """https://phoenix.acinq.co/server/api"""
 
-    def __init__(self):
-        if not settings.phoenixd_api_endpoint:
+    def __init__(self, config: Optional[Settings] = None):
+        super().__init__(config)
+        if not self.config.phoenixd_api_endpoint:
             raise ValueError(
                 "cannot initialize PhoenixdWallet: missing phoenixd_api_endpoint"
             )
-        if not settings.phoenixd_api_password:
+        if not self.config.phoenixd_api_password:
             raise ValueError(
                 "cannot initialize PhoenixdWallet: missing phoenixd_api_password"
             )
 
-        self.endpoint = self.normalize_endpoint(settings.phoenixd_api_endpoint)
+        self.endpoint = self.normalize_endpoint(self.config.phoenixd_api_endpoint)
 
         self.ws_url = f"ws://{urllib.parse.urlsplit(self.endpoint).netloc}/websocket"
-        password = settings.phoenixd_api_password
+        password = self.config.phoenixd_api_password
         encoded_auth = base64.b64encode(f":{password}".encode())
         auth = str(encoded_auth, "utf-8")
         self.headers = {
             "Authorization": f"Basic {auth}",
-            "User-Agent": settings.user_agent,
+            "User-Agent": self.config.user_agent,
         }
 
-        self.client = httpx.AsyncClient(base_url=self.endpoint, headers=self.headers)
+        self.client = create_http_client(
+            "PhoenixdWallet", base_url=self.endpoint, headers=self.headers
+        )
 
     async def cleanup(self):
         try:
@@ -56,7 +59,7 @@ class PhoenixdWallet(Wallet):
 
     async def status(self) -> StatusResponse:
         try:
-            r = await self.client.get("/getinfo", timeout=10)
+            r = await self.client.get("/getinfo")
             r.raise_for_status()
             data = r.json()
 
@@ -101,7 +104,7 @@ class PhoenixdWallet(Wallet):
             r = await self.client.post(
                 "/createinvoice",
                 data=data,
-                timeout=40,
+                timeout=settings.funding_source_invoice_timeout,
             )
             r.raise_for_status()
             data = r.json()
@@ -137,7 +140,7 @@ class PhoenixdWallet(Wallet):
                 data={
                     "invoice": bolt11,
                 },
-                timeout=40,
+                timeout=settings.funding_source_pay_timeout,
             )
 
             r.raise_for_status()
@@ -0,0 +1,258 @@
+import asyncio
+import random
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import AsyncGenerator, Dict, List, Optional
+
+from bolt11 import decode as bolt11_decode
+from loguru import logger
+
+from lnbits.settings import RouterWalletBackend, settings
+
+from .base import (
+    InvoiceResponse,
+    PaymentFailedStatus,
+    PaymentPendingStatus,
+    PaymentResponse,
+    PaymentStatus,
+    StatusResponse,
+    Wallet,
+)
+
+# seconds until the balances are fetched again before routing a payment
+BALANCE_MAX_AGE = 10
+
+
+@dataclass
+class RouterBackend:
+    name: str
+    wallet: Wallet
+    weight: float = 1
+    balance_msat: Optional[int] = None
+    error_message: Optional[str] = None
+
+
+class RouterWallet(Wallet):
+    """
+    Spreads the invoices and payments over several backends. Invoices are created
+    by weight, or on the backend with the least outbound balance (`liquidity`),
+    payments go to the backend with the most outbound balance and fail over to
+    the next one when a payment fails. The paid invoices of all backends are
+    merged into one stream.
+    """
+
+    def __init__(self, backends: Optional[List[RouterBackend]] = None):
+        if backends is None:
+            backends = [
+                _create_backend(config) for config in settings.router_wallet_backends
+            ]
+        if not backends:
+            raise ValueError("cannot initialize RouterWallet: no backends configured")
+        names = [backend.name for backend in backends]
+        if len(set(names)) != len(names):
+            raise ValueError("cannot initialize RouterWallet: duplicate backend names")
+        self.backends: Dict[str, RouterBackend] = {b.name: b for b in backends}
+        self.strategy = settings.router_wallet_strategy
+        self.balances_checked = 0.0
+        self.owners: OrderedDict[str, str] = OrderedDict()
+
+    async def cleanup(self):
+        for backend in self.backends.values():
+            try:
+                await backend.wallet.cleanup()
+            except Exception as exc:
+                logger.warning(f"cleanup of backend {backend.name} failed: {exc}")
+
+    async def status(self) -> StatusResponse:
+        await self._update_balances()
+        connected = [b for b in self.backends.values() if b.error_message is None]
+        errors = [
+            f"{b.name}: {b.error_message}"
+            for b in self.backends.values()
+            if b.error_message is not None
+        ]
+        if not connected:
+            return StatusResponse("; ".join(errors), 0)
+        if errors:
+            logger.warning(f"RouterWallet backends unavailable: {'; '.join(errors)}")
+        return StatusResponse(None, sum(b.balance_msat or 0 for b in connected))
+
+    async def create_invoice(
+        self,
+        amount: int,
+        memo: Optional[str] = None,
+        description_hash: Optional[bytes] = None,
+        unhashed_description: Optional[bytes] = None,
+        **kwargs,
+    ) -> InvoiceResponse:
+        error_message = "no backend available"
+        for backend in await self._invoice_backends():
+            try:
+                response = await backend.wallet.create_invoice(
+                    amount,
+                    memo=memo,
+                    description_hash=description_hash,
+                    unhashed_description=unhashed_description,
+                    **kwargs,
+                )
+            except Exception as exc:
+                logger.warning(f"create_invoice on backend {backend.name}: {exc}")
+                error_message = str(exc)
+                continue
+            if response.ok and response.checking_id:
+                self._set_owner(response.checking_id, backend.name)
+                return response
+            error_message = response.error_message or error_message
+            logger.warning(f"create_invoice on backend {backend.name}: {error_message}")
+        return InvoiceResponse(False, None, None, error_message)
+
+    async def pay_invoice(self, bolt11: str, fee_limit_msat: int) -> PaymentResponse:
+        invoice = bolt11_decode(bolt11)
+        amount_msat = (invoice.amount_msat or 0) + fee_limit_msat
+        response = PaymentResponse(False, None, None, None, "no backend available")
+        for backend in await self._payment_backends(amount_msat):
+            try:
+                response = await backend.wallet.pay_invoice(bolt11, fee_limit_msat)
+            except Exception as exc:
+                # the payment may have been sent, do not try another backend
+                logger.warning(f"pay_invoice on backend {backend.name}: {exc}")
+                self._set_owner(invoice.payment_hash, backend.name)
+                return PaymentResponse(None, None, None, None, str(exc))
+            if response.ok is not False:
+                checking_id = response.checking_id or invoice.payment_hash
+                self._set_owner(checking_id, backend.name)
+                if backend.balance_msat is not None:
+                    backend.balance_msat -= amount_msat
+                return response
+            logger.info(
+                f"payment failed on backend {backend.name}: {response.error_message}"
+            )
+        return response
+
+    async def get_invoice_status(self, checking_id: str) -> PaymentStatus:
+        owner = self.owners.get(checking_id)
+        if owner in self.backends:
+            return await self.backends[owner].wallet.get_invoice_status(checking_id)
+        statuses = await asyncio.gather(
+            *[b.wallet.get_invoice_status(checking_id) for b in self.backends.values()]
+        )
+        return _merge_statuses(statuses)
+
+    async def get_payment_status(self, checking_id: str) -> PaymentStatus:
+        owner = self.owners.get(checking_id)
+        if owner in self.backends:
+            return await self.backends[owner].wallet.get_payment_status(checking_id)
+        statuses = await asyncio.gather(
+            *[b.wallet.get_payment_status(checking_id) for b in self.backends.values()]
+        )
+        return _merge_statuses(statuses)
+
+    async def paid_invoices_stream(self) -> AsyncGenerator[str, None]:
+        queue: asyncio.Queue = asyncio.Queue()
+        tasks = [
+            asyncio.create_task(self._forward_stream(backend, queue))
+            for backend in self.backends.values()
+        ]
+        try:
+            while settings.lnbits_running:
+                yield await queue.get()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def backend_of(self, checking_id: str) -> Optional[str]:
+        return self.owners.get(checking_id)
+
+    def get_backend(self, name: Optional[str]) -> Wallet:
+        backend = self.backends.get(name) if name else None
+        return backend.wallet if backend else self
+
+    async def _forward_stream(self, backend: RouterBackend, queue: asyncio.Queue):
+        while settings.lnbits_running:
+            try:
+                async for checking_id in backend.wallet.paid_invoices_stream():
+                    self._set_owner(checking_id, backend.name)
+                    await queue.put(checking_id)
+            except Exception as exc:
+                logger.error(f"invoice stream of backend {backend.name}: {exc}")
+            await asyncio.sleep(5)
+
+    async def _update_balances(self):
+        async def _status(backend: RouterBackend):
+            try:
+                backend.error_message, balance_msat = await backend.wallet.status()
+            except Exception as exc:
+                backend.error_message, balance_msat = str(exc), 0
+            backend.balance_msat = None if backend.error_message else balance_msat
+
+        await asyncio.gather(*[_status(b) for b in self.backends.values()])
+        self.balances_checked = time.monotonic()
+
+    async def _fresh_balances(self):
+        if time.monotonic() - self.balances_checked > BALANCE_MAX_AGE:
+            await self._update_balances()
+
+    async def _invoice_backends(self) -> List[RouterBackend]:
+        """Order in which the backends are asked to create an invoice."""
+        backends = list(self.backends.values())
+        if self.strategy == "liquidity":
+            await self._fresh_balances()
+            # the least outbound balance leaves the most capacity to receive
+            return sorted(
+                backends,
+                key=lambda b: (b.error_message is not None, b.balance_msat or 0),
+            )
+        weighted = [b for b in backends if b.weight > 0]
+        if not weighted:
+            return backends
+        first = random.choices(weighted, weights=[b.weight for b in weighted])[0]
+        others = sorted(
+            (b for b in weighted if b is not first), key=lambda b: -b.weight
+        )
+        return [first, *others]
+
+    async def _payment_backends(self, amount_msat: int) -> List[RouterBackend]:
+        """Backends with enough outbound balance first, the largest balance first."""
+        await self._fresh_balances()
+        return sorted(
+            self.backends.values(),
+            key=lambda b: (
+                b.balance_msat is None,
+                (b.balance_msat or 0) < amount_msat,
+                -(b.balance_msat or 0),
+            ),
+        )
+
+    def _set_owner(self, checking_id: str, name: str):
+        self.owners[checking_id] = name
+        self.owners.move_to_end(checking_id)
+        if len(self.owners) > 10_000:
+            self.owners.popitem(last=False)
+
+
+def _merge_statuses(statuses: List[PaymentStatus]) -> PaymentStatus:
+    """Status of a payment without a known owner, the backends that do not know
+    the payment report it as failed."""
+    for status in statuses:
+        if status.success:
+            return status
+    if any(status.pending for status in statuses):
+        return PaymentPendingStatus()
+    return PaymentFailedStatus()
+
+
+def _create_backend(config: RouterWalletBackend) -> RouterBackend:
+    """Create the backend wallet with its own funding source settings."""
+    from lnbits import wallets
+
+    if config.wallet_class == "RouterWallet":
+        raise ValueError("cannot initialize RouterWallet: nested RouterWallet")
+    unknown = set(config.settings) - set(settings.__fields__)
+    if unknown:
+        raise ValueError(
+            f"cannot initialize RouterWallet: unknown settings {', '.join(unknown)}"
+        )
+    constructor = getattr(wallets, config.wallet_class)
+    wallet = constructor(settings.copy(update=config.settings))
+    return RouterBackend(config.name, wallet, config.weight)
@@ -7,7 +7,7 @@ from typing import AsyncGenerator, Optional
 import httpx
 from loguru import logger
 
-from lnbits.settings import settings
+from lnbits.settings import Settings, settings
 
 from .base import (
     InvoiceResponse,
@@ -18,6 +18,7 @@ from .base import (
     PaymentSuccessStatus,
     StatusResponse,
     Wallet,
+    create_http_client,
 )
 
 
@@ -30,22 +31,27 @@ class UnknownError(Exception):
 
 
 class SparkWallet(Wallet):
-    def __init__(self):
-        if not settings.spark_url:
+    def __init__(self, config: Optional[Settings] = None):
+        super().__init__(config)
+        if not self.config.spark_url:
             raise ValueError("cannot initialize SparkWallet: missing spark_url")
-        if not settings.spark_token:
+        if not self.config.spark_token:
             raise ValueError("cannot initialize SparkWallet: missing spark_token")
 
-        url = self.normalize_endpoint(settings.spark_url)
+        url = self.normalize_endpoint(self.config.spark_url)
         url = url.replace("/rpc", "")
-        self.token = settings.spark_token
+        self.token = self.config.spark_token
 
-        headers = {"X-Access": self.token, "User-Agent": settings.user_agent}
-        self.client = httpx.AsyncClient(base_url=url, headers=headers)
+        headers = {"X-Access": self.token, "User-Agent": self.config.user_agent}
+        self.client = create_http_client("SparkWallet", base_url=url, headers=headers)
+        self.stream_client = create_http_client(
+            "SparkWallet", base_url=url, headers=headers, stream=True
+        )
 
     async def cleanup(self):
         try:
             await self.client.aclose()
+            await self.stream_client.aclose()
         except RuntimeError as e:
             logger.warning(f"Error closing wallet connection: {e}")
 
@@ -246,7 +252,7 @@ class SparkWallet(Wallet):
 
         while settings.lnbits_running:
             try:
-                async with self.client.stream("GET", url, timeout=None) as r:
+                async with self.stream_client.stream("GET", url) as r:
                     async for line in r.aiter_lines():
                         if line.startswith("data:"):
                             data = json.loads(line[5:])
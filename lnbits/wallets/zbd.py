@@ -5,7 +5,7 @@ import httpx
 from loguru import logger
 
 from lnbits import bolt11
-from lnbits.settings import settings
+from lnbits.settings import Settings, settings
 
 from .base import (
     InvoiceResponse,
@@ -15,24 +15,28 @@ from .base import (
     StatusResponse,
     UnsupportedError,
     Wallet,
+    create_http_client,
 )
 
 
 class ZBDWallet(Wallet):
     """https://zbd.dev/api-reference/"""
 
-    def __init__(self):
-        if not settings.zbd_api_endpoint:
+    def __init__(self, config: Optional[Settings] = None):
+        super().__init__(config)
+        if not self.config.zbd_api_endpoint:
             raise ValueError("cannot initialize ZBDWallet: missing zbd_api_endpoint")
-        if not settings.zbd_api_key:
+        if not self.config.zbd_api_key:
             raise ValueError("cannot initialize ZBDWallet: missing zbd_api_key")
 
-        self.endpoint = self.normalize_endpoint(settings.zbd_api_endpoint)
+        self.endpoint = self.normalize_endpoint(self.config.zbd_api_endpoint)
         headers = {
-            "apikey": settings.zbd_api_key,
-            "User-Agent": settings.user_agent,
+            "apikey": self.config.zbd_api_key,
+            "User-Agent": self.config.user_agent,
         }
-        self.client = httpx.AsyncClient(base_url=self.endpoint, headers=headers)
+        self.client = create_http_client(
+            "ZBDWallet", base_url=self.endpoint, headers=headers
+        )
 
     async def cleanup(self):
         try:
@@ -42,7 +46,7 @@ class ZBDWallet(Wallet):
 
     async def status(self) -> StatusResponse:
         try:
-            r = await self.client.get("wallet", timeout=10)
+            r = await self.client.get("wallet")
         except (httpx.ConnectError, httpx.RequestError):
             return StatusResponse(f"Unable to connect to '{self.endpoint}'", 0)
 
@@ -79,7 +83,7 @@ class ZBDWallet(Wallet):
         r = await self.client.post(
             "charges",
             json=data,
-            timeout=40,
+            timeout=settings.funding_source_invoice_timeout,
         )
 
         if r.is_error:
@@ -104,7 +108,7 @@ class ZBDWallet(Wallet):
                 "internalId": "",
                 "callbackUrl": "",
             },
-            timeout=40,
+            timeout=settings.funding_source_pay_timeout,
         )
 
         if r.is_error:
@@ -1,6 +1,11 @@
+import json
+
 import pytest
 
-from lnbits.settings import settings
+from lnbits.core.crud import update_admin_settings
+from lnbits.core.db import db
+from lnbits.core.services import settings_sync
+from lnbits.settings import EditableSettings, settings
 
 
 @pytest.mark.asyncio
@@ -31,6 +36,27 @@ async def test_admin_update_settings(client, superuser):
     assert settings.lnbits_site_title == new_site_title
 
 
+@pytest.mark.asyncio
+async def test_admin_update_settings_sync(client, superuser):
+    await settings_sync.check()
+    response = await client.put(
+        f"/admin/api/v1/settings?usr={superuser.id}",
+        json={"lnbits_blocked_ips": ["10.0.0.1"]},
+    )
+    assert response.status_code == 200
+    assert settings.snapshot.blocked_ips == frozenset(["10.0.0.1"])
+    # the own change is not loaded again
+    reloads = settings_sync.reloads
+    assert await settings_sync.check() == []
+    assert settings_sync.reloads == reloads
+
+    # changed by another worker
+    await update_admin_settings(EditableSettings(lnbits_blocked_ips=[]))
+    assert "lnbits_blocked_ips" in await settings_sync.check()
+    assert settings.snapshot.blocked_ips == frozenset()
+    assert settings_sync.reloads == reloads + 1
+
+
 @pytest.mark.asyncio
 async def test_admin_update_noneditable_settings(client, superuser):
     response = await client.put(
@@ -38,3 +64,49 @@ async def test_admin_update_noneditable_settings(client, superuser):
         json={"super_user": "UPDATED"},
     )
     assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_admin_monitor_metrics(client, superuser):
+    response = await client.get(f"/admin/api/v1/monitor?usr={superuser.id}")
+    assert response.status_code == 200
+    assert "circuit" in response.json()["funding_source_health"]
+
+    response = await client.get(f"/admin/api/v1/monitor/metrics?usr={superuser.id}")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "lnbits_funding_source_circuit_open" in response.text
+    # labeled with the route template, the first request is measured already
+    assert (
+        'lnbits_http_request_duration_seconds_count{method="GET",'
+        'route="/admin/api/v1/monitor",status="200"}'
+    ) in response.text
+    assert 'lnbits_db_query_duration_seconds_count{db="database",' in response.text
+    assert 'lnbits_queue_size{queue="internal_invoices"} 0' in response.text
+    assert 'lnbits_open_connections{kind="websocket"} 0' in response.text
+
+
+@pytest.mark.asyncio
+async def test_admin_update_settings_concurrently(client, superuser):
+    async with db.connect() as conn:
+        fetchone = conn.fetchone
+
+        async def fetchone_then_update(query: str, values: tuple = ()):
+            row = await fetchone(query, values)
+            # another worker changes other settings right after they were read
+            conn.fetchone = fetchone  # type: ignore
+            await update_admin_settings(
+                EditableSettings(lnbits_site_tagline="other worker"), conn=conn
+            )
+            return row
+
+        conn.fetchone = fetchone_then_update  # type: ignore
+        version = await update_admin_settings(
+            EditableSettings(lnbits_site_description="this worker"), conn=conn
+        )
+
+    row = await db.fetchone("SELECT editable_settings, version FROM settings")
+    assert row["version"] == version
+    editable_settings = json.loads(row["editable_settings"])
+    assert editable_settings["lnbits_site_tagline"] == "other worker"
+    assert editable_settings["lnbits_site_description"] == "this worker"
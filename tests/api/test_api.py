@@ -1,13 +1,25 @@
+import asyncio
 import hashlib
+import json
 
 import pytest
 
 from lnbits import bolt11
+from lnbits.core import services
+from lnbits.core.crud import (
+    create_account,
+    create_wallet,
+    get_payments,
+    get_standalone_payment,
+    get_wallet,
+)
 from lnbits.core.models import CreateInvoice, Payment
 from lnbits.core.views.payment_api import api_payment
 from lnbits.settings import settings
+from lnbits.wallets import get_funding_source
 
 from ..helpers import (
+    assert_max_queries,
     get_random_invoice_data,
 )
 
@@ -95,6 +107,48 @@ async def test_get_wallet_adminkey(client, adminkey_headers_to):
     assert "id" in result
 
 
+# check GET /api/v1/wallet and /api/v1/payments: ETag changes with the wallet
+@pytest.mark.asyncio
+async def test_get_wallet_and_payments_not_modified(
+    client, inkey_headers_to, inkey_headers_from
+):
+    etags = {}
+    for path in ["/api/v1/wallet", "/api/v1/payments?limit=2"]:
+        response = await client.get(path, headers=inkey_headers_to)
+        assert response.status_code == 200
+        etags[path] = response.headers["etag"]
+        response = await client.get(
+            path, headers={**inkey_headers_to, "If-None-Match": etags[path]}
+        )
+        assert response.status_code == 304
+        assert response.content == b""
+
+    other = await client.get("/api/v1/wallet", headers=inkey_headers_from)
+
+    data = await get_random_invoice_data()
+    response = await client.post(
+        "/api/v1/payments", json=data, headers=inkey_headers_to
+    )
+    assert response.status_code == 201
+    invoice = response.json()
+
+    for path, etag in etags.items():
+        response = await client.get(
+            path, headers={**inkey_headers_to, "If-None-Match": etag}
+        )
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
+    hashes = [payment["payment_hash"] for payment in response.json()]
+    assert invoice["payment_hash"] in hashes
+
+    # the other wallet did not change
+    response = await client.get(
+        "/api/v1/wallet",
+        headers={**inkey_headers_from, "If-None-Match": other.headers["etag"]},
+    )
+    assert response.status_code == 304
+
+
 # check PUT /api/v1/wallet/newwallet: empty request where admin key is needed
 @pytest.mark.asyncio
 async def test_put_empty_request_expected_admin_keys(client):
@@ -126,6 +180,82 @@ async def test_create_invoice(client, inkey_headers_to):
     return invoice
 
 
+@pytest.mark.asyncio
+async def test_create_invoice_and_list_queries(client, inkey_headers_to):
+    data = await get_random_invoice_data()
+    with assert_max_queries(8):
+        response = await client.post(
+            "/api/v1/payments", json=data, headers=inkey_headers_to
+        )
+    assert response.status_code == 201
+    # the persisted wallet version, which the ETag is made of, is read first
+    with assert_max_queries(5) as trace:
+        response = await client.get(
+            "/api/v1/payments", params={"limit": 10}, headers=inkey_headers_to
+        )
+    assert response.status_code == 200
+    assert not trace.repeated()
+
+
+@pytest.mark.asyncio
+async def test_create_invoice_batch(client, inkey_headers_to):
+    invoices = [await get_random_invoice_data() for _ in range(3)]
+    invoices.insert(1, {"out": False, "amount": 0, "memo": "no amount"})
+    invoices.append({"out": False, "amount": 5, "description_hash": "nothex"})
+    response = await client.post(
+        "/api/v1/payments/batch", json=invoices, headers=inkey_headers_to
+    )
+    assert response.status_code == 201
+    results = response.json()
+    assert len(results) == 5
+    assert results[1]["error"] == "Amountless invoices not supported."
+    assert results[4]["error"]
+
+    for data, result in zip(invoices, results):
+        if result["error"]:
+            assert not result["payment_hash"]
+            continue
+        decoded = bolt11.decode(result["payment_request"])
+        assert decoded.amount_msat == data["amount"] * 1000
+        response = await client.get(
+            f"/api/v1/payments/{result['payment_hash']}", headers=inkey_headers_to
+        )
+        assert response.status_code == 200
+        payment = response.json()
+        assert payment["paid"] is False
+        assert payment["details"]["memo"] == data["memo"]
+        assert payment["details"]["checking_id"] == result["checking_id"]
+
+
+@pytest.mark.asyncio
+async def test_create_invoice_batch_records_backend(client, inkey_headers_to, mocker):
+    mocker.patch.object(get_funding_source(), "backend_of", return_value="lnd1")
+    invoices = [
+        {"out": False, "amount": 5, "memo": "external"},
+        {"out": False, "amount": 5, "memo": "internal", "internal": True},
+    ]
+    response = await client.post(
+        "/api/v1/payments/batch", json=invoices, headers=inkey_headers_to
+    )
+    assert response.status_code == 201
+    external, internal = [
+        await get_standalone_payment(result["payment_hash"])
+        for result in response.json()
+    ]
+    assert external and external.funding_source == "lnd1"
+    # internal invoices are held by the fake wallet, not the funding source
+    assert internal and internal.funding_source is None
+
+
+@pytest.mark.asyncio
+async def test_create_invoice_batch_too_large(client, inkey_headers_to):
+    invoices = [{"out": False, "amount": 1}] * (settings.lightning_batch_max_size + 1)
+    response = await client.post(
+        "/api/v1/payments/batch", json=invoices, headers=inkey_headers_to
+    )
+    assert response.status_code == 400
+
+
 @pytest.mark.asyncio
 async def test_create_invoice_fiat_amount(client, inkey_headers_to):
     data = await get_random_invoice_data()
@@ -279,6 +409,139 @@ async def test_pay_invoice_invoicekey(client, invoice, inkey_headers_from):
     assert response.status_code >= 300  # should fail
 
 
+@pytest.mark.asyncio
+async def test_pay_invoice_batch(
+    client, adminkey_headers_from, inkey_headers_to, from_wallet
+):
+    internal_invoices = []
+    for _ in range(2):
+        response = await client.post(
+            "/api/v1/payments",
+            json=await get_random_invoice_data(),
+            headers=inkey_headers_to,
+        )
+        internal_invoices.append(response.json()["payment_request"])
+    # not in the database, so paid through the funding source
+    external = await get_funding_source().create_invoice(amount=21, memo="external")
+    assert external.payment_request
+    bolt11s = [
+        internal_invoices[0],
+        "not an invoice",
+        external.payment_request,
+        internal_invoices[1],
+        internal_invoices[0],
+    ]
+
+    balance_before = (await get_wallet(from_wallet.id)).balance_msat
+    response = await client.post(
+        "/api/v1/payments/batch/pay",
+        json={"bolt11": bolt11s},
+        headers=adminkey_headers_from,
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    results = {
+        result["index"]: result
+        for result in map(json.loads, response.text.splitlines())
+    }
+    assert len(results) == 5
+    assert results[1]["error"] == "Bolt11 decoding failed."
+    assert results[4]["error"] == "Invoice is more than once in the batch."
+    for index in (0, 2, 3):
+        assert results[index]["status"] == "success"
+
+    balance_after = (await get_wallet(from_wallet.id)).balance_msat
+    assert balance_before - balance_after == (10 + 21 + 10) * 1000
+
+    for index in (0, 3):
+        response = await client.get(
+            f"/api/v1/payments/{results[index]['payment_hash']}",
+            headers=inkey_headers_to,
+        )
+        assert response.json()["paid"] is True
+
+
+@pytest.mark.asyncio
+async def test_pay_invoice_batch_insufficient_balance(client, inkey_headers_from):
+    user = await create_account()
+    wallet = await create_wallet(user_id=user.id)
+    invoices = []
+    for _ in range(2):
+        response = await client.post(
+            "/api/v1/payments",
+            json=await get_random_invoice_data(),
+            headers=inkey_headers_from,
+        )
+        invoices.append(response.json()["payment_request"])
+
+    response = await client.post(
+        "/api/v1/payments/batch/pay",
+        json={"bolt11": invoices},
+        headers={"X-Api-Key": wallet.adminkey},
+    )
+    assert response.status_code == 520
+    assert response.json()["detail"] == "Insufficient balance."
+    # all reserved funds are released
+    payments = await get_payments(wallet_id=wallet.id)
+    assert payments == []
+
+
+@pytest.mark.asyncio
+async def test_pay_invoice_batch_concurrent_duplicate(
+    client, adminkey_headers_from, inkey_headers_to, from_wallet, mocker
+):
+    response = await client.post(
+        "/api/v1/payments",
+        json=await get_random_invoice_data(),
+        headers=inkey_headers_to,
+    )
+    payment_request = response.json()["payment_request"]
+    create_payments = services.create_payments
+
+    async def create_payments_twice(data, conn):
+        # the same payments were inserted by a concurrent request
+        await create_payments(data, conn=conn)
+        await create_payments(data, conn=conn)
+
+    mocker.patch.object(services, "create_payments", create_payments_twice)
+    response = await client.post(
+        "/api/v1/payments/batch/pay",
+        json={"bolt11": [payment_request]},
+        headers=adminkey_headers_from,
+    )
+    assert response.status_code == 520
+    assert response.json()["detail"] == "Payment already exists."
+    payment_hash = bolt11.decode(payment_request).payment_hash
+    payments = await get_payments(wallet_id=from_wallet.id, outgoing=True)
+    assert payment_hash not in [payment.payment_hash for payment in payments]
+
+
+@pytest.mark.asyncio
+async def test_pay_invoices_without_reading_results(
+    client, inkey_headers_to, from_wallet
+):
+    response = await client.post(
+        "/api/v1/payments",
+        json=await get_random_invoice_data(),
+        headers=inkey_headers_to,
+    )
+    invoice = response.json()
+
+    # the payments are started even if the results are never read
+    await services.pay_invoices(
+        wallet_id=from_wallet.id, payment_requests=[invoice["payment_request"]]
+    )
+    for _ in range(50):
+        if not services._batch_payment_tasks:
+            break
+        await asyncio.sleep(0.01)
+
+    response = await client.get(
+        f"/api/v1/payments/{invoice['payment_hash']}", headers=inkey_headers_to
+    )
+    assert response.json()["paid"] is True
+
+
 # check POST /api/v1/payments: payment with admin key, trying to pay twice [should fail]
 @pytest.mark.asyncio
 async def test_pay_invoice_adminkey(client, invoice, adminkey_headers_from):
@@ -368,6 +631,31 @@ async def test_get_payments_history(client, adminkey_headers_from, fake_payments
     assert response.status_code == 400
 
 
+@pytest.mark.asyncio
+@pytest.mark.parametrize("group", ["hour", "day", "month"])
+async def test_get_payments_history_buckets(
+    client, adminkey_headers_from, fake_payments, group
+):
+    # unfiltered history is summed from the hourly buckets,
+    # it has to match the history aggregated from the payments
+    response = await client.get(
+        "/api/v1/payments/history",
+        params={"group": group},
+        headers=adminkey_headers_from,
+    )
+    assert response.status_code == 200
+    buckets = response.json()
+    assert len(buckets) > 0
+
+    response = await client.get(
+        "/api/v1/payments/history",
+        params={"group": group, "checking_id[ne]": "none"},
+        headers=adminkey_headers_from,
+    )
+    assert response.status_code == 200
+    assert response.json() == buckets
+
+
 # check POST /api/v1/payments/decode
 @pytest.mark.asyncio
 async def test_decode_invoice(client, invoice):
@@ -1,5 +1,10 @@
+import asyncio
+
 import pytest
 
+from lnbits.core.tasks import payment_waiters
+from lnbits.settings import settings
+
 
 # check if the client is working
 @pytest.mark.asyncio
@@ -24,3 +29,36 @@ async def test_api_public_payment_longpolling_wrong_hash(client, invoice):
     )
     assert response.status_code == 404
     assert response.json()["detail"] == "Payment does not exist."
+
+
+@pytest.mark.asyncio
+async def test_api_public_payment_longpolling_waits_for_payment(
+    client, inkey_headers_to, adminkey_headers_from, mocker
+):
+    response = await client.post(
+        "/api/v1/payments",
+        json={"out": False, "amount": 21, "memo": "long-poll"},
+        headers=inkey_headers_to,
+    )
+    invoice = response.json()
+    url = f"/public/v1/payment/{invoice['payment_hash']}"
+
+    mocker.patch.object(settings, "lnbits_longpoll_timeout", 0.1)
+    response = await client.get(url)
+    assert response.status_code == 408
+
+    mocker.patch.object(settings, "lnbits_longpoll_timeout", 10)
+    polls = [asyncio.create_task(client.get(url)) for _ in range(3)]
+    while payment_waiters.dict()["waiters"] < 3:
+        await asyncio.sleep(0.01)
+    assert payment_waiters.dict()["payment_hashes"] == 1
+
+    response = await client.post(
+        "/api/v1/payments",
+        json={"out": True, "bolt11": invoice["payment_request"]},
+        headers=adminkey_headers_from,
+    )
+    assert response.status_code < 300
+    for response in await asyncio.gather(*polls):
+        assert response.json()["status"] == "paid"
+    assert payment_waiters.dict() == {"payment_hashes": 0, "waiters": 0}
@@ -1,12 +1,14 @@
 import random
 import string
-from typing import Optional
+from contextlib import contextmanager
+from typing import Iterator, Optional
 
 from psycopg2 import connect
 from psycopg2.errors import InvalidCatalogName
 
 from lnbits import core
 from lnbits.db import DB_TYPE, POSTGRES, FromRowModel
+from lnbits.utils.query_trace import QueryTrace, trace_queries
 from lnbits.wallets import get_funding_source, set_funding_source
 
 
@@ -23,6 +25,14 @@ def get_random_string(iterations: int = 10):
     )
 
 
+@contextmanager
+def assert_max_queries(limit: int) -> Iterator[QueryTrace]:
+    """Fails if the code in the context runs more than `limit` database queries."""
+    with trace_queries() as trace:
+        yield trace
+    assert trace.count <= limit, f"expected at most {limit}, {trace.summary()}"
+
+
 async def get_random_invoice_data():
     return {"out": False, "amount": 10, "memo": f"test_memo_{get_random_string(10)}"}
 
@@ -35,7 +45,7 @@ is_regtest: bool = not is_fake
 
 def clean_database(settings):
     if DB_TYPE == POSTGRES:
-        conn = connect(settings.lnbits_database_url)
+        conn = connect(settings.lnbits_database_url.replace("+asyncpg", "", 1))
         conn.autocommit = True
         with conn.cursor() as cur:
             try:
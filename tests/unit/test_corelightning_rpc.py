@@ -0,0 +1,134 @@
+import asyncio
+import json
+from pathlib import Path
+
+import pytest
+import pytest_asyncio
+from pyln.client import RpcError
+
+from lnbits.settings import settings
+from lnbits.wallets.corelightning import CoreLightningWallet
+from lnbits.wallets.corelightning_rpc import AsyncLightningRpc
+
+
+class FakeLightningd:
+    """Answers `echo` and `fail` over a unix socket, like lightningd would."""
+
+    def __init__(self):
+        self.connections = 0
+        self.requests: list = []
+        self.hold: asyncio.Event = asyncio.Event()
+        self.tasks: set = set()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        decoder = json.JSONDecoder()
+        buffer = ""
+        while data := await reader.read(1024):
+            buffer += data.decode()
+            while buffer:
+                try:
+                    request, end = decoder.raw_decode(buffer)
+                except json.JSONDecodeError:
+                    break
+                buffer = buffer[end:].lstrip()
+                self.requests.append(request)
+                task = asyncio.create_task(self.respond(request, writer))
+                self.tasks.add(task)
+                task.add_done_callback(self.tasks.discard)
+
+    async def respond(self, request: dict, writer: asyncio.StreamWriter):
+        params = request["params"]
+        if request["method"] == "fail":
+            response = {"id": request["id"], "error": {"code": -1, "message": "nope"}}
+        elif request["method"] == "disconnect":
+            writer.close()
+            return
+        else:
+            if params.get("wait"):
+                await self.hold.wait()
+            response = {"id": request["id"], "result": params}
+        # a notification without an id must be ignored by the client
+        writer.write(b'{"jsonrpc": "2.0", "method": "log", "params": {}}\n\n')
+        writer.write(json.dumps(response).encode() + b"\n\n")
+
+
+@pytest_asyncio.fixture
+async def lightningd(tmp_path):
+    fake = FakeLightningd()
+    socket_path = str(Path(tmp_path, "rpc"))
+    server = await asyncio.start_unix_server(fake.handle, socket_path)
+    yield fake, socket_path
+    server.close()
+
+
+@pytest.mark.asyncio
+async def test_calls_are_pipelined_by_id(lightningd):
+    fake, socket_path = lightningd
+    rpc = AsyncLightningRpc(socket_path, pool_size=2)
+
+    slow = asyncio.create_task(rpc.echo(wait=True, n=-1))
+    await asyncio.sleep(0.05)
+    results = await asyncio.gather(*[rpc.echo(n=n, skipped=None) for n in range(50)])
+
+    # the fast calls are not held up by the pending one
+    assert [r["n"] for r in results] == list(range(50))
+    assert not slow.done()
+    fake.hold.set()
+    assert (await slow)["n"] == -1
+
+    assert fake.connections == 2
+    assert all("skipped" not in r["params"] for r in fake.requests)
+    await rpc.close()
+
+
+@pytest.mark.asyncio
+async def test_error_response_raises_rpc_error(lightningd):
+    _, socket_path = lightningd
+    rpc = AsyncLightningRpc(socket_path)
+
+    with pytest.raises(RpcError) as exc:
+        await rpc.call("fail", {"a": 1})
+    assert exc.value.method == "fail"
+    assert exc.value.error == {"code": -1, "message": "nope"}
+    await rpc.close()
+
+
+@pytest.mark.asyncio
+async def test_reconnects_after_connection_loss(lightningd):
+    fake, socket_path = lightningd
+    rpc = AsyncLightningRpc(socket_path, pool_size=1)
+
+    with pytest.raises(ConnectionError):
+        await rpc.disconnect()
+    assert await rpc.echo(n=1) == {"n": 1}
+    assert fake.connections == 2
+    await rpc.close()
+
+
+@pytest.mark.asyncio
+async def test_last_pay_index_pages_back_from_the_last_update(mocker):
+    mocker.patch.object(settings, "corelightning_rpc", "lightning-rpc")
+    wallet = CoreLightningWallet()
+    # updated_index 1..250, only the invoice updated 120th is paid
+    invoices = [
+        {"updated_index": i, **({"pay_index": 7} if i == 120 else {})}
+        for i in range(1, 251)
+    ]
+
+    async def listinvoices(index: str, start: int, limit: int) -> dict:
+        assert index == "updated"
+        return {"invoices": invoices[start - 1 : start - 1 + limit]}
+
+    wallet.ln = mocker.Mock()
+    wallet.ln.wait = mocker.AsyncMock(return_value={"updated": 250})
+    wallet.ln.listinvoices = mocker.AsyncMock(side_effect=listinvoices)
+
+    assert await wallet._get_last_pay_index() == 7
+    assert [c.kwargs["start"] for c in wallet.ln.listinvoices.call_args_list] == [
+        151,
+        51,
+    ]
+
+    wallet.ln.wait.return_value = {"subsystem": "invoices"}
+    assert await wallet._get_last_pay_index() == 0
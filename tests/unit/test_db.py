@@ -1,14 +1,42 @@
-from datetime import date
+from datetime import date, timezone
+from time import time
 
 import pytest
 
 from lnbits.core.crud import (
+    create_payment,
+    create_payments,
     create_wallet,
     delete_wallet,
+    delete_wallet_payment,
+    force_delete_wallet,
+    get_accounts,
+    get_payments_history,
+    get_total_balance,
     get_wallet,
     get_wallet_for_key,
+    get_wallet_version_for_key,
+    update_payment_details,
+    update_payment_status,
+    update_wallet,
 )
-from lnbits.db import POSTGRES
+from lnbits.core.db import db
+from lnbits.core.models import AccountFilters, CreatePayment
+from lnbits.db import (
+    ASYNCPG,
+    COCKROACH,
+    POSTGRES,
+    SQLALCHEMY,
+    SQLITE,
+    Connection,
+    Filter,
+    Filters,
+    database_driver,
+    database_type,
+)
+from lnbits.helpers import get_db_vendor_name
+from lnbits.settings import settings
+from lnbits.utils.cache import cache
 
 
 @pytest.mark.asyncio
@@ -18,6 +46,67 @@ async def test_date_conversion(db):
         assert row and isinstance(row[0], date)
 
 
+@pytest.mark.parametrize(
+    "url, db_type, driver, vendor",
+    [
+        (None, SQLITE, SQLALCHEMY, "SQLite"),
+        ("postgres://lnbits@localhost/lnbits", POSTGRES, SQLALCHEMY, "PostgreSQL"),
+        ("postgres+asyncpg://lnbits@localhost/lnbits", POSTGRES, ASYNCPG, "PostgreSQL"),
+        (
+            "postgresql+asyncpg://lnbits@localhost/lnbits",
+            POSTGRES,
+            ASYNCPG,
+            "PostgreSQL",
+        ),
+        ("cockroachdb://lnbits@localhost/lnbits", COCKROACH, SQLALCHEMY, "CockroachDB"),
+    ],
+)
+def test_database_url(mocker, url, db_type, driver, vendor):
+    assert database_type(url) == db_type
+    assert database_driver(url) == driver
+    mocker.patch.object(settings, "lnbits_database_url", url)
+    assert get_db_vendor_name() == vendor
+
+
+def test_rewrite_query_and_values():
+    conn = Connection(None, None, POSTGRES, "test", "test")
+    query = "SELECT * FROM apipayments WHERE memo LIKE '%a' AND hash = ?"
+    assert conn.rewrite_query(query) == (
+        "SELECT * FROM apipayments WHERE memo LIKE '%%a' AND hash = %s"
+    )
+    assert conn.rewrite_query(query) == conn.rewrite_query(query)
+    assert Connection(None, None, SQLITE, "test", "test").rewrite_query(query) == query
+    conn = Connection(None, None, POSTGRES, "test", "test", ASYNCPG)
+    assert conn.rewrite_query("SELECT ? + ?, '%a' FROM x WHERE y = ?") == (
+        "SELECT $1 + $2, '%a' FROM x WHERE y = $3"
+    )
+
+    values = conn.rewrite_values(("f" * 64, "<b>coffee</b> &amp; cake", 1, None))
+    assert values == ("f" * 64, "coffee  cake", 1, None)
+    assert conn.rewrite_values("<i>memo</i>") == ("memo",)
+
+
+@pytest.mark.asyncio
+async def test_asyncpg_values(db):
+    if db.driver != ASYNCPG:
+        pytest.skip("asyncpg only")
+    # values asyncpg refuses are converted to the type of the parameter
+    row = await db.fetchone("SELECT ?::text AS a, ?::int AS b", (5, "7"))
+    assert row["a"] == "5"
+    assert row["b"] == 7
+    row = await db.fetchone("SELECT 1.5::numeric AS a, now()::timestamp AS b")
+    assert isinstance(row["a"], float)
+    assert isinstance(row["b"], float)
+    async with db.connect() as conn:
+        await conn.execute("CREATE TEMP TABLE asyncpg_values (a INT)")
+        result = await conn.execute(
+            "INSERT INTO asyncpg_values (a) VALUES (?), (?)", (1, 2)
+        )
+        assert result.rowcount == 2
+        result = await conn.execute("UPDATE asyncpg_values SET a = a + 1")
+        assert result.rowcount == 2
+
+
 # make test to create wallet and delete wallet
 @pytest.mark.asyncio
 async def test_create_wallet_and_delete_wallet(app, to_user):
@@ -35,3 +124,183 @@ async def test_create_wallet_and_delete_wallet(app, to_user):
 
     del_wallet = await get_wallet_for_key(wallet.inkey)
     assert del_wallet is None
+
+
+@pytest.mark.asyncio
+async def test_wallet_version_follows_writes(app, to_user):
+    wallet = await create_wallet(user_id=to_user.id, wallet_name="test_version")
+    assert await get_wallet_version_for_key(wallet.inkey) == (wallet.id, 0)
+
+    await update_wallet(wallet.id, name="renamed")
+    await create_payment(
+        wallet_id=wallet.id,
+        checking_id=f"version_{wallet.id}",
+        payment_request="",
+        payment_hash=f"version_{wallet.id}",
+        amount=1000,
+        memo="incoming",
+    )
+    _, created = await get_wallet_version_for_key(wallet.adminkey)
+    assert created > 1
+    await update_payment_status(f"version_{wallet.id}", pending=False)
+    _, paid = await get_wallet_version_for_key(wallet.inkey)
+    assert paid > created
+
+    await delete_wallet(user_id=to_user.id, wallet_id=wallet.id)
+    assert await get_wallet_version_for_key(wallet.inkey) is None
+
+
+@pytest.mark.asyncio
+async def test_wallet_stats_follow_payments(app, to_user):
+    wallet = await create_wallet(user_id=to_user.id, wallet_name="test_wallet_stats")
+    await create_payment(
+        wallet_id=wallet.id,
+        checking_id=f"stats_in_{wallet.id}",
+        payment_request="",
+        payment_hash=f"stats_in_{wallet.id}",
+        amount=5000,
+        memo="incoming",
+    )
+    await create_payment(
+        wallet_id=wallet.id,
+        checking_id=f"stats_out_{wallet.id}",
+        payment_request="",
+        payment_hash=f"stats_out_{wallet.id}",
+        amount=-1000,
+        fee=-100,
+        memo="outgoing",
+    )
+
+    async def get_stats():
+        id_filter = Filter.parse_query("id", [to_user.id], AccountFilters)
+        page = await get_accounts(
+            filters=Filters(filters=[id_filter], model=AccountFilters)
+        )
+        assert len(page.data) == 1
+        return page.data[0]
+
+    account = await get_stats()
+    balance_before = account.balance_msat
+    # incoming invoice is still pending
+    assert (await get_wallet(wallet.id)).balance_msat == -1100
+
+    await update_payment_status(f"stats_in_{wallet.id}", pending=False)
+    await update_payment_details(f"stats_out_{wallet.id}", pending=False, fee=-10)
+    account = await get_stats()
+    assert account.balance_msat == balance_before + 5000 + 90
+    assert account.last_payment is not None
+
+    transactions_before = account.transaction_count
+    await delete_wallet_payment(f"stats_out_{wallet.id}", wallet.id)
+    account = await get_stats()
+    assert account.transaction_count == transactions_before - 1
+    assert account.balance_msat == balance_before + 5000 + 1100
+
+    balance = (await get_wallet(wallet.id)).balance_msat
+    row = await db.fetchone(
+        "SELECT balance_msat FROM wallet_stats WHERE wallet = ?", (wallet.id,)
+    )
+    assert row["balance_msat"] == balance == 5000
+
+
+@pytest.mark.asyncio
+async def test_concurrent_payment_update_is_counted_once(app, to_user):
+    wallet = await create_wallet(user_id=to_user.id, wallet_name="test_wallet_race")
+    checking_id = f"race_{wallet.id}"
+    await create_payment(
+        wallet_id=wallet.id,
+        checking_id=checking_id,
+        payment_request="",
+        payment_hash=checking_id,
+        amount=5000,
+        memo="incoming",
+    )
+
+    async with db.connect() as conn:
+        fetchall = conn.fetchall
+
+        async def fetchall_then_settle(query: str, values: tuple = ()):
+            rows = await fetchall(query, values)
+            # another worker settles the payment right after it was read
+            conn.fetchall = fetchall  # type: ignore
+            await update_payment_details(checking_id, pending=False, conn=conn)
+            return rows
+
+        conn.fetchall = fetchall_then_settle  # type: ignore
+        await update_payment_details(checking_id, pending=False, fee=0, conn=conn)
+
+    row = await db.fetchone(
+        "SELECT balance_msat FROM wallet_stats WHERE wallet = ?", (wallet.id,)
+    )
+    assert row[0] == 5000
+
+    await delete_wallet_payment(checking_id, wallet.id)
+    await force_delete_wallet(wallet.id)
+    row = await db.fetchone(
+        "SELECT COUNT(*) FROM wallet_stats WHERE wallet = ?", (wallet.id,)
+    )
+    assert row[0] == 0
+
+
+@pytest.mark.asyncio
+async def test_payments_history_cache_follows_other_workers(app, to_user):
+    wallet = await create_wallet(user_id=to_user.id, wallet_name="test_history")
+    checking_id = f"history_{wallet.id}"
+    await create_payment(
+        wallet_id=wallet.id,
+        checking_id=checking_id,
+        payment_request="",
+        payment_hash=checking_id,
+        amount=5000,
+        memo="incoming",
+    )
+    two_days_ago = int(time()) - 2 * 86400
+    await db.execute(
+        f"UPDATE apipayments SET time = {db.timestamp_placeholder} "
+        "WHERE checking_id = ?",
+        (two_days_ago, checking_id),
+    )
+    assert await get_payments_history(wallet.id, "day") == []
+    stale = cache.get(f"payments_history:{wallet.id}:day")
+    assert stale
+
+    await update_payment_details(checking_id, pending=False)
+    # the cache of a worker that did not settle the payment
+    cache.set(f"payments_history:{wallet.id}:day", stale)
+
+    history = await get_payments_history(wallet.id, "day")
+    assert len(history) == 1
+    assert history[0].income == 5000
+    day = history[0].date.replace(tzinfo=timezone.utc)
+    assert day.timestamp() == two_days_ago - two_days_ago % 86400
+
+
+@pytest.mark.asyncio
+async def test_create_payments_in_chunks(app, to_user):
+    wallet = await create_wallet(user_id=to_user.id, wallet_name="test_bulk")
+    # more parameters than the 999 older sqlite versions allow per statement
+    payments = [
+        CreatePayment(
+            wallet_id=wallet.id,
+            checking_id=f"bulk_{i}_{wallet.id}",
+            payment_request="",
+            payment_hash=f"bulk_{i}_{wallet.id}",
+            amount=-1000,
+            memo="bulk",
+        )
+        for i in range(150)
+    ]
+    await create_payments(payments)
+
+    row = await db.fetchone(
+        "SELECT COUNT(*), SUM(amount) FROM apipayments WHERE wallet = ?",
+        (wallet.id,),
+    )
+    assert tuple(row) == (150, -150_000)
+    assert (await get_wallet(wallet.id)).balance_msat == -150_000
+
+
+@pytest.mark.asyncio
+async def test_total_balance_matches_balances_view(app, from_wallet, to_wallet):
+    row = await db.fetchone("SELECT SUM(balance) FROM balances")
+    assert await get_total_balance() == row[0]
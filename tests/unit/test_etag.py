@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+from fastapi import Request
+
+from lnbits.utils.etag import WalletResponseCache
+
+
+def make_request(etag=None) -> Request:
+    headers = [(b"if-none-match", etag.encode())] if etag else []
+    return Request(
+        {
+            "type": "http",
+            "method": "GET",
+            "scheme": "http",
+            "server": ("localhost", 80),
+            "path": "/api/v1/wallet",
+            "query_string": b"",
+            "headers": headers,
+        }
+    )
+
+
+@pytest.mark.asyncio
+async def test_wallet_response_cache():
+    # the persisted versions, as every worker reads them
+    versions = {"wallet": 0, "other": 0}
+
+    async def get_version(api_key):
+        wallet_id = api_key.split("-")[0]
+        return wallet_id, versions[wallet_id]
+
+    cache = WalletResponseCache(get_version)
+    computed = []
+
+    async def compute():
+        computed.append(1)
+        return "wallet", {"balance": len(computed)}
+
+    response = await cache.respond(make_request(), "wallet-key", compute)
+    etag = response.headers["etag"]
+    assert response.body == b'{"balance":1}'
+
+    response = await cache.respond(make_request(etag), "wallet-key", compute)
+    assert response.status_code == 304
+    response = await cache.respond(make_request(), "wallet-key", compute)
+    assert response.body == b'{"balance":1}'
+    assert len(computed) == 1
+
+    # another wallet was written
+    versions["other"] += 1
+    response = await cache.respond(make_request(etag), "wallet-key", compute)
+    assert response.status_code == 304
+    assert len(computed) == 1
+
+    # written by another worker
+    versions["wallet"] += 1
+    response = await cache.respond(make_request(etag), "wallet-key", compute)
+    assert response.status_code == 200
+    assert response.body == b'{"balance":2}'
+    assert response.headers["etag"] != etag
+
+    async def compute_while_written():
+        versions["wallet"] += 1
+        return await compute()
+
+    # a response that was read while the wallet was written is computed again
+    versions["wallet"] += 1
+    response = await cache.respond(make_request(), "wallet-key", compute_while_written)
+    etag = response.headers["etag"]
+    response = await cache.respond(make_request(etag), "wallet-key", compute)
+    assert response.status_code == 200
+    assert response.body == b'{"balance":4}'
+    assert cache.dict() == {"responses": 1, "hits": 3, "misses": 4, "shared": 0}
+
+    # the content of another wallet is not cached under this api key
+    response = await cache.respond(make_request(), "other-key", compute)
+    assert "etag" not in response.headers
+
+    # concurrent requests share the computation
+    versions["wallet"] += 1
+    responses = await asyncio.gather(
+        *[cache.respond(make_request(), "wallet-key", compute) for _ in range(3)]
+    )
+    assert [r.body for r in responses] == [b'{"balance":6}'] * 3
+    assert cache.dict()["shared"] == 2
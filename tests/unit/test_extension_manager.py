@@ -0,0 +1,76 @@
+import hashlib
+import io
+import zipfile
+from pathlib import Path
+
+import httpx
+import pytest
+
+from lnbits import extension_manager
+from lnbits.extension_manager import _extract_into, download_url
+
+
+def _zip_bytes(files: dict) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zip_file:
+        for name, content in files.items():
+            zip_file.writestr(name, content)
+    return buffer.getvalue()
+
+
+@pytest.mark.asyncio
+async def test_download_url_hashes_while_streaming(mocker, tmp_path):
+    content = b"x" * 300_000
+    transport = httpx.MockTransport(lambda _: httpx.Response(200, content=content))
+    async_client = httpx.AsyncClient
+    mocker.patch.object(
+        extension_manager.httpx,
+        "AsyncClient",
+        lambda **kwargs: async_client(transport=transport, **kwargs),
+    )
+
+    progress = []
+    save_path = Path(tmp_path, "ext.zip")
+    archive_hash = await download_url(
+        "https://example.com/ext.zip",
+        save_path,
+        lambda downloaded, total: progress.append((downloaded, total)),
+    )
+
+    assert archive_hash == hashlib.sha256(content).hexdigest()
+    assert save_path.read_bytes() == content
+    assert not Path(f"{save_path}.part").exists()
+    assert progress[-1] == (len(content), len(content))
+
+
+@pytest.mark.asyncio
+async def test_download_url_removes_partial_file(mocker, tmp_path):
+    async def stream():
+        yield b"x" * 1000
+        raise httpx.ReadError("connection lost")
+
+    transport = httpx.MockTransport(lambda _: httpx.Response(200, content=stream()))
+    async_client = httpx.AsyncClient
+    mocker.patch.object(
+        extension_manager.httpx,
+        "AsyncClient",
+        lambda **kwargs: async_client(transport=transport, **kwargs),
+    )
+
+    save_path = Path(tmp_path, "ext.zip")
+    with pytest.raises(httpx.ReadError):
+        await download_url("https://example.com/ext.zip", save_path)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_extract_into_replaces_target(tmp_path):
+    target = Path(tmp_path, "myext")
+    target.mkdir()
+    Path(target, "stale.py").write_text("old")
+
+    archive = _zip_bytes({"myext-v2/config.json": "{}", "myext-v2/views.py": "new"})
+    with zipfile.ZipFile(io.BytesIO(archive)) as zip_ref:
+        _extract_into(zip_ref, target)
+
+    assert sorted(p.name for p in target.iterdir()) == ["config.json", "views.py"]
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["myext"]
@@ -0,0 +1,63 @@
+from collections import OrderedDict
+
+import pytest
+from bolt11 import Bolt11, MilliSatoshi, TagChar, Tags, decode, encode
+
+from lnbits.settings import settings
+from lnbits.wallets.fake import FakeWallet, fast_encode
+
+
+@pytest.mark.parametrize(
+    "amount, description, description_hash, expiry",
+    [
+        (1, "", None, None),
+        (21, "load test ünicode", None, 3600),
+        (123_456_789, None, "ab" * 32, 60),
+    ],
+)
+def test_fast_encode_matches_bolt11(amount, description, description_hash, expiry):
+    def invoice() -> Bolt11:
+        tags = Tags()
+        if description_hash:
+            tags.add(TagChar.description_hash, description_hash)
+        else:
+            tags.add(TagChar.description, description)
+        if expiry:
+            tags.add(TagChar.expire_time, expiry)
+        tags.add(TagChar.payment_secret, "11" * 32)
+        tags.add(TagChar.payment_hash, "22" * 32)
+        return Bolt11(
+            currency="bc",
+            amount_msat=MilliSatoshi(amount * 1000),
+            date=1700000000,
+            tags=tags,
+        )
+
+    bolt11 = fast_encode(invoice(), FakeWallet.privkey)
+    assert bolt11 == encode(invoice(), FakeWallet.privkey)
+    assert decode(bolt11).payment_hash == "22" * 32
+
+
+@pytest.mark.asyncio
+async def test_load_test_mode(mocker):
+    mocker.patch.object(settings, "fake_wallet_max_invoices", 2)
+    mocker.patch.object(settings, "fake_wallet_fast_signing", True)
+    mocker.patch.object(FakeWallet, "payment_secrets", OrderedDict())
+    mocker.patch.object(FakeWallet, "paid_invoices", OrderedDict())
+    wallet = FakeWallet()
+
+    invoices = [await wallet.create_invoice(1) for _ in range(3)]
+    assert list(wallet.payment_secrets) == [i.checking_id for i in invoices[1:]]
+    assert invoices[0].checking_id
+    assert (await wallet.get_invoice_status(invoices[0].checking_id)).failed
+
+    # an invoice the wallet does not know about, like one of another node
+    external = await wallet.create_invoice(1)
+    assert external.payment_request and external.checking_id
+    wallet.payment_secrets.pop(external.checking_id)
+    assert not (await wallet.pay_invoice(external.payment_request, 0)).ok
+    mocker.patch.object(settings, "fake_wallet_pay_external", True)
+    assert (await wallet.pay_invoice(external.payment_request, 0)).ok
+
+    mocker.patch.object(settings, "fake_wallet_failure_rate", 1)
+    assert (await wallet.create_invoice(1)).failed
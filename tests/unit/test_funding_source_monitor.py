@@ -0,0 +1,169 @@
+import asyncio
+
+import pytest
+
+from lnbits.core import services
+from lnbits.core.crud import get_standalone_payment
+from lnbits.core.services import PaymentError, pay_invoice
+from lnbits.wallets.base import (
+    InvoiceResponse,
+    PaymentPendingStatus,
+    PaymentResponse,
+    PaymentStatus,
+    StatusResponse,
+)
+from lnbits.wallets.fake import FakeWallet
+from lnbits.wallets.monitor import CircuitBreaker, FundingSourceMonitor
+
+
+class FlakyFakeWallet(FakeWallet):
+    def __init__(self):
+        super().__init__()
+        self.down = False
+        self.calls = 0
+
+    async def status(self) -> StatusResponse:
+        self.calls += 1
+        if self.down:
+            raise ConnectionError("backend down")
+        return await super().status()
+
+    async def pay_invoice(self, bolt11: str, fee_limit_msat: int) -> PaymentResponse:
+        self.calls += 1
+        if self.down:
+            return PaymentResponse(None, None, None, None, "connection refused")
+        return await super().pay_invoice(bolt11, fee_limit_msat)
+
+    async def create_invoice(self, amount: int, *args, **kwargs) -> InvoiceResponse:
+        self.calls += 1
+        if self.down:
+            return InvoiceResponse(False, None, None, "connection refused")
+        if amount > 1000:
+            return InvoiceResponse(False, None, None, "amount too large")
+        return await super().create_invoice(amount, *args, **kwargs)
+
+    async def get_payment_status(self, checking_id: str) -> PaymentStatus:
+        self.calls += 1
+        # like the backends, errors are returned as pending
+        return PaymentPendingStatus()
+
+
+@pytest.mark.asyncio
+async def test_circuit_opens_and_recovers_with_probe():
+    wallet = FlakyFakeWallet()
+    monitor = FundingSourceMonitor("FlakyFakeWallet", 3, 0.05)
+    monitor.instrument(wallet)
+    assert (await wallet.status()).error_message is None
+
+    wallet.down = True
+    for _ in range(3):
+        with pytest.raises(ConnectionError):
+            await wallet.status()
+    assert monitor.circuit.state == CircuitBreaker.OPEN
+
+    # fails fast without calling the backend
+    calls = wallet.calls
+    error_message, _ = await wallet.status()
+    assert error_message and "unavailable" in error_message
+    assert (await wallet.get_payment_status("aa")).pending
+    assert wallet.calls == calls
+
+    # a failing probe opens the circuit again
+    await asyncio.sleep(0.1)
+    with pytest.raises(ConnectionError):
+        await wallet.status()
+    assert monitor.circuit.state == CircuitBreaker.OPEN
+
+    await asyncio.sleep(0.1)
+    wallet.down = False
+    assert (await wallet.status()).error_message is None
+    assert monitor.circuit.state == CircuitBreaker.CLOSED
+
+    stats = monitor.dict()["methods"]["status"]
+    assert stats["calls"] == 6
+    assert stats["errors"] == 4
+    assert stats["rejected"] == 1
+    assert stats["latency"]["buckets"]["60"] == 6
+
+
+@pytest.mark.asyncio
+async def test_rejected_invoice_is_not_a_backend_failure():
+    wallet = FlakyFakeWallet()
+    monitor = FundingSourceMonitor("FlakyFakeWallet", 2, 60)
+    monitor.instrument(wallet)
+
+    for _ in range(3):
+        assert (await wallet.create_invoice(5000)).ok is False
+    assert monitor.circuit.state == CircuitBreaker.CLOSED
+    assert monitor.dict()["methods"]["create_invoice"]["errors"] == 0
+
+    wallet.down = True
+    for _ in range(2):
+        assert (await wallet.create_invoice(21)).ok is False
+    assert monitor.circuit.state == CircuitBreaker.OPEN
+    assert monitor.dict()["methods"]["create_invoice"]["errors"] == 2
+
+
+@pytest.mark.asyncio
+async def test_pending_status_check_does_not_close_circuit():
+    wallet = FlakyFakeWallet()
+    monitor = FundingSourceMonitor("FlakyFakeWallet", 1, 0.05)
+    monitor.instrument(wallet)
+    wallet.down = True
+    with pytest.raises(ConnectionError):
+        await wallet.status()
+    assert monitor.circuit.state == CircuitBreaker.OPEN
+
+    # the probe is a status check that does not tell whether the backend is up
+    await asyncio.sleep(0.1)
+    calls = wallet.calls
+    assert (await wallet.get_payment_status("aa")).pending
+    assert wallet.calls == calls + 1
+    assert monitor.circuit.state == CircuitBreaker.OPEN
+
+    # the next call probes again
+    wallet.down = False
+    assert (await wallet.status()).error_message is None
+    assert monitor.circuit.state == CircuitBreaker.CLOSED
+
+
+@pytest.mark.asyncio
+async def test_open_circuit_fails_payment(app, from_wallet, mocker):
+    wallet = FlakyFakeWallet()
+    monitor = FundingSourceMonitor("FlakyFakeWallet", 1, 60)
+    monitor.instrument(wallet)
+    mocker.patch.object(services, "get_funding_source", lambda: wallet)
+    invoice = await FakeWallet().create_invoice(21)
+    assert invoice.payment_request
+
+    wallet.down = True
+    await pay_invoice(wallet_id=from_wallet.id, payment_request=invoice.payment_request)
+    assert monitor.circuit.state == CircuitBreaker.OPEN
+
+    invoice = await FakeWallet().create_invoice(21)
+    assert invoice.payment_request and invoice.checking_id
+    with pytest.raises(PaymentError) as exc:
+        await pay_invoice(
+            wallet_id=from_wallet.id, payment_request=invoice.payment_request
+        )
+    assert exc.value.status == "failed"
+    assert "unavailable" in exc.value.message
+    assert await get_standalone_payment(invoice.checking_id) is None
+
+
+@pytest.mark.asyncio
+async def test_prometheus_exposition():
+    wallet = FakeWallet()
+    monitor = FundingSourceMonitor("FakeWallet", 5, 30)
+    monitor.instrument(wallet)
+    await wallet.status()
+
+    lines = monitor.prometheus().splitlines()
+    labels = 'funding_source="FakeWallet",method="status"'
+    assert "# TYPE lnbits_funding_source_call_duration_seconds histogram" in lines
+    assert (
+        f'lnbits_funding_source_call_duration_seconds_bucket{{{labels},le="+Inf"}} 1'
+        in lines
+    )
+    assert f"lnbits_funding_source_errors_total{{{labels}}} 0" in lines
+    assert 'lnbits_funding_source_circuit_open{funding_source="FakeWallet"} 0' in lines
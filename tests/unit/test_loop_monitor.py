@@ -0,0 +1,31 @@
+import asyncio
+import time
+
+import pytest
+
+from lnbits.utils.loop_monitor import LoopMonitor
+
+
+def blocking_call():
+    time.sleep(0.3)
+
+
+@pytest.mark.asyncio
+async def test_loop_monitor_records_blocking_call_site():
+    monitor = LoopMonitor(threshold=0.05)
+    monitor.start()
+    await asyncio.sleep(0.1)
+    assert monitor.stalls == 0
+
+    blocking_call()
+    await asyncio.sleep(0.1)
+    monitor.stop()
+
+    assert monitor.stalls == 1
+    assert monitor.max_lag >= 0.2
+    data = monitor.dict()
+    site = data["slow_call_sites"][0]
+    assert site["site"].endswith("in blocking_call")
+    assert site["stalls"] == 1
+    assert site["blocked_seconds"] > 0.1
+    assert "in test_loop_monitor_records_blocking_call_site" in site["stack"][-2]
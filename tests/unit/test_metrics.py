@@ -0,0 +1,35 @@
+from lnbits.utils.metrics import Metrics
+
+
+def test_metrics_render():
+    metrics = Metrics()
+    latency = metrics.histogram("test_seconds", "Test latency.", ("route",))
+    latency.observe(0.02, '/a/"{id}"')
+    latency.observe(2, '/a/"{id}"')
+    with latency.time("/b"):
+        pass
+
+    @metrics.gauge("test_size", "Test size.", ("queue",))
+    def collect_a():
+        yield ("a",), 1
+
+    @metrics.gauge("test_size", "Test size.", ("queue",))
+    def collect_b():
+        yield ("b",), 2
+
+    lines = metrics.render().splitlines()
+    assert lines[:2] == [
+        "# HELP test_seconds Test latency.",
+        "# TYPE test_seconds histogram",
+    ]
+    assert 'test_seconds_bucket{route="/a/\\"{id}\\"",le="0.01"} 0' in lines
+    assert 'test_seconds_bucket{route="/a/\\"{id}\\"",le="0.025"} 1' in lines
+    assert 'test_seconds_bucket{route="/a/\\"{id}\\"",le="+Inf"} 2' in lines
+    assert 'test_seconds_sum{route="/a/\\"{id}\\""} 2.02' in lines
+    assert 'test_seconds_count{route="/b"} 1' in lines
+    assert lines[-4:] == [
+        "# HELP test_size Test size.",
+        "# TYPE test_size gauge",
+        'test_size{queue="a"} 1',
+        'test_size{queue="b"} 2',
+    ]
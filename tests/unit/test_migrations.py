@@ -0,0 +1,67 @@
+from types import ModuleType
+from uuid import uuid4
+
+import pytest
+
+from lnbits.core.crud import get_dbversions
+from lnbits.core.db import db
+from lnbits.core.helpers import get_migrations, run_migration
+
+
+def migrations_module(table: str) -> ModuleType:
+    # defined out of order on purpose
+    async def m002_double_values(db):
+        async for rows in db.fetch_batches(
+            f"SELECT id, value FROM {table} WHERE value > 0", key="id", batch_size=2
+        ):
+            await db.update_many(
+                table, "id", ["value"], [(row["id"], row["value"] * 2) for row in rows]
+            )
+
+    async def m001_create_table(db):
+        await db.execute(f"CREATE TABLE {table} (id TEXT PRIMARY KEY, value INT)")
+        for i in range(5):
+            await db.execute(f"INSERT INTO {table} VALUES (?, ?)", (f"id{i}", i))
+
+    module = ModuleType("test_migrations")
+    module.m002_double_values = m002_double_values  # type: ignore
+    module.m001_create_table = m001_create_table  # type: ignore
+    return module
+
+
+def test_get_migrations_sorted():
+    module = migrations_module("test")
+    assert [m.version for m in get_migrations(module)] == [1, 2]
+    assert [m.name for m in get_migrations(module, 1)] == ["double_values"]
+
+    module.m001_duplicate = module.m001_create_table  # type: ignore
+    with pytest.raises(ValueError):
+        get_migrations(module)
+
+
+@pytest.mark.asyncio
+async def test_run_migration(app):
+    table = f"test_{uuid4().hex[:8]}"
+    db_name = f"test_{table}"
+    module = migrations_module(table)
+
+    runs = await run_migration(db, module, db_name, 0)
+    assert [run.migration.version for run in runs] == [1, 2]
+    assert all(run.seconds is not None for run in runs)
+    assert (await get_dbversions())[db_name] == 2
+    rows = await db.fetchall(f"SELECT value FROM {table} ORDER BY id")
+    assert [row["value"] for row in rows] == [0, 2, 4, 6, 8]
+
+    # a dry-run explains the statements without running them
+    runs = await run_migration(db, module, db_name, 1, dry_run=True, explain=True)
+    assert len(runs) == 1
+    statements = runs[0].statements
+    assert len(statements) == 2
+    assert statements[0].query.startswith(f"UPDATE {table} SET value = CASE id")
+    assert statements[0].rows == 5
+    rows = await db.fetchall(f"SELECT value FROM {table} ORDER BY id")
+    assert [row["value"] for row in rows] == [0, 2, 4, 6, 8]
+    assert (await get_dbversions())[db_name] == 2
+
+    await db.execute(f"DROP TABLE {table}")
+    await db.execute("DELETE FROM dbversions WHERE db = ?", (db_name,))
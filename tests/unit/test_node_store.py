@@ -0,0 +1,122 @@
+from types import SimpleNamespace
+
+import pytest
+
+from lnbits.db import Filters
+from lnbits.nodes.base import NodePeerInfo
+from lnbits.nodes.cln import CoreLightningNode
+from lnbits.nodes.store import NodeBatch, NodeRecords
+
+
+@pytest.mark.asyncio
+async def test_node_records_sync():
+    # index -> (status, value) on the node
+    remote = {i: ("done", i) for i in range(1, 8)}
+    remote[3] = ("open", 3)
+    fetched = []
+
+    async def fetch(after: int, limit: int) -> NodeBatch:
+        indexes = sorted(i for i in remote if i > after)[:limit]
+        fetched.extend(indexes)
+        return NodeBatch(
+            [(i, None if remote[i][0] == "failed" else remote[i]) for i in indexes],
+            last_index=indexes[-1] if indexes else after,
+            more=len(indexes) == limit,
+        )
+
+    records = NodeRecords(fetch, lambda record: record[0] == "open", batch_size=3)
+    await records.sync()
+    assert fetched == [1, 2, 3, 4, 5, 6, 7]
+
+    page = await records.page(Filters(offset=2, limit=3))
+    assert page.total == 7
+    assert [value for _, value in page.data] == [5, 4, 3]
+
+    # only new records and the open records are fetched
+    fetched.clear()
+    remote[3] = ("failed", 3)
+    remote[8] = ("done", 8)
+    await records.sync()
+    assert fetched == [3, 8]
+    fetched.clear()
+    await records.sync()
+    assert fetched == []
+
+    page = await records.page(Filters(offset=5, limit=3))
+    assert page.total == 7
+    assert [value for _, value in page.data] == [2, 1]
+
+    # too many open records, fetched again in batches from the oldest one
+    records.max_open_checks = 1
+    for i in (5, 6):
+        remote[i] = ("open", i)
+        records.put(i, remote[i])
+    remote[6] = ("done", 6)
+    fetched.clear()
+    await records.sync()
+    assert fetched == [5, 6, 7, 8]
+    assert records.dict()["open"] == 1
+
+
+@pytest.mark.asyncio
+async def test_cln_node_payments_sync(mocker):
+    def part(index, payment_hash, status, amount):
+        return {
+            "created_index": index,
+            "payment_hash": payment_hash,
+            "groupid": 1,
+            "status": status,
+            "amount_msat": amount,
+            "amount_sent_msat": amount + 1,
+            "created_at": 1700000000 + index,
+            "destination": "peer",
+        }
+
+    sendpays = [
+        part(1, "a", "complete", 1000),
+        part(2, "b", "pending", 500),
+        part(3, "a", "complete", 2000),
+        part(4, "c", "failed", 100),
+    ]
+    calls = []
+
+    async def ln_rpc(method, **kwargs):
+        if "payment_hash" in kwargs:
+            calls.append(kwargs["payment_hash"])
+            parts = [p for p in sendpays if p["payment_hash"] == kwargs["payment_hash"]]
+            return {"payments": parts}
+        calls.append(kwargs["start"])
+        parts = [p for p in sendpays if p["created_index"] >= kwargs["start"]]
+        return {"payments": parts[: kwargs["limit"]]}
+
+    node = CoreLightningNode(SimpleNamespace())
+    node.payments.batch_size = 2
+    mocker.patch.object(node, "ln_rpc", ln_rpc)
+    mocker.patch.object(node, "_get_peer_info", return_value=NodePeerInfo(id="peer"))
+
+    await node.payments.sync()
+    assert calls == [1, 3, 5]
+    page = await node.get_payments(Filters())
+    assert [(p.payment_hash, p.amount, p.pending) for p in page.data] == [
+        ("b", 500, True),
+        ("a", 3000, False),
+    ]
+    assert page.data[1].fee == 2
+    assert page.data[1].destination
+    assert page.data[1].destination.id == "peer"
+
+    # the pending payment completes, the complete one is not combined again
+    calls.clear()
+    sendpays[1]["status"] = "complete"
+    await node.payments.sync()
+    assert calls == ["b", 5]
+    page = await node.get_payments(Filters())
+    assert [(p.payment_hash, p.amount, p.pending) for p in page.data] == [
+        ("b", 500, False),
+        ("a", 3000, False),
+    ]
+
+    # nothing is open anymore
+    calls.clear()
+    await node.payments.sync()
+    assert calls == [5]
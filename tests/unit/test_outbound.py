@@ -0,0 +1,77 @@
+import asyncio
+
+import httpx
+import pytest
+
+from lnbits.settings import settings
+from lnbits.utils.outbound import (
+    OutboundClient,
+    OutboundRequestError,
+    cache_ttl,
+    is_public_address,
+)
+
+
+def test_is_public_address():
+    assert is_public_address("1.1.1.1")
+    assert is_public_address("2606:4700:4700::1111")
+    assert not is_public_address("127.0.0.1")
+    assert not is_public_address("10.0.0.8")
+    assert not is_public_address("169.254.169.254")
+    assert not is_public_address("::1")
+    assert not is_public_address("::ffff:192.168.1.1")
+    assert not is_public_address("fe80::1%eth0")
+
+
+def test_cache_ttl():
+    assert cache_ttl(httpx.Headers(), 60) == 60
+    assert cache_ttl(httpx.Headers({"cache-control": "public, max-age=5"}), 60) == 5
+    assert cache_ttl(httpx.Headers({"cache-control": "max-age=600"}), 60) == 60
+    assert cache_ttl(httpx.Headers({"cache-control": "no-store"}), 60) == 0
+
+
+@pytest.mark.asyncio
+async def test_outbound_client(mocker):
+    mocker.patch.object(settings, "lnbits_outbound_allow_private_hosts", False)
+    mocker.patch.object(settings, "lnbits_outbound_max_response_size", 1000)
+    mocker.patch.object(settings, "lnbits_outbound_cache_ttl", 60)
+    requests = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request.url.path)
+        await asyncio.sleep(0.01)
+        if request.url.path == "/redirect":
+            return httpx.Response(302, headers={"location": "http://127.0.0.1/"})
+        if request.url.path == "/large":
+            return httpx.Response(200, content=b"x" * 1001)
+        if request.url.path == "/nocache":
+            return httpx.Response(200, json={}, headers={"cache-control": "no-store"})
+        return httpx.Response(200, json={"tag": "payRequest"})
+
+    client = OutboundClient()
+    client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    url = "https://1.1.1.1/.well-known/lnurlp/alice"
+
+    responses = await asyncio.gather(*[client.get(url, cache=True) for _ in range(3)])
+    assert [r.json() for r in responses] == [{"tag": "payRequest"}] * 3
+    r = await client.get(url, cache=True)
+    r.raise_for_status()
+    assert r.json() == {"tag": "payRequest"}
+    # params are part of the url
+    await client.get(url, params={"amount": 1000}, cache=True)
+    await client.get("https://1.1.1.1/nocache", cache=True)
+    await client.get("https://1.1.1.1/nocache", cache=True)
+    assert requests == ["/.well-known/lnurlp/alice"] * 2 + ["/nocache"] * 2
+    assert client.dict()["hits"] == 1
+    assert client.dict()["shared"] == 2
+
+    with pytest.raises(OutboundRequestError):
+        await client.get("http://127.0.0.1:5000/.well-known/lnurlp/alice")
+    with pytest.raises(OutboundRequestError):
+        await client.get("https://1.1.1.1/redirect", follow_redirects=True)
+    with pytest.raises(OutboundRequestError):
+        await client.get("https://1.1.1.1/large")
+    with pytest.raises(OutboundRequestError):
+        await client.get("file:///etc/passwd")
+    assert (await client.get("https://1.1.1.1/redirect")).status_code == 302
+    assert client.dict()["hosts"] == 0
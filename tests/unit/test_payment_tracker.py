@@ -0,0 +1,84 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from lnbits.settings import settings
+from lnbits.wallets.base import (
+    PaymentFailedStatus,
+    PaymentPendingStatus,
+    PaymentSuccessStatus,
+    PaymentTracker,
+)
+from lnbits.wallets.lndrest import LndRestWallet
+
+
+@pytest.mark.asyncio
+async def test_payment_tracker_follows_subscription():
+    updates: asyncio.Queue = asyncio.Queue()
+
+    async def subscribe():
+        while True:
+            update = await updates.get()
+            if update is None:
+                raise ConnectionError("subscription closed")
+            yield update
+
+    tracker = PaymentTracker(subscribe, max_size=2)
+    tracker.start()
+    await updates.put(("a", PaymentPendingStatus()))
+    await updates.put(("b", PaymentSuccessStatus(fee_msat=-1000)))
+    await asyncio.sleep(0.01)
+
+    assert tracker.get("a") == PaymentPendingStatus()
+    assert tracker.get("b") == PaymentSuccessStatus(fee_msat=-1000)
+    assert tracker.get("c") is None
+
+    # pending statuses are not trusted while disconnected, final ones are
+    await updates.put(None)
+    await asyncio.sleep(0.01)
+    assert tracker.get("a") is None
+    assert tracker.get("b") == PaymentSuccessStatus(fee_msat=-1000)
+
+    tracker.set("c", PaymentFailedStatus())
+    assert list(tracker.statuses) == ["b", "c"]
+    await tracker.stop()
+
+
+@pytest.mark.asyncio
+async def test_lndrest_payment_status_from_tracker(mocker):
+    mocker.patch.object(settings, "lnd_rest_endpoint", "http://127.0.0.1:8080")
+    mocker.patch.object(settings, "lnd_rest_macaroon", "eNcRyPtEdMaCaRoOn")
+    mocker.patch.object(settings, "lnd_rest_cert", "")
+    wallet = LndRestWallet()
+    track_payment = mocker.spy(wallet, "_track_payment")
+
+    payments = [
+        {"payment_hash": "aa" * 32, "status": "IN_FLIGHT"},
+        {
+            "payment_hash": "bb" * 32,
+            "status": "SUCCEEDED",
+            "fee_msat": "1000",
+            "payment_preimage": "cc" * 32,
+        },
+    ]
+    content = "\n".join(json.dumps({"result": p}) for p in payments)
+
+    def handler(request: httpx.Request):
+        assert request.url.path == "/v2/router/payments"
+        return httpx.Response(200, content=content)
+
+    wallet.stream_client = httpx.AsyncClient(
+        base_url="http://127.0.0.1:8080", transport=httpx.MockTransport(handler)
+    )
+    async for checking_id, status in wallet._subscribe_payments():
+        wallet.payment_tracker.set(checking_id, status)
+    wallet.payment_tracker.connected = True
+
+    assert (await wallet.get_payment_status("aa" * 32)).pending
+    status = await wallet.get_payment_status("bb" * 32)
+    assert status.success
+    assert status.preimage == "cc" * 32
+    track_payment.assert_not_called()
+    await wallet.cleanup()
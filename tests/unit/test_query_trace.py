@@ -0,0 +1,31 @@
+from lnbits.utils.query_trace import current_trace, normalize_sql, trace_queries
+
+
+def test_normalize_sql():
+    assert (
+        normalize_sql("SELECT * FROM apipayments\n WHERE amount > 10 AND memo = 'a''b'")
+        == "SELECT * FROM apipayments WHERE amount > ? AND memo = ?"
+    )
+    assert (
+        normalize_sql("SELECT * FROM wallets WHERE id IN (?, ?,?)")
+        == "SELECT * FROM wallets WHERE id IN (...)"
+    )
+    # numbers in names are kept
+    assert normalize_sql("SELECT * FROM table_v2") == "SELECT * FROM table_v2"
+
+
+def test_trace_queries():
+    assert current_trace.get() is None
+    with trace_queries() as trace:
+        assert current_trace.get() is trace
+        trace.record("SELECT * FROM wallets WHERE id = ?", 0.001, "a")
+        trace.record("SELECT * FROM wallets WHERE id = ?", 0.002, "a")
+        trace.record("SELECT * FROM accounts WHERE id = 1", 0.001, "b")
+    assert current_trace.get() is None
+
+    assert trace.count == 3
+    assert round(trace.seconds, 3) == 0.004
+    assert trace.repeated() == {"SELECT * FROM wallets WHERE id = ?": 2}
+    summary = trace.summary()
+    assert summary.startswith("3 queries in 4.0 ms")
+    assert "likely N+1, 2 times: SELECT * FROM wallets WHERE id = ?" in summary
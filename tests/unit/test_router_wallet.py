@@ -0,0 +1,175 @@
+import asyncio
+
+import pytest
+
+from lnbits.core import services
+from lnbits.core.crud import get_standalone_payment
+from lnbits.core.services import create_invoice, pay_invoice
+from lnbits.settings import RouterWalletBackend, settings
+from lnbits.wallets.base import PaymentResponse, StatusResponse
+from lnbits.wallets.fake import FakeWallet
+from lnbits.wallets.lndrest import LndRestWallet
+from lnbits.wallets.monitor import FundingSourceMonitor
+from lnbits.wallets.router import RouterBackend, RouterWallet
+
+
+class NodeFakeWallet(FakeWallet):
+    """FakeWallet with its own balance and paid invoices queue."""
+
+    def __init__(self, balance_msat: int):
+        self.balance_msat = balance_msat
+        self.queue = asyncio.Queue()
+        self.paid: list = []
+
+    async def status(self) -> StatusResponse:
+        return StatusResponse(None, self.balance_msat)
+
+    async def pay_invoice(self, bolt11: str, fee_limit_msat: int) -> PaymentResponse:
+        self.paid.append(bolt11)
+        return await super().pay_invoice(bolt11, fee_limit_msat)
+
+
+def router(**balances: int) -> RouterWallet:
+    return RouterWallet(
+        [RouterBackend(name, NodeFakeWallet(msat)) for name, msat in balances.items()]
+    )
+
+
+@pytest.mark.asyncio
+async def test_status_sums_backends():
+    wallet = router(lnd1=1000, lnd2=2000)
+    assert await wallet.status() == StatusResponse(None, 3000)
+
+
+@pytest.mark.asyncio
+async def test_backends_created_with_own_settings(mocker):
+    backends = [
+        RouterWalletBackend(
+            name=f"lnd{port}",
+            wallet_class="LndRestWallet",
+            settings={
+                "lnd_rest_endpoint": f"http://127.0.0.1:{port}",
+                "lnd_rest_macaroon": "eNcRyPtEdMaCaRoOn",
+                "lnd_rest_route_hints": port == 8081,
+            },
+        )
+        for port in (8081, 8082)
+    ]
+    mocker.patch.object(settings, "router_wallet_backends", backends)
+    wallet = RouterWallet()
+
+    lnd1, lnd2 = (backend.wallet for backend in wallet.backends.values())
+    assert isinstance(lnd1, LndRestWallet) and isinstance(lnd2, LndRestWallet)
+    assert lnd1.endpoint == "http://127.0.0.1:8081"
+    assert lnd2.endpoint == "http://127.0.0.1:8082"
+    assert lnd1.config.lnd_rest_route_hints is True
+    assert lnd2.config.lnd_rest_route_hints is False
+    # the global settings are left alone
+    assert settings.lnd_rest_endpoint != lnd1.endpoint
+    assert settings.lnd_rest_route_hints is True
+    await wallet.cleanup()
+
+
+@pytest.mark.asyncio
+async def test_backend_status_checks_are_monitored():
+    wallet = router(lnd1=1000)
+    monitor = FundingSourceMonitor("RouterWallet", 5, 30)
+    monitor.instrument(wallet)
+
+    assert wallet.get_backend(None) is wallet
+    backend = wallet.get_backend("lnd1")
+    assert backend is wallet.get_backend("lnd1")
+    assert (await backend.get_payment_status("aa")).pending
+    health = monitor.dict()
+    assert health["methods"]["get_payment_status"]["calls"] == 0
+    assert health["backends"]["lnd1"]["methods"]["get_payment_status"]["calls"] == 1
+
+
+@pytest.mark.asyncio
+async def test_backends_have_their_own_circuit(mocker):
+    wallet = router(lnd1=1000, lnd2=2000)
+    failing = wallet.backends["lnd1"].wallet
+    mocker.patch.object(
+        failing, "get_payment_status", side_effect=ConnectionError("lnd1 is down")
+    )
+    monitor = FundingSourceMonitor("RouterWallet", 2, 30)
+    monitor.instrument(wallet)
+
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            await wallet.get_backend("lnd1").get_payment_status("aa")
+    # rejected without calling the backend
+    assert (await wallet.get_backend("lnd1").get_payment_status("aa")).pending
+    assert (await wallet.get_backend("lnd2").get_payment_status("aa")).pending
+
+    health = monitor.dict()
+    assert health["circuit"]["state"] == "closed"
+    assert health["backends"]["lnd1"]["circuit"]["state"] == "open"
+    stats = health["backends"]["lnd1"]["methods"]["get_payment_status"]
+    assert (stats["errors"], stats["rejected"]) == (2, 1)
+    assert health["backends"]["lnd2"]["circuit"]["state"] == "closed"
+
+
+@pytest.mark.asyncio
+async def test_invoices_by_weight_and_liquidity():
+    wallet = RouterWallet(
+        [
+            RouterBackend("lnd1", NodeFakeWallet(1000), weight=0),
+            RouterBackend("lnd2", NodeFakeWallet(5000), weight=1),
+        ]
+    )
+    invoice = await wallet.create_invoice(21)
+    assert invoice.checking_id
+    assert wallet.backend_of(invoice.checking_id) == "lnd2"
+
+    wallet.strategy = "liquidity"
+    invoice = await wallet.create_invoice(21)
+    assert invoice.checking_id
+    assert wallet.backend_of(invoice.checking_id) == "lnd1"
+
+
+@pytest.mark.asyncio
+async def test_payment_routed_by_capacity_and_recorded(app, from_wallet, mocker):
+    wallet = router(small=10_000, big=50_000_000)
+    mocker.patch.object(services, "get_funding_source", lambda: wallet)
+    mocker.patch("lnbits.core.models.get_funding_source", lambda: wallet)
+
+    invoice = await FakeWallet().create_invoice(1000)
+    assert invoice.payment_request and invoice.checking_id
+    await pay_invoice(wallet_id=from_wallet.id, payment_request=invoice.payment_request)
+
+    big = wallet.backends["big"]
+    assert isinstance(big.wallet, NodeFakeWallet)
+    assert big.wallet.paid == [invoice.payment_request]
+    payment = await get_standalone_payment(invoice.checking_id)
+    assert payment and payment.funding_source == "big"
+    assert payment.is_out
+    # the status check goes to the owning backend only
+    small_status = mocker.spy(wallet.backends["small"].wallet, "get_payment_status")
+    big_status = mocker.spy(big.wallet, "get_payment_status")
+    await payment.check_status()
+    big_status.assert_called_once_with(invoice.checking_id)
+    small_status.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_merged_invoice_stream(app, to_wallet, mocker):
+    wallet = router(lnd1=1000, lnd2=1000)
+    mocker.patch.object(services, "get_funding_source", lambda: wallet)
+    payment_hash, _ = await create_invoice(wallet_id=to_wallet.id, amount=21, memo="")
+    payment = await get_standalone_payment(payment_hash, incoming=True)
+    assert payment and payment.funding_source in {"lnd1", "lnd2"}
+
+    stream = wallet.paid_invoices_stream()
+    for backend in wallet.backends.values():
+        invoice = await backend.wallet.create_invoice(1)
+        assert invoice.payment_request
+        await backend.wallet.pay_invoice(invoice.payment_request, 0)
+    received = {await stream.__anext__() for _ in range(2)}
+    await stream.aclose()
+
+    assert len(received) == 2
+    assert {wallet.backend_of(checking_id) for checking_id in received} == {
+        "lnd1",
+        "lnd2",
+    }
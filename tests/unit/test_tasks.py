@@ -0,0 +1,161 @@
+import asyncio
+from typing import AsyncGenerator, Optional
+
+import httpx
+import pytest
+
+from lnbits import tasks
+from lnbits.core import tasks as core_tasks
+from lnbits.core.crud import (
+    get_invoice_stream_cursor,
+    get_standalone_payment,
+    update_invoice_stream_cursor,
+)
+from lnbits.core.services import create_invoice
+from lnbits.core.tasks import StatusManifestChecker, watchdog_task
+from lnbits.settings import settings
+from lnbits.wallets.base import StatusResponse
+from lnbits.wallets.fake import FakeWallet
+
+
+class ResumableFakeWallet(FakeWallet):
+    resumable_invoice_stream = True
+
+    def __init__(self, checking_ids: list):
+        super().__init__()
+        self.checking_ids = checking_ids
+        self.resumed_from: Optional[int] = None
+
+    async def paid_invoices_stream(self) -> AsyncGenerator[str, None]:
+        self.resumed_from = self.invoice_stream_cursor
+        for checking_id in self.checking_ids:
+            self.invoice_stream_cursor = (self.invoice_stream_cursor or 0) + 1
+            yield checking_id
+
+
+@pytest.mark.asyncio
+async def test_invoice_listener_resumes_from_saved_cursor(app, to_wallet, mocker):
+    payment_hash, _ = await create_invoice(
+        wallet_id=to_wallet.id, amount=21, memo="resumed"
+    )
+    funding_source = ResumableFakeWallet(["unknown", payment_hash])
+    mocker.patch.object(tasks, "get_funding_source", lambda: funding_source)
+
+    key = funding_source.invoice_stream_cursor_key
+    await update_invoice_stream_cursor(key, 41)
+    await tasks.invoice_listener()
+
+    assert funding_source.resumed_from == 41
+    assert await get_invoice_stream_cursor(key) == 43
+    payment = await get_standalone_payment(payment_hash)
+    assert payment
+    assert not payment.pending
+
+
+@pytest.mark.asyncio
+async def test_invoice_listener_keeps_cursor_before_pending_dispatch(app, mocker):
+    funding_source = ResumableFakeWallet(["first", "slow", "third"])
+    mocker.patch.object(tasks, "get_funding_source", lambda: funding_source)
+    release = asyncio.Event()
+    dispatched = []
+
+    async def dispatch(checking_id: str):
+        if checking_id == "slow":
+            await release.wait()
+        dispatched.append(checking_id)
+
+    mocker.patch.object(tasks, "invoice_callback_dispatcher", dispatch)
+
+    key = funding_source.invoice_stream_cursor_key
+    await update_invoice_stream_cursor(key, 10)
+    listener = asyncio.create_task(tasks.invoice_listener())
+    while len(dispatched) < 2:
+        await asyncio.sleep(0.01)
+    await asyncio.sleep(0.01)
+
+    # the slow dispatch does not hold back the next one, only the cursor
+    assert dispatched == ["first", "third"]
+    assert await get_invoice_stream_cursor(key) == 11
+
+    release.set()
+    await listener
+    assert await get_invoice_stream_cursor(key) == 13
+
+
+@pytest.mark.asyncio
+async def test_invoice_listener_retries_failed_dispatch(app, mocker):
+    funding_source = ResumableFakeWallet(["first", "failing", "third"])
+    mocker.patch.object(tasks, "get_funding_source", lambda: funding_source)
+    attempts = []
+
+    async def dispatch(checking_id: str):
+        attempts.append(checking_id)
+        if attempts.count("failing") == 1 and checking_id == "failing":
+            raise RuntimeError("database is gone")
+
+    mocker.patch.object(tasks, "invoice_callback_dispatcher", dispatch)
+
+    key = funding_source.invoice_stream_cursor_key
+    await update_invoice_stream_cursor(key, 10)
+    await tasks.invoice_listener()
+
+    assert attempts.count("failing") == 2
+    assert await get_invoice_stream_cursor(key) == 13
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "error_message, switched", [(None, True), ("node unreachable", False)]
+)
+async def test_watchdog_skips_failed_status(app, mocker, error_message, switched):
+    funding_source = FakeWallet()
+    mocker.patch.object(
+        funding_source,
+        "status",
+        mocker.AsyncMock(return_value=StatusResponse(error_message, 0)),
+    )
+    mocker.patch("lnbits.core.services.get_funding_source", lambda: funding_source)
+    mocker.patch.object(core_tasks, "get_funding_source", lambda: funding_source)
+    switch = mocker.patch.object(core_tasks, "switch_to_voidwallet")
+    mocker.patch.object(settings, "lnbits_watchdog", True)
+    mocker.patch.object(settings, "lnbits_watchdog_delta", 0)
+
+    def stop(seconds):
+        settings.lnbits_running = False
+        return 0
+
+    mocker.patch.object(core_tasks, "jittered", stop)
+    try:
+        await watchdog_task()
+    finally:
+        settings.lnbits_running = True
+
+    funding_source.status.assert_awaited_once()
+    assert switch.called is switched
+
+
+@pytest.mark.asyncio
+async def test_status_manifest_conditional_get(mocker):
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        if request.headers.get("if-none-match") == '"v1"':
+            return httpx.Response(304)
+        return httpx.Response(200, json={"killswitch": 1}, headers={"etag": '"v1"'})
+
+    mocker.patch.object(settings, "lnbits_status_manifest", "https://status/m.json")
+    checker = StatusManifestChecker()
+    checker._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    assert await checker.check() == {"killswitch": 1}
+    assert await checker.check() == {"killswitch": 1}
+    assert "if-none-match" not in requests[0].headers
+    assert checker.not_modified
+    assert checker.dict()["killswitch"] is True
+
+    mocker.patch.object(settings, "lnbits_status_manifest", "https://status/x.json")
+    requests.clear()
+    await checker.check()
+    assert "if-none-match" not in requests[0].headers
+    assert not checker.not_modified
@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+import pytest_asyncio
+
+from lnbits.settings import settings
+from lnbits.wallets.base import create_http_client, http_client_stats
+
+RESPONSE = (
+    b"HTTP/1.1 200 OK\r\n"
+    b"Content-Type: application/json\r\n"
+    b"Content-Length: 16\r\n\r\n"
+    b'{"balance": 100}'
+)
+
+
+@pytest_asyncio.fixture
+async def backend():
+    """Keep-alive http backend, counts the connections it accepts."""
+    connections = []
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        connections.append(writer)
+        try:
+            while await reader.readuntil(b"\r\n\r\n"):
+                writer.write(RESPONSE)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    yield f"http://127.0.0.1:{port}", connections
+    server.close()
+
+
+@pytest.mark.asyncio
+async def test_http_client_reuses_connections(backend):
+    url, connections = backend
+    http_client_stats.pop("TestWallet", None)
+    client = create_http_client("TestWallet", base_url=url)
+
+    for _ in range(10):
+        r = await client.get("/balance")
+        assert r.json() == {"balance": 100}
+    await asyncio.gather(*[client.get("/balance") for _ in range(10)])
+    await client.aclose()
+
+    stats = http_client_stats["TestWallet"]
+    assert stats.requests == 20
+    assert stats.connections == len(connections)
+    assert stats.reused == 20 - len(connections)
+    assert len(connections) <= 10
+
+
+@pytest.mark.asyncio
+async def test_http_stream_client_is_separate(backend):
+    url, _ = backend
+    client = create_http_client("TestWallet", base_url=url)
+    stream_client = create_http_client("TestWallet", base_url=url, stream=True)
+
+    assert client.timeout.read == settings.funding_source_timeout
+    assert stream_client.timeout.read is None
+    async with stream_client.stream("GET", "/stream") as r:
+        await r.aread()
+    assert http_client_stats["TestWallet:stream"].requests >= 1
+
+    await client.aclose()
+    await stream_client.aclose()
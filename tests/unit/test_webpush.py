@@ -0,0 +1,84 @@
+import base64
+import json
+import os
+from uuid import uuid4
+
+import http_ece
+import httpx
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from py_vapid import Vapid
+
+from lnbits import tasks
+from lnbits.core.crud import create_webpush_subscription, get_webpush_subscription
+from lnbits.settings import settings
+from lnbits.utils.webpush import WebPushSender
+
+
+def b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).strip(b"=").decode()
+
+
+@pytest.mark.asyncio
+async def test_send_push_notifications(app, mocker):
+    vapid = Vapid()
+    vapid.generate_keys()
+    mocker.patch.object(
+        settings, "lnbits_webpush_privkey", vapid.private_pem().decode()
+    )
+    receiver_key = ec.generate_private_key(ec.SECP256R1())
+    auth_secret = os.urandom(16)
+    keys = {
+        "p256dh": b64(
+            receiver_key.public_key().public_bytes(
+                serialization.Encoding.X962,
+                serialization.PublicFormat.UncompressedPoint,
+            )
+        ),
+        "auth": b64(auth_secret),
+    }
+    user = uuid4().hex
+    endpoints = [
+        "https://push.example.com/ok-1",
+        "https://push.example.com/ok-2",
+        "https://other.example.com/gone",
+    ]
+    subscriptions = [
+        await create_webpush_subscription(
+            endpoint,
+            user,
+            json.dumps({"endpoint": endpoint, "keys": keys}),
+            "localhost",
+        )
+        for endpoint in endpoints
+    ]
+
+    received = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert request.headers["authorization"].startswith("vapid t=")
+        assert request.headers["content-encoding"] == "aes128gcm"
+        payload = http_ece.decrypt(
+            request.content,
+            private_key=receiver_key,
+            auth_secret=auth_secret,
+            version="aes128gcm",
+        )
+        received.append(json.loads(payload))
+        return httpx.Response(410 if request.url.path == "/gone" else 201)
+
+    sender = WebPushSender()
+    sender._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    mocker.patch.object(tasks, "webpush_sender", sender)
+
+    notifications = [(s, "LNbits", "paid", "https://lnbits") for s in subscriptions]
+    await tasks.send_push_notifications(notifications)
+    await tasks.send_push_notifications(notifications[:2])
+
+    assert len(received) == 5
+    assert received[0] == {"title": "LNbits", "body": "paid", "url": "https://lnbits"}
+    # signed once for each push service
+    assert sender.signed == 2
+    assert await get_webpush_subscription(endpoints[0], user)
+    assert not await get_webpush_subscription(endpoints[2], user)
@@ -74,6 +74,15 @@ cursor.execute(
     ),
 )
 
+cursor.execute(
+    """
+    INSERT INTO wallet_stats
+      (wallet, balance_msat, transaction_count, last_payment)
+    VALUES (?, ?, ?, ?)
+    """,
+    (wallet_id, amount * 1000, 1, int(time.time())),
+)
+
 print(f"created test admin: {adminkey} with {amount} sats")
 
 conn.commit()